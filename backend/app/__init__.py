@@ -1,3 +1,3 @@
- """
+"""
 WeChat文章搜索系统后端
 """
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""准入控制：按客户端限流，并限制高开销接口的并发数
+
+- 每个客户端（X-API-Key 在 ADMISSION_API_KEYS 中时按API Key，否则按客户端IP）在每个接口上有一个令牌桶，
+  令牌不足时返回429和Retry-After
+- 每个接口有全局并发上限，超出的请求进入有界等待队列，队列已满或等待超时同样返回429，
+  因此过载时请求的额外等待时间不超过 ADMISSION_QUEUE_TIMEOUT
+
+限流状态保存在进程内，多进程部署时每个工作进程各自计算。
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from .metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# 每个客户端每秒允许的请求数和突发容量，0表示不限流
+INGEST_RATE_LIMIT = float(os.environ.get("INGEST_RATE_LIMIT", "10"))
+INGEST_RATE_BURST = float(os.environ.get("INGEST_RATE_BURST", "20"))
+SEARCH_RATE_LIMIT = float(os.environ.get("SEARCH_RATE_LIMIT", "20"))
+SEARCH_RATE_BURST = float(os.environ.get("SEARCH_RATE_BURST", "40"))
+# 每个工作进程同时处理的请求数上限，0表示不限制
+INGEST_MAX_CONCURRENCY = int(os.environ.get("INGEST_MAX_CONCURRENCY", "8"))
+SEARCH_MAX_CONCURRENCY = int(os.environ.get("SEARCH_MAX_CONCURRENCY", "32"))
+# 超出并发上限时的等待队列长度和最长等待秒数
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "2"))
+# 保留令牌桶的客户端数上限，超出时淘汰最久未访问的客户端
+ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS", "10000"))
+# 按API Key单独限流的Key（逗号分隔）；不在其中的 X-API-Key 忽略，按客户端IP限流，
+# 避免客户端轮换随机Key绕过限流并挤掉其他客户端的令牌桶
+ADMISSION_API_KEYS = frozenset(
+    key.strip() for key in os.environ.get("ADMISSION_API_KEYS", "").split(",") if key.strip()
+)
+
+ADMISSION_REJECTED = Counter("admission_rejected_total", "准入控制拒绝的请求", ("endpoint", "reason"))
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "admission_queue_wait_seconds", "等待并发名额的时间", ("endpoint",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+)
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "正在处理的受控请求数", ("endpoint",))
+ADMISSION_QUEUED = Gauge("admission_queued", "等待并发名额的请求数", ("endpoint",))
+
+class TokenBucketLimiter:
+    """按客户端的令牌桶，只在事件循环线程中使用，不需要加锁"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = ADMISSION_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        # 客户端 -> [剩余令牌, 上次更新时间]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """
+        尝试取一个令牌
+
+        Returns:
+            float: 0表示放行，否则为需要等待的秒数
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+class ConcurrencyLimiter:
+    """并发上限加有界FIFO等待队列，名额释放时直接交给队首的请求"""
+
+    def __init__(self, name: str, limit: int, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: deque = deque()
+        self._in_flight = ADMISSION_IN_FLIGHT.labels(name)
+        self._queued = ADMISSION_QUEUED.labels(name)
+
+    async def acquire(self) -> Optional[str]:
+        """
+        获取并发名额
+
+        Returns:
+            None: 获取成功，处理完后必须调用 release
+            str: 拒绝原因（queue_full 或 queue_timeout）
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._in_flight.set(self.active)
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._queued.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # 客户端断开时，如果名额已经交给了本请求，需要归还
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            self._queued.set(len(self._waiters))
+
+    def release(self):
+        """释放名额，有等待的请求时直接转交"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        self._in_flight.set(self.active)
+
+class EndpointPolicy:
+    """单个接口的准入策略"""
+
+    def __init__(self, name: str, rate: float = 0, burst: float = 0, max_concurrency: int = 0):
+        self.name = name
+        self.rate_limiter = TokenBucketLimiter(rate, burst) if rate > 0 else None
+        self.concurrency = ConcurrencyLimiter(name, max_concurrency) if max_concurrency > 0 else None
+
+def default_policies() -> Dict[str, EndpointPolicy]:
+    """按路径配置的准入策略"""
+    return {
+        "/artlist/": EndpointPolicy("ingest", INGEST_RATE_LIMIT, INGEST_RATE_BURST, INGEST_MAX_CONCURRENCY),
+        "/search/": EndpointPolicy("search", SEARCH_RATE_LIMIT, SEARCH_RATE_BURST, SEARCH_MAX_CONCURRENCY),
+    }
+
+def client_key(scope) -> str:
+    """限流使用的客户端标识：API Key在 ADMISSION_API_KEYS 中时使用API Key，否则使用客户端IP"""
+    if ADMISSION_API_KEYS:
+        for name, value in scope.get("headers") or ():
+            if name == b"x-api-key":
+                key = value.decode("latin-1")
+                if key in ADMISSION_API_KEYS:
+                    return "key:" + key
+                break
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+async def _reject(send, retry_after: float, message: str):
+    body = json.dumps({"detail": message}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(int(retry_after + 0.999), 1)).encode()),
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class AdmissionMiddleware:
+    """按路径应用准入策略的ASGI中间件"""
+
+    def __init__(self, app, policies: Optional[Dict[str, EndpointPolicy]] = None):
+        self.app = app
+        self.policies = default_policies() if policies is None else policies
+
+    async def __call__(self, scope, receive, send):
+        policy = self.policies.get(scope["path"]) if scope["type"] == "http" else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        if policy.rate_limiter:
+            retry_after = policy.rate_limiter.acquire(client_key(scope))
+            if retry_after:
+                ADMISSION_REJECTED.labels(policy.name, "rate_limit").inc()
+                await _reject(send, retry_after, "请求过于频繁，请稍后重试")
+                return
+
+        if policy.concurrency is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        reason = await policy.concurrency.acquire()
+        ADMISSION_QUEUE_SECONDS.labels(policy.name).observe(time.perf_counter() - start)
+        if reason:
+            ADMISSION_REJECTED.labels(policy.name, reason).inc()
+            await _reject(send, 1, "服务繁忙，请稍后重试")
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            policy.concurrency.release()
@@ -0,0 +1,157 @@
+"""熔断器：外部依赖持续失败时快速失败，避免请求线程堆积在超时等待上
+
+状态:
+    closed     正常放行，按滑动时间窗口统计失败率
+    open       失败率超过阈值后熔断，所有调用立即失败，持续 open_seconds 秒
+    half_open  熔断到期后放行少量探测请求，全部成功则恢复，任一失败则重新熔断
+"""
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, Any, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝调用"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} 熔断中，{retry_after:.0f} 秒后重试")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """基于失败率的熔断器，线程安全"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        minimum_calls: int = 20,
+        window_seconds: float = 30.0,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 3,
+        on_state_change: Optional[Callable[[str], None]] = None
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.on_state_change = on_state_change
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        # 每秒一个桶: [秒, 调用数, 失败数]
+        self._buckets: deque = deque()
+        self._calls = 0
+        self._failures = 0
+        self._probes = 0
+        self._probe_successes = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str):
+        self._state = state
+        self._buckets.clear()
+        self._calls = self._failures = 0
+        self._probes = self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if self.on_state_change:
+            self.on_state_change(state)
+
+    def retry_after(self) -> float:
+        """距离允许探测的剩余秒数"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def is_open(self) -> bool:
+        """是否处于熔断状态（不占用半开探测名额）"""
+        return self.state == OPEN
+
+    def allow(self) -> bool:
+        """判断本次调用是否放行，放行后必须调用 record_success 或 record_failure"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def check(self):
+        """不放行时抛出 CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+            elif self._state == CLOSED:
+                self._record(False)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN)
+            elif self._state == CLOSED:
+                self._record(True)
+                if self._calls >= self.minimum_calls and self._failures / self._calls >= self.failure_rate:
+                    self._transition(OPEN)
+
+    def _record(self, failed: bool):
+        second = int(time.monotonic())
+        if self._buckets and self._buckets[-1][0] == second:
+            bucket = self._buckets[-1]
+        else:
+            bucket = [second, 0, 0]
+            self._buckets.append(bucket)
+        bucket[1] += 1
+        self._calls += 1
+        if failed:
+            bucket[2] += 1
+            self._failures += 1
+
+        # 移出窗口外的桶
+        while self._buckets and self._buckets[0][0] <= second - self.window_seconds:
+            _, calls, failures = self._buckets.popleft()
+            self._calls -= calls
+            self._failures -= failures
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return {
+                "state": state,
+                "window_calls": self._calls,
+                "window_failures": self._failures,
+                "rejected": self._rejected,
+                "retry_after": round(max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0), 1)
+                if state == OPEN else 0.0,
+                "failure_rate_threshold": self.failure_rate,
+                "minimum_calls": self.minimum_calls,
+                "window_seconds": self.window_seconds,
+                "open_seconds": self.open_seconds
+            }
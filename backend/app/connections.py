@@ -0,0 +1,411 @@
+"""连接管理：MySQL连接池与共享的Elasticsearch客户端
+
+所有连接参数都通过环境变量配置，并统计连接池使用率和获取连接的等待时间，
+便于按并发量调整连接池大小。Elasticsearch调用按操作类型设置超时，并经过熔断器，
+ES持续失败时快速失败而不是占住工作线程。
+"""
+import os
+import time
+import logging
+import threading
+import itertools
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from elasticsearch import Elasticsearch, ApiError, TransportError
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
+
+from .metrics import REGISTRY, Counter, Gauge, Histogram, ES_REQUEST_SECONDS
+from . import tracing
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, STATES
+
+logger = logging.getLogger(__name__)
+
+# MySQL连接池配置
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "3600"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "10"))
+
+# MySQL只读副本：逗号分隔的完整连接地址，未设置时读写都使用主库
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# 副本复制延迟超过该秒数时不再使用，读请求回退到主库
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "5"))
+# 副本延迟检查间隔（秒）
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", "5"))
+
+# Elasticsearch客户端配置
+ES_HOST = os.environ.get("ES_HOST", "localhost")
+ES_PORT = os.environ.get("ES_PORT", "9200")
+ES_MAXSIZE = int(os.environ.get("ES_MAXSIZE", "25"))
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", "10"))
+ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", "3"))
+ES_RETRY_ON_TIMEOUT = os.environ.get("ES_RETRY_ON_TIMEOUT", "true").lower() in ("1", "true", "yes")
+# 按操作类型的超时（秒），未列出的操作（bulk等）使用 ES_REQUEST_TIMEOUT
+ES_SEARCH_TIMEOUT = float(os.environ.get("ES_SEARCH_TIMEOUT", "3"))
+ES_INDEX_TIMEOUT = float(os.environ.get("ES_INDEX_TIMEOUT", "5"))
+ES_OPERATION_TIMEOUTS = {
+    "search": ES_SEARCH_TIMEOUT,
+    "get": ES_SEARCH_TIMEOUT,
+    "index": ES_INDEX_TIMEOUT,
+    "delete": ES_INDEX_TIMEOUT
+}
+
+# Elasticsearch熔断器配置
+ES_BREAKER_FAILURE_RATE = float(os.environ.get("ES_BREAKER_FAILURE_RATE", "0.5"))
+ES_BREAKER_MINIMUM_CALLS = int(os.environ.get("ES_BREAKER_MINIMUM_CALLS", "20"))
+ES_BREAKER_WINDOW = float(os.environ.get("ES_BREAKER_WINDOW", "30"))
+ES_BREAKER_OPEN_SECONDS = float(os.environ.get("ES_BREAKER_OPEN_SECONDS", "30"))
+ES_BREAKER_HALF_OPEN_PROBES = int(os.environ.get("ES_BREAKER_HALF_OPEN_PROBES", "3"))
+
+class WaitStats:
+    """获取连接等待时间的累计统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.count,
+                "wait_seconds_total": round(self.total, 6),
+                "wait_seconds_avg": round(self.total / self.count, 6) if self.count else 0.0,
+                "wait_seconds_max": round(self.max, 6)
+            }
+
+db_wait_stats = WaitStats()
+
+DB_POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "获取MySQL连接的等待时间",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "MySQL连接池连接数", ("state",))
+ES_POOL_CONNECTIONS = Gauge("es_pool_connections", "Elasticsearch连接池连接数", ("node", "state"))
+DB_REPLICA_LAG_SECONDS = Gauge("db_replica_lag_seconds", "MySQL副本复制延迟，无法获取时为-1", ("replica",))
+DB_READ_ROUTED = Counter("db_read_routed_total", "只读会话路由到的数据库", ("target",))
+ES_CIRCUIT_STATE = Gauge("es_circuit_breaker_state", "Elasticsearch熔断器状态（处于该状态时为1）", ("state",))
+ES_CIRCUIT_REJECTED = Counter("es_circuit_breaker_rejected_total", "熔断期间被拒绝的Elasticsearch调用", ("operation",))
+
+class TimedQueuePool(QueuePool):
+    """记录获取连接等待时间的连接池"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            db_wait_stats.record(elapsed)
+            DB_POOL_CHECKOUT_WAIT_SECONDS.observe(elapsed)
+
+def create_db_engine(url: str, **kwargs) -> Engine:
+    """按连接池配置创建数据库引擎"""
+    options = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+    if url.startswith("mysql"):
+        options["connect_args"] = {"connect_timeout": DB_CONNECT_TIMEOUT}
+    elif url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False, "timeout": DB_POOL_TIMEOUT}
+    options.update(kwargs)
+    return create_engine(url, **options)
+
+def db_pool_stats(engine: Engine) -> Dict[str, Any]:
+    """MySQL连接池使用情况"""
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        max_overflow = getattr(pool, "_max_overflow", DB_MAX_OVERFLOW)
+        capacity = pool.size() + max(max_overflow, 0)
+        stats.update({
+            "size": pool.size(),
+            "max_overflow": max_overflow,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "utilization": round(pool.checkedout() / capacity, 4) if capacity else 0.0
+        })
+    stats.update(db_wait_stats.snapshot())
+    return stats
+
+# 已经提示过无法读取复制状态的 (副本, 原因)，每种情况只记录一次警告
+_replica_warned: Set[Tuple[str, str]] = set()
+
+def _warn_replica(engine: Engine, reason: str):
+    key = (engine.url.render_as_string(hide_password=True), reason)
+    if key not in _replica_warned:
+        _replica_warned.add(key)
+        logger.warning(f"MySQL副本 {engine.url.host} {reason}，无法确认复制延迟，只读查询使用主库")
+
+def replica_lag(engine: Engine) -> Optional[float]:
+    """
+    查询副本的复制延迟（秒）
+
+    Returns:
+        float: 延迟秒数；非MySQL时视为0
+        None: 复制线程已停止、没有复制状态（不是副本）或没有查询权限（需要 REPLICATION CLIENT）
+    """
+    with engine.connect() as conn:
+        if conn.dialect.name != "mysql":
+            return 0.0
+        # MySQL 8.0.22 起使用 REPLICA 术语
+        for statement, column in (
+            ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+            ("SHOW SLAVE STATUS", "Seconds_Behind_Master")
+        ):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except DBAPIError:
+                continue
+            if row is None:
+                _warn_replica(engine, "没有复制状态（不是副本）")
+                return None
+            lag = row.get(column)
+            return float(lag) if lag is not None else None
+    _warn_replica(engine, "无法查询复制状态（需要 REPLICATION CLIENT 权限）")
+    return None
+
+class ReplicaRouter:
+    """
+    只读会话的路由：在延迟不超过 DB_REPLICA_MAX_LAG 的副本间轮询，
+    没有可用副本时使用主库。副本状态由后台线程定期检查，选择副本时不会阻塞。
+    """
+
+    def __init__(self, primary: Engine, replicas: List[Engine],
+                 max_lag: float = DB_REPLICA_MAX_LAG, check_interval: float = DB_REPLICA_CHECK_INTERVAL):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        # 首次检查完成前不使用副本
+        self._healthy = [False] * len(replicas)
+        self._lag: List[Optional[float]] = [None] * len(replicas)
+        self._checked_at: List[Optional[float]] = [None] * len(replicas)
+        self._errors: List[Optional[str]] = [None] * len(replicas)
+        self._counter = itertools.count()
+        self._stop_event = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def read_engine(self) -> Engine:
+        """选择只读会话使用的引擎"""
+        n = len(self.replicas)
+        if n:
+            start = next(self._counter)
+            for k in range(n):
+                i = (start + k) % n
+                if self._healthy[i]:
+                    DB_READ_ROUTED.labels("replica").inc()
+                    return self.replicas[i]
+        DB_READ_ROUTED.labels("primary").inc()
+        return self.primary
+
+    def check(self):
+        """检查所有副本的连通性和复制延迟"""
+        for i, replica in enumerate(self.replicas):
+            try:
+                lag = replica_lag(replica)
+                self._errors[i] = None if lag is not None else "复制已停止或无法读取复制状态"
+            except Exception as e:
+                lag = None
+                self._errors[i] = str(e)
+            healthy = lag is not None and lag <= self.max_lag
+            if healthy != self._healthy[i]:
+                log = logger.info if healthy else logger.warning
+                log(f"MySQL副本 {replica.url.host} {'恢复使用' if healthy else '暂停使用'}: 延迟 {lag}, {self._errors[i] or ''}")
+            self._lag[i] = lag
+            self._healthy[i] = healthy
+            self._checked_at[i] = time.time()
+            DB_REPLICA_LAG_SECONDS.labels(replica.url.host or str(i)).set(lag if lag is not None else -1)
+
+    def _check_loop(self):
+        while not self._stop_event.is_set():
+            self.check()
+            self._stop_event.wait(self.check_interval)
+
+    def start(self) -> bool:
+        """启动后台检查线程"""
+        if not self.replicas:
+            return False
+        if self._worker and self._worker.is_alive():
+            return True
+        self._stop_event.clear()
+        self._worker = threading.Thread(target=self._check_loop, name="replica-monitor", daemon=True)
+        self._worker.start()
+        logger.info(f"MySQL副本检查已启动: {len(self.replicas)} 个副本，最大延迟 {self.max_lag} 秒")
+        return True
+
+    def stop(self):
+        """停止后台检查线程并释放副本连接"""
+        self._stop_event.set()
+        for replica in self.replicas:
+            replica.dispose()
+
+    def status(self) -> List[Dict[str, Any]]:
+        """各副本状态"""
+        return [
+            {
+                "url": replica.url.render_as_string(hide_password=True),
+                "healthy": self._healthy[i],
+                "lag_seconds": self._lag[i],
+                "checked_at": self._checked_at[i],
+                "error": self._errors[i],
+                "pool": db_pool_stats(replica)
+            }
+            for i, replica in enumerate(self.replicas)
+        ]
+
+def es_operation(method: str, path: str) -> str:
+    """按请求方法和路径归类ES调用"""
+    if "/_search" in path or "/_pit" in path or "/_count" in path:
+        return "search"
+    if "/_bulk" in path:
+        return "bulk"
+    if "/_delete_by_query" in path:
+        return "delete"
+    if "/_doc" in path or "/_create/" in path or "/_update" in path:
+        if method == "DELETE":
+            return "delete"
+        if method in ("GET", "HEAD"):
+            return "get"
+        return "index"
+    return "other"
+
+def _set_breaker_state(state: str):
+    for name in STATES:
+        ES_CIRCUIT_STATE.labels(name).set(1 if name == state else 0)
+    log = logger.info if state == "closed" else logger.warning
+    log(f"Elasticsearch熔断器状态: {state}")
+
+es_breaker = CircuitBreaker(
+    "elasticsearch",
+    failure_rate=ES_BREAKER_FAILURE_RATE,
+    minimum_calls=ES_BREAKER_MINIMUM_CALLS,
+    window_seconds=ES_BREAKER_WINDOW,
+    open_seconds=ES_BREAKER_OPEN_SECONDS,
+    half_open_probes=ES_BREAKER_HALF_OPEN_PROBES,
+    on_state_change=_set_breaker_state
+)
+for _state in STATES:
+    ES_CIRCUIT_STATE.labels(_state).set(1 if _state == "closed" else 0)
+
+class InstrumentedElasticsearch(Elasticsearch):
+    """
+    所有API方法最终都经过perform_request，在这里统一记录耗时、
+    按操作类型设置超时并经过熔断器
+    """
+
+    def perform_request(self, method: str, path: str, **kwargs):
+        operation = es_operation(method, path)
+        if not es_breaker.allow():
+            ES_CIRCUIT_REJECTED.labels(operation).inc()
+            raise CircuitOpenError(es_breaker.name, es_breaker.retry_after())
+
+        # 共享客户端使用按操作的超时，调用方通过options()指定的超时不受影响
+        client = self
+        timeout = ES_OPERATION_TIMEOUTS.get(operation)
+        if timeout and self is _es_client:
+            client = self.options(request_timeout=timeout)
+
+        failed = False
+        try:
+            with ES_REQUEST_SECONDS.labels(operation).time(), \
+                    tracing.span(f"es.{operation}", **{"es.method": method, "es.path": path}):
+                return super(InstrumentedElasticsearch, client).perform_request(method, path, **kwargs)
+        except TransportError:
+            # 连接失败、超时
+            failed = True
+            raise
+        except ApiError as e:
+            # 4xx是请求本身的问题，只有5xx和429说明ES不可用或过载
+            failed = e.status_code >= 500 or e.status_code == 429
+            raise
+        finally:
+            if failed:
+                es_breaker.record_failure()
+            else:
+                es_breaker.record_success()
+
+_es_client: Optional[Elasticsearch] = None
+_es_lock = threading.Lock()
+
+def get_es_client() -> Elasticsearch:
+    """获取进程内共享的Elasticsearch客户端"""
+    global _es_client
+    if _es_client is None:
+        with _es_lock:
+            if _es_client is None:
+                _es_client = InstrumentedElasticsearch(
+                    f"http://{ES_HOST}:{ES_PORT}",
+                    connections_per_node=ES_MAXSIZE,
+                    request_timeout=ES_REQUEST_TIMEOUT,
+                    max_retries=ES_MAX_RETRIES,
+                    retry_on_timeout=ES_RETRY_ON_TIMEOUT
+                )
+    return _es_client
+
+def es_pool_stats() -> Dict[str, Any]:
+    """Elasticsearch连接池使用情况"""
+    stats = {
+        "maxsize": ES_MAXSIZE,
+        "request_timeout": ES_REQUEST_TIMEOUT,
+        "max_retries": ES_MAX_RETRIES,
+        "retry_on_timeout": ES_RETRY_ON_TIMEOUT,
+        "operation_timeouts": ES_OPERATION_TIMEOUTS,
+        "breaker": es_breaker.snapshot(),
+        "nodes": []
+    }
+    if _es_client is None:
+        return stats
+
+    try:
+        for node in _es_client.transport.node_pool.all():
+            pool = getattr(node, "pool", None)
+            if pool is None:
+                continue
+            # urllib3连接池队列中保存空闲连接和未创建的空位，取走的部分即正在使用的连接
+            queue = pool.pool
+            in_use = max(queue.maxsize - queue.qsize(), 0) if queue is not None else 0
+            stats["nodes"].append({
+                "node": str(node.config.host),
+                "connections_created": pool.num_connections,
+                "requests": pool.num_requests,
+                "in_use": in_use,
+                "utilization": round(in_use / ES_MAXSIZE, 4) if ES_MAXSIZE else 0.0
+            })
+    except Exception as e:
+        logger.warning(f"获取Elasticsearch连接池状态时发生错误: {e}")
+    return stats
+
+def register_pool_metrics(engine: Engine):
+    """在输出指标前刷新连接池仪表"""
+    def collect():
+        db_stats = db_pool_stats(engine)
+        if "size" in db_stats:
+            DB_POOL_CONNECTIONS.labels("size").set(db_stats["size"])
+            DB_POOL_CONNECTIONS.labels("checked_out").set(db_stats["checked_out"])
+            DB_POOL_CONNECTIONS.labels("idle").set(db_stats["idle"])
+            DB_POOL_CONNECTIONS.labels("overflow").set(max(db_stats["overflow"], 0))
+        for node in es_pool_stats()["nodes"]:
+            ES_POOL_CONNECTIONS.labels(node["node"], "in_use").set(node["in_use"])
+            ES_POOL_CONNECTIONS.labels(node["node"], "maxsize").set(ES_MAXSIZE)
+
+    REGISTRY.register_collector(collect)
@@ -1,47 +1,77 @@
 """
-Elasticsearch utilities for WeChat article search system.
+Elasticsearch-only存储：文章和日志只保存在Elasticsearch中
+
+STORAGE_BACKEND=es-only 时由 services/storage.py 使用，适合写入量大、MySQL成为瓶颈的部署。
+文章写入与MySQL+ES模式相同的搜索索引（ES_INDEX），搜索直接复用 services/search.py；
+文档包含文章表除自增id外的全部列，各函数的返回结构与 services/article.py、services/log.py 相同。
+
+批量写入使用bulk API且不强制刷新，新文章在索引刷新间隔（默认1秒）后可查。
+
+近似重复检测的分段键保存在文档的 simhash_bands 字段中，每批文章用一次terms查询取候选，
+刷新间隔内先后写入的两批文章彼此不可见，可能分到不同的簇。
 """
 import os
-import json
 import uuid
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Iterator, Optional
+
+from elasticsearch import helpers
+from elasticsearch.exceptions import NotFoundError, BadRequestError
+from pydantic import ValidationError
 
-from elasticsearch import Elasticsearch, helpers
-from elasticsearch.exceptions import NotFoundError, ConnectionError
+from .connections import get_es_client
+from .metrics import INGEST_ARTICLES
+from . import tracing
+from .models.article import ARTICLE_FULL, ARTICLE_DOCUMENT
+from .services.search import ES_INDEX, put_embedding_mapping
+from .schemas import ArticleIn, article_record, validate_article, validate_articles, error_report
+from .services.article import extract_articles, storage_error, UPDATABLE_FIELDS
+from .services import dedup
+from .services import embedding
+from .services import log as log_service
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 从环境变量获取Elasticsearch配置
-ES_HOST = os.environ.get("ES_HOST", "localhost")
-ES_PORT = os.environ.get("ES_PORT", "9200")
-ES_ARTICLES_INDEX = os.environ.get("ES_ARTICLES_INDEX", "wechat_articles")
+# 日志索引
 ES_LOGS_INDEX = os.environ.get("ES_LOGS_INDEX", "wechat_logs")
+# 每个bulk请求包含的文章数
+ES_BULK_CHUNK_SIZE = int(os.environ.get("ES_BULK_CHUNK_SIZE", "500"))
+# 每批文章查询近似重复候选的最大文档数
+ES_DEDUP_CANDIDATES = int(os.environ.get("ES_DEDUP_CANDIDATES", "1000"))
 
-# 创建Elasticsearch客户端
-es_client = Elasticsearch(f"http://{ES_HOST}:{ES_PORT}")
+# 获取共享的Elasticsearch客户端
+es_client = get_es_client()
 
-# 文章索引映射
-ARTICLES_MAPPING = {
-    "mappings": {
-        "properties": {
-            "url": {"type": "keyword"},
-            "title": {"type": "text", "analyzer": "standard", "search_analyzer": "standard"},
-            "digest": {"type": "text", "analyzer": "standard", "search_analyzer": "standard"},
-            "pub_time": {"type": "long"},
-            "pub_time_iso": {"type": "date"},
-            "cover": {"type": "keyword"},
-            "bizname": {"type": "text", "analyzer": "standard", "search_analyzer": "standard"},
-            "biz": {"type": "keyword"},
-            "unique_id": {"type": "keyword"},
-            "created_at": {"type": "date"}
-        }
-    }
+# 可用于文章列表排序的字段（keyword/long/date类型）
+SORTABLE_FIELDS = {
+    "unique_id", "url", "pub_time", "pub_time_iso", "cover", "biz", "mid", "idx", "cluster_id", "created_at", "updated_at"
+}
+
+# 近似重复检测字段，已有索引在初始化时补充映射
+CLUSTER_MAPPING = {
+    "cluster_id": {"type": "keyword"},
+    "simhash": {"type": "long", "index": False},
+    "simhash_bands": {"type": "integer"}
 }
 
+def _articles_mapping(text_analyzer: Optional[str] = None, search_analyzer: Optional[str] = None) -> Dict[str, Any]:
+    """文章索引映射，文本字段可指定分词器"""
+    text = {"type": "text"}
+    if text_analyzer:
+        text = {"type": "text", "analyzer": text_analyzer, "search_analyzer": search_analyzer or text_analyzer}
+    properties = {field: {"type": "keyword"} for field in ("unique_id", "url", "cover", "biz", "mid", "idx")}
+    properties.update({field: dict(text) for field in ("title", "digest", "bizname")})
+    properties.update({
+        "pub_time": {"type": "long"},
+        "pub_time_iso": {"type": "date"},
+        "created_at": {"type": "date"},
+        "updated_at": {"type": "date"}
+    })
+    properties.update(CLUSTER_MAPPING)
+    properties.update(embedding.EMBEDDING_MAPPING)
+    return {"mappings": {"properties": properties}}
+
 # 日志索引映射
 LOGS_MAPPING = {
     "mappings": {
@@ -50,504 +80,409 @@ LOGS_MAPPING = {
             "method": {"type": "keyword"},
             "path": {"type": "keyword"},
             "client": {"type": "keyword"},
+            "log_id": {"type": "keyword"},
             "data": {"type": "object", "enabled": False},
             "created_at": {"type": "date"}
         }
     }
 }
 
-# 尝试使用IK分词器，如果可用的话
-try:
-    # 测试IK分词器是否可用
-    test_query = {
-        "analyzer": "ik_smart",
-        "text": "测试文本"
-    }
-    
+def _ik_available() -> bool:
+    """检查IK分词器是否可用"""
     try:
-        # 尝试分析文本
-        es_client.indices.analyze(body=test_query)
-        
-        # 如果成功，使用IK分词器配置
-        logger.info("IK分词器可用，使用IK分词器配置")
-        ARTICLES_MAPPING = {
-            "mappings": {
-                "properties": {
-                    "url": {"type": "keyword"},
-                    "title": {"type": "text", "analyzer": "ik_max_word", "search_analyzer": "ik_smart"},
-                    "digest": {"type": "text", "analyzer": "ik_max_word", "search_analyzer": "ik_smart"},
-                    "pub_time": {"type": "long"},
-                    "pub_time_iso": {"type": "date"},
-                    "cover": {"type": "keyword"},
-                    "bizname": {"type": "text", "analyzer": "ik_max_word", "search_analyzer": "ik_smart"},
-                    "biz": {"type": "keyword"},
-                    "unique_id": {"type": "keyword"},
-                    "created_at": {"type": "date"}
-                }
-            },
-            "settings": {
-                "analysis": {
-                    "analyzer": {
-                        "ik_max_word": {
-                            "type": "custom",
-                            "tokenizer": "ik_max_word",
-                            "filter": ["lowercase"]
-                        },
-                        "ik_smart": {
-                            "type": "custom",
-                            "tokenizer": "ik_smart",
-                            "filter": ["lowercase"]
-                        }
-                    }
-                }
-            }
-        }
+        es_client.indices.analyze(analyzer="ik_smart", text="测试文本")
+        return True
     except Exception as e:
         logger.warning(f"IK分词器不可用，使用标准分词器: {e}")
-except Exception as e:
-    logger.warning(f"检查IK分词器失败，使用标准分词器: {e}")
+        return False
 
-def initialize_indices():
-    """
-    初始化Elasticsearch索引
-    """
+def _create_articles_index():
+    """创建文章索引，优先使用IK分词器，失败时使用基本映射"""
+    mapping = _articles_mapping("ik_max_word", "ik_smart") if _ik_available() else _articles_mapping("standard")
+    try:
+        es_client.indices.create(index=ES_INDEX, body=mapping)
+        logger.info(f"创建索引: {ES_INDEX}")
+    except Exception as e:
+        logger.error(f"使用自定义映射创建索引失败，使用基本映射: {e}")
+        es_client.indices.create(index=ES_INDEX, body=_articles_mapping())
+        logger.info(f"使用基本映射创建索引: {ES_INDEX}")
+
+def initialize_indices() -> bool:
+    """初始化文章和日志索引"""
     try:
-        # 检查Elasticsearch连接
         if not es_client.ping():
             logger.error("无法连接到Elasticsearch")
             return False
-        
-        # 创建文章索引（如果不存在）
-        if not es_client.indices.exists(index=ES_ARTICLES_INDEX):
-            try:
-                es_client.indices.create(
-                    index=ES_ARTICLES_INDEX,
-                    body=ARTICLES_MAPPING
-                )
-                logger.info(f"创建索引: {ES_ARTICLES_INDEX}")
-            except Exception as e:
-                logger.error(f"使用自定义映射创建索引失败: {e}")
-                
-                # 尝试使用基本设置创建索引
-                try:
-                    basic_mapping = {
-                        "mappings": {
-                            "properties": {
-                                "url": {"type": "keyword"},
-                                "title": {"type": "text"},
-                                "digest": {"type": "text"},
-                                "pub_time": {"type": "long"},
-                                "pub_time_iso": {"type": "date"},
-                                "cover": {"type": "keyword"},
-                                "bizname": {"type": "text"},
-                                "biz": {"type": "keyword"},
-                                "unique_id": {"type": "keyword"},
-                                "created_at": {"type": "date"}
-                            }
-                        }
-                    }
-                    
-                    es_client.indices.create(
-                        index=ES_ARTICLES_INDEX,
-                        body=basic_mapping
-                    )
-                    logger.info(f"使用基本设置创建索引: {ES_ARTICLES_INDEX}")
-                except Exception as basic_error:
-                    logger.error(f"使用基本设置创建索引失败: {basic_error}")
-                    return False
-        
-        # 创建日志索引（如果不存在）
+
+        if not es_client.indices.exists(index=ES_INDEX):
+            _create_articles_index()
+        else:
+            es_client.indices.put_mapping(index=ES_INDEX, properties=CLUSTER_MAPPING)
+            put_embedding_mapping(ES_INDEX)
         if not es_client.indices.exists(index=ES_LOGS_INDEX):
-            try:
-                es_client.indices.create(
-                    index=ES_LOGS_INDEX,
-                    body=LOGS_MAPPING
-                )
-                logger.info(f"创建索引: {ES_LOGS_INDEX}")
-            except Exception as e:
-                logger.error(f"创建日志索引失败: {e}")
-                return False
-        
+            es_client.indices.create(index=ES_LOGS_INDEX, body=LOGS_MAPPING)
+            logger.info(f"创建索引: {ES_LOGS_INDEX}")
+        else:
+            # 日志分页的排序字段，已有索引补充映射
+            es_client.indices.put_mapping(index=ES_LOGS_INDEX, properties={"log_id": {"type": "keyword"}})
         return True
-    except ConnectionError as e:
-        logger.error(f"Elasticsearch连接错误: {e}")
-        return False
     except Exception as e:
         logger.error(f"初始化索引时发生错误: {e}")
         return False
 
-def save_log(log_data: Dict[str, Any]) -> bool:
-    """
-    保存请求日志到Elasticsearch
-    
-    Args:
-        log_data: 包含timestamp, method, path, client, data的字典
-    
-    Returns:
-        bool: 保存成功返回True，否则返回False
-    """
+def _now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat()
+
+def _article_document(article: ArticleIn, now: str) -> Dict[str, Any]:
+    """按文章表的列生成新文章的文档"""
+    document = article_record(article)
+    pub_time_iso = document["pub_time_iso"]
+    if pub_time_iso:
+        document["pub_time_iso"] = pub_time_iso.isoformat()
+    else:
+        document["pub_time"] = None
+    document["created_at"] = now
+    document["updated_at"] = now
+    return document
+
+# 近似重复检测写入文档的字段
+CLUSTER_FIELDS = ("simhash", "simhash_bands", "cluster_id")
+
+def _update_fields(article: ArticleIn, document: Dict[str, Any]) -> Dict[str, Any]:
+    """已有文章需要更新的字段：只覆盖请求中提供的字段，保留创建时间"""
+    fields = {field: document[field] for field in UPDATABLE_FIELDS.intersection(article)}
+    if document["pub_time_iso"]:
+        fields["pub_time"] = document["pub_time"]
+        fields["pub_time_iso"] = document["pub_time_iso"]
+    # 部分更新时文档中的标题或摘要不完整，只有两者都提供时才更新指纹、簇ID和向量
+    if "title" in article and "digest" in article:
+        fields.update((field, document[field]) for field in CLUSTER_FIELDS)
+        fields["embedding"] = document["embedding"]
+    fields["updated_at"] = document["updated_at"]
+    return fields
+
+def _load_candidates(values: List[int]) -> dedup.BandIndex:
+    """查询与任一指纹有相同分段键的已有文章，查询失败时不影响写入"""
+    index = dedup.BandIndex()
+    keys = sorted({key for value in values for key in dedup.band_keys(value)})
+    if not keys:
+        return index
     try:
-        # 添加创建时间
-        log_data["created_at"] = datetime.now().isoformat()
-        
-        # 保存到Elasticsearch
-        es_client.index(
-            index=ES_LOGS_INDEX,
-            document=log_data
+        response = es_client.search(
+            index=ES_INDEX,
+            body={
+                "query": {"terms": {"simhash_bands": keys}},
+                "_source": ["unique_id", "simhash", "cluster_id"],
+                "size": ES_DEDUP_CANDIDATES,
+                "track_total_hits": False
+            }
         )
-        return True
     except Exception as e:
-        logger.error(f"保存日志时发生错误: {e}")
-        return False
+        logger.warning(f"查询近似重复候选时发生错误，本批文章不合并簇: {e}")
+        return index
+    for hit in response["hits"]["hits"]:
+        source = hit["_source"]
+        if source.get("simhash") is not None and source.get("cluster_id"):
+            index.add(source["unique_id"], dedup.to_unsigned(source["simhash"]), source["cluster_id"])
+    return index
+
+def _assign_clusters(documents: List[Dict[str, Any]]):
+    """为一批文档计算指纹并分配簇ID"""
+    values = [dedup.fingerprint(document["title"], document["digest"]) for document in documents]
+    index = _load_candidates([value for value in values if value is not None])
+    clusters = dedup.assign_clusters(
+        ((document["unique_id"], value) for document, value in zip(documents, values)), index
+    )
+    for document, value, cluster_id in zip(documents, values, clusters):
+        document["simhash"] = dedup.to_signed(value) if value is not None else None
+        document["simhash_bands"] = dedup.band_keys(value) if value is not None else []
+        document["cluster_id"] = cluster_id
+
+def _assign_embeddings(documents: List[Dict[str, Any]]):
+    """为一批文档整批编码向量，没有向量模型时为None"""
+    for document, vector in zip(documents, embedding.encode_articles(documents)):
+        document["embedding"] = vector
+
+def _upsert_action(article: ArticleIn, document: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "_op_type": "update",
+        "_index": ES_INDEX,
+        "_id": document["unique_id"],
+        "doc": _update_fields(article, document),
+        "upsert": document
+    }
+
+def _to_article(source: Dict[str, Any]) -> Dict[str, Any]:
+    """文档转为与MySQL模式相同字段的文章字典，id为None"""
+    return {field: source.get(field) for field in ARTICLE_FULL.fields}
 
 def save_article_data(request_data: Dict[str, Any]) -> Dict[str, Any]:
     """
-    保存文章数据到Elasticsearch
-    
+    批量保存文章数据到Elasticsearch
+
     Args:
         request_data: 包含文章数据的请求
-    
+
     Returns:
         Dict: 包含保存结果的字典
     """
     try:
-        # 打印原始数据结构，帮助调试
-        logger.info(f"接收到的数据结构: {type(request_data)}")
-        logger.info(f"数据顶层键: {list(request_data.keys()) if isinstance(request_data, dict) else '非字典'}")
-        
-        # 适应多种可能的数据结构
-        articles = []
-        
-        # 检查是否有多层嵌套结构
-        if isinstance(request_data, dict):
-            logger.info("处理字典类型数据")
-            
-            # 情况1: 直接包含文章列表的数据结构 {"data": [...]}
-            if "data" in request_data and isinstance(request_data["data"], list):
-                logger.info("情况1: 数据直接包含文章列表")
-                articles = request_data["data"]
-                
-            # 情况2: 更深层嵌套 {"data": {"data": {"data": [...]}}}
-            elif "data" in request_data:
-                data_level1 = request_data["data"]
-                logger.info(f"数据第一层: {type(data_level1)}")
-                
-                if isinstance(data_level1, dict):
-                    # 检查第二层
-                    if "data" in data_level1:
-                        data_level2 = data_level1["data"]
-                        logger.info(f"数据第二层: {type(data_level2)}")
-                        
-                        # 可能是直接的文章列表
-                        if isinstance(data_level2, list):
-                            logger.info("情况2.1: 二层嵌套文章列表")
-                            articles = data_level2
-                            
-                        # 可能还有第三层
-                        elif isinstance(data_level2, dict):
-                            if "data" in data_level2:
-                                data_level3 = data_level2["data"]
-                                logger.info(f"数据第三层: {type(data_level3)}")
-                                
-                                if isinstance(data_level3, list):
-                                    logger.info("情况2.2: 三层嵌套文章列表")
-                                    articles = data_level3
-            
-            # 如果仍未找到文章，尝试递归查找文章列表
-            if not articles:
-                logger.info("尝试递归查找文章列表")
-                articles = find_articles_recursively(request_data)
-        else:
+        with tracing.span("extract_articles"):
+            articles = extract_articles(request_data)
+        if articles is None:
             return {"success": False, "message": "请求数据格式不正确", "saved": 0}
-        
+
         logger.info(f"找到 {len(articles)} 篇文章")
-        
+
         if not articles:
             return {"success": False, "message": "没有找到文章数据", "saved": 0}
-        
-        # 准备批量操作
-        bulk_data = []
-        now = datetime.now().isoformat()
-        
-        for article in articles:
-            # 生成唯一ID
-            unique_id = f"{article.get('biz', '')}-{article.get('mid', '')}-{article.get('idx', '')}"
-            # 检查是否所有部分都存在
-            parts = unique_id.split('-')
-            if len(parts) != 3 or not all(parts) or unique_id == "--":
-                # 如果缺少任何部分，生成随机ID
-                logger.warning(f"文章缺少完整标识信息，使用随机ID: biz={article.get('biz', '')}, mid={article.get('mid', '')}, idx={article.get('idx', '')}")
-                unique_id = str(uuid.uuid4())
+
+        # 整批校验，不合法的文章不写入
+        with tracing.span("validate_articles", articles=len(articles)):
+            valid, errors = validate_articles(articles)
+        if errors:
+            logger.warning(f"{len(errors)} 篇文章未通过校验")
+            INGEST_ARTICLES.labels("invalid").inc(len(errors))
+
+        now = _now()
+        positions = [index for index, _ in valid]
+        documents = [_article_document(article, now) for _, article in valid]
+        _assign_clusters(documents)
+        _assign_embeddings(documents)
+        actions = [_upsert_action(article, document) for (_, article), document in zip(valid, documents)]
+
+        saved_count = 0
+        failed_count = len(errors)
+        # streaming_bulk 按提交顺序返回每个操作的结果
+        for index, (ok, item) in zip(positions, helpers.streaming_bulk(
+            es_client, actions, chunk_size=ES_BULK_CHUNK_SIZE, raise_on_error=False, raise_on_exception=False
+        )):
+            info = item["update"]
+            if ok:
+                saved_count += 1
+                INGEST_ARTICLES.labels("saved" if info.get("result") == "created" else "updated").inc()
             else:
-                logger.info(f"为文章生成唯一ID: {unique_id}")
-            
-            # 转换发布时间
-            pub_time = article.get("pub_time", "")
-            pub_time_iso = None
-            if pub_time:
-                try:
-                    pub_time_iso = datetime.fromtimestamp(int(pub_time)).isoformat()
-                except (ValueError, TypeError):
-                    pub_time_iso = None
-            
-            # 准备文档
-            doc = {
-                "url": article.get("url", ""),
-                "title": article.get("title", ""),
-                "digest": article.get("digest", ""),
-                "pub_time": pub_time,
-                "pub_time_iso": pub_time_iso,
-                "cover": article.get("cover", ""),
-                "bizname": article.get("bizname", ""),
-                "biz": article.get("biz", ""),
-                "unique_id": unique_id,
-                "created_at": now
-            }
-            
-            # 添加到批量操作
-            bulk_data.append({
-                "_index": ES_ARTICLES_INDEX,
-                "_id": unique_id,
-                "_source": doc
-            })
-        
-        # 执行批量操作
-        if bulk_data:
-            success, failed = helpers.bulk(
-                es_client,
-                bulk_data,
-                stats_only=True
-            )
-            return {
-                "success": True,
-                "message": f"成功保存 {success} 篇文章，失败 {failed} 篇",
-                "saved": success,
-                "failed": failed
-            }
-        else:
-            return {"success": False, "message": "没有有效的文章数据", "saved": 0}
-    
+                failed_count += 1
+                error = info.get("error", info.get("status"))
+                errors.append(storage_error(index, error))
+                INGEST_ARTICLES.labels("failed").inc()
+                logger.error(f"保存单篇文章时发生错误: {info.get('_id')} {error}")
+
+        return {
+            "success": True,
+            "message": f"成功保存 {saved_count} 篇文章，失败 {failed_count} 篇",
+            "saved": saved_count,
+            "failed": failed_count,
+            "errors": sorted(errors, key=lambda item: item["index"])
+        }
+
     except Exception as e:
         logger.error(f"保存文章数据时发生错误: {e}")
         return {"success": False, "message": f"保存文章数据时发生错误: {str(e)}", "saved": 0}
 
-def find_articles_recursively(data: Any, max_depth: int = 5, current_depth: int = 0) -> List[Dict[str, Any]]:
-    """
-    递归查找数据结构中的文章列表
-    
-    Args:
-        data: 要搜索的数据
-        max_depth: 最大递归深度
-        current_depth: 当前递归深度
-    
-    Returns:
-        List: 找到的文章列表
-    """
-    # 防止过深递归
-    if current_depth >= max_depth:
-        return []
-    
-    # 如果是列表，检查是否为文章列表
-    if isinstance(data, list) and len(data) > 0:
-        # 检查第一个元素是否像文章
-        if isinstance(data[0], dict) and any(k in data[0] for k in ['title', 'url', 'bizname']):
-            return data
-    
-    # 如果是字典，递归检查所有值
-    if isinstance(data, dict):
-        for key, value in data.items():
-            # 特别检查名为"data"的键
-            if key == "data":
-                if isinstance(value, list):
-                    # 检查是否为文章列表
-                    if len(value) > 0 and isinstance(value[0], dict) and any(k in value[0] for k in ['title', 'url', 'bizname']):
-                        return value
-                
-                # 递归检查
-                result = find_articles_recursively(value, max_depth, current_depth + 1)
-                if result:
-                    return result
-            
-            # 递归检查其他键
-            result = find_articles_recursively(value, max_depth, current_depth + 1)
-            if result:
-                return result
-    
-    return []
-
-def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]:
+def add_single_article(article_data: Dict[str, Any]) -> Dict[str, Any]:
     """
-    搜索文章
-    
+    添加单篇文章，写入后立即刷新
+
     Args:
-        query: 搜索关键词
-        page: 页码，从1开始
-        size: 每页结果数
-    
+        article_data: 文章数据
+
     Returns:
-        Dict: 包含搜索结果的字典
+        Dict: 包含操作结果的字典
     """
     try:
-        # 计算偏移量
-        from_val = (page - 1) * size
-        
-        # 构建查询
-        search_query = {
-            "query": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["title^3", "digest^2", "bizname"],
-                    "type": "best_fields",
-                    "operator": "or",
-                    "minimum_should_match": "70%"
-                }
-            },
-            "highlight": {
-                "fields": {
-                    "title": {"number_of_fragments": 0},
-                    "digest": {"number_of_fragments": 2, "fragment_size": 150}
-                },
-                "pre_tags": ["<em>"],
-                "post_tags": ["</em>"],
-                "encoder": "html"  # 确保HTML标签不被转义
-            },
-            "sort": [
-                "_score",
-                {"pub_time_iso": {"order": "desc"}}
-            ],
-            "from": from_val,
-            "size": size
+        if not article_data:
+            return {"success": False, "message": "文章数据为空", "saved": 0}
+
+        try:
+            article = validate_article(article_data)
+        except ValidationError as e:
+            return {"success": False, "message": "文章数据不合法", "saved": 0, "errors": error_report(e)}
+
+        document = _article_document(article, _now())
+        _assign_clusters([document])
+        _assign_embeddings([document])
+        action = _upsert_action(article, document)
+        response = es_client.update(
+            index=ES_INDEX,
+            id=action["_id"],
+            doc=action["doc"],
+            upsert=action["upsert"],
+            refresh=True,
+            source=True
+        )
+        article = _to_article(response["get"]["_source"])
+        verb = "添加" if response["result"] == "created" else "更新"
+        return {
+            "success": True,
+            "message": f"成功{verb}文章: {article['title']}",
+            "id": action["_id"],
+            "article": article
         }
-        
-        # 执行搜索
-        start_time = datetime.now()
+
+    except Exception as e:
+        logger.error(f"添加文章时发生错误: {e}")
+        return {"success": False, "message": f"添加文章时发生错误: {str(e)}", "saved": 0}
+
+def get_all_articles(
+    page: int = 1, size: int = 20, sort_by: str = "pub_time_iso", sort_order: str = "desc"
+) -> Dict[str, Any]:
+    """获取所有文章，不可排序的字段按发布时间倒序"""
+    try:
+        order = "desc" if sort_order.lower() == "desc" else "asc"
+        if sort_by not in SORTABLE_FIELDS:
+            sort_by, order = "pub_time_iso", "desc"
+
         response = es_client.search(
-            index=ES_ARTICLES_INDEX,
-            body=search_query
+            index=ES_INDEX,
+            body={
+                "query": {"match_all": {}},
+                # unique_id作为次级排序，保证分页稳定
+                "sort": [{sort_by: {"order": order}}, {"unique_id": {"order": order}}],
+                "_source": {"excludes": ["embedding"]},
+                "from": (page - 1) * size,
+                "size": size,
+                "track_total_hits": True
+            }
         )
-        end_time = datetime.now()
-        took_ms = (end_time - start_time).total_seconds() * 1000
-        
-        # 处理结果
-        hits = response["hits"]["hits"]
-        total = response["hits"]["total"]["value"]
-        
-        results = []
-        for hit in hits:
-            source = hit["_source"]
-            highlight = hit.get("highlight", {})
-            
-            # 应用高亮
-            if "title" in highlight:
-                source["title"] = highlight["title"][0]
-            if "digest" in highlight:
-                source["digest"] = "...".join(highlight["digest"])
-            
-            results.append(source)
-        
+
         return {
-            "query": query,
             "page": page,
             "size": size,
-            "total": total,
-            "took": took_ms,
-            "results": results
+            "total": response["hits"]["total"]["value"],
+            "articles": [_to_article(hit["_source"]) for hit in response["hits"]["hits"]]
         }
-    
+
     except Exception as e:
-        logger.error(f"搜索文章时发生错误: {e}")
+        logger.error(f"获取所有文章时发生错误: {e}")
         return {
-            "query": query,
             "page": page,
             "size": size,
             "total": 0,
-            "took": 0,
-            "results": [],
+            "articles": [],
             "error": str(e)
         }
 
-def get_logs(start_time: Optional[str] = None, end_time: Optional[str] = None, 
-             page: int = 1, size: int = 50) -> Dict[str, Any]:
+def _scan_batches(query: Dict[str, Any], batch_size: int, keep_alive: str = "1m") -> Iterator[List[Dict[str, Any]]]:
+    """使用PIT + search_after按索引内部顺序分批读取文章，每批为文档的 _source 列表"""
+    pit_id = es_client.open_point_in_time(index=ES_INDEX, keep_alive=keep_alive)["id"]
+    try:
+        search_after = None
+        while True:
+            body = {
+                "query": query,
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "sort": [{"_shard_doc": "asc"}],
+                "_source": {"excludes": ["embedding"]},
+                "size": batch_size,
+                "track_total_hits": False
+            }
+            if search_after:
+                body["search_after"] = search_after
+
+            response = es_client.search(body=body)
+            hits = response["hits"]["hits"]
+            if not hits:
+                break
+
+            # PIT id 可能在每次请求后变化
+            pit_id = response.get("pit_id", pit_id)
+            search_after = hits[-1]["sort"]
+            yield [hit["_source"] for hit in hits]
+    finally:
+        try:
+            es_client.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"关闭PIT时发生错误: {e}")
+
+def iter_articles(
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    biz: Optional[str] = None,
+    batch_size: int = 1000,
+    keep_alive: str = "1m"
+) -> Iterator[Dict[str, Any]]:
+    """
+    使用PIT + search_after流式读取文章（按索引内部顺序），内存占用与文章总数无关
+
+    Yields:
+        Dict: 单篇文章，字段与 ARTICLE_DOCUMENT 相同
     """
-    获取日志
-    
+    filters = []
+    if start_time or end_time:
+        pub_range = {}
+        if start_time:
+            pub_range["gte"] = start_time.isoformat()
+        if end_time:
+            pub_range["lte"] = end_time.isoformat()
+        filters.append({"range": {"pub_time_iso": pub_range}})
+    if biz:
+        filters.append({"term": {"biz": biz}})
+
+    query = {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+    for sources in _scan_batches(query, batch_size, keep_alive):
+        for source in sources:
+            yield {field: source.get(field) for field in ARTICLE_DOCUMENT.fields}
+
+def backfill_clusters(batch_size: int = dedup.DEDUP_BATCH_SIZE, reset: bool = False) -> Dict[str, Any]:
+    """
+    为没有簇ID的文章计算指纹和簇ID，每批一次候选查询和一次bulk部分更新（刷新后下一批可见）
+
     Args:
-        start_time: 开始时间（ISO格式）
-        end_time: 结束时间（ISO格式）
-        page: 页码，从1开始
-        size: 每页结果数
-    
+        batch_size: 每批处理的文章数
+        reset: 先用update_by_query清除全部文章的簇ID再重新计算
+
     Returns:
-        Dict: 包含日志结果的字典
+        Dict: 处理的文章数和归入已有簇的文章数
     """
     try:
-        # 计算偏移量
-        from_val = (page - 1) * size
-        
-        # 构建查询
-        query_parts = []
-        if start_time:
-            query_parts.append({"range": {"timestamp": {"gte": start_time}}})
-        if end_time:
-            query_parts.append({"range": {"timestamp": {"lte": end_time}}})
-        
-        query = {"match_all": {}}
-        if query_parts:
-            query = {"bool": {"must": query_parts}}
-        
-        search_query = {
-            "query": query,
-            "sort": [{"timestamp": {"order": "desc"}}],
-            "from": from_val,
-            "size": size
-        }
-        
-        # 执行搜索
-        response = es_client.search(
-            index=ES_LOGS_INDEX,
-            body=search_query
-        )
-        
-        # 处理结果
-        hits = response["hits"]["hits"]
-        total = response["hits"]["total"]["value"]
-        
-        logs = [hit["_source"] for hit in hits]
-        
+        if reset:
+            es_client.update_by_query(
+                index=ES_INDEX,
+                query={"exists": {"field": "cluster_id"}},
+                script={"source": "for (f in params.fields) { ctx._source.remove(f) }", "params": {"fields": list(CLUSTER_FIELDS)}},
+                conflicts="proceed",
+                refresh=True
+            )
+            logger.info("已清空全部簇ID")
+
+        processed = duplicates = 0
+        query = {"bool": {"must_not": [{"exists": {"field": "cluster_id"}}]}}
+        for sources in _scan_batches(query, batch_size):
+            documents = [
+                {"unique_id": source["unique_id"], "title": source.get("title"), "digest": source.get("digest")}
+                for source in sources
+            ]
+            _assign_clusters(documents)
+            actions = [
+                {
+                    "_op_type": "update",
+                    "_index": ES_INDEX,
+                    "_id": document["unique_id"],
+                    "doc": {field: document[field] for field in CLUSTER_FIELDS}
+                }
+                for document in documents
+            ]
+            helpers.bulk(es_client, actions, chunk_size=ES_BULK_CHUNK_SIZE, refresh=True)
+            processed += len(documents)
+            duplicates += sum(document["cluster_id"] != document["unique_id"] for document in documents)
+            logger.info(f"已回填 {processed} 篇文章的簇ID，其中近似重复 {duplicates} 篇")
+
         return {
-            "page": page,
-            "size": size,
-            "total": total,
-            "logs": logs
+            "success": True,
+            "message": f"回填 {processed} 篇文章，近似重复 {duplicates} 篇",
+            "processed": processed,
+            "duplicates": duplicates
         }
-    
     except Exception as e:
-        logger.error(f"获取日志时发生错误: {e}")
-        return {
-            "page": page,
-            "size": size,
-            "total": 0,
-            "logs": [],
-            "error": str(e)
-        }
+        logger.error(f"回填簇ID时发生错误: {e}")
+        return {"success": False, "message": f"回填簇ID时发生错误: {str(e)}", "processed": 0, "duplicates": 0}
 
 def delete_article(article_id: str) -> Dict[str, Any]:
-    """
-    删除指定ID的文章
-    
-    Args:
-        article_id: 文章唯一ID
-    
-    Returns:
-        Dict: 包含删除结果的字典
-    """
+    """删除指定ID的文章"""
     try:
-        response = es_client.delete(
-            index=ES_ARTICLES_INDEX,
-            id=article_id,
-            refresh=True
-        )
-        
+        es_client.delete(index=ES_INDEX, id=article_id, refresh=True)
         return {
             "success": True,
             "message": f"成功删除文章 ID: {article_id}",
@@ -567,254 +502,185 @@ def delete_article(article_id: str) -> Dict[str, Any]:
             "deleted": False
         }
 
-def clear_articles() -> Dict[str, Any]:
-    """
-    清空所有文章（删除并重建索引）
-    
-    Returns:
-        Dict: 包含操作结果的字典
-    """
+def _delete_query(criteria: Dict[str, Any]) -> Dict[str, Any]:
+    """批量删除条件对应的查询，bizname 是text字段，按短语匹配"""
+    filters = []
+    if criteria.get("ids"):
+        filters.append({"terms": {"unique_id": criteria["ids"]}})
+    if criteria.get("biz"):
+        filters.append({"term": {"biz": criteria["biz"]}})
+    if criteria.get("bizname"):
+        filters.append({"match_phrase": {"bizname": criteria["bizname"]}})
+    if criteria.get("start") or criteria.get("end"):
+        bounds = {}
+        if criteria.get("start"):
+            bounds["gte"] = criteria["start"].isoformat()
+        if criteria.get("end"):
+            bounds["lte"] = criteria["end"].isoformat()
+        filters.append({"range": {"pub_time_iso": bounds}})
+    return {"bool": {"filter": filters}}
+
+def _submit_delete(query: Dict[str, Any], action: str) -> Dict[str, Any]:
+    """提交异步执行的 delete_by_query，任务ID为ES的任务ID"""
     try:
-        # 检查索引是否存在
-        if es_client.indices.exists(index=ES_ARTICLES_INDEX):
-            # 删除索引
-            es_client.indices.delete(index=ES_ARTICLES_INDEX)
-            logger.info(f"已删除索引: {ES_ARTICLES_INDEX}")
-            
-            # 重建索引
-            try:
-                es_client.indices.create(
-                    index=ES_ARTICLES_INDEX,
-                    body=ARTICLES_MAPPING
-                )
-                logger.info(f"已重建索引: {ES_ARTICLES_INDEX}")
-                
-                return {
-                    "success": True,
-                    "message": "所有文章已清空，索引已重建"
-                }
-            except Exception as create_error:
-                logger.error(f"重建索引时发生错误: {create_error}")
-                
-                # 尝试使用基本设置重建索引
-                try:
-                    basic_mapping = {
-                        "mappings": {
-                            "properties": {
-                                "url": {"type": "keyword"},
-                                "title": {"type": "text"},
-                                "digest": {"type": "text"},
-                                "pub_time": {"type": "long"},
-                                "pub_time_iso": {"type": "date"},
-                                "cover": {"type": "keyword"},
-                                "bizname": {"type": "text"},
-                                "biz": {"type": "keyword"},
-                                "unique_id": {"type": "keyword"},
-                                "created_at": {"type": "date"}
-                            }
-                        }
-                    }
-                    
-                    es_client.indices.create(
-                        index=ES_ARTICLES_INDEX,
-                        body=basic_mapping
-                    )
-                    logger.info(f"使用基本设置重建索引: {ES_ARTICLES_INDEX}")
-                    
-                    return {
-                        "success": True,
-                        "message": "所有文章已清空，索引已使用基本设置重建"
-                    }
-                except Exception as basic_error:
-                    logger.error(f"使用基本设置重建索引时发生错误: {basic_error}")
-                    return {
-                        "success": False,
-                        "message": f"删除索引成功，但重建索引失败: {str(basic_error)}"
-                    }
-        else:
-            # 如果索引不存在，创建一个新索引
-            try:
-                es_client.indices.create(
-                    index=ES_ARTICLES_INDEX,
-                    body=ARTICLES_MAPPING
-                )
-                logger.info(f"索引不存在，已创建新索引: {ES_ARTICLES_INDEX}")
-                
-                return {
-                    "success": True,
-                    "message": f"索引 {ES_ARTICLES_INDEX} 不存在，已创建新索引"
-                }
-            except Exception as create_error:
-                logger.error(f"创建新索引时发生错误: {create_error}")
-                
-                # 尝试使用基本设置创建索引
-                try:
-                    basic_mapping = {
-                        "mappings": {
-                            "properties": {
-                                "url": {"type": "keyword"},
-                                "title": {"type": "text"},
-                                "digest": {"type": "text"},
-                                "pub_time": {"type": "long"},
-                                "pub_time_iso": {"type": "date"},
-                                "cover": {"type": "keyword"},
-                                "bizname": {"type": "text"},
-                                "biz": {"type": "keyword"},
-                                "unique_id": {"type": "keyword"},
-                                "created_at": {"type": "date"}
-                            }
-                        }
-                    }
-                    
-                    es_client.indices.create(
-                        index=ES_ARTICLES_INDEX,
-                        body=basic_mapping
-                    )
-                    logger.info(f"使用基本设置创建新索引: {ES_ARTICLES_INDEX}")
-                    
-                    return {
-                        "success": True,
-                        "message": f"索引 {ES_ARTICLES_INDEX} 不存在，已使用基本设置创建新索引"
-                    }
-                except Exception as basic_error:
-                    logger.error(f"使用基本设置创建新索引时发生错误: {basic_error}")
-                    return {
-                        "success": False,
-                        "message": f"创建新索引失败: {str(basic_error)}"
-                    }
+        response = es_client.delete_by_query(
+            index=ES_INDEX, query=query, conflicts="proceed", refresh=True,
+            slices="auto", wait_for_completion=False
+        )
+        task_id = response["task"]
+        return {
+            "success": True,
+            "message": f"{action}任务已提交: {task_id}",
+            "job": {"id": task_id, "kind": "delete", "status": "running", "total": None, "processed": 0}
+        }
     except Exception as e:
-        logger.error(f"清空文章时发生错误: {e}")
+        logger.error(f"提交{action}任务时发生错误: {e}")
         return {
             "success": False,
-            "message": f"清空文章时发生错误: {str(e)}"
+            "message": f"提交{action}任务时发生错误: {str(e)}"
         }
 
-def add_single_article(article_data: Dict[str, Any]) -> Dict[str, Any]:
+def delete_articles(criteria: Dict[str, Any]) -> Dict[str, Any]:
+    """提交批量删除任务"""
+    return _submit_delete(_delete_query(criteria), "批量删除")
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """查询 delete_by_query 任务（批量删除和清空都是delete），不存在时返回None"""
+    try:
+        info = es_client.tasks.get(task_id=job_id)
+    except (NotFoundError, BadRequestError):
+        return None
+    task = info["task"]
+    status = task.get("status") or {}
+    response = info.get("response") or {}
+    error = info.get("error") or (response.get("failures") or [None])[0]
+    if error:
+        state, message = "failed", str(error)
+    elif info.get("completed"):
+        state, message = "done", f"成功删除 {response.get('deleted', status.get('deleted', 0))} 篇文章"
+    else:
+        state, message = "running", None
+    return {
+        "id": job_id,
+        "kind": "delete",
+        "status": state,
+        "total": status.get("total"),
+        "processed": response.get("deleted", status.get("deleted", 0)),
+        "message": message,
+        "created_at": datetime.fromtimestamp(task["start_time_in_millis"] / 1000).isoformat()
+    }
+
+def clear_articles() -> Dict[str, Any]:
     """
-    添加单篇文章
-    
-    Args:
-        article_data: 包含文章数据的字典
-    
-    Returns:
-        Dict: 包含添加结果的字典
+    提交清空文章任务
+
+    不删除重建索引：索引重建期间搜索和写入会失败，且不支持取消。改为异步的 match_all delete_by_query，
+    索引一直可用，提交之后写入的文章不受影响。
     """
+    return _submit_delete({"match_all": {}}, "清空")
+
+def save_log(log_data: Dict[str, Any]) -> bool:
+    """保存请求日志到Elasticsearch，文档ID同时写入 log_id 字段作为分页排序的第二键"""
     try:
-        if not article_data:
-            return {"success": False, "message": "文章数据为空", "saved": 0}
-        
-        # 生成唯一ID
-        unique_id = f"{article_data.get('biz', '')}-{article_data.get('mid', '')}-{article_data.get('idx', '')}"
-        # 检查是否所有部分都存在
-        parts = unique_id.split('-')
-        if len(parts) != 3 or not all(parts) or unique_id == "--":
-            # 如果缺少任何部分，生成随机ID
-            logger.warning(f"文章缺少完整标识信息，使用随机ID: biz={article_data.get('biz', '')}, mid={article_data.get('mid', '')}, idx={article_data.get('idx', '')}")
-            unique_id = str(uuid.uuid4())
-        else:
-            logger.info(f"为文章生成唯一ID: {unique_id}")
-        
-        # 转换发布时间
-        pub_time = article_data.get("pub_time", "")
-        pub_time_iso = None
-        if pub_time:
-            try:
-                pub_time_iso = datetime.fromtimestamp(int(pub_time)).isoformat()
-            except (ValueError, TypeError):
-                pub_time_iso = None
-        
-        # 准备文档
-        doc = {
-            "url": article_data.get("url", ""),
-            "title": article_data.get("title", ""),
-            "digest": article_data.get("digest", ""),
-            "pub_time": pub_time,
-            "pub_time_iso": pub_time_iso,
-            "cover": article_data.get("cover", ""),
-            "bizname": article_data.get("bizname", ""),
-            "biz": article_data.get("biz", ""),
-            "unique_id": unique_id,
-            "created_at": datetime.now().isoformat()
-        }
-        
-        # 保存到Elasticsearch
-        response = es_client.index(
-            index=ES_ARTICLES_INDEX,
-            id=unique_id,
-            document=doc,
-            refresh=True
+        now = datetime.now().isoformat()
+        log_id = uuid.uuid4().hex
+        es_client.index(
+            index=ES_LOGS_INDEX,
+            id=log_id,
+            document={
+                "log_id": log_id,
+                "timestamp": now,
+                "method": log_data.get("method"),
+                "path": log_data.get("path"),
+                "client": log_data.get("client"),
+                "data": log_data.get("data"),
+                "created_at": now
+            }
         )
-        
-        return {
-            "success": True,
-            "message": f"成功添加文章: {doc['title']}",
-            "id": unique_id,
-            "article": doc
-        }
-    
+        return True
     except Exception as e:
-        logger.error(f"添加文章时发生错误: {e}")
-        return {"success": False, "message": f"添加文章时发生错误: {str(e)}", "saved": 0}
+        logger.error(f"保存日志时发生错误: {e}")
+        return False
+
+def _log_dict(log_id: str, source: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": log_id,
+        "timestamp": source.get("timestamp"),
+        "method": source.get("method"),
+        "path": source.get("path"),
+        "client": source.get("client"),
+        "payload_codec": None,
+        "payload_size": None,
+        "created_at": source.get("created_at")
+    }
 
-def get_all_articles(page: int = 1, size: int = 20, sort_by: str = "pub_time_iso", sort_order: str = "desc") -> Dict[str, Any]:
+def get_logs(
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    size: int = 50,
+    detail: bool = False
+) -> Dict[str, Any]:
     """
-    获取所有文章
-    
+    按时间倒序分页获取日志，按 (timestamp, log_id) 排序后用 search_after 翻页
+
+    升级前写入的日志没有 log_id，同一毫秒内的这些日志之间顺序不固定，翻页时可能重复或遗漏
+
     Args:
-        page: 页码，从1开始
-        size: 每页结果数
-        sort_by: 排序字段，默认为发布时间
-        sort_order: 排序顺序，默认为降序
-    
-    Returns:
-        Dict: 包含文章列表的字典
+        detail: 是否同时返回请求/响应数据，默认不读取 data
     """
+    position = log_service.decode_cursor(cursor) if cursor else None
     try:
-        # 计算偏移量
-        from_val = (page - 1) * size
-        
-        # 构建查询，匹配所有文档
-        search_query = {
-            "query": {
-                "match_all": {}
-            },
-            "sort": [
-                {sort_by: {"order": sort_order}}
-            ],
-            "from": from_val,
-            "size": size
+        filters = []
+        if start_time:
+            filters.append({"range": {"timestamp": {"gte": start_time.isoformat()}}})
+        if end_time:
+            filters.append({"range": {"timestamp": {"lte": end_time.isoformat()}}})
+        query = {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+        body = {
+            "query": query,
+            "sort": [{"timestamp": {"order": "desc"}}, {"log_id": {"order": "desc"}}],
+            "size": size + 1,
+            "track_total_hits": False
         }
-        
-        # 执行搜索
-        response = es_client.search(
-            index=ES_ARTICLES_INDEX,
-            body=search_query
-        )
-        
-        # 处理结果
+        if not detail:
+            body["_source"] = {"excludes": ["data"]}
+        if position:
+            body["search_after"] = position
+        response = es_client.search(index=ES_LOGS_INDEX, body=body)
+
         hits = response["hits"]["hits"]
-        total = response["hits"]["total"]["value"]
-        
-        # 提取文章数据
-        articles = [hit["_source"] for hit in hits]
-        
+        has_more = len(hits) > size
+        hits = hits[:size]
+        logs = []
+        for hit in hits:
+            item = _log_dict(hit["_id"], hit["_source"])
+            if detail:
+                item["data"] = hit["_source"].get("data")
+            logs.append(item)
+
         return {
-            "page": page,
             "size": size,
-            "total": total,
-            "articles": articles
+            "logs": logs,
+            "cursor": log_service.encode_cursor(hits[-1]["sort"]) if has_more else None,
+            "has_more": has_more
         }
-    
+
     except Exception as e:
-        logger.error(f"获取所有文章时发生错误: {e}")
+        logger.error(f"获取日志时发生错误: {e}")
         return {
-            "page": page,
             "size": size,
-            "total": 0,
-            "articles": [],
+            "logs": [],
+            "cursor": None,
+            "has_more": False,
             "error": str(e)
         }
 
-# 初始化索引
-if __name__ != "__main__":
-    initialize_indices() 
\ No newline at end of file
+def get_log(log_id: str) -> Optional[Dict[str, Any]]:
+    """单条日志的完整内容，不存在时返回None"""
+    try:
+        response = es_client.get(index=ES_LOGS_INDEX, id=log_id)
+    except NotFoundError:
+        return None
+    return {**_log_dict(response["_id"], response["_source"]), "data": response["_source"].get("data")}
@@ -2,36 +2,70 @@
 FastAPI server for WeChat article search system.
 """
 import os
+import time
 import logging
+from datetime import datetime
+from typing import Optional
 from fastapi import FastAPI, Request, Query, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 
 # 导入数据库依赖
-from app.models.database import get_db, engine, Base
+from app.models.database import get_db, get_read_db, engine, replica_engines, replica_router
 import app.models.article
 import app.models.log
+import app.models.pending_index
+import app.models.data_version
+import app.models.simhash_band
+import app.models.related_article
+import app.models.article_tombstone
+import app.models.article_job
+import app.models.log_rollup
+from app.connections import db_pool_stats, es_pool_stats, get_es_client, register_pool_metrics, es_breaker
+from app.circuit_breaker import CircuitOpenError
+from app import metrics
+from app import tracing
+from app.admission import AdmissionMiddleware
+from app.responses import FastJSONResponse, CompressionMiddleware
+from app.schemas import ArticleDeleteFilter
 
 # 导入业务逻辑
-from app.services import article as article_service
-from app.services import search as search_service
-from app.services import log as log_service
-
-# 初始化数据库表
-Base.metadata.create_all(bind=engine)
+from app.services import data_version
+from app.services import changes as changes_service
+from app.services import export as export_service
+from app.services.storage import storage
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 多进程部署时由 run.py 在主进程中初始化一次，工作进程跳过
+APP_INIT_ON_STARTUP = os.environ.get("APP_INIT_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Elasticsearch熔断时搜索的处理方式：none 直接返回503，mysql 降级为MySQL模糊匹配
+ES_SEARCH_FALLBACK = os.environ.get("ES_SEARCH_FALLBACK", "none").lower()
+
+def initialize_storage():
+    """初始化存储后端：mysql+es 模式建表、执行结构迁移并创建搜索索引，es-only 模式创建ES索引"""
+    storage.initialize()
+
+if APP_INIT_ON_STARTUP:
+    initialize_storage()
+
 # 创建FastAPI应用
 app = FastAPI(
     title="WeChat Article Search API",
-    description="API for searching WeChat articles using MySQL + Elasticsearch",
-    version="2.0.0"
+    description="API for searching WeChat articles using MySQL + Elasticsearch (or Elasticsearch only)",
+    version="2.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# 准入控制：按客户端限流并限制 /artlist/、/search/ 的并发，放在CORS内层以便429响应带CORS头
+app.add_middleware(AdmissionMiddleware)
+
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -41,45 +75,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化搜索索引
-search_service.init_search_index()
+# 响应压缩（gzip/brotli）
+app.add_middleware(CompressionMiddleware)
+
+# 指标采集
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+for replica_engine in replica_engines:
+    metrics.instrument_engine(replica_engine)
+register_pool_metrics(engine)
+
+# 请求追踪：按采样导出每个请求的阶段耗时，放在最外层以覆盖其他中间件
+app.add_middleware(tracing.TracingMiddleware)
+tracing.instrument_engine(engine)
+for replica_engine in replica_engines:
+    tracing.instrument_engine(replica_engine)
+tracing.instrument_sessions()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """启动后台任务"""
+    storage.start()
+    replica_router.start()
+    metrics.start_metrics_flusher()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """停止后台任务并释放连接"""
+    storage.stop()
+    replica_router.stop()
+    metrics.stop_metrics_flusher()
+    tracing.stop_trace_exporter()
+    engine.dispose()
+    get_es_client().close()
 
 # API端点定义（保持兼容现有API）
 @app.post("/artlist/")
 async def save_articles(request: Request, db: Session = Depends(get_db)):
     """保存文章列表"""
     try:
-        data = await request.json()
-        result = article_service.save_article_data(db, data)
+        with tracing.span("parse_json"):
+            data = await request.json()
+        # 数据库和ES调用是阻塞的，放到线程池中执行，避免阻塞事件循环上的其他请求
+        start = time.perf_counter()
+        with tracing.span("save_articles"):
+            result = await run_in_threadpool(storage.save_articles, db, data)
         
         # 记录日志
         log_data = {
             "method": request.method,
             "path": request.url.path,
             "client": request.client.host,
+            "latency_ms": (time.perf_counter() - start) * 1000,
             "data": {
                 "request": data,
                 "response": result
             }
         }
-        log_service.save_log(db, log_data)
+        with tracing.span("save_log"):
+            await run_in_threadpool(storage.save_log, db, log_data)
         
-        return result
+        return FastJSONResponse(result)
     except Exception as e:
         logger.error(f"处理请求时发生错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _service_unavailable(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="搜索服务暂时不可用",
+        headers={"Retry-After": str(max(int(retry_after), 1))}
+    )
+
 @app.get("/search/")
-async def search(
+def search(
+    request: Request,
     q: str = Query(..., description="搜索关键词"),
     page: int = Query(1, ge=1, description="页码"),
     size: int = Query(10, ge=1, le=50, description="每页结果数"),
-    db: Session = Depends(get_db)
+    collapse: bool = Query(False, description="按近似重复簇折叠结果"),
+    mode: str = Query("lexical", pattern="^(lexical|hybrid)$", description="lexical：关键词；hybrid：关键词+向量"),
+    db: Session = Depends(get_read_db)
 ):
     """搜索文章"""
+    # 数据未变化时直接返回304，不查询ES
+    validators = storage.validators(db, "search")
+    if validators and data_version.not_modified(request, validators):
+        return Response(status_code=304, headers=validators.headers)
+
     try:
         # 首先用ES搜索
-        search_result = search_service.search_articles(q, page, size)
+        search_result = storage.search(db, q, page, size, collapse, mode)
         
         # 如果有匹配结果，从MySQL获取完整数据
         if search_result["total"] > 0 and "unique_ids" in search_result:
@@ -90,30 +176,181 @@ async def search(
             # 将完整数据与高亮结果合并
             # ...
         
-        return search_result
+        # 直接返回响应对象，跳过FastAPI对返回值的通用编码遍历；出错的结果不可缓存
+        headers = validators.headers if validators and "error" not in search_result else None
+        return FastJSONResponse(search_result, headers=headers)
+    except CircuitOpenError as e:
+        fallback = storage.search_fallback(db, q, page, size) if ES_SEARCH_FALLBACK == "mysql" else None
+        if fallback is None:
+            raise _service_unavailable(e.retry_after)
+        return FastJSONResponse(fallback)
     except Exception as e:
         logger.error(f"搜索文章时发生错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/search/export")
+async def export_search(
+    q: str = Query(..., description="搜索关键词"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="导出格式"),
+    start: Optional[datetime] = Query(None, description="发布时间下限（ISO格式）"),
+    end: Optional[datetime] = Query(None, description="发布时间上限（ISO格式）")
+):
+    """流式导出全部搜索结果"""
+    if es_breaker.is_open():
+        raise _service_unavailable(es_breaker.retry_after())
+    return StreamingResponse(
+        export_service.export_search_results(format, q, start, end),
+        media_type=export_service.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="search.{format}"'}
+    )
+
 @app.get("/articles/")
-async def get_articles(
+def get_articles(
+    request: Request,
     page: int = Query(1, ge=1, description="页码"),
     size: int = Query(20, ge=1, le=100, description="每页结果数"),
     sort_by: str = Query("pub_time_iso", description="排序字段"),
     sort_order: str = Query("desc", description="排序顺序"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """获取所有文章"""
-    return article_service.get_all_articles(db, page, size, sort_by, sort_order)
+    # 数据未变化时直接返回304，不查询MySQL
+    validators = storage.validators(db, "articles")
+    if validators and data_version.not_modified(request, validators):
+        return Response(status_code=304, headers=validators.headers)
+
+    result = storage.get_articles(db, page, size, sort_by, sort_order)
+    headers = validators.headers if validators and "error" not in result else None
+    return FastJSONResponse(result, headers=headers)
+
+@app.get("/articles/changes")
+def get_article_changes(
+    since: Optional[str] = Query(None, description="上次返回的游标，为空时从头开始"),
+    limit: int = Query(500, ge=1, le=1000, description="最多返回的变更数"),
+    db: Session = Depends(get_db)
+):
+    """按变更顺序返回新增、更新和删除的文章"""
+    try:
+        result = storage.get_changes(db, since, limit)
+    except changes_service.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except changes_service.CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=501, detail=f"{storage.name} 存储模式不支持变更订阅")
+    return FastJSONResponse(result)
+
+@app.get("/articles/export")
+async def export_articles(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="导出格式"),
+    start: Optional[datetime] = Query(None, description="发布时间下限（ISO格式）"),
+    end: Optional[datetime] = Query(None, description="发布时间上限（ISO格式）"),
+    biz: Optional[str] = Query(None, description="公众号biz")
+):
+    """流式导出文章"""
+    return StreamingResponse(
+        export_service.export_articles(format, start, end, biz),
+        media_type=export_service.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="articles.{format}"'}
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus格式的指标"""
+    return PlainTextResponse(
+        metrics.render(metrics.collect()),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.get("/stats/pools")
+async def get_pool_stats():
+    """MySQL和Elasticsearch连接池使用情况"""
+    return {
+        "storage": storage.name,
+        "mysql": db_pool_stats(engine),
+        "mysql_replicas": replica_router.status(),
+        "elasticsearch": es_pool_stats()
+    }
+
+@app.get("/logs/")
+def get_logs(
+    start: Optional[datetime] = Query(None, description="开始时间（ISO格式）"),
+    end: Optional[datetime] = Query(None, description="结束时间（ISO格式）"),
+    cursor: Optional[str] = Query(None, description="上一页返回的游标，为空时从最新的日志开始"),
+    size: int = Query(50, ge=1, le=100, description="每页条数"),
+    db: Session = Depends(get_read_db)
+):
+    """按时间倒序分页获取日志，不含请求/响应数据"""
+    try:
+        return FastJSONResponse(storage.get_logs(db, start, end, cursor, size))
+    except changes_service.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/logs/{log_id}")
+def get_log(log_id: str, db: Session = Depends(get_read_db)):
+    """单条日志的完整内容，包括请求和响应数据"""
+    log = storage.get_log(db, log_id)
+    if log is None:
+        raise HTTPException(status_code=404, detail=f"未找到日志: {log_id}")
+    return FastJSONResponse(log)
+
+@app.get("/stats/ingest")
+def get_ingest_stats(
+    start: Optional[datetime] = Query(None, description="开始时间（ISO格式），默认为结束时间前24小时（minute为前1小时）"),
+    end: Optional[datetime] = Query(None, description="结束时间（ISO格式），默认为当前时间"),
+    period: str = Query("hour", pattern="^(minute|hour)$", description="时间桶：minute 或 hour"),
+    group_by: Optional[str] = Query(None, description="时间桶之外的分组字段，逗号分隔：path、client、success"),
+    path: Optional[str] = Query(None, description="只统计该路径"),
+    client: Optional[str] = Query(None, description="只统计该客户端"),
+    db: Session = Depends(get_read_db)
+):
+    """按分钟或小时汇总的请求数、保存的文章数和耗时，只读汇总表"""
+    fields = [field.strip() for field in group_by.split(",") if field.strip()] if group_by else []
+    unknown = [field for field in fields if field not in ("path", "client", "success")]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的分组字段: {', '.join(unknown)}")
+    result = storage.get_ingest_stats(db, start, end, period, fields, path, client)
+    if result is None:
+        raise HTTPException(status_code=501, detail=f"{storage.name} 存储模式不支持请求统计")
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return FastJSONResponse(result)
+
+@app.get("/article/{article_id}/related")
+def get_related_articles(
+    article_id: str,
+    size: int = Query(10, ge=1, le=50, description="返回的相关文章数"),
+    db: Session = Depends(get_read_db)
+):
+    """预计算的相关文章"""
+    result = storage.get_related(db, article_id, size)
+    if result is None:
+        raise HTTPException(status_code=501, detail=f"{storage.name} 存储模式不支持相关文章")
+    return FastJSONResponse(result)
 
 @app.delete("/article/{article_id}")
-async def delete_article(article_id: str, db: Session = Depends(get_db)):
+def delete_article(article_id: str, db: Session = Depends(get_db)):
     """删除指定ID的文章"""
-    return article_service.delete_article_by_id(db, article_id)
+    return storage.delete_article(db, article_id)
+
+@app.post("/articles/delete", status_code=202)
+def delete_articles(criteria: ArticleDeleteFilter, db: Session = Depends(get_db)):
+    """按ID列表或条件（biz、bizname、发布时间范围）批量删除文章，后台执行，返回任务"""
+    result = storage.delete_articles(db, criteria.model_dump(exclude_none=True))
+    return FastJSONResponse(result, status_code=202 if result["success"] else 500)
+
+@app.get("/articles/jobs/{job_id}")
+def get_article_job(job_id: str, db: Session = Depends(get_db)):
+    """后台任务的状态和进度"""
+    job = storage.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"未找到任务: {job_id}")
+    return FastJSONResponse(job)
 
-@app.delete("/articles/all")
-async def clear_all_articles(db: Session = Depends(get_db)):
-    """清空所有文章"""
-    return article_service.clear_articles(db)
+@app.delete("/articles/all", status_code=202)
+def clear_all_articles(db: Session = Depends(get_db)):
+    """清空所有文章，后台执行，返回任务（通过 GET /articles/jobs/{job_id} 查询进度）"""
+    result = storage.clear_articles(db)
+    return FastJSONResponse(result, status_code=202 if result["success"] else 500)
 
 # [其他API端点保持不变]
\ No newline at end of file
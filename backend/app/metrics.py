@@ -0,0 +1,392 @@
+"""Prometheus指标
+
+轻量的进程内指标实现（计数器、直方图、仪表），按Prometheus文本格式输出，
+不依赖 prometheus_client。热点路径上每次记录只有一次加锁的加法。
+
+多进程部署时设置 METRICS_MULTIPROC_DIR，各工作进程定期把自身指标写入该目录，
+/metrics 汇总所有存活进程的数据。
+"""
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 多进程汇总目录，未设置时只输出本进程指标
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+# 工作进程写出指标快照的间隔（秒）
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+
+# 默认延迟分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Metric:
+    """带标签的指标基类"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values: str):
+        """获取指定标签值的子指标，子指标会被缓存（标签值应为字符串）"""
+        key = values
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出当前数据，用于输出和多进程汇总"""
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": {json.dumps([str(v) for v in key]): child.value() for key, child in list(self._children.items())}
+        }
+
+class _CounterChild:
+    __slots__ = ("_lock", "_value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def value(self) -> float:
+        return self._value
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self._value = value
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class _Timer:
+    """记录代码块耗时的上下文管理器"""
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_upper", "_counts", "_sum")
+
+    def __init__(self, upper: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._upper = upper
+        # 各分桶的非累计计数，最后一个为 +Inf
+        self._counts = [0] * (len(upper) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._upper, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def value(self) -> List[Any]:
+        with self._lock:
+            return [list(self._counts), self._sum]
+
+class Histogram(_Metric):
+    """分桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def register_collector(self, collector: Callable[[], None]):
+        """注册在输出前调用的回调，用于刷新连接池等仪表"""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"采集指标时发生错误: {e}")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+REGISTRY = Registry()
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: List[str], values: List[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def render(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    """按Prometheus文本格式（0.0.4）输出"""
+    lines = []
+    for name, data in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        names = data["labelnames"]
+        for key, value in sorted(data["samples"].items()):
+            values = json.loads(key)
+            if data["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+                continue
+
+            counts, total = value
+            cumulative = 0
+            for upper, count in zip(list(data["buckets"]) + [float("inf")], counts):
+                cumulative += count
+                labels = _format_labels(names, values, ("le", _format_value(upper)))
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(names, values)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(names, values)} {cumulative}")
+    lines.append("")
+    return "\n".join(lines)
+
+def merge(snapshots: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """合并多个进程的快照：计数器、仪表和直方图都按标签求和"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for name, data in snapshot.items():
+            target = merged.setdefault(name, {**data, "samples": {}})
+            for key, value in data["samples"].items():
+                if key not in target["samples"]:
+                    target["samples"][key] = json.loads(json.dumps(value))
+                elif data["type"] == "histogram":
+                    counts, total = target["samples"][key]
+                    target["samples"][key] = [[a + b for a, b in zip(counts, value[0])], total + value[1]]
+                else:
+                    target["samples"][key] += value
+    return merged
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_MULTIPROC_DIR, f"metrics_{pid}.json")
+
+def write_snapshot():
+    """把本进程的指标写入多进程汇总目录"""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(tmp_path, path)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def collect() -> Dict[str, Dict[str, Any]]:
+    """获取要输出的指标，多进程模式下汇总所有存活进程"""
+    if not METRICS_MULTIPROC_DIR:
+        return REGISTRY.snapshot()
+
+    write_snapshot()
+    snapshots = []
+    for filename in os.listdir(METRICS_MULTIPROC_DIR):
+        if not (filename.startswith("metrics_") and filename.endswith(".json")):
+            continue
+        path = os.path.join(METRICS_MULTIPROC_DIR, filename)
+        pid = int(filename[len("metrics_"):-len(".json")])
+        if not _pid_alive(pid):
+            # 已退出进程的数据不再汇总
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取指标快照失败 {path}: {e}")
+    return merge(snapshots)
+
+_stop_event = threading.Event()
+
+def _flush_loop():
+    while not _stop_event.wait(METRICS_FLUSH_INTERVAL):
+        try:
+            write_snapshot()
+        except Exception as e:
+            logger.warning(f"写出指标快照时发生错误: {e}")
+
+def start_metrics_flusher():
+    """多进程模式下启动定期写出快照的线程"""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    _stop_event.clear()
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+def stop_metrics_flusher():
+    """停止写出快照并删除本进程的快照"""
+    _stop_event.set()
+    if METRICS_MULTIPROC_DIR:
+        try:
+            os.remove(_snapshot_path(os.getpid()))
+        except OSError:
+            pass
+
+# ---- 应用指标 ----
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP请求处理耗时", ("method", "path", "status")
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "正在处理的HTTP请求数"
+)
+ES_REQUEST_SECONDS = Histogram(
+    "es_request_duration_seconds", "Elasticsearch调用耗时", ("operation",)
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "MySQL语句执行耗时", ("operation",)
+)
+INGEST_ARTICLES = Counter(
+    "ingest_articles_total", "入库文章数", ("result",)
+)
+
+class MetricsMiddleware:
+    """记录每个端点延迟的ASGI中间件，路径使用路由模板以控制标签数量"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels()
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path, str(status["code"])).observe(
+                time.perf_counter() - start
+            )
+
+def instrument_engine(engine):
+    """按语句类型记录SQL执行耗时"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_start")
+        if not started:
+            return
+        operation = statement.lstrip().split(" ", 1)[0].lower()
+        if operation not in ("select", "insert", "update", "delete"):
+            operation = "other"
+        DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("metrics_start"):
+            conn.info["metrics_start"].pop()
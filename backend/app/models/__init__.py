@@ -1,3 +1,3 @@
- """
+"""
 数据模型包
 """
\ No newline at end of file
@@ -1,14 +1,15 @@
- """文章数据模型"""
-from sqlalchemy import Column, Integer, String, Text, DateTime, BigInteger
+"""文章数据模型"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, BigInteger, Index, select, Select
 from sqlalchemy.sql import func
 from datetime import datetime
-from .database import Base
+from typing import Dict, List, Any, Iterable, Sequence
+from .database import Base, BigIntPK, Timestamp
 
 class Article(Base):
     """文章表模型"""
     __tablename__ = "articles"
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
     unique_id = Column(String(100), unique=True, nullable=False)
     url = Column(String(500), nullable=False)
     title = Column(String(200), nullable=False)
@@ -20,24 +21,70 @@ class Article(Base):
     biz = Column(String(100))
     mid = Column(String(100))
     idx = Column(String(10))
-    created_at = Column(DateTime, nullable=False, default=func.now())
-    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
-    
+    # 标题和摘要的SimHash（有符号64位存储）及近似重复簇ID（簇内最早入库文章的unique_id）
+    simhash = Column(BigInteger)
+    cluster_id = Column(String(100))
+    created_at = Column(Timestamp, nullable=False, default=func.now())
+    updated_at = Column(Timestamp, nullable=False, default=func.now(), onupdate=func.now())
+
+    # 二级索引（已有库通过 migrations.py 补建）
+    __table_args__ = (
+        Index("ix_articles_pub_time_iso_id", "pub_time_iso", "id"),
+        Index("ix_articles_created_at_id", "created_at", "id"),
+        Index("ix_articles_updated_at_id", "updated_at", "id"),
+        Index("ix_articles_biz_pub_time_iso", "biz", "pub_time_iso"),
+        Index("ix_articles_cluster_id", "cluster_id"),
+    )
+
     def to_dict(self):
         """转换为字典"""
-        return {
-            "id": self.id,
-            "unique_id": self.unique_id,
-            "url": self.url,
-            "title": self.title,
-            "digest": self.digest,
-            "pub_time": self.pub_time,
-            "pub_time_iso": self.pub_time_iso.isoformat() if self.pub_time_iso else None,
-            "cover": self.cover,
-            "bizname": self.bizname,
-            "biz": self.biz,
-            "mid": self.mid,
-            "idx": self.idx,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        return ARTICLE_FULL.to_dict(tuple(getattr(self, field) for field in ARTICLE_FULL.fields))
+
+class ArticleProjection:
+    """
+    文章的列投影，用于只读路径
+
+    只查询需要的列，结果是SQLAlchemy Core的Row（基于元组，没有ORM对象的身份映射和实例状态），
+    所有路径共用同一个序列化函数转为字典，日期时间列按位置格式化。
+    """
+    __slots__ = ("name", "fields", "columns", "_datetime_positions")
+
+    def __init__(self, name: str, fields: Sequence[str]):
+        self.name = name
+        self.fields = tuple(fields)
+        self.columns = tuple(Article.__table__.c[field] for field in self.fields)
+        self._datetime_positions = tuple(
+            i for i, column in enumerate(self.columns) if isinstance(column.type, DateTime)
+        )
+
+    def select(self) -> Select:
+        """查询本投影列的语句"""
+        return select(*self.columns)
+
+    def to_dict(self, row: Sequence[Any]) -> Dict[str, Any]:
+        """将一行转为字典"""
+        if self._datetime_positions:
+            row = list(row)
+            for i in self._datetime_positions:
+                if row[i] is not None:
+                    row[i] = row[i].isoformat()
+        return dict(zip(self.fields, row))
+
+    def to_dicts(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        """将多行转为字典列表"""
+        to_dict = self.to_dict
+        return [to_dict(row) for row in rows]
+
+# 各读路径使用的投影
+ARTICLE_FULL = ArticleProjection("full", (
+    "id", "unique_id", "url", "title", "digest", "pub_time", "pub_time_iso", "cover",
+    "bizname", "biz", "mid", "idx", "cluster_id", "created_at", "updated_at"
+))
+# 写入ES需要的列
+ARTICLE_INDEX = ArticleProjection("index", ("unique_id", "title", "digest", "bizname", "pub_time_iso", "cluster_id"))
+# 搜索结果补全：标题和摘要的高亮来自ES，不需要读取digest
+ARTICLE_HYDRATE = ArticleProjection("hydrate", (
+    "unique_id", "url", "title", "pub_time", "pub_time_iso", "cover", "bizname", "biz"
+))
+# 除自增id外的全部列：导出文件的列，也是ES-only存储模式下的文档字段
+ARTICLE_DOCUMENT = ArticleProjection("document", ARTICLE_FULL.fields[1:])
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""文章后台任务"""
+from sqlalchemy import Column, String, Text, DateTime, BigInteger
+from sqlalchemy.sql import func
+from .database import Base, BigIntPK
+
+class ArticleJob(Base):
+    """
+    批量删除等耗时操作的后台任务，执行任务的进程每处理一批更新一次进度，
+    多进程部署时任一进程都能查询
+    """
+    __tablename__ = "article_jobs"
+
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    kind = Column(String(20), nullable=False)
+    # pending、running、done、failed
+    status = Column(String(20), nullable=False, default="pending")
+    params = Column(Text)
+    total = Column(BigInteger)
+    processed = Column(BigInteger, nullable=False, default=0)
+    message = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime)
@@ -0,0 +1,20 @@
+"""已删除文章的记录"""
+from sqlalchemy import Column, String, Index
+from sqlalchemy.sql import func
+from .database import Base, BigIntPK, Timestamp
+
+class ArticleTombstone(Base):
+    """
+    删除文章时写入的墓碑，变更订阅（/articles/changes）据此输出删除事件；
+    清空全部文章只写一行，op为clear、unique_id为空
+    """
+    __tablename__ = "article_tombstones"
+
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    unique_id = Column(String(100))
+    op = Column(String(10), nullable=False, default="delete")
+    deleted_at = Column(Timestamp, nullable=False, default=func.now())
+
+    __table_args__ = (
+        Index("ix_article_tombstones_deleted_at_id", "deleted_at", "id"),
+    )
@@ -0,0 +1,12 @@
+"""数据版本：文章数据每次变更时递增，用于HTTP条件请求"""
+from sqlalchemy import Column, String, DateTime, BigInteger
+from sqlalchemy.sql import func
+from .database import Base
+
+class DataVersion(Base):
+    """数据版本表，每类数据一行"""
+    __tablename__ = "data_versions"
+
+    name = Column(String(50), primary_key=True)
+    generation = Column(BigInteger, nullable=False, default=0)
+    modified_at = Column(DateTime, nullable=False, default=func.now())
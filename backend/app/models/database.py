@@ -1,10 +1,13 @@
- """数据库连接管理"""
+"""数据库连接管理"""
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import BigInteger, Integer, DateTime
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 import logging
 
+from ..connections import create_db_engine, ReplicaRouter, DATABASE_REPLICA_URLS
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
@@ -15,24 +18,56 @@ DB_USER = os.environ.get("DB_USER", "root")
 DB_PASSWORD = os.environ.get("DB_PASSWORD", "password")
 DB_NAME = os.environ.get("DB_NAME", "wechatrec")
 
+# 设置DATABASE_URL时直接使用（如基准测试使用的 sqlite:///bench.db）
+DATABASE_URL = os.environ.get("DATABASE_URL") or \
+    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
 # 创建数据库连接
 try:
-    DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-    logger.info(f"数据库连接成功: {DB_HOST}:{DB_PORT}/{DB_NAME}")
+    # 连接池参数见 connections.py（DB_POOL_SIZE、DB_MAX_OVERFLOW等）
+    engine = create_db_engine(DATABASE_URL)
+    logger.info(f"数据库连接成功: {engine.url.render_as_string(hide_password=True)}")
 except Exception as e:
     logger.error(f"数据库连接失败: {e}")
     raise
 
+# 只读副本（DATABASE_REPLICA_URLS），只读接口通过 get_read_db 使用
+replica_engines = [create_db_engine(url) for url in DATABASE_REPLICA_URLS]
+replica_router = ReplicaRouter(engine, replica_engines)
+if replica_engines:
+    logger.info(f"配置了 {len(replica_engines)} 个MySQL只读副本")
+
 # 创建会话
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # 声明基类
 Base = declarative_base()
 
+# 自增主键类型：SQLite只有INTEGER PRIMARY KEY才会自增
+BigIntPK = BigInteger().with_variant(Integer, "sqlite")
+
+# 按时间键集扫描的时间列：SQLite按字符串比较日期时间，存储格式与 CURRENT_TIMESTAMP（func.now()默认值）
+# 一致、与MySQL DATETIME一样精确到秒，绑定参数和列值才能正确比较
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
 def get_db():
-    """获取数据库会话"""
+    """获取数据库会话（主库），写入以及需要读到刚写入数据的接口使用"""
     db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def read_session() -> Session:
+    """创建只读会话：优先使用延迟在允许范围内的副本，否则使用主库"""
+    return SessionLocal(bind=replica_router.read_engine())
+
+def get_read_db():
+    """获取只读数据库会话"""
+    db = read_session()
     try:
         yield db
     finally:
@@ -1,21 +1,31 @@
- """日志数据模型"""
-from sqlalchemy import Column, Integer, String, Text, DateTime, BigInteger, JSON
+"""日志数据模型"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, BigInteger, JSON, Index, LargeBinary
+from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.sql import func
-from datetime import datetime
-from .database import Base
+from datetime import datetime, date, timedelta
+from .database import Base, BigIntPK
 
 class Log(Base):
     """日志表模型"""
     __tablename__ = "logs"
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
     timestamp = Column(DateTime, nullable=False)
     method = Column(String(10))
     path = Column(String(200))
     client = Column(String(50))
     data = Column(JSON)
+    # 超过阈值的请求/响应数据压缩后存放在payload中，data置空
+    payload = Column(LargeBinary().with_variant(LONGBLOB(), "mysql"))
+    payload_codec = Column(String(10))
+    payload_size = Column(Integer)
     created_at = Column(DateTime, nullable=False, default=func.now())
-    
+
+    # 按时间过滤/排序的索引（已有库通过 migrations.py 补建）
+    __table_args__ = (
+        Index("ix_logs_timestamp_id", "timestamp", "id"),
+    )
+
     def to_dict(self):
         """转换为字典"""
         return {
@@ -25,5 +35,16 @@ class Log(Base):
             "path": self.path,
             "client": self.client,
             "data": self.data,
+            "payload_codec": self.payload_codec,
+            "payload_size": self.payload_size,
             "created_at": self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+def log_partition_name(day: date) -> str:
+    """按天分区的分区名，分区上界为次日零点"""
+    return f"p{day.strftime('%Y%m%d')}"
+
+def log_partition_sql(day: date) -> str:
+    """生成单个按天分区的定义（MySQL RANGE 分区）"""
+    upper = (day + timedelta(days=1)).isoformat()
+    return f"PARTITION {log_partition_name(day)} VALUES LESS THAN (TO_DAYS('{upper}'))"
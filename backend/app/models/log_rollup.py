@@ -0,0 +1,29 @@
+"""请求日志汇总数据模型"""
+from sqlalchemy import Column, String, DateTime, BigInteger, Boolean, UniqueConstraint
+from .database import Base, BigIntPK
+
+class LogRollup(Base):
+    """
+    按时间桶（分钟、小时）× 路径 × 客户端 × 是否成功汇总的请求数、文章数和耗时，
+    由 services/log_rollup.py 在内存中累加后定期写入，统计接口只读这张表，不扫描 logs
+    """
+    __tablename__ = "log_rollups"
+
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    # minute 或 hour
+    period = Column(String(10), nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    path = Column(String(200), nullable=False, default="")
+    client = Column(String(50), nullable=False, default="")
+    success = Column(Boolean, nullable=False)
+    requests = Column(BigInteger, nullable=False, default=0)
+    # 保存成功和失败的文章数
+    articles = Column(BigInteger, nullable=False, default=0)
+    failed_articles = Column(BigInteger, nullable=False, default=0)
+    latency_ms_sum = Column(BigInteger, nullable=False, default=0)
+    latency_ms_max = Column(BigInteger, nullable=False, default=0)
+
+    # 唯一键同时用于按 (period, bucket) 范围查询
+    __table_args__ = (
+        UniqueConstraint("period", "bucket", "path", "client", "success", name="uq_log_rollups_key"),
+    )
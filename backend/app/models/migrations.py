@@ -0,0 +1,235 @@
+"""数据库结构迁移
+
+按版本号顺序执行的结构变更，已执行的版本记录在 schema_migrations 表中。
+每个迁移都必须是幂等的（先检查再变更），以便在启动时或命令行中重复执行。
+
+用法（在 backend 目录下）:
+    python -m app.models.migrations            # 执行所有未执行的迁移
+    python -m app.models.migrations --status   # 查看迁移状态
+"""
+import os
+import logging
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Any, Tuple
+from sqlalchemy import Column, Integer, String, DateTime, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import func
+
+from .database import Base, engine
+from .article import Article
+from .log import Log, log_partition_sql
+from .pending_index import PendingIndex
+from .data_version import DataVersion
+from .simhash_band import SimhashBand
+from .related_article import RelatedArticle
+from .article_tombstone import ArticleTombstone
+from .article_job import ArticleJob
+from .log_rollup import LogRollup
+
+logger = logging.getLogger(__name__)
+
+# 启动时是否自动执行迁移
+DB_AUTO_MIGRATE = os.environ.get("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+class SchemaMigration(Base):
+    """迁移版本记录表"""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, nullable=False, default=func.now())
+
+def _index_names(conn: Connection, table_name: str) -> set:
+    """获取表上已存在的索引名"""
+    return {index["name"] for index in inspect(conn).get_indexes(table_name)}
+
+def _ensure_indexes(conn: Connection, table, names: List[str]):
+    """按模型中声明的索引补建缺失的索引"""
+    existing = _index_names(conn, table.name)
+    declared = {index.name: index for index in table.indexes}
+    for name in names:
+        if name in existing:
+            logger.info(f"索引已存在，跳过: {table.name}.{name}")
+            continue
+        declared[name].create(bind=conn)
+        logger.info(f"创建索引: {table.name}.{name}")
+
+def _add_columns(conn: Connection, table, names: List[str]):
+    """按模型中声明的列补建缺失的列"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            logger.info(f"列已存在，跳过: {table.name}.{name}")
+            continue
+        column_sql = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_sql}"))
+        logger.info(f"添加列: {table.name}.{name}")
+
+def _001_article_log_indexes(conn: Connection):
+    """文章排序/过滤及日志时间索引"""
+    _ensure_indexes(conn, Article.__table__, [
+        "ix_articles_pub_time_iso_id",
+        "ix_articles_created_at_id",
+        "ix_articles_updated_at_id",
+        "ix_articles_biz_pub_time_iso",
+    ])
+    _ensure_indexes(conn, Log.__table__, ["ix_logs_timestamp_id"])
+
+def _002_log_compressed_payload(conn: Connection):
+    """日志表压缩数据列"""
+    _add_columns(conn, Log.__table__, ["payload", "payload_codec", "payload_size"])
+
+def _003_partition_logs(conn: Connection):
+    """日志表按天RANGE分区（仅MySQL），过期数据通过删除分区清理"""
+    if conn.dialect.name != "mysql":
+        logger.info("非MySQL数据库，跳过日志表分区")
+        return
+
+    partitioned = conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'logs' AND PARTITION_NAME IS NOT NULL"
+    )).scalar()
+    if partitioned:
+        logger.info("日志表已分区，跳过")
+        return
+
+    # 分区键必须包含在主键中
+    conn.execute(text("ALTER TABLE logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, `timestamp`)"))
+
+    # 今天之前的历史数据放入p_old，之后预建7天分区，剩余由保留任务滚动创建
+    today = date.today()
+    partitions = [f"PARTITION p_old VALUES LESS THAN (TO_DAYS('{today.isoformat()}'))"]
+    partitions += [log_partition_sql(today + timedelta(days=i)) for i in range(8)]
+    partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    conn.execute(text(
+        f"ALTER TABLE logs PARTITION BY RANGE (TO_DAYS(`timestamp`)) ({', '.join(partitions)})"
+    ))
+    logger.info(f"日志表已按天分区: {len(partitions)} 个分区")
+
+def _004_pending_index(conn: Connection):
+    """待重试的ES索引/删除操作"""
+    PendingIndex.__table__.create(bind=conn, checkfirst=True)
+
+def _005_data_versions(conn: Connection):
+    """文章数据版本，初始修改时间取现有文章的最大更新时间"""
+    DataVersion.__table__.create(bind=conn, checkfirst=True)
+    exists = conn.execute(
+        DataVersion.__table__.select().where(DataVersion.name == "articles")
+    ).first()
+    if not exists:
+        modified_at = conn.execute(
+            Article.__table__.select().with_only_columns(func.max(Article.updated_at))
+        ).scalar()
+        conn.execute(DataVersion.__table__.insert().values(
+            name="articles", generation=1, modified_at=modified_at or func.now()
+        ))
+
+def _006_article_clusters(conn: Connection):
+    """近似重复检测：文章SimHash和簇ID列、簇索引及分段查找表，已有文章由 app.services.dedup 回填"""
+    _add_columns(conn, Article.__table__, ["simhash", "cluster_id"])
+    _ensure_indexes(conn, Article.__table__, ["ix_articles_cluster_id"])
+    SimhashBand.__table__.create(bind=conn, checkfirst=True)
+
+def _007_related_articles(conn: Connection):
+    """预计算的相关文章列表，由 app.services.related 构建"""
+    RelatedArticle.__table__.create(bind=conn, checkfirst=True)
+
+def _008_article_tombstones(conn: Connection):
+    """删除文章的墓碑，变更订阅据此输出删除事件（按 updated_at, id 扫描文章的索引已由迁移1创建）"""
+    ArticleTombstone.__table__.create(bind=conn, checkfirst=True)
+
+def _009_article_jobs(conn: Connection):
+    """批量删除等后台任务的状态和进度"""
+    ArticleJob.__table__.create(bind=conn, checkfirst=True)
+
+def _010_log_rollups(conn: Connection):
+    """请求日志按分钟和小时的汇总"""
+    LogRollup.__table__.create(bind=conn, checkfirst=True)
+
+def _011_pending_index_revision(conn: Connection):
+    """待同步操作的版本号，重试完成后按版本号条件删除"""
+    _add_columns(conn, PendingIndex.__table__, ["revision"])
+
+# 迁移列表：(版本号, 名称, 执行函数)，只能追加，不能修改已发布的版本
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "article_log_indexes", _001_article_log_indexes),
+    (2, "log_compressed_payload", _002_log_compressed_payload),
+    (3, "partition_logs", _003_partition_logs),
+    (4, "pending_index", _004_pending_index),
+    (5, "data_versions", _005_data_versions),
+    (6, "article_clusters", _006_article_clusters),
+    (7, "related_articles", _007_related_articles),
+    (8, "article_tombstones", _008_article_tombstones),
+    (9, "article_jobs", _009_article_jobs),
+    (10, "log_rollups", _010_log_rollups),
+    (11, "pending_index_revision", _011_pending_index_revision),
+]
+
+def applied_versions(bind: Engine = engine) -> Dict[int, Any]:
+    """获取已执行的迁移版本"""
+    SchemaMigration.__table__.create(bind=bind, checkfirst=True)
+    with bind.connect() as conn:
+        rows = conn.execute(SchemaMigration.__table__.select()).all()
+    return {row.version: row.applied_at for row in rows}
+
+def run_migrations(bind: Engine = engine) -> Dict[str, Any]:
+    """
+    执行所有未执行的迁移
+
+    Args:
+        bind: 数据库引擎
+
+    Returns:
+        Dict: 包含本次执行的迁移版本列表
+    """
+    done = applied_versions(bind)
+    applied = []
+
+    for version, name, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+
+        logger.info(f"执行数据库迁移 {version:03d}_{name}")
+        with bind.begin() as conn:
+            upgrade(conn)
+            try:
+                conn.execute(SchemaMigration.__table__.insert().values(version=version, name=name))
+            except IntegrityError:
+                # 多个进程同时启动时，其他进程已记录该版本
+                logger.info(f"迁移 {version:03d}_{name} 已由其他进程记录")
+        applied.append(version)
+
+    if applied:
+        logger.info(f"数据库迁移完成: {applied}")
+    return {"success": True, "applied": applied}
+
+def migration_status(bind: Engine = engine) -> List[Dict[str, Any]]:
+    """获取每个迁移的执行状态"""
+    done = applied_versions(bind)
+    return [
+        {
+            "version": version,
+            "name": name,
+            "applied_at": done[version].isoformat() if version in done else None
+        }
+        for version, name, _ in MIGRATIONS
+    ]
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="数据库结构迁移")
+    parser.add_argument("--status", action="store_true", help="只显示迁移状态，不执行")
+    args = parser.parse_args()
+
+    if args.status:
+        for item in migration_status():
+            state = item["applied_at"] or "未执行"
+            print(f"{item['version']:03d}_{item['name']}: {state}")
+    else:
+        Base.metadata.create_all(bind=engine)
+        print(run_migrations())
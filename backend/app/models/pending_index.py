@@ -0,0 +1,36 @@
+"""待同步到Elasticsearch的文章"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from .database import Base
+
+class PendingIndex(Base):
+    """
+    索引或删除失败（包括熔断期间）的文章，由后台任务重试，
+    同一篇文章只保留最后一次操作
+    """
+    __tablename__ = "pending_index"
+
+    unique_id = Column(String(100), primary_key=True)
+    action = Column(String(10), nullable=False, default="index")
+    attempts = Column(Integer, nullable=False, default=0)
+    # 每次记录新操作时递增，重试完成后只删除读取时的那一版，期间记录的新操作保留
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    next_attempt_at = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        Index("ix_pending_index_next_attempt_at", "next_attempt_at"),
+    )
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            "unique_id": self.unique_id,
+            "action": self.action,
+            "attempts": self.attempts,
+            "revision": self.revision,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "next_attempt_at": self.next_attempt_at.isoformat() if self.next_attempt_at else None
+        }
@@ -0,0 +1,15 @@
+"""相关文章列表"""
+from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy.sql import func
+from .database import Base
+
+class RelatedArticle(Base):
+    """
+    离线计算的相关文章，每篇文章一行，neighbours 为按相似度降序的JSON列表，
+    包含展示需要的字段，查询时只读取这一行
+    """
+    __tablename__ = "related_articles"
+
+    unique_id = Column(String(100), primary_key=True)
+    neighbours = Column(Text, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=func.now())
@@ -0,0 +1,20 @@
+"""文章SimHash分段索引"""
+from sqlalchemy import Column, Integer, String, BigInteger, Index
+from .database import Base
+
+class SimhashBand(Base):
+    """
+    近似重复检测的分段查找表：每篇文章的64位SimHash切成4段，每段一行，
+    band_key = 段号 << 16 | 段值。汉明距离不超过3的两个指纹至少有一段完全相同，
+    按 band_key 等值查询即可取到全部候选
+    """
+    __tablename__ = "simhash_bands"
+
+    band_key = Column(Integer, primary_key=True, autoincrement=False)
+    unique_id = Column(String(100), primary_key=True)
+    simhash = Column(BigInteger, nullable=False)
+    cluster_id = Column(String(100), nullable=False)
+
+    __table_args__ = (
+        Index("ix_simhash_bands_unique_id", "unique_id"),
+    )
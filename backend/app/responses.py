@@ -0,0 +1,190 @@
+"""响应序列化与压缩
+
+- FastJSONResponse: 使用orjson序列化（未安装时回退到标准库json），
+  路由直接返回该响应时FastAPI不再对返回值做 jsonable_encoder 遍历
+- CompressionMiddleware: 按 Accept-Encoding 协商brotli（需要安装 brotli）或gzip，
+  只压缩超过 COMPRESS_MIN_SIZE 字节的响应，流式响应逐块压缩并在每块后同步刷新，客户端能及时收到每一块
+"""
+import os
+import json
+import zlib
+import logging
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from . import tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 小于该字节数的响应不压缩
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+# gzip压缩级别（1-9）和brotli质量（0-11），取偏快的值以控制CPU开销
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))
+
+# 不需要再压缩的内容类型
+_INCOMPRESSIBLE_PREFIXES = (b"image/", b"video/", b"audio/", b"application/zip", b"application/gzip")
+
+def _json_default(value: Any) -> Any:
+    # orjson和标准库都无法序列化的值（如MySQL聚合返回的Decimal）转为字符串；标准库的日期时间与orjson一致输出ISO格式
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def dumps(content: Any) -> bytes:
+    """序列化为UTF-8编码的JSON"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """使用orjson序列化的JSON响应"""
+
+    def render(self, content: Any) -> bytes:
+        with tracing.span("serialize") as current:
+            body = dumps(content)
+            if current is not None:
+                current.attributes["bytes"] = len(body)
+        return body
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    根据Accept-Encoding选择压缩算法，客户端同时接受时优先brotli
+
+    Returns:
+        str: "br" 或 "gzip"，都不接受时为None
+    """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        token, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token.strip().lower()] = q
+
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+class _Compressor:
+    """统一gzip和brotli的流式压缩接口"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._impl = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._impl.process(data)
+        return self._impl.compress(data)
+
+    def flush(self) -> bytes:
+        """输出已压缩的数据，压缩流保持可继续写入"""
+        return self._impl.flush() if self.encoding == "br" else self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._impl.finish() if self.encoding == "br" else self._impl.flush()
+
+class CompressionMiddleware:
+    """按协商结果压缩响应的ASGI中间件"""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers") or ():
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = message.get("headers") or []
+                if _skip_compression(headers):
+                    state["passthrough"] = True
+                    await send(message)
+                else:
+                    # 等看到第一块响应体再决定是否压缩
+                    state["start"] = message
+                return
+
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            start = state["start"]
+
+            if start is not None:
+                state["start"] = None
+                headers = list(start.get("headers") or [])
+                if not more_body and len(body) < self.minimum_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                state["compressor"] = compressor
+                headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers.append((b"content-length", str(len(body)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send({**start, "headers": headers})
+
+            compressor = state["compressor"]
+            data = compressor.compress(body)
+            # 流式响应每块都刷新，否则数据留在压缩器缓冲区中，客户端要等很久才收到一大段
+            data += compressor.finish() if not more_body else compressor.flush()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+def _skip_compression(headers: List[Tuple[bytes, bytes]]) -> bool:
+    for name, value in headers:
+        name = name.lower()
+        if name == b"content-encoding":
+            return True
+        if name == b"content-type" and value.lower().startswith(_INCOMPRESSIBLE_PREFIXES):
+            return True
+    return False
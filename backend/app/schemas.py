@@ -0,0 +1,137 @@
+"""请求数据校验
+
+/artlist/ 上报的文章在写入前按 ArticleIn 整批校验：整个列表交给pydantic-core编译好的校验器一次处理，
+完成类型转换（数字转字符串、时间戳字符串转整数），并按 articles 表的列长度检查字段（包括由 biz-mid-idx 组成的 unique_id），
+不合法的文章在写库前被拒绝并给出逐条的错误信息，不再等数据库报错后回滚。
+
+ArticleIn 是TypedDict，校验结果直接是字典，不创建模型实例。
+"""
+import os
+import uuid
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from typing_extensions import Annotated, TypedDict
+from pydantic import AfterValidator, BaseModel, BeforeValidator, ConfigDict, Field, TypeAdapter, ValidationError, model_validator
+from pydantic_core import PydanticCustomError
+
+from .models.article import Article
+
+logger = logging.getLogger(__name__)
+
+# 批量删除一次最多指定的文章ID数
+ARTICLE_DELETE_MAX_IDS = int(os.environ.get("ARTICLE_DELETE_MAX_IDS", "10000"))
+
+def _max_length(column: str) -> int:
+    """articles 表字符串列的长度"""
+    return Article.__table__.c[column].type.length
+
+def _empty_to_none(value: Any) -> Any:
+    # 采集端用空字符串表示没有发布时间
+    return None if value == "" else value
+
+class ArticleIn(TypedDict, total=False):
+    """上报的单篇文章，校验后只包含请求中提供的字段"""
+    __pydantic_config__ = ConfigDict(coerce_numbers_to_str=True)
+
+    url: Annotated[str, Field(max_length=_max_length("url"))]
+    title: Annotated[str, Field(max_length=_max_length("title"))]
+    digest: Optional[str]
+    pub_time: Annotated[Optional[int], BeforeValidator(_empty_to_none)]
+    cover: Annotated[Optional[str], Field(max_length=_max_length("cover"))]
+    bizname: Annotated[Optional[str], Field(max_length=_max_length("bizname"))]
+    biz: Annotated[str, Field(max_length=_max_length("biz"))]
+    mid: Annotated[str, Field(max_length=_max_length("mid"))]
+    idx: Annotated[str, Field(max_length=_max_length("idx"))]
+
+# 请求中没有提供的字段写入时的默认值
+ARTICLE_DEFAULTS: Dict[str, Any] = {
+    "url": "", "title": "", "digest": "", "pub_time": None, "cover": "",
+    "bizname": "", "biz": "", "mid": "", "idx": ""
+}
+
+def _check_unique_id(article: ArticleIn) -> ArticleIn:
+    # biz、mid 各自不超过列长度时，拼成的 unique_id 仍可能超过 unique_id 列的长度
+    max_length = _max_length("unique_id")
+    biz, mid, idx = article.get("biz"), article.get("mid"), article.get("idx")
+    if biz and mid and idx and len(biz) + len(mid) + len(idx) + 2 > max_length:
+        raise PydanticCustomError(
+            "unique_id_too_long",
+            "biz-mid-idx 组成的 unique_id 不能超过 {max_length} 个字符",
+            {"max_length": max_length}
+        )
+    return article
+
+_CHECKED_ARTICLE = Annotated[ArticleIn, AfterValidator(_check_unique_id)]
+
+ARTICLE = TypeAdapter(_CHECKED_ARTICLE)
+ARTICLE_LIST = TypeAdapter(List[_CHECKED_ARTICLE])
+
+def make_unique_id(biz: str, mid: str, idx: str) -> str:
+    """由 biz-mid-idx 生成文章唯一ID，缺少任何部分时使用随机ID"""
+    if biz and mid and idx:
+        return f"{biz}-{mid}-{idx}"
+    logger.warning(f"文章缺少完整标识信息，使用随机ID: biz={biz}, mid={mid}, idx={idx}")
+    return str(uuid.uuid4())
+
+def pub_datetime(pub_time: Optional[int]) -> Optional[datetime]:
+    """发布时间戳转换为datetime，超出范围时为None"""
+    if not pub_time:
+        return None
+    try:
+        return datetime.fromtimestamp(pub_time)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+def article_record(article: ArticleIn) -> Dict[str, Any]:
+    """补全默认值并生成 unique_id 和 pub_time_iso，键与 articles 表的列对应"""
+    record = {**ARTICLE_DEFAULTS, **article}
+    record["unique_id"] = make_unique_id(record["biz"], record["mid"], record["idx"])
+    record["pub_time_iso"] = pub_datetime(record["pub_time"])
+    return record
+
+def _error_item(loc: Tuple[Any, ...], error: Dict[str, Any]) -> Dict[str, Any]:
+    return {"field": ".".join(str(part) for part in loc) or None, "type": error["type"], "message": error["msg"]}
+
+def error_report(error: ValidationError) -> List[Dict[str, Any]]:
+    """将校验错误转为 [{"field", "type", "message"}]"""
+    return [_error_item(item["loc"], item) for item in error.errors(include_url=False)]
+
+def validate_article(data: Any) -> ArticleIn:
+    """校验单篇文章，不合法时抛出 ValidationError"""
+    return ARTICLE.validate_python(data)
+
+def validate_articles(items: List[Any]) -> Tuple[List[Tuple[int, ArticleIn]], List[Dict[str, Any]]]:
+    """
+    整批校验文章
+
+    全部合法时只调用一次列表校验器；有不合法的文章时，除去出错的位置后把其余文章逐条校验
+
+    Returns:
+        Tuple: ([(在请求中的位置, 文章)], [{"index": 位置, "errors": [...]}])
+    """
+    try:
+        return list(enumerate(ARTICLE_LIST.validate_python(items))), []
+    except ValidationError as e:
+        invalid: Dict[int, List[Dict[str, Any]]] = {}
+        for item in e.errors(include_url=False):
+            index, *field = item["loc"]
+            invalid.setdefault(index, []).append(_error_item(tuple(field), item))
+
+    valid = [(i, ARTICLE.validate_python(item)) for i, item in enumerate(items) if i not in invalid]
+    return valid, [{"index": index, "errors": errors} for index, errors in sorted(invalid.items())]
+
+class ArticleDeleteFilter(BaseModel):
+    """POST /articles/delete 的删除条件，各项同时满足，至少提供一项（清空全部文章使用 DELETE /articles/all）"""
+    ids: Optional[List[str]] = Field(None, max_length=ARTICLE_DELETE_MAX_IDS, description="文章unique_id列表")
+    biz: Optional[str] = Field(None, description="公众号biz")
+    bizname: Optional[str] = Field(None, description="公众号名称")
+    start: Optional[datetime] = Field(None, description="发布时间下限（含）")
+    end: Optional[datetime] = Field(None, description="发布时间上限（含）")
+
+    @model_validator(mode="after")
+    def _require_condition(self) -> "ArticleDeleteFilter":
+        if not (self.ids or self.biz or self.bizname or self.start or self.end):
+            raise ValueError("至少需要提供 ids、biz、bizname、start、end 中的一项")
+        return self
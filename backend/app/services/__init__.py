@@ -1,3 +1,3 @@
- """
+"""
 业务逻辑服务包
 """
\ No newline at end of file
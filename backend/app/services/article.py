@@ -1,16 +1,34 @@
- """文章业务逻辑处理"""
-import uuid
+"""文章业务逻辑处理"""
+import os
+import time
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, func
+from sqlalchemy import desc, asc, func, select, delete, or_
+from pydantic import ValidationError
 
-from ..models.article import Article
-from ..services.search import index_article, delete_article_from_index, clear_index, reindex_all_articles
+from ..models.article import Article, ArticleProjection, ARTICLE_FULL, ARTICLE_INDEX, ARTICLE_HYDRATE
+from ..metrics import INGEST_ARTICLES
+from .. import tracing
+from ..schemas import ArticleIn, article_record, validate_article, validate_articles, error_report
+from ..models.database import SessionLocal
+from ..services.search import index_article, delete_article_from_index, reindex_all_articles, bulk_sync_articles
+from ..services.index_retry import defer_index
+from ..services import data_version
+from ..services import dedup
+from ..services import related
+from ..services import changes
+from ..services import jobs
 
 logger = logging.getLogger(__name__)
 
+# 批量删除每批删除的文章数（每批一条DELETE语句并提交）
+ARTICLE_DELETE_CHUNK = int(os.environ.get("ARTICLE_DELETE_CHUNK", "1000"))
+# 清空文章每批删除的文章数和每秒最多删除的文章数，0表示不限速
+ARTICLE_CLEAR_CHUNK = int(os.environ.get("ARTICLE_CLEAR_CHUNK", "1000"))
+ARTICLE_CLEAR_ROWS_PER_SECOND = int(os.environ.get("ARTICLE_CLEAR_ROWS_PER_SECOND", "5000"))
+
 def find_articles_recursively(data: Any, max_depth: int = 5, current_depth: int = 0) -> List[Dict[str, Any]]:
     """
     递归查找数据结构中的文章列表
@@ -55,6 +73,77 @@ def find_articles_recursively(data: Any, max_depth: int = 5, current_depth: int
     
     return []
 
+def extract_articles(request_data: Any) -> Optional[List[Any]]:
+    """
+    从请求数据中找出文章列表，兼容多层嵌套的 {"data": ...} 结构
+
+    Returns:
+        List: 文章列表，没有找到时为空列表；请求数据不是对象时为None
+    """
+    logger.info(f"接收到的数据结构: {type(request_data)}")
+    logger.info(f"数据顶层键: {list(request_data.keys()) if isinstance(request_data, dict) else '非字典'}")
+    
+    if not isinstance(request_data, dict):
+        return None
+    
+    # 适应多种可能的数据结构
+    articles = []
+    
+    logger.info("处理字典类型数据")
+    
+    # 情况1: 直接包含文章列表的数据结构 {"data": [...]}
+    if "data" in request_data and isinstance(request_data["data"], list):
+        logger.info("情况1: 数据直接包含文章列表")
+        articles = request_data["data"]
+        
+    # 情况2: 更深层嵌套 {"data": {"data": {"data": [...]}}}
+    elif "data" in request_data:
+        data_level1 = request_data["data"]
+        logger.info(f"数据第一层: {type(data_level1)}")
+        
+        if isinstance(data_level1, dict):
+            # 检查第二层
+            if "data" in data_level1:
+                data_level2 = data_level1["data"]
+                logger.info(f"数据第二层: {type(data_level2)}")
+                
+                # 可能是直接的文章列表
+                if isinstance(data_level2, list):
+                    logger.info("情况2.1: 二层嵌套文章列表")
+                    articles = data_level2
+                    
+                # 可能还有第三层
+                elif isinstance(data_level2, dict):
+                    if "data" in data_level2:
+                        data_level3 = data_level2["data"]
+                        logger.info(f"数据第三层: {type(data_level3)}")
+                        
+                        if isinstance(data_level3, list):
+                            logger.info("情况2.2: 三层嵌套文章列表")
+                            articles = data_level3
+    
+    # 如果仍未找到文章，尝试递归查找文章列表
+    if not articles:
+        logger.info("尝试递归查找文章列表")
+        articles = find_articles_recursively(request_data)
+    
+    return articles
+
+# 更新已有文章时可以覆盖的字段，只覆盖请求中提供的字段
+UPDATABLE_FIELDS = frozenset(("url", "title", "digest", "cover", "bizname"))
+
+def update_article(existing: Article, article: ArticleIn, record: Dict[str, Any]):
+    """用上报数据更新已有文章，请求中没有提供的字段和无效的发布时间保留原值"""
+    for field in UPDATABLE_FIELDS.intersection(article):
+        setattr(existing, field, article[field])
+    if record["pub_time_iso"]:
+        existing.pub_time = record["pub_time"]
+        existing.pub_time_iso = record["pub_time_iso"]
+
+def storage_error(index: int, error: Any) -> Dict[str, Any]:
+    """写入失败的文章在错误报告中的条目，格式与校验错误相同"""
+    return {"index": index, "errors": [{"field": None, "type": "storage_error", "message": str(error)}]}
+
 def save_article_data(db: Session, request_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     保存文章数据
@@ -67,52 +156,9 @@ def save_article_data(db: Session, request_data: Dict[str, Any]) -> Dict[str, An
         Dict: 包含保存结果的字典
     """
     try:
-        logger.info(f"接收到的数据结构: {type(request_data)}")
-        logger.info(f"数据顶层键: {list(request_data.keys()) if isinstance(request_data, dict) else '非字典'}")
-        
-        # 适应多种可能的数据结构
-        articles = []
-        
-        # 检查是否有多层嵌套结构
-        if isinstance(request_data, dict):
-            logger.info("处理字典类型数据")
-            
-            # 情况1: 直接包含文章列表的数据结构 {"data": [...]}
-            if "data" in request_data and isinstance(request_data["data"], list):
-                logger.info("情况1: 数据直接包含文章列表")
-                articles = request_data["data"]
-                
-            # 情况2: 更深层嵌套 {"data": {"data": {"data": [...]}}}
-            elif "data" in request_data:
-                data_level1 = request_data["data"]
-                logger.info(f"数据第一层: {type(data_level1)}")
-                
-                if isinstance(data_level1, dict):
-                    # 检查第二层
-                    if "data" in data_level1:
-                        data_level2 = data_level1["data"]
-                        logger.info(f"数据第二层: {type(data_level2)}")
-                        
-                        # 可能是直接的文章列表
-                        if isinstance(data_level2, list):
-                            logger.info("情况2.1: 二层嵌套文章列表")
-                            articles = data_level2
-                            
-                        # 可能还有第三层
-                        elif isinstance(data_level2, dict):
-                            if "data" in data_level2:
-                                data_level3 = data_level2["data"]
-                                logger.info(f"数据第三层: {type(data_level3)}")
-                                
-                                if isinstance(data_level3, list):
-                                    logger.info("情况2.2: 三层嵌套文章列表")
-                                    articles = data_level3
-            
-            # 如果仍未找到文章，尝试递归查找文章列表
-            if not articles:
-                logger.info("尝试递归查找文章列表")
-                articles = find_articles_recursively(request_data)
-        else:
+        with tracing.span("extract_articles"):
+            articles = extract_articles(request_data)
+        if articles is None:
             return {"success": False, "message": "请求数据格式不正确", "saved": 0}
         
         logger.info(f"找到 {len(articles)} 篇文章")
@@ -120,85 +166,66 @@ def save_article_data(db: Session, request_data: Dict[str, Any]) -> Dict[str, An
         if not articles:
             return {"success": False, "message": "没有找到文章数据", "saved": 0}
         
+        # 整批校验，不合法的文章不写库
+        with tracing.span("validate_articles", articles=len(articles)):
+            valid, errors = validate_articles(articles)
+        if errors:
+            logger.warning(f"{len(errors)} 篇文章未通过校验")
+            INGEST_ARTICLES.labels("invalid").inc(len(errors))
+        
         saved_count = 0
-        failed_count = 0
+        failed_count = len(errors)
         
-        for article_data in articles:
+        for index, article in valid:
             try:
-                # 生成唯一ID
-                biz = article_data.get('biz', '')
-                mid = article_data.get('mid', '')
-                idx = article_data.get('idx', '')
-                
-                unique_id = f"{biz}-{mid}-{idx}"
-                # 检查是否所有部分都存在
-                parts = unique_id.split('-')
-                if len(parts) != 3 or not all(parts) or unique_id == "--":
-                    # 如果缺少任何部分，生成随机ID
-                    logger.warning(f"文章缺少完整标识信息，使用随机ID: biz={biz}, mid={mid}, idx={idx}")
-                    unique_id = str(uuid.uuid4())
-                else:
-                    logger.info(f"为文章生成唯一ID: {unique_id}")
-                
-                # 转换发布时间
-                pub_time = article_data.get("pub_time", "")
-                pub_time_iso = None
-                if pub_time:
-                    try:
-                        pub_time_iso = datetime.fromtimestamp(int(pub_time))
-                    except (ValueError, TypeError):
-                        pub_time_iso = None
+                # 补全默认值，生成唯一ID和发布时间
+                record = article_record(article)
+                unique_id = record["unique_id"]
                 
                 # 检查文章是否已存在
                 existing_article = db.query(Article).filter(Article.unique_id == unique_id).first()
                 
                 if existing_article:
                     # 更新现有文章
-                    existing_article.url = article_data.get("url", existing_article.url)
-                    existing_article.title = article_data.get("title", existing_article.title)
-                    existing_article.digest = article_data.get("digest", existing_article.digest)
-                    existing_article.pub_time = pub_time or existing_article.pub_time
-                    existing_article.pub_time_iso = pub_time_iso or existing_article.pub_time_iso
-                    existing_article.cover = article_data.get("cover", existing_article.cover)
-                    existing_article.bizname = article_data.get("bizname", existing_article.bizname)
-                    
+                    update_article(existing_article, article, record)
                     article_obj = existing_article
+                    ingest_result = "updated"
                 else:
                     # 创建新文章
-                    article_obj = Article(
-                        unique_id=unique_id,
-                        url=article_data.get("url", ""),
-                        title=article_data.get("title", ""),
-                        digest=article_data.get("digest", ""),
-                        pub_time=pub_time,
-                        pub_time_iso=pub_time_iso,
-                        cover=article_data.get("cover", ""),
-                        bizname=article_data.get("bizname", ""),
-                        biz=biz,
-                        mid=mid,
-                        idx=idx
-                    )
+                    article_obj = Article(**record)
                     db.add(article_obj)
+                    ingest_result = "saved"
                 
+                # 近似重复检测，与文章在同一事务中提交
+                dedup.assign_cluster(db, article_obj)
                 db.commit()
                 
-                # 同步到Elasticsearch
+                # 同步到Elasticsearch，失败（包括熔断期间）时转入重试队列
                 index_result = index_article(article_obj.to_dict())
                 if not index_result:
-                    logger.warning(f"文章添加到MySQL成功，但索引到Elasticsearch失败: {unique_id}")
+                    logger.warning(f"文章添加到MySQL成功，但索引到Elasticsearch失败，稍后重试: {unique_id}")
+                    defer_index(db, unique_id, "index", "index_article failed")
                 
                 saved_count += 1
+                INGEST_ARTICLES.labels(ingest_result).inc()
                 
             except Exception as item_error:
                 logger.error(f"保存单篇文章时发生错误: {item_error}")
                 failed_count += 1
+                errors.append(storage_error(index, item_error))
+                INGEST_ARTICLES.labels("failed").inc()
                 db.rollback()
         
+        # 每次请求只递增一次数据版本
+        if saved_count:
+            data_version.bump(db)
+        
         return {
             "success": True,
             "message": f"成功保存 {saved_count} 篇文章，失败 {failed_count} 篇",
             "saved": saved_count,
-            "failed": failed_count
+            "failed": failed_count,
+            "errors": sorted(errors, key=lambda item: item["index"])
         }
         
     except Exception as e:
@@ -214,24 +241,21 @@ def get_all_articles(
         # 计算偏移量
         skip = (page - 1) * size
         
-        # 确定排序方式
+        # 确定排序方式，以id作为次级排序，与 (排序字段, id) 复合索引一致
+        direction = desc if sort_order.lower() == "desc" else asc
         if hasattr(Article, sort_by):
-            order_column = getattr(Article, sort_by)
-            if sort_order.lower() == "desc":
-                order_column = desc(order_column)
-            else:
-                order_column = asc(order_column)
+            order_columns = [direction(getattr(Article, sort_by)), direction(Article.id)]
         else:
-            order_column = desc(Article.pub_time_iso)
+            order_columns = [desc(Article.pub_time_iso), desc(Article.id)]
         
         # 查询总数
-        total = db.query(Article).count()
+        total = db.scalar(select(func.count()).select_from(Article))
         
-        # 查询数据
-        articles = db.query(Article).order_by(order_column).offset(skip).limit(size).all()
+        # 查询数据（只读路径不加载ORM对象）
+        rows = db.execute(ARTICLE_FULL.select().order_by(*order_columns).offset(skip).limit(size))
         
         # 转换为字典列表
-        result = [article.to_dict() for article in articles]
+        result = ARTICLE_FULL.to_dicts(rows)
         
         return {
             "page": page,
@@ -250,16 +274,94 @@ def get_all_articles(
             "error": str(e)
         }
 
-def get_articles_by_ids(db: Session, unique_ids: List[str]) -> Dict[str, Dict[str, Any]]:
-    """根据ID列表获取文章"""
+def search_articles_fallback(db: Session, query: str, page: int = 1, size: int = 10) -> Dict[str, Any]:
+    """
+    Elasticsearch不可用时在MySQL中按关键词模糊匹配标题和摘要，
+    每个关键词都需要出现，结果按发布时间倒序，没有相关性排序和高亮
+
+    Args:
+        db: 数据库会话
+        query: 搜索关键词
+        page: 页码
+        size: 每页结果数
+
+    Returns:
+        Dict: 与搜索接口相同的结构，fallback 字段标明结果来源
+    """
+    conditions = [
+        or_(Article.title.like(f"%{term}%"), Article.digest.like(f"%{term}%"))
+        for term in query.split()
+    ]
+
+    start = datetime.now()
+    total = db.scalar(select(func.count()).select_from(Article).where(*conditions))
+    rows = db.execute(
+        ARTICLE_INDEX.select().where(*conditions)
+        .order_by(desc(Article.pub_time_iso), desc(Article.id)).offset((page - 1) * size).limit(size)
+    )
+    took_ms = (datetime.now() - start).total_seconds() * 1000
+
+    results = ARTICLE_INDEX.to_dicts(rows)
+    for result in results:
+        result["digest"] = result["digest"] or ""
+        result["bizname"] = result["bizname"] or ""
+    return {
+        "query": query,
+        "page": page,
+        "size": size,
+        "total": total,
+        "took": took_ms,
+        "results": results,
+        "unique_ids": [r["unique_id"] for r in results],
+        "fallback": "mysql"
+    }
+
+def iter_articles(
+    db: Session,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    biz: Optional[str] = None,
+    batch_size: int = 1000,
+    projection: ArticleProjection = ARTICLE_FULL
+) -> Iterator[Dict[str, Any]]:
+    """
+    按id顺序流式读取文章，使用服务端游标分批获取，内存占用与文章总数无关
+
+    Args:
+        db: 数据库会话
+        start_time: 发布时间下限
+        end_time: 发布时间上限
+        biz: 公众号biz
+        batch_size: 每批读取的行数
+        projection: 读取的列
+
+    Yields:
+        Dict: 单篇文章
+    """
+    stmt = projection.select().order_by(Article.id)
+    if start_time:
+        stmt = stmt.where(Article.pub_time_iso >= start_time)
+    if end_time:
+        stmt = stmt.where(Article.pub_time_iso <= end_time)
+    if biz:
+        stmt = stmt.where(Article.biz == biz)
+
+    to_dict = projection.to_dict
+    for row in db.execute(stmt.execution_options(yield_per=batch_size)):
+        yield to_dict(row)
+
+def get_articles_by_ids(
+    db: Session, unique_ids: List[str], projection: ArticleProjection = ARTICLE_HYDRATE
+) -> Dict[str, Dict[str, Any]]:
+    """根据ID列表获取文章，默认只读取补全搜索结果需要的列"""
     try:
         if not unique_ids:
             return {}
             
-        articles = db.query(Article).filter(Article.unique_id.in_(unique_ids)).all()
+        rows = db.execute(projection.select().where(Article.unique_id.in_(unique_ids)))
         
         # 转换为以ID为键的字典
-        result = {article.unique_id: article.to_dict() for article in articles}
+        result = {article["unique_id"]: article for article in projection.to_dicts(rows)}
         
         return result
         
@@ -281,12 +383,17 @@ def delete_article_by_id(db: Session, article_id: str) -> Dict[str, Any]:
         
         # 从MySQL删除
         db.delete(article)
+        dedup.delete_bands(db, [article_id])
+        related.delete_lists(db, [article_id])
+        changes.record_deletes(db, [article_id])
         db.commit()
         
         # 从Elasticsearch删除
         delete_result = delete_article_from_index(article_id)
         if not delete_result:
-            logger.warning(f"从MySQL删除文章成功，但从Elasticsearch删除失败: {article_id}")
+            logger.warning(f"从MySQL删除文章成功，但从Elasticsearch删除失败，稍后重试: {article_id}")
+            defer_index(db, article_id, "delete", "delete_article_from_index failed")
+        data_version.bump(db)
         
         return {
             "success": True,
@@ -303,33 +410,168 @@ def delete_article_by_id(db: Session, article_id: str) -> Dict[str, Any]:
             "deleted": False
         }
 
+def _delete_conditions(criteria: Dict[str, Any]) -> List[Any]:
+    """批量删除条件中除ID列表以外的部分"""
+    conditions = []
+    if criteria.get("biz"):
+        conditions.append(Article.biz == criteria["biz"])
+    if criteria.get("bizname"):
+        conditions.append(Article.bizname == criteria["bizname"])
+    if criteria.get("start"):
+        conditions.append(Article.pub_time_iso >= criteria["start"])
+    if criteria.get("end"):
+        conditions.append(Article.pub_time_iso <= criteria["end"])
+    return conditions
+
+def _matching_batches(db: Session, criteria: Dict[str, Any], batch_size: int) -> Iterator[List[Any]]:
+    """
+    分批读取匹配条件的文章 (id, unique_id)
+
+    指定ID列表时按列表分批；否则按主键键集扫描，整个任务只遍历一遍主键，没有索引的条件（如bizname）也不会每批全表扫描
+    """
+    stmt = select(Article.id, Article.unique_id).where(*_delete_conditions(criteria))
+    unique_ids = criteria.get("ids")
+    if unique_ids:
+        for start in range(0, len(unique_ids), batch_size):
+            rows = db.execute(stmt.where(Article.unique_id.in_(unique_ids[start:start + batch_size]))).all()
+            if rows:
+                yield rows
+        return
+
+    last_id = 0
+    while True:
+        rows = db.execute(stmt.where(Article.id > last_id).order_by(Article.id).limit(batch_size)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+def _delete_batch(db: Session, rows: List[Any], tombstones: List[str]) -> int:
+    """
+    删除一批文章并提交，锁和undo日志只涉及这一批；随后用一次bulk请求从ES删除，ES删除失败的转入同步重试队列
+
+    Args:
+        rows: 文章的 (id, unique_id)
+        tombstones: 需要写入删除记录的文章ID
+
+    Returns:
+        int: 从ES删除失败的文章数
+    """
+    unique_ids = [row.unique_id for row in rows]
+    db.execute(delete(Article).where(Article.id.in_([row.id for row in rows])))
+    dedup.delete_bands(db, unique_ids)
+    related.delete_lists(db, unique_ids)
+    changes.record_deletes(db, tombstones)
+    db.commit()
+
+    try:
+        errors = bulk_sync_articles([], unique_ids)
+    except Exception as e:
+        logger.warning(f"从Elasticsearch批量删除文章时发生错误，稍后重试: {e}")
+        errors = {unique_id: str(e) for unique_id in unique_ids}
+    for unique_id, error in errors.items():
+        defer_index(db, unique_id, "delete", error[:1000])
+    # 每批更新数据版本，任务执行期间缓存不会一直返回已删除的文章
+    data_version.bump(db)
+    return len(errors)
+
+def delete_matching_articles(criteria: Dict[str, Any], progress: jobs.JobProgress) -> str:
+    """按条件批量删除文章（后台任务的执行函数），每批一条 DELETE ... WHERE id IN (...) 并提交"""
+    with SessionLocal() as db:
+        conditions = _delete_conditions(criteria)
+        if criteria.get("ids"):
+            conditions.append(Article.unique_id.in_(criteria["ids"]))
+        progress.advance(0, db.scalar(select(func.count()).select_from(Article).where(*conditions)))
+
+        deleted = deferred = 0
+        for rows in _matching_batches(db, criteria, ARTICLE_DELETE_CHUNK):
+            deferred += _delete_batch(db, rows, [row.unique_id for row in rows])
+            deleted += len(rows)
+            progress.advance(len(rows))
+    return f"成功删除 {deleted} 篇文章" + (f"，{deferred} 篇从ES删除失败，已转入重试队列" if deferred else "")
+
+def delete_articles(db: Session, criteria: Dict[str, Any]) -> Dict[str, Any]:
+    """提交批量删除任务，立即返回任务状态"""
+    try:
+        job = jobs.create_job(db, "delete", criteria)
+        jobs.start_job(job.id, lambda progress: delete_matching_articles(criteria, progress))
+        return {
+            "success": True,
+            "message": f"批量删除任务已提交: {job.id}",
+            "job": jobs.job_dict(job)
+        }
+    except Exception as e:
+        logger.error(f"提交批量删除任务时发生错误: {e}")
+        db.rollback()
+        return {
+            "success": False,
+            "message": f"提交批量删除任务时发生错误: {str(e)}"
+        }
+
+def clear_all_articles(max_id: int, cleared_at: datetime, progress: jobs.JobProgress) -> str:
+    """
+    清空提交任务时已有的文章（后台任务的执行函数）
+
+    只删除 id 不超过 max_id 的文章，任务执行期间新入库的文章保留。按主键分批删除并提交，
+    每秒最多删除 ARTICLE_CLEAR_ROWS_PER_SECOND 篇，批与批之间其他请求的写入可以拿到锁。
+    变更订阅中清空只记一条clear，cleared_at 之后修改过的文章在clear之后又出现在订阅中，删除时单独记录。
+    """
+    with SessionLocal() as db:
+        progress.advance(0, db.scalar(select(func.count()).select_from(Article).where(Article.id <= max_id)))
+
+        deleted = deferred = 0
+        last_id = 0
+        started = time.monotonic()
+        while True:
+            rows = db.execute(
+                select(Article.id, Article.unique_id, Article.updated_at)
+                .where(Article.id > last_id, Article.id <= max_id)
+                .order_by(Article.id)
+                .limit(ARTICLE_CLEAR_CHUNK)
+            ).all()
+            if not rows:
+                break
+            deferred += _delete_batch(db, rows, [row.unique_id for row in rows if row.updated_at >= cleared_at])
+            deleted += len(rows)
+            last_id = rows[-1].id
+            progress.advance(len(rows))
+
+            if ARTICLE_CLEAR_ROWS_PER_SECOND > 0:
+                delay = started + deleted / ARTICLE_CLEAR_ROWS_PER_SECOND - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+    return f"已清空 {deleted} 篇文章" + (f"，{deferred} 篇从ES删除失败，已转入重试队列" if deferred else "")
+
 def clear_articles(db: Session) -> Dict[str, Any]:
-    """清空所有文章"""
+    """提交清空文章任务，已有清空任务在执行时返回该任务"""
     try:
-        # 从MySQL删除所有文章
-        db.query(Article).delete()
-        db.commit()
-        
-        # 从Elasticsearch清空索引
-        clear_result = clear_index()
-        
-        if clear_result["success"]:
+        active = jobs.find_active_job(db, "clear")
+        if active:
             return {
                 "success": True,
-                "message": "所有文章已清空"
+                "message": f"清空任务正在执行: {active['id']}",
+                "job": active
             }
-        else:
-            return {
-                "success": True,
-                "message": f"MySQL文章已清空，但ES索引操作状态: {clear_result['message']}"
-            }
-            
+
+        # 先记录clear再确定范围，之后入库的文章不会被清空
+        cleared_at = db.scalar(select(func.now()))
+        changes.record_clear(db)
+        db.commit()
+        max_id = db.scalar(select(func.max(Article.id))) or 0
+
+        job = jobs.create_job(db, "clear", {"max_id": max_id, "cleared_at": cleared_at})
+        jobs.start_job(job.id, lambda progress: clear_all_articles(max_id, cleared_at, progress))
+        return {
+            "success": True,
+            "message": f"清空任务已提交: {job.id}",
+            "job": jobs.job_dict(job)
+        }
     except Exception as e:
-        logger.error(f"清空文章时发生错误: {e}")
+        logger.error(f"提交清空任务时发生错误: {e}")
         db.rollback()
         return {
             "success": False,
-            "message": f"清空文章时发生错误: {str(e)}"
+            "message": f"提交清空任务时发生错误: {str(e)}"
         }
 
 def add_single_article(db: Session, article_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -346,81 +588,56 @@ def add_single_article(db: Session, article_data: Dict[str, Any]) -> Dict[str, A
     try:
         if not article_data:
             return {"success": False, "message": "文章数据为空", "saved": 0}
-            
-        # 生成唯一ID
-        biz = article_data.get('biz', '')
-        mid = article_data.get('mid', '')
-        idx = article_data.get('idx', '')
-        
-        unique_id = f"{biz}-{mid}-{idx}"
-        # 检查是否所有部分都存在
-        parts = unique_id.split('-')
-        if len(parts) != 3 or not all(parts) or unique_id == "--":
-            # 如果缺少任何部分，生成随机ID
-            logger.warning(f"文章缺少完整标识信息，使用随机ID: biz={biz}, mid={mid}, idx={idx}")
-            unique_id = str(uuid.uuid4())
-        
-        # 转换发布时间
-        pub_time = article_data.get("pub_time", "")
-        pub_time_iso = None
-        if pub_time:
-            try:
-                pub_time_iso = datetime.fromtimestamp(int(pub_time))
-            except (ValueError, TypeError):
-                pub_time_iso = None
+        
+        try:
+            article = validate_article(article_data)
+        except ValidationError as e:
+            return {"success": False, "message": "文章数据不合法", "saved": 0, "errors": error_report(e)}
+        
+        # 补全默认值，生成唯一ID和发布时间
+        record = article_record(article)
+        unique_id = record["unique_id"]
         
         # 检查文章是否已存在
         existing_article = db.query(Article).filter(Article.unique_id == unique_id).first()
         
         if existing_article:
             # 更新现有文章
-            existing_article.url = article_data.get("url", existing_article.url)
-            existing_article.title = article_data.get("title", existing_article.title)
-            existing_article.digest = article_data.get("digest", existing_article.digest)
-            existing_article.pub_time = pub_time or existing_article.pub_time
-            existing_article.pub_time_iso = pub_time_iso or existing_article.pub_time_iso
-            existing_article.cover = article_data.get("cover", existing_article.cover)
-            existing_article.bizname = article_data.get("bizname", existing_article.bizname)
+            update_article(existing_article, article, record)
+            dedup.assign_cluster(db, existing_article)
             
             db.commit()
+            article_dict = existing_article.to_dict()
             
             # 同步到Elasticsearch
-            index_article(existing_article.to_dict())
+            index_article(article_dict)
+            data_version.bump(db)
             
             return {
                 "success": True,
                 "message": f"成功更新文章: {existing_article.title}",
                 "id": unique_id,
-                "article": existing_article.to_dict()
+                "article": article_dict
             }
         else:
             # 创建新文章
-            article = Article(
-                unique_id=unique_id,
-                url=article_data.get("url", ""),
-                title=article_data.get("title", ""),
-                digest=article_data.get("digest", ""),
-                pub_time=pub_time,
-                pub_time_iso=pub_time_iso,
-                cover=article_data.get("cover", ""),
-                bizname=article_data.get("bizname", ""),
-                biz=biz,
-                mid=mid,
-                idx=idx
-            )
+            article_obj = Article(**record)
             
-            db.add(article)
+            db.add(article_obj)
+            dedup.assign_cluster(db, article_obj)
             db.commit()
-            db.refresh(article)
+            db.refresh(article_obj)
+            article_dict = article_obj.to_dict()
             
             # 同步到Elasticsearch
-            index_article(article.to_dict())
+            index_article(article_dict)
+            data_version.bump(db)
             
             return {
                 "success": True,
-                "message": f"成功添加文章: {article.title}",
+                "message": f"成功添加文章: {article_obj.title}",
                 "id": unique_id,
-                "article": article.to_dict()
+                "article": article_dict
             }
             
     except Exception as e:
@@ -435,14 +652,15 @@ def add_single_article(db: Session, article_data: Dict[str, Any]) -> Dict[str, A
 def rebuild_search_index(db: Session) -> Dict[str, Any]:
     """重建搜索索引"""
     try:
-        # 从MySQL获取所有文章
-        articles = db.query(Article).all()
+        # 从MySQL获取所有文章（只读取索引需要的列）
+        rows = db.execute(ARTICLE_INDEX.select().execution_options(yield_per=1000))
         
         # 转换为字典列表
-        articles_dict = [article.to_dict() for article in articles]
+        articles_dict = ARTICLE_INDEX.to_dicts(rows)
         
         # 重建索引
         result = reindex_all_articles(articles_dict)
+        data_version.bump(db)
         
         return result
         
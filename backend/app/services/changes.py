@@ -0,0 +1,202 @@
+"""文章变更订阅
+
+GET /articles/changes?since=<游标>&limit=<条数> 按变更时间顺序返回新增、更新和删除的文章，
+下游保存返回的游标，下次从该位置继续拉取，不需要每天全量导出。
+
+变更有两个来源：articles 表按 (updated_at, id) 的键集扫描（索引 ix_articles_updated_at_id），
+以及删除文章时写入 article_tombstones 的墓碑。两边各自按键集读取后按时间归并，游标记录两边的位置。
+
+- 同一篇文章多次修改只以最新状态出现一次；created_at 等于 updated_at 时为 insert，否则为 update，下游应按upsert处理
+- 只返回 CHANGE_FEED_LAG 秒之前的变更，避免提交晚于自身 updated_at 的事务落在已返回的游标之前
+- 回填簇ID不修改 updated_at，不产生变更
+- 墓碑保留 TOMBSTONE_RETENTION_DAYS 天，由日志保留任务一起清理；游标早于保留期时无法保证不漏掉删除，返回410
+
+用法（在 backend 目录下）:
+    python -m app.services.changes --prune    # 清理过期墓碑
+"""
+import os
+import json
+import base64
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import select, insert, delete, func, tuple_, literal
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, InstrumentedAttribute
+
+from ..models.database import engine
+from ..models.article import Article, ARTICLE_FULL
+from ..models.article_tombstone import ArticleTombstone
+
+logger = logging.getLogger(__name__)
+
+# 只返回多少秒之前的变更
+CHANGE_FEED_LAG = int(os.environ.get("CHANGE_FEED_LAG", "5"))
+# 墓碑保留天数，0表示不清理
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", "30"))
+# 每批清理的墓碑数
+TOMBSTONE_PURGE_CHUNK = int(os.environ.get("TOMBSTONE_PURGE_CHUNK", "5000"))
+
+Position = Tuple[datetime, int]
+_START: Position = (datetime(1970, 1, 1), 0)
+_MAX_ID = 2 ** 63 - 1
+
+class CursorError(ValueError):
+    """游标格式不正确"""
+
+class CursorExpired(Exception):
+    """游标早于墓碑保留期"""
+
+def encode_cursor(articles: Position, tombstones: Position) -> str:
+    payload = {"a": [articles[0].isoformat(), articles[1]], "t": [tombstones[0].isoformat(), tombstones[1]]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Position, Position]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return tuple(
+            (datetime.fromisoformat(payload[key][0]), int(payload[key][1])) for key in ("a", "t")
+        )
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        raise CursorError(f"游标格式不正确: {cursor}") from e
+
+def record_deletes(db: Session, unique_ids: List[str]):
+    """记录被删除的文章（由调用方提交）"""
+    if unique_ids:
+        db.execute(insert(ArticleTombstone), [{"unique_id": unique_id, "op": "delete"} for unique_id in unique_ids])
+
+def record_clear(db: Session):
+    """记录清空全部文章（由调用方提交）"""
+    db.execute(insert(ArticleTombstone).values(unique_id=None, op="clear"))
+
+def _article_change(row: Any) -> Dict[str, Any]:
+    article = ARTICLE_FULL.to_dict(row)
+    return {
+        "op": "insert" if article["created_at"] == article["updated_at"] else "update",
+        "unique_id": article["unique_id"],
+        "changed_at": article["updated_at"],
+        "article": article
+    }
+
+def _tombstone_change(row: Any) -> Dict[str, Any]:
+    return {"op": row.op, "unique_id": row.unique_id, "changed_at": row.deleted_at.isoformat()}
+
+def _after(time_column: InstrumentedAttribute, id_column: InstrumentedAttribute, position: Position):
+    """(时间, id) 键集条件，参数按列的类型绑定，SQLite 下与存储的时间字符串格式一致"""
+    return tuple_(time_column, id_column) > tuple_(literal(position[0], time_column.type), literal(position[1], id_column.type))
+
+def get_changes(db: Session, since: Optional[str] = None, limit: int = 500) -> Dict[str, Any]:
+    """
+    读取游标之后的变更
+
+    Args:
+        db: 数据库会话
+        since: 上次返回的游标，为空时从头开始
+        limit: 最多返回的变更数
+
+    Returns:
+        Dict: {"changes": [...], "cursor": 下次请求的游标, "has_more": 是否还有可立即读取的变更}
+
+    Raises:
+        CursorError: 游标格式不正确
+        CursorExpired: 游标早于墓碑保留期
+    """
+    article_position, tombstone_position = decode_cursor(since) if since else (_START, _START)
+    # 变更时间由数据库的 now() 写入，使用数据库时钟，不受应用服务器时钟偏差影响
+    now = db.scalar(select(func.now())).replace(microsecond=0)
+    if since and TOMBSTONE_RETENTION_DAYS > 0 and tombstone_position[0] < now - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        raise CursorExpired(f"游标早于删除记录的保留期（{TOMBSTONE_RETENTION_DAYS} 天），需要重新全量同步")
+    horizon = now - timedelta(seconds=CHANGE_FEED_LAG)
+
+    article_rows = db.execute(
+        ARTICLE_FULL.select()
+        .where(_after(Article.updated_at, Article.id, article_position), Article.updated_at < horizon)
+        .order_by(Article.updated_at, Article.id)
+        .limit(limit)
+    ).all()
+    tombstone_rows = db.execute(
+        select(ArticleTombstone.id, ArticleTombstone.unique_id, ArticleTombstone.op, ArticleTombstone.deleted_at)
+        .where(
+            _after(ArticleTombstone.deleted_at, ArticleTombstone.id, tombstone_position),
+            ArticleTombstone.deleted_at < horizon
+        )
+        .order_by(ArticleTombstone.deleted_at, ArticleTombstone.id)
+        .limit(limit)
+    ).all()
+
+    # 按时间归并，同一时间先删除后写入（删除后重新入库的文章以写入为准）
+    updated_at = ARTICLE_FULL.fields.index("updated_at")
+    article_id = ARTICLE_FULL.fields.index("id")
+    merged = sorted(
+        [(row[updated_at], 1, row[article_id], row) for row in article_rows]
+        + [(row.deleted_at, 0, row.id, row) for row in tombstone_rows],
+        key=lambda item: item[:3]
+    )
+    consumed = merged[:limit]
+
+    changes = []
+    consumed_articles = consumed_tombstones = 0
+    for changed_at, kind, row_id, row in consumed:
+        if kind:
+            article_position = (changed_at, row_id)
+            consumed_articles += 1
+            changes.append(_article_change(row))
+        else:
+            tombstone_position = (changed_at, row_id)
+            consumed_tombstones += 1
+            changes.append(_tombstone_change(row))
+
+    # 归并顺序保证：另一类中早于最后一条变更的记录都已返回（同一时间的删除记录排在文章之前），
+    # 该类的位置也随之前移，只有文章（或只有删除记录）的页不会让另一类的位置停在保留期之前
+    if consumed:
+        last_time, last_kind = consumed[-1][:2]
+        if last_kind:
+            tombstone_position = max(tombstone_position, (last_time, _MAX_ID))
+        else:
+            article_position = max(article_position, (last_time, 0))
+
+    # 读到了 horizon 之前的全部变更时，位置前移到 horizon，游标不会因为长时间没有变更而过期
+    if len(article_rows) < limit and consumed_articles == len(article_rows):
+        article_position = max(article_position, (horizon, 0))
+    if len(tombstone_rows) < limit and consumed_tombstones == len(tombstone_rows):
+        tombstone_position = max(tombstone_position, (horizon, 0))
+
+    return {
+        "changes": changes,
+        "cursor": encode_cursor(article_position, tombstone_position),
+        "has_more": len(merged) > limit or len(article_rows) == limit or len(tombstone_rows) == limit
+    }
+
+def prune_tombstones(bind: Engine = engine, retention_days: int = TOMBSTONE_RETENTION_DAYS) -> int:
+    """分批删除过期的墓碑，每批单独提交"""
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        with bind.begin() as conn:
+            ids = conn.execute(
+                select(ArticleTombstone.id).where(ArticleTombstone.deleted_at < cutoff)
+                .order_by(ArticleTombstone.deleted_at).limit(TOMBSTONE_PURGE_CHUNK)
+            ).scalars().all()
+            if not ids:
+                break
+            conn.execute(delete(ArticleTombstone).where(ArticleTombstone.id.in_(ids)))
+        deleted += len(ids)
+    if deleted:
+        logger.info(f"已删除过期墓碑 {deleted} 条")
+    return deleted
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="文章变更订阅维护")
+    parser.add_argument("--prune", action="store_true", help="清理过期墓碑")
+    args = parser.parse_args()
+
+    if args.prune:
+        print({"deleted": prune_tombstones()})
+    else:
+        parser.print_help()
@@ -0,0 +1,131 @@
+"""数据版本与HTTP条件请求
+
+文章写入、删除、清空以及ES同步重试成功后递增 data_versions 表中的版本号，
+/articles/ 和 /search/ 据此生成ETag和Last-Modified。客户端带 If-None-Match
+或 If-Modified-Since 且数据未变化时直接返回304，不执行MySQL或ES查询。
+
+版本号从接口查询数据所用的同一个会话读取（使用只读副本时读副本上的版本号），并且在查询数据之前读取：
+副本复制到的版本号不会超前于它已有的数据，ETag只可能比数据旧（下次请求返回200），
+不会出现新版本号配旧数据、之后一直返回304的情况。ES的同步写入使用 refresh=True，
+在递增版本号之前已经可以搜到。
+
+版本号按数据源在进程内缓存 DATA_VERSION_TTL 秒，本进程的写入会立即使缓存失效；
+多进程部署时其他进程最多延迟 DATA_VERSION_TTL 秒看到新版本。
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import update, select
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+from ..models.database import SessionLocal
+from ..models.data_version import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# 进程内缓存版本号的秒数
+DATA_VERSION_TTL = float(os.environ.get("DATA_VERSION_TTL", "1"))
+
+ARTICLES = "articles"
+
+# (数据源, 名称) -> (缓存时间, 版本号, 最后修改时间)
+_cache: Dict[Tuple[str, str], Tuple[float, int, Optional[datetime]]] = {}
+_lock = threading.Lock()
+
+def bump(db: Session, name: str = ARTICLES):
+    """递增数据版本，在数据变更提交后调用"""
+    try:
+        now = datetime.now().replace(microsecond=0)
+        result = db.execute(
+            update(DataVersion)
+            .where(DataVersion.name == name)
+            .values(generation=DataVersion.generation + 1, modified_at=now)
+        )
+        if result.rowcount == 0:
+            db.add(DataVersion(name=name, generation=1, modified_at=now))
+        db.commit()
+    except Exception as e:
+        logger.error(f"更新数据版本时发生错误: {e}")
+        db.rollback()
+    finally:
+        with _lock:
+            for key in [key for key in _cache if key[1] == name]:
+                _cache.pop(key, None)
+
+def _read(db: Session, name: str) -> Tuple[int, Optional[datetime]]:
+    row = db.execute(
+        select(DataVersion.generation, DataVersion.modified_at).where(DataVersion.name == name)
+    ).first()
+    return (row[0], row[1]) if row else (0, None)
+
+def current(name: str = ARTICLES, db: Optional[Session] = None) -> Tuple[int, Optional[datetime]]:
+    """
+    当前数据版本
+
+    Args:
+        name: 版本名称
+        db: 查询数据所用的会话，为空时读主库
+
+    Returns:
+        Tuple: (版本号, 最后修改时间)
+    """
+    source = str(db.get_bind().url) if db is not None else ""
+    key = (source, name)
+    now = time.monotonic()
+    cached = _cache.get(key)
+    if cached and now - cached[0] < DATA_VERSION_TTL:
+        return cached[1], cached[2]
+
+    if db is not None:
+        generation, modified_at = _read(db, name)
+    else:
+        with SessionLocal() as session:
+            generation, modified_at = _read(session, name)
+    with _lock:
+        _cache[key] = (now, generation, modified_at)
+    return generation, modified_at
+
+class Validators:
+    """一次请求的缓存校验信息"""
+    __slots__ = ("etag", "modified_at")
+
+    def __init__(self, etag: str, modified_at: Optional[datetime]):
+        self.etag = etag
+        self.modified_at = modified_at
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.modified_at:
+            headers["Last-Modified"] = format_datetime(self.modified_at.astimezone(timezone.utc), usegmt=True)
+        return headers
+
+def validators(prefix: str, db: Optional[Session] = None, name: str = ARTICLES) -> Validators:
+    """按当前数据版本生成校验信息，prefix 区分不同接口，db 为接口查询数据所用的会话"""
+    generation, modified_at = current(name, db)
+    return Validators(f'W/"{prefix}-{generation}"', modified_at)
+
+def not_modified(request: Request, current_validators: Validators) -> bool:
+    """判断客户端缓存的版本是否仍然有效"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # 弱比较：忽略 W/ 前缀
+        etag = current_validators.etag[2:]
+        return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and current_validators.modified_at:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return current_validators.modified_at.astimezone(timezone.utc) <= since
+    return False
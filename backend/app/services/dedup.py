@@ -0,0 +1,285 @@
+"""近似重复文章检测
+
+同一篇文章常被多个公众号转载，unique_id（biz-mid-idx）不同但标题和摘要几乎相同。
+入库时对标题+摘要计算64位SimHash，汉明距离不超过 SIMHASH_MAX_DISTANCE 的文章归入同一簇，
+簇ID为簇内最早入库文章的unique_id，保存在 articles.cluster_id 并同步到ES，
+/search/?collapse=true 按簇折叠搜索结果。
+
+查找候选使用分段索引（simhash_bands 表）：64位指纹切成4段16位，距离不超过3的两个指纹
+至少有一段完全相同，因此只需按4个段值等值查询，再对候选计算汉明距离。
+
+已有文章的簇ID用命令行回填（在 backend 目录下）:
+    python -m app.services.dedup                 # 回填没有簇ID的文章
+    python -m app.services.dedup --reset         # 清空后全部重新计算
+"""
+import os
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from sqlalchemy import select, delete, insert, update, bindparam
+from sqlalchemy.orm import Session
+
+from ..models.article import Article, ARTICLE_INDEX
+from ..models.simhash_band import SimhashBand
+from .search import bulk_sync_articles
+from .index_retry import defer_index
+from .features import normalize_text
+from . import data_version
+
+logger = logging.getLogger(__name__)
+
+# 视为近似重复的最大汉明距离，4段分段索引只保证距离不超过3时召回全部候选
+SIMHASH_MAX_DISTANCE = int(os.environ.get("SIMHASH_MAX_DISTANCE", "3"))
+# 回填时每批处理的文章数
+DEDUP_BATCH_SIZE = int(os.environ.get("DEDUP_BATCH_SIZE", "1000"))
+
+BANDS = 4
+BAND_BITS = 16
+_BAND_MASK = (1 << BAND_BITS) - 1
+
+# 按位计数的车道宽度：每个64位哈希展开为64个16位车道（每位一个），
+# 所有特征的展开值直接相加就得到每一位的计数，不需要逐位循环
+_LANE_BITS = 16
+_LANE_MASK = (1 << _LANE_BITS) - 1
+_BYTE_SPREAD = [sum(((byte >> bit) & 1) << (_LANE_BITS * bit) for bit in range(8)) for byte in range(256)]
+
+@lru_cache(maxsize=1 << 16)
+def _spread(shingle: str) -> int:
+    """特征的64位哈希展开后的车道值，常见字符组合命中缓存"""
+    h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+    value = 0
+    for byte in range(8):
+        value |= _BYTE_SPREAD[(h >> (8 * byte)) & 0xFF] << (_LANE_BITS * 8 * byte)
+    return value
+
+def fingerprint(title: Optional[str], digest: Optional[str]) -> Optional[int]:
+    """
+    标题+摘要的64位SimHash
+
+    特征为去除标点和空白后的相邻两字（中文按字切分），不足两个字时返回None
+    """
+    text = normalize_text(title, digest)
+    count = len(text) - 1
+    if count < 1:
+        return None
+    total = sum(map(_spread, (text[i:i + 2] for i in range(count))))
+    result = 0
+    for bit in range(64):
+        if ((total >> (_LANE_BITS * bit)) & _LANE_MASK) * 2 > count:
+            result |= 1 << bit
+    return result
+
+def to_signed(value: int) -> int:
+    """无符号指纹转为BIGINT/long可存储的有符号值"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+def band_keys(value: int) -> List[int]:
+    """指纹的4个分段键：段号 << 16 | 段值"""
+    return [band << BAND_BITS | (value >> (BAND_BITS * band)) & _BAND_MASK for band in range(BANDS)]
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class BandIndex:
+    """内存中的分段索引，用于一批文章内部及其候选之间的查找"""
+    __slots__ = ("_bands",)
+
+    def __init__(self):
+        self._bands: Dict[int, List[Tuple[str, int, str]]] = {}
+
+    def add(self, unique_id: str, value: int, cluster_id: str):
+        entry = (unique_id, value, cluster_id)
+        for key in band_keys(value):
+            self._bands.setdefault(key, []).append(entry)
+
+    def find(self, value: int, exclude: Optional[str] = None) -> Optional[str]:
+        """距离最近的近似重复文章所在的簇，不包括文章自身"""
+        best: Optional[Tuple[int, str]] = None
+        for key in band_keys(value):
+            for unique_id, candidate, cluster_id in self._bands.get(key, ()):
+                if unique_id == exclude:
+                    continue
+                distance = hamming(value, candidate)
+                if distance <= SIMHASH_MAX_DISTANCE and (best is None or distance < best[0]):
+                    best = (distance, cluster_id)
+        return best[1] if best else None
+
+def assign_clusters(items: Iterable[Tuple[str, Optional[int]]], index: BandIndex) -> List[str]:
+    """
+    按顺序为文章分配簇ID，同一批中先出现的文章也作为后续文章的候选
+
+    Args:
+        items: (unique_id, 指纹)
+        index: 已有文章的候选
+
+    Returns:
+        List: 每篇文章的簇ID
+    """
+    clusters = []
+    for unique_id, value in items:
+        if value is None:
+            clusters.append(unique_id)
+            continue
+        cluster_id = index.find(value, exclude=unique_id) or unique_id
+        index.add(unique_id, value, cluster_id)
+        clusters.append(cluster_id)
+    return clusters
+
+def load_candidates(db: Session, values: Iterable[int]) -> BandIndex:
+    """从 simhash_bands 表读取与任一指纹有相同分段的文章"""
+    index = BandIndex()
+    keys = {key for value in values for key in band_keys(value)}
+    if not keys:
+        return index
+    seen = set()
+    rows = db.execute(
+        select(SimhashBand.unique_id, SimhashBand.simhash, SimhashBand.cluster_id)
+        .where(SimhashBand.band_key.in_(keys))
+    )
+    for unique_id, value, cluster_id in rows:
+        if unique_id not in seen:
+            seen.add(unique_id)
+            index.add(unique_id, to_unsigned(value), cluster_id)
+    return index
+
+def _band_rows(unique_id: str, value: int, cluster_id: str) -> List[Dict[str, Any]]:
+    signed = to_signed(value)
+    return [
+        {"band_key": key, "unique_id": unique_id, "simhash": signed, "cluster_id": cluster_id}
+        for key in band_keys(value)
+    ]
+
+def assign_cluster(db: Session, article: Article):
+    """
+    计算文章的指纹和簇ID并更新分段索引，在文章写入的事务中调用（由调用方提交）
+
+    标题和摘要没有变化的已有文章保留原簇ID
+    """
+    value = fingerprint(article.title, article.digest)
+    signed = to_signed(value) if value is not None else None
+    if article.cluster_id is not None and article.simhash == signed:
+        return
+
+    if article.cluster_id is not None:
+        db.execute(delete(SimhashBand).where(SimhashBand.unique_id == article.unique_id))
+    if value is None:
+        cluster_id = article.unique_id
+    else:
+        cluster_id = load_candidates(db, [value]).find(value, exclude=article.unique_id) or article.unique_id
+        db.execute(insert(SimhashBand), _band_rows(article.unique_id, value, cluster_id))
+    article.simhash = signed
+    article.cluster_id = cluster_id
+
+def delete_bands(db: Session, unique_ids: List[str]):
+    """删除文章的分段索引（由调用方提交）"""
+    db.execute(delete(SimhashBand).where(SimhashBand.unique_id.in_(unique_ids)))
+
+def clear_bands(db: Session):
+    db.execute(delete(SimhashBand))
+
+def _sync_clusters(db: Session, articles: List[Dict[str, Any]]):
+    """回填后把簇ID同步到ES，失败的文章转入重试队列"""
+    try:
+        errors = bulk_sync_articles(articles)
+    except Exception as e:
+        logger.warning(f"同步簇ID到Elasticsearch时发生错误，稍后重试: {e}")
+        errors = {article["unique_id"]: str(e) for article in articles}
+    for unique_id, error in errors.items():
+        defer_index(db, unique_id, "index", error[:1000])
+
+def backfill_clusters(db: Session, batch_size: int = DEDUP_BATCH_SIZE, reset: bool = False) -> Dict[str, Any]:
+    """
+    按id顺序为没有簇ID的文章计算指纹和簇ID，每批一次候选查询和一次批量更新
+
+    Args:
+        db: 数据库会话
+        batch_size: 每批处理的文章数
+        reset: 先清空全部簇ID和分段索引再重新计算
+
+    Returns:
+        Dict: 处理的文章数和归入已有簇的文章数
+    """
+    table = Article.__table__
+    if reset:
+        clear_bands(db)
+        db.execute(update(table).values(simhash=None, cluster_id=None, updated_at=table.c.updated_at))
+        db.commit()
+        logger.info("已清空全部簇ID")
+
+    # 只改派生列，保留文章的更新时间
+    update_stmt = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(simhash=bindparam("_simhash"), cluster_id=bindparam("_cluster_id"), updated_at=table.c.updated_at)
+    )
+
+    processed = duplicates = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Article.id, *ARTICLE_INDEX.columns)
+            .where(Article.cluster_id.is_(None), Article.id > last_id)
+            .order_by(Article.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        articles = [ARTICLE_INDEX.to_dict(row[1:]) for row in rows]
+        values = [fingerprint(article["title"], article["digest"]) for article in articles]
+        index = load_candidates(db, [value for value in values if value is not None])
+        clusters = assign_clusters(((article["unique_id"], value) for article, value in zip(articles, values)), index)
+
+        params = []
+        bands = []
+        for row, article, value, cluster_id in zip(rows, articles, values, clusters):
+            article["cluster_id"] = cluster_id
+            params.append({
+                "_id": row[0],
+                "_simhash": to_signed(value) if value is not None else None,
+                "_cluster_id": cluster_id
+            })
+            if value is not None:
+                bands += _band_rows(article["unique_id"], value, cluster_id)
+            if cluster_id != article["unique_id"]:
+                duplicates += 1
+
+        delete_bands(db, [article["unique_id"] for article in articles])
+        if bands:
+            db.execute(insert(SimhashBand), bands)
+        db.execute(update_stmt, params)
+        db.commit()
+
+        _sync_clusters(db, articles)
+        processed += len(rows)
+        logger.info(f"已回填 {processed} 篇文章的簇ID，其中近似重复 {duplicates} 篇")
+
+    if processed:
+        data_version.bump(db)
+    return {
+        "success": True,
+        "message": f"回填 {processed} 篇文章，近似重复 {duplicates} 篇",
+        "processed": processed,
+        "duplicates": duplicates
+    }
+
+if __name__ == "__main__":
+    import argparse
+    from ..models.database import SessionLocal
+    from .storage import storage
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="回填文章的近似重复簇ID")
+    parser.add_argument("--batch-size", type=int, default=DEDUP_BATCH_SIZE, help="每批处理的文章数")
+    parser.add_argument("--reset", action="store_true", help="清空全部簇ID后重新计算")
+    args = parser.parse_args()
+
+    storage.initialize()
+    with SessionLocal() as session:
+        print(storage.backfill_clusters(session, args.batch_size, args.reset))
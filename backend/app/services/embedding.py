@@ -0,0 +1,196 @@
+"""文章向量
+
+混合搜索（/search/?mode=hybrid）使用的文章向量，离线计算，不依赖外部模型服务：
+标题+摘要的TF-IDF向量（features.vectorize，EMBEDDING_FEATURES 维）经截断SVD降到 EMBEDDING_DIM 维（LSA），
+按行L2归一化后写入ES的 embedding 字段（dense_vector）。查询词用同一模型编码，ES的kNN检索与BM25关键词查询合并评分。
+
+SVD分批累加TF-IDF矩阵的Gram矩阵（EMBEDDING_FEATURES × EMBEDDING_FEATURES），再做特征分解取前 EMBEDDING_DIM 个
+右奇异向量，内存与文章数无关。模型保存在 EMBEDDING_MODEL_PATH，各进程在文件更新后自动重新加载；
+重新训练后已有文档的向量需要重新编码。需要安装numpy，未安装或尚未训练时不写入向量，混合搜索退化为关键词搜索。
+
+用法（在 backend 目录下）:
+    python -m app.services.embedding               # 训练模型并重新编码全部文章
+    python -m app.services.embedding --fit-only    # 只训练模型
+    python -m app.services.embedding --encode-only # 用现有模型重新编码全部文章
+"""
+import os
+import logging
+import threading
+from itertools import islice
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .features import HASH_BITS, normalize_text, document_frequencies, inverse_document_frequency, vectorize
+
+logger = logging.getLogger(__name__)
+
+# 向量维数（ES dense_vector 的 dims，修改后需要重建索引）
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "128"))
+# SVD之前的TF-IDF维数（2的幂）
+EMBEDDING_FEATURES = int(os.environ.get("EMBEDDING_FEATURES", "1024"))
+# 训练和重新编码时每批的文章数
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "4096"))
+# 模型文件
+EMBEDDING_MODEL_PATH = os.environ.get(
+    "EMBEDDING_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "embedding.npz")
+)
+
+# 文章索引的向量字段映射，已有索引在初始化时补充
+EMBEDDING_MAPPING = {
+    "embedding": {"type": "dense_vector", "dims": EMBEDDING_DIM, "index": True, "similarity": "cosine"}
+}
+
+class Encoder:
+    """IDF和SVD投影矩阵，整批文本一次矩阵乘法编码"""
+    __slots__ = ("idf", "components", "features")
+
+    def __init__(self, idf: "np.ndarray", components: "np.ndarray"):
+        self.idf = idf
+        # features × dim
+        self.components = components
+        self.features = components.shape[0]
+
+    def encode(self, texts: Sequence[str]) -> "np.ndarray":
+        """已规范化的文本编码为按行L2归一化的向量，没有特征的文本为零向量"""
+        if not texts:
+            return np.zeros((0, self.components.shape[1]), np.float32)
+        projected = vectorize(texts, self.idf, self.features) @ self.components
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        return projected / np.maximum(norms, 1e-12)
+
+    def encode_articles(self, articles: Sequence[Dict[str, Any]]) -> List[Optional[List[float]]]:
+        """文章的向量，零向量（ES的cosine相似度不接受）为None"""
+        vectors = self.encode(_texts(articles))
+        valid = np.any(vectors != 0, axis=1)
+        return [vector if ok else None for vector, ok in zip(vectors.tolist(), valid.tolist())]
+
+    def encode_query(self, query: str) -> Optional[List[float]]:
+        return self.encode_articles([{"title": query}])[0]
+
+    def save(self, path: str):
+        """写入临时文件后替换，其他进程不会读到写了一半的模型"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp = f"{path}.tmp.npz"
+        np.savez(temp, idf=self.idf, components=self.components)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Encoder":
+        with np.load(path) as data:
+            return cls(data["idf"], data["components"])
+
+_lock = threading.Lock()
+_cached: Optional[Encoder] = None
+_cached_mtime: Optional[float] = None
+
+def get_encoder() -> Optional[Encoder]:
+    """当前模型，文件更新后重新加载；未安装numpy或尚未训练时返回None"""
+    global _cached, _cached_mtime
+    if np is None:
+        return None
+    try:
+        mtime = os.stat(EMBEDDING_MODEL_PATH).st_mtime
+    except OSError:
+        return None
+    if mtime == _cached_mtime:
+        return _cached
+
+    with _lock:
+        if mtime != _cached_mtime:
+            try:
+                encoder = Encoder.load(EMBEDDING_MODEL_PATH)
+            except Exception as e:
+                logger.error(f"加载向量模型失败: {e}")
+                return _cached
+            if encoder.components.shape[1] != EMBEDDING_DIM:
+                logger.error(f"向量模型维数 {encoder.components.shape[1]} 与 EMBEDDING_DIM={EMBEDDING_DIM} 不一致")
+                encoder = None
+            _cached, _cached_mtime = encoder, mtime
+    return _cached
+
+def encode_articles(articles: Sequence[Dict[str, Any]]) -> List[Optional[List[float]]]:
+    """用当前模型编码一批文章，没有模型时全部为None"""
+    encoder = get_encoder()
+    if encoder is None:
+        return [None] * len(articles)
+    return encoder.encode_articles(articles)
+
+def encode_query(query: str) -> Optional[List[float]]:
+    encoder = get_encoder()
+    return encoder.encode_query(query) if encoder else None
+
+def fit_encoder(
+    batches: Callable[[], Iterable[Sequence[Dict[str, Any]]]],
+    dim: int = EMBEDDING_DIM,
+    features: int = EMBEDDING_FEATURES
+) -> Encoder:
+    """
+    训练模型：第一遍统计文档频率，第二遍累加TF-IDF矩阵的Gram矩阵，特征分解后取前dim个分量
+
+    Args:
+        batches: 每次调用返回一遍全部文章（按批）
+        dim: 向量维数
+        features: SVD之前的TF-IDF维数
+    """
+    if np is None:
+        raise RuntimeError("训练向量模型需要安装numpy")
+
+    frequencies = np.zeros(1 << HASH_BITS, np.int64)
+    count = 0
+    for batch in batches():
+        frequencies += document_frequencies(_texts(batch))
+        count += len(batch)
+    if not count:
+        raise ValueError("没有文章，无法训练向量模型")
+    idf = inverse_document_frequency(frequencies, count)
+
+    gram = np.zeros((features, features), np.float64)
+    for batch in batches():
+        matrix = vectorize(_texts(batch), idf, features)
+        gram += matrix.T @ matrix
+
+    # Gram矩阵的特征向量是TF-IDF矩阵的右奇异向量，eigh 按特征值升序返回
+    _, vectors = np.linalg.eigh(gram)
+    components = vectors[:, ::-1][:, :dim].astype(np.float32)
+    logger.info(f"向量模型训练完成: {count} 篇文章，{features} -> {dim} 维")
+    return Encoder(idf, components)
+
+def _texts(articles: Sequence[Dict[str, Any]]) -> List[str]:
+    return [normalize_text(article.get("title"), article.get("digest")) for article in articles]
+
+def chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+if __name__ == "__main__":
+    import argparse
+    from .storage import storage
+    from .search import update_embeddings
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="训练文章向量模型并重新编码索引")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--fit-only", action="store_true", help="只训练模型")
+    group.add_argument("--encode-only", action="store_true", help="用现有模型重新编码全部文章")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="每批的文章数")
+    args = parser.parse_args()
+
+    storage.initialize()
+
+    def all_batches() -> Iterator[List[Dict[str, Any]]]:
+        return chunks(storage.iter_articles(None, None, None, args.batch_size), args.batch_size)
+
+    if not args.encode_only:
+        fit_encoder(all_batches).save(EMBEDDING_MODEL_PATH)
+    if not args.fit_only:
+        print(update_embeddings(all_batches()))
@@ -0,0 +1,85 @@
+"""数据导出服务：以NDJSON或CSV格式流式输出文章和搜索结果"""
+import io
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+
+from ..models.article import ARTICLE_DOCUMENT
+from . import search as search_service
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+# 每批从数据库/ES读取的行数
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# 每次写出的行数，减少小块写出的开销
+EXPORT_CHUNK_ROWS = 500
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+ARTICLE_EXPORT_FIELDS = list(ARTICLE_DOCUMENT.fields)
+
+SEARCH_EXPORT_FIELDS = ["unique_id", "title", "digest", "bizname", "pub_time_iso", "score"]
+
+def encode_rows(rows: Iterable[Dict[str, Any]], fmt: str, fields: List[str]) -> Iterator[str]:
+    """将行按指定格式编码，每EXPORT_CHUNK_ROWS行输出一块"""
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+
+    count = 0
+    for row in rows:
+        if writer:
+            writer.writerow([row.get(field) for field in fields])
+        else:
+            buffer.write(json.dumps({field: row.get(field) for field in fields}, ensure_ascii=False))
+            buffer.write("\n")
+
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_articles(
+    fmt: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    biz: Optional[str] = None
+) -> Iterator[str]:
+    """
+    导出文章，由存储后端按id（ES-only模式下按unique_id）顺序流式读取
+
+    MySQL会话在生成器内部创建，保证在整个响应流式输出期间有效；大范围扫描使用只读副本
+    """
+    try:
+        rows = storage.iter_articles(start_time, end_time, biz, EXPORT_BATCH_SIZE)
+        yield from encode_rows(rows, fmt, ARTICLE_EXPORT_FIELDS)
+    except Exception as e:
+        logger.error(f"导出文章时发生错误: {e}")
+        raise
+
+def export_search_results(
+    fmt: str,
+    query: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None
+) -> Iterator[str]:
+    """导出全部搜索结果"""
+    try:
+        rows = search_service.scan_search_results(query, start_time, end_time, EXPORT_BATCH_SIZE)
+        yield from encode_rows(rows, fmt, SEARCH_EXPORT_FIELDS)
+    except Exception as e:
+        logger.error(f"导出搜索结果时发生错误: {e}")
+        raise
@@ -0,0 +1,62 @@
+"""标题+摘要的文本特征
+
+近似重复检测、相关文章和向量搜索共用：文本去除标点和空白并转为小写，特征为相邻两字（中文按字切分）。
+TF-IDF向量把特征哈希到 2^20 个桶计算IDF，再按桶号带符号地投影到指定维数，整批文本在numpy中一次计算。
+"""
+import os
+import re
+from typing import Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 参与计算的最大字符数（去除标点和空白后），沿用近似重复检测的配置名
+TEXT_MAX_CHARS = int(os.environ.get("SIMHASH_MAX_CHARS", "4096"))
+
+HASH_BITS = 20
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+def normalize_text(title: Optional[str], digest: Optional[str]) -> str:
+    """标题+摘要去除标点和空白并转为小写"""
+    return _NON_WORD.sub("", f"{title or ''}{digest or ''}".lower())[:TEXT_MAX_CHARS]
+
+def _bigram_buckets(texts: Sequence[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    一批文本的全部相邻两字特征，整批向量化计算
+
+    Returns:
+        Tuple: (特征所在文本的序号, 哈希桶号)
+    """
+    joined = "\0".join(texts) + "\0"
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32)
+    left, right = codes[:-1], codes[1:]
+    valid = (left != 0) & (right != 0)
+    # 每个位置之前的分隔符个数就是它所在文本的序号
+    documents = np.cumsum(codes == 0)[:-1][valid]
+    keys = (left[valid].astype(np.uint64) << np.uint64(21)) | right[valid]
+    buckets = (keys * np.uint64(_HASH_MULTIPLIER)) >> np.uint64(64 - HASH_BITS)
+    return documents, buckets.astype(np.int64)
+
+def document_frequencies(texts: Sequence[str]) -> "np.ndarray":
+    """每个哈希桶出现在多少篇文本中"""
+    documents, buckets = _bigram_buckets(texts)
+    pairs = np.unique((documents << HASH_BITS) | buckets)
+    return np.bincount(pairs & ((1 << HASH_BITS) - 1), minlength=1 << HASH_BITS)
+
+def inverse_document_frequency(frequencies: "np.ndarray", count: int) -> "np.ndarray":
+    return (np.log((1 + count) / (1 + frequencies)) + 1).astype(np.float32)
+
+def vectorize(texts: Sequence[str], idf: "np.ndarray", dim: int) -> "np.ndarray":
+    """文本的TF-IDF向量（按桶号带符号投影到dim维，dim为2的幂），按行L2归一化"""
+    documents, buckets = _bigram_buckets(texts)
+    columns = buckets & (dim - 1)
+    signs = 1 - 2 * ((buckets >> (dim.bit_length() - 1)) & 1)
+    matrix = np.bincount(
+        documents * dim + columns, weights=idf[buckets] * signs, minlength=len(texts) * dim
+    ).reshape(len(texts), dim).astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
@@ -0,0 +1,212 @@
+"""Elasticsearch同步重试
+
+文章写入MySQL后同步到ES失败（包括熔断期间直接跳过的同步）时，记录到 pending_index 表，
+由后台任务在ES恢复后批量重试，失败次数越多重试间隔越长。多进程部署时每个工作进程都启动后台任务，
+同一时间只有取得文件锁的进程执行重试。
+
+用法（在 backend 目录下）:
+    python -m app.services.index_retry
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, Optional
+from sqlalchemy import select, update, delete, func, bindparam
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ..models.database import SessionLocal
+from ..models.article import Article, ARTICLE_INDEX
+from ..models.pending_index import PendingIndex
+from ..connections import es_breaker
+from ..circuit_breaker import CircuitOpenError
+from ..metrics import Counter
+from .search import bulk_sync_articles
+from . import data_version
+
+logger = logging.getLogger(__name__)
+
+# 后台重试间隔（秒），0表示不启动后台任务
+INDEX_RETRY_INTERVAL = float(os.environ.get("INDEX_RETRY_INTERVAL", "10"))
+# 每批重试的文章数
+INDEX_RETRY_BATCH = int(os.environ.get("INDEX_RETRY_BATCH", "500"))
+# 单篇文章的最长重试间隔（秒）
+INDEX_RETRY_MAX_BACKOFF = float(os.environ.get("INDEX_RETRY_MAX_BACKOFF", "3600"))
+
+INDEX_DEFERRED = Counter("es_index_deferred_total", "转入重试队列的ES同步操作", ("action",))
+INDEX_RETRIED = Counter("es_index_retried_total", "重试的ES同步操作", ("result",))
+
+_LOCK_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "index_retry.lock"
+)
+
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+@contextmanager
+def _job_lock() -> Iterator[bool]:
+    """进程间互斥锁，已被其他进程持有时返回False"""
+    os.makedirs(os.path.dirname(_LOCK_PATH), exist_ok=True)
+    with open(_LOCK_PATH, "w") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def defer_index(db: Session, unique_id: str, action: str = "index", error: str = ""):
+    """
+    记录待同步的文章，同一篇文章只保留最后一次操作
+
+    Args:
+        db: 数据库会话
+        unique_id: 文章唯一ID
+        action: index 或 delete
+        error: 失败原因
+    """
+    try:
+        pending = db.get(PendingIndex, unique_id)
+        if pending:
+            pending.action = action
+            pending.last_error = error
+            pending.next_attempt_at = datetime.now()
+            # 在SQL中递增，并发记录时也不会回到重试任务读取时的版本
+            pending.revision = PendingIndex.revision + 1
+        else:
+            db.add(PendingIndex(unique_id=unique_id, action=action, last_error=error, next_attempt_at=datetime.now()))
+        db.commit()
+        INDEX_DEFERRED.labels(action).inc()
+    except Exception as e:
+        logger.error(f"记录待同步文章时发生错误: {unique_id}, {e}")
+        db.rollback()
+
+# 按读取时的版本号删除或推迟：重试期间有新操作记录时版本号已变化，不会被覆盖
+_DELETE_SYNCED = delete(PendingIndex.__table__).where(
+    PendingIndex.unique_id == bindparam("b_unique_id"), PendingIndex.revision == bindparam("b_revision")
+)
+_POSTPONE_FAILED = (
+    update(PendingIndex.__table__)
+    .where(PendingIndex.unique_id == bindparam("b_unique_id"), PendingIndex.revision == bindparam("b_revision"))
+    .values(attempts=bindparam("b_attempts"), last_error=bindparam("b_last_error"),
+            next_attempt_at=bindparam("b_next_attempt_at"))
+)
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(INDEX_RETRY_INTERVAL * 2 ** attempts, INDEX_RETRY_MAX_BACKOFF))
+
+def retry_pending(batch_size: int = INDEX_RETRY_BATCH) -> Dict[str, Any]:
+    """
+    重试一批到期的待同步文章
+
+    Returns:
+        Dict: 成功和失败的数量
+    """
+    if es_breaker.is_open():
+        return {"success": False, "message": "Elasticsearch熔断中，跳过重试", "synced": 0, "failed": 0}
+
+    with SessionLocal() as db:
+        now = datetime.now()
+        pending = db.execute(
+            select(PendingIndex)
+            .where(PendingIndex.next_attempt_at <= now)
+            .order_by(PendingIndex.next_attempt_at)
+            .limit(batch_size)
+        ).scalars().all()
+        if not pending:
+            return {"success": True, "synced": 0, "failed": 0}
+
+        index_ids = [p.unique_id for p in pending if p.action == "index"]
+        articles = ARTICLE_INDEX.to_dicts(
+            db.execute(ARTICLE_INDEX.select().where(Article.unique_id.in_(index_ids)))
+        ) if index_ids else []
+        found = {article["unique_id"] for article in articles}
+        # 待索引但已从MySQL删除的文章改为删除
+        deleted_ids = [p.unique_id for p in pending if p.action == "delete" or p.unique_id not in found]
+
+        try:
+            errors = bulk_sync_articles(articles, deleted_ids)
+        except CircuitOpenError as e:
+            return {"success": False, "message": str(e), "synced": 0, "failed": 0}
+        except Exception as e:
+            logger.warning(f"重试ES同步时发生错误: {e}")
+            errors = {p.unique_id: str(e) for p in pending}
+
+        synced_rows, failed_rows = [], []
+        for p in pending:
+            key = {"b_unique_id": p.unique_id, "b_revision": p.revision}
+            if p.unique_id in errors:
+                failed_rows.append({
+                    **key, "b_attempts": p.attempts + 1, "b_last_error": errors[p.unique_id][:1000],
+                    "b_next_attempt_at": now + _backoff(p.attempts + 1)
+                })
+            else:
+                synced_rows.append(key)
+        conn = db.connection()
+        if synced_rows:
+            conn.execute(_DELETE_SYNCED, synced_rows)
+        if failed_rows:
+            conn.execute(_POSTPONE_FAILED, failed_rows)
+        db.commit()
+
+        synced = len(pending) - len(errors)
+        if synced:
+            # 搜索结果发生了变化
+            data_version.bump(db)
+        INDEX_RETRIED.labels("synced").inc(synced)
+        INDEX_RETRIED.labels("failed").inc(len(errors))
+        if synced:
+            logger.info(f"重试ES同步: 成功 {synced} 篇，失败 {len(errors)} 篇")
+        return {"success": True, "synced": synced, "failed": len(errors)}
+
+def pending_count(db: Session) -> int:
+    """待同步的文章数"""
+    return db.scalar(select(func.count()).select_from(PendingIndex)) or 0
+
+def _retry_loop():
+    """后台定期重试，每轮处理完所有到期的文章；其他进程正在重试时跳过本轮"""
+    while not _stop_event.is_set():
+        try:
+            with _job_lock() as locked:
+                while locked and not _stop_event.is_set():
+                    result = retry_pending()
+                    if not result["success"] or result["synced"] + result["failed"] < INDEX_RETRY_BATCH:
+                        break
+        except Exception as e:
+            logger.error(f"ES同步重试任务发生错误: {e}")
+        _stop_event.wait(INDEX_RETRY_INTERVAL)
+
+def start_index_retry_worker() -> bool:
+    """启动后台重试线程"""
+    global _worker
+    if INDEX_RETRY_INTERVAL <= 0:
+        logger.info("未配置重试间隔，不启动ES同步重试任务")
+        return False
+    if _worker and _worker.is_alive():
+        return True
+
+    _stop_event.clear()
+    _worker = threading.Thread(target=_retry_loop, name="index-retry", daemon=True)
+    _worker.start()
+    logger.info(f"ES同步重试任务已启动，间隔 {INDEX_RETRY_INTERVAL} 秒")
+    return True
+
+def stop_index_retry_worker():
+    """停止后台重试线程"""
+    _stop_event.set()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(retry_pending())
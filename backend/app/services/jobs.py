@@ -0,0 +1,126 @@
+"""文章后台任务
+
+批量删除、清空等耗时操作不在HTTP请求中执行：接口创建一行 article_jobs 记录后立即返回任务，
+由提交任务的进程在后台线程中执行，每处理一批更新一次进度，通过 GET /articles/jobs/{job_id} 查询。
+
+执行任务的进程退出后进度不再更新，超过 JOB_STALE_SECONDS 秒未更新的运行中任务显示为 interrupted；
+批量删除可以用相同条件重新提交，从剩余的文章继续；清空任务重新提交即可。
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+
+from ..models.database import engine
+from ..models.article_job import ArticleJob
+
+logger = logging.getLogger(__name__)
+
+# 运行中的任务超过多少秒未更新进度视为已中断
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "300"))
+
+class JobProgress:
+    """任务进度，执行函数每处理一批调用一次 advance"""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.processed = 0
+
+    def advance(self, count: int, total: Optional[int] = None):
+        """累加已处理数，total 不为空时同时更新总数"""
+        self.processed += count
+        values = {"processed": self.processed, "updated_at": func.now()}
+        if total is not None:
+            values["total"] = total
+        with engine.begin() as conn:
+            conn.execute(update(ArticleJob).where(ArticleJob.id == self.job_id).values(**values))
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化: {type(value)}")
+
+def create_job(db: Session, kind: str, params: Dict[str, Any]) -> ArticleJob:
+    """创建任务记录"""
+    job = ArticleJob(kind=kind, status="pending", params=json.dumps(params, ensure_ascii=False, default=_json_default))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def _finish(job_id: int, status: str, message: str):
+    with engine.begin() as conn:
+        conn.execute(
+            update(ArticleJob).where(ArticleJob.id == job_id)
+            .values(status=status, message=message, updated_at=func.now(), finished_at=func.now())
+        )
+
+def _run(job_id: int, target: Callable[[JobProgress], str]):
+    with engine.begin() as conn:
+        conn.execute(
+            update(ArticleJob).where(ArticleJob.id == job_id).values(status="running", updated_at=func.now())
+        )
+    try:
+        message = target(JobProgress(job_id))
+    except Exception as e:
+        logger.error(f"后台任务 {job_id} 失败: {e}")
+        _finish(job_id, "failed", str(e))
+        return
+    logger.info(f"后台任务 {job_id} 完成: {message}")
+    _finish(job_id, "done", message)
+
+def start_job(job_id: int, target: Callable[[JobProgress], str]) -> threading.Thread:
+    """
+    在后台线程中执行任务
+
+    Args:
+        job_id: create_job 返回的任务ID
+        target: 执行函数，接收进度对象，返回完成时的说明；抛出异常时任务失败
+    """
+    worker = threading.Thread(target=_run, args=(job_id, target), name=f"article-job-{job_id}", daemon=True)
+    worker.start()
+    return worker
+
+def job_dict(job: ArticleJob, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """任务的状态和进度，now 为数据库当前时间，用于判断运行中的任务是否已中断"""
+    status = job.status
+    if status in ("pending", "running") and now and (now - job.updated_at).total_seconds() > JOB_STALE_SECONDS:
+        status = "interrupted"
+    return {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": status,
+        "params": json.loads(job.params) if job.params else {},
+        "total": job.total,
+        "processed": job.processed,
+        "message": job.message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def find_active_job(db: Session, kind: str) -> Optional[Dict[str, Any]]:
+    """同类任务中最近一个仍在执行的任务，没有时返回None"""
+    job = db.scalars(
+        select(ArticleJob)
+        .where(ArticleJob.kind == kind, ArticleJob.status.in_(("pending", "running")))
+        .order_by(ArticleJob.id.desc())
+        .limit(1)
+    ).first()
+    if job is None:
+        return None
+    result = job_dict(job, db.scalar(select(func.now())))
+    return None if result["status"] == "interrupted" else result
+
+def get_job(db: Session, job_id: str) -> Optional[Dict[str, Any]]:
+    """查询任务，不存在时返回None"""
+    if not job_id.isdigit():
+        return None
+    job = db.get(ArticleJob, int(job_id))
+    if job is None:
+        return None
+    return job_dict(job, db.scalar(select(func.now())))
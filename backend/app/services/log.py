@@ -1,75 +1,197 @@
- """日志服务"""
+"""日志服务"""
+import os
+import json
+import zlib
+import base64
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import select, desc, tuple_, literal
 
 from ..models.log import Log
+from . import log_rollup
+from .changes import CursorError
 
 logger = logging.getLogger(__name__)
 
+# 序列化后超过该字节数的日志数据压缩存储
+LOG_COMPRESS_THRESHOLD = int(os.environ.get("LOG_COMPRESS_THRESHOLD", "1024"))
+# 压缩算法：zlib 或 zstd（需要安装 zstandard，未安装时回退到 zlib）
+LOG_PAYLOAD_CODEC = os.environ.get("LOG_PAYLOAD_CODEC", "zlib")
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 日志列表返回的列，不含请求/响应数据（单条详情见 get_log）
+LOG_LIST_COLUMNS = (
+    Log.id, Log.timestamp, Log.method, Log.path, Log.client, Log.payload_codec, Log.payload_size, Log.created_at
+)
+
+def encode_payload(data: Any) -> Tuple[Any, Optional[bytes], Optional[str], Optional[int]]:
+    """
+    按大小决定日志数据的存储方式
+
+    Returns:
+        Tuple: (data, payload, payload_codec, payload_size)，小数据原样放在data中，
+        大数据压缩后放在payload中
+    """
+    if data is None:
+        return None, None, None, None
+
+    raw = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+    if len(raw) < LOG_COMPRESS_THRESHOLD:
+        return data, None, None, None
+
+    if LOG_PAYLOAD_CODEC == "zstd" and zstandard is not None:
+        return None, zstandard.ZstdCompressor(level=3).compress(raw), "zstd", len(raw)
+    return None, zlib.compress(raw, 6), "zlib", len(raw)
+
+def decode_payload(payload: Optional[bytes], codec: Optional[str]) -> Any:
+    """解压日志数据"""
+    if payload is None:
+        return None
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("解压zstd日志数据需要安装 zstandard")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raw = zlib.decompress(payload)
+    return json.loads(raw)
+
 def save_log(db: Session, log_data: Dict[str, Any]) -> bool:
-    """保存日志到数据库"""
+    """保存日志到数据库，保存成功后累加请求汇总"""
     try:
+        data, payload, payload_codec, payload_size = encode_payload(log_data.get("data"))
+        timestamp = datetime.now()
+
         # 准备日志数据
         new_log = Log(
-            timestamp=datetime.now(),
+            timestamp=timestamp,
             method=log_data.get("method"),
             path=log_data.get("path"),
             client=log_data.get("client"),
-            data=log_data.get("data")
+            data=data,
+            payload=payload,
+            payload_codec=payload_codec,
+            payload_size=payload_size
         )
         
         db.add(new_log)
         db.commit()
-        
-        return True
     except Exception as e:
         logger.error(f"保存日志时发生错误: {e}")
         db.rollback()
         return False
 
+    try:
+        log_rollup.record(log_data, timestamp)
+    except Exception as e:
+        logger.error(f"累加请求汇总时发生错误: {e}")
+    return True
+
+def encode_cursor(position: List[Any]) -> str:
+    """把最后一条日志的排序值编码为游标"""
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise CursorError(f"游标格式不正确: {cursor}") from e
+    if not isinstance(position, list) or len(position) != 2:
+        raise CursorError(f"游标格式不正确: {cursor}")
+    return position
+
+def _log_item(row: Any) -> Dict[str, Any]:
+    item = dict(row._mapping)
+    for key in ("timestamp", "created_at"):
+        item[key] = item[key].isoformat() if item[key] else None
+    return item
+
+def _log_detail(log: Log) -> Dict[str, Any]:
+    item = log.to_dict()
+    if log.payload is not None:
+        item["data"] = decode_payload(log.payload, log.payload_codec)
+    return item
+
 def get_logs(
-    db: Session, 
-    start_time: datetime = None, 
-    end_time: datetime = None,
-    page: int = 1, 
-    size: int = 50
+    db: Session,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    size: int = 50,
+    detail: bool = False
 ) -> Dict[str, Any]:
-    """获取日志"""
+    """
+    按时间倒序分页获取日志
+
+    按 (timestamp, id) 键集分页（索引 ix_logs_timestamp_id），每页只读 size+1 行且不统计总数，
+    翻到多深都是一次索引范围扫描。
+
+    Args:
+        db: 数据库会话
+        start_time: 开始时间
+        end_time: 结束时间
+        cursor: 上一页返回的游标，为空时从最新的日志开始
+        size: 每页条数
+        detail: 是否同时返回请求/响应数据（解压压缩存储的数据），默认只返回 LOG_LIST_COLUMNS
+
+    Returns:
+        Dict: {"size": ..., "logs": [...], "cursor": 下一页的游标, "has_more": 是否还有下一页}
+
+    Raises:
+        CursorError: 游标格式不正确
+    """
+    position = None
+    if cursor:
+        timestamp, log_id = decode_cursor(cursor)
+        try:
+            position = (datetime.fromisoformat(timestamp), int(log_id))
+        except (ValueError, TypeError) as e:
+            raise CursorError(f"游标格式不正确: {cursor}") from e
+
     try:
-        # 基本查询
-        query = db.query(Log)
-        
-        # 应用时间过滤
+        stmt = select(Log) if detail else select(*LOG_LIST_COLUMNS)
         if start_time:
-            query = query.filter(Log.timestamp >= start_time)
+            stmt = stmt.where(Log.timestamp >= start_time)
         if end_time:
-            query = query.filter(Log.timestamp <= end_time)
-        
-        # 计算总数
-        total = query.count()
-        
-        # 分页
-        skip = (page - 1) * size
-        logs = query.order_by(desc(Log.timestamp)).offset(skip).limit(size).all()
-        
-        # 转换为字典列表
-        result = [log.to_dict() for log in logs]
-        
+            stmt = stmt.where(Log.timestamp <= end_time)
+        if position:
+            # 参数按列的类型绑定，SQLite 下与存储的时间字符串格式一致
+            stmt = stmt.where(
+                tuple_(Log.timestamp, Log.id) < tuple_(literal(position[0], Log.timestamp.type), literal(position[1], Log.id.type))
+            )
+        stmt = stmt.order_by(desc(Log.timestamp), desc(Log.id)).limit(size + 1)
+
+        if detail:
+            logs = [_log_detail(log) for log in db.scalars(stmt)]
+        else:
+            logs = [_log_item(row) for row in db.execute(stmt)]
+        has_more = len(logs) > size
+        logs = logs[:size]
+
         return {
-            "page": page,
             "size": size,
-            "total": total,
-            "logs": result
+            "logs": logs,
+            "cursor": encode_cursor([logs[-1]["timestamp"], logs[-1]["id"]]) if has_more else None,
+            "has_more": has_more
         }
     except Exception as e:
         logger.error(f"获取日志时发生错误: {e}")
         return {
-            "page": page,
             "size": size,
-            "total": 0,
             "logs": [],
+            "cursor": None,
+            "has_more": False,
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+def get_log(db: Session, log_id: str) -> Optional[Dict[str, Any]]:
+    """单条日志的完整内容（含解压后的请求/响应数据），不存在时返回None"""
+    if not log_id.isdigit():
+        return None
+    log = db.get(Log, int(log_id))
+    return _log_detail(log) if log else None
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""日志保留策略
+
+MySQL中日志表按天RANGE分区（见迁移003），过期日志通过删除整个分区清理，
+并提前创建未来几天的分区；未分区的数据库（如开发用的SQLite）退化为分批删除。后台任务同时清理过期的文章墓碑（见 changes.py）
+和日志汇总（见 log_rollup.py）。多进程部署时每个工作进程都启动后台任务，每轮只有取得文件锁的进程执行，
+避免多个进程同时修改分区。
+
+用法（在 backend 目录下）:
+    python -m app.services.log_retention
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from sqlalchemy import text, select, delete
+from sqlalchemy.engine import Connection, Engine
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ..models.database import engine
+from ..models.log import Log, log_partition_name, log_partition_sql
+from . import changes
+from . import log_rollup
+
+logger = logging.getLogger(__name__)
+
+# 日志保留天数，0表示不清理
+LOG_RETENTION_DAYS = int(os.environ.get("LOG_RETENTION_DAYS", "30"))
+# 提前创建的分区天数
+LOG_PARTITION_AHEAD_DAYS = int(os.environ.get("LOG_PARTITION_AHEAD_DAYS", "7"))
+# 后台清理间隔（秒）
+LOG_RETENTION_INTERVAL = int(os.environ.get("LOG_RETENTION_INTERVAL", "3600"))
+# 未分区时每批删除的行数
+LOG_PURGE_CHUNK = int(os.environ.get("LOG_PURGE_CHUNK", "5000"))
+
+_LOCK_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "log_retention.lock"
+)
+
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+@contextmanager
+def _job_lock() -> Iterator[bool]:
+    """进程间互斥锁，已被其他进程持有时返回False"""
+    os.makedirs(os.path.dirname(_LOCK_PATH), exist_ok=True)
+    with open(_LOCK_PATH, "w") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _partitions(conn: Connection) -> List[Tuple[str, str]]:
+    """获取日志表的分区列表 (分区名, 上界TO_DAYS值)"""
+    if conn.dialect.name != "mysql":
+        return []
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'logs' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    )).all()
+    return [(row[0], row[1]) for row in rows]
+
+def drop_expired_partitions(conn: Connection, partitions: List[Tuple[str, str]], cutoff: date) -> List[str]:
+    """删除上界不晚于cutoff的分区（整个分区都已过期）"""
+    cutoff_days = conn.execute(text("SELECT TO_DAYS(:cutoff)"), {"cutoff": cutoff}).scalar()
+    expired = [
+        name for name, bound in partitions
+        if bound != "MAXVALUE" and int(bound) <= cutoff_days
+    ]
+    if expired:
+        conn.execute(text(f"ALTER TABLE logs DROP PARTITION {', '.join(expired)}"))
+        logger.info(f"已删除过期日志分区: {expired}")
+    return expired
+
+def create_future_partitions(conn: Connection, partitions: List[Tuple[str, str]], until: date) -> List[str]:
+    """从pmax中拆分出直到until（含）的按天分区"""
+    bounds = [int(bound) for _, bound in partitions if bound != "MAXVALUE"]
+    if not bounds:
+        return []
+
+    # 最后一个分区的上界即第一个尚未覆盖的日期
+    next_day = conn.execute(text("SELECT FROM_DAYS(:days)"), {"days": max(bounds)}).scalar()
+    days = []
+    while next_day <= until:
+        days.append(next_day)
+        next_day += timedelta(days=1)
+    if not days:
+        return []
+
+    definitions = [log_partition_sql(day) for day in days]
+    definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    conn.execute(text(f"ALTER TABLE logs REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})"))
+    created = [log_partition_name(day) for day in days]
+    logger.info(f"已创建日志分区: {created}")
+    return created
+
+def delete_expired_rows(bind: Engine, cutoff: date) -> int:
+    """未分区时分批删除过期日志，每批单独提交以避免长事务"""
+    deleted = 0
+    while True:
+        with bind.begin() as conn:
+            ids = conn.execute(
+                select(Log.id).where(Log.timestamp < cutoff).order_by(Log.timestamp).limit(LOG_PURGE_CHUNK)
+            ).scalars().all()
+            if not ids:
+                break
+            conn.execute(delete(Log).where(Log.id.in_(ids)))
+        deleted += len(ids)
+    if deleted:
+        logger.info(f"已删除过期日志 {deleted} 条")
+    return deleted
+
+def run_log_retention(bind: Engine = engine, retention_days: int = LOG_RETENTION_DAYS) -> Dict[str, Any]:
+    """
+    执行一次日志保留任务
+
+    Args:
+        bind: 数据库引擎
+        retention_days: 保留天数
+
+    Returns:
+        Dict: 包含删除/创建的分区或删除的行数
+    """
+    try:
+        cutoff = date.today() - timedelta(days=retention_days)
+
+        with bind.begin() as conn:
+            partitions = _partitions(conn)
+            if partitions:
+                dropped = drop_expired_partitions(conn, partitions, cutoff)
+                created = create_future_partitions(
+                    conn, _partitions(conn), date.today() + timedelta(days=LOG_PARTITION_AHEAD_DAYS)
+                )
+                return {"success": True, "mode": "partition", "dropped": dropped, "created": created}
+
+        deleted = delete_expired_rows(bind, cutoff)
+        return {"success": True, "mode": "delete", "deleted": deleted}
+    except Exception as e:
+        logger.error(f"执行日志保留任务时发生错误: {e}")
+        return {"success": False, "message": f"执行日志保留任务时发生错误: {str(e)}"}
+
+def _retention_loop():
+    """后台定期执行日志保留任务"""
+    while not _stop_event.is_set():
+        with _job_lock() as locked:
+            # 其他工作进程正在执行本轮清理
+            if locked:
+                run_log_retention()
+                try:
+                    changes.prune_tombstones()
+                except Exception as e:
+                    logger.error(f"清理过期墓碑时发生错误: {e}")
+                try:
+                    log_rollup.prune_rollups()
+                except Exception as e:
+                    logger.error(f"清理过期日志汇总时发生错误: {e}")
+        _stop_event.wait(LOG_RETENTION_INTERVAL)
+
+def start_log_retention_worker() -> bool:
+    """启动后台日志保留线程"""
+    global _worker
+    if LOG_RETENTION_DAYS <= 0:
+        logger.info("未配置日志保留天数，不启动日志清理任务")
+        return False
+    if _worker and _worker.is_alive():
+        return True
+
+    _stop_event.clear()
+    _worker = threading.Thread(target=_retention_loop, name="log-retention", daemon=True)
+    _worker.start()
+    logger.info(f"日志清理任务已启动，保留 {LOG_RETENTION_DAYS} 天")
+    return True
+
+def stop_log_retention_worker():
+    """停止后台日志保留线程"""
+    _stop_event.set()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(run_log_retention())
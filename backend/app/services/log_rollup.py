@@ -0,0 +1,286 @@
+"""请求日志汇总
+
+日志保存成功后把这条请求累加到进程内存中的分钟和小时两个时间桶，后台线程每 LOG_ROLLUP_FLUSH_INTERVAL 秒
+用一条 upsert（MySQL的 INSERT ... ON DUPLICATE KEY UPDATE，SQLite/PostgreSQL的 ON CONFLICT DO UPDATE）
+把累加值写入 log_rollups 表。GET /stats/ingest 只读汇总表，“每个客户端每小时调用多少次、保存多少篇文章”
+之类的统计不再扫描 logs 表和解压请求数据。
+
+- 汇总不在保存日志的事务中写入：请求之间不会争用同一汇总行的锁，汇总写入失败也不影响日志本身，
+  失败的累加值留在内存中下次重试
+- 统计结果最多落后 LOG_ROLLUP_FLUSH_INTERVAL 秒；进程正常退出时写出剩余的累加值，进程崩溃时丢失最后一个间隔的累加值
+- 汇总从部署后开始累加，之前的日志不回填；日志表按保留期清理后汇总仍然保留
+- 分钟汇总保留 LOG_ROLLUP_MINUTE_RETENTION_DAYS 天，小时汇总保留 LOG_ROLLUP_HOUR_RETENTION_DAYS 天，由日志保留任务一起清理
+
+用法（在 backend 目录下）:
+    python -m app.services.log_rollup --prune    # 清理过期汇总
+"""
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import select, delete, func, case
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..models.database import engine
+from ..models.log_rollup import LogRollup
+
+logger = logging.getLogger(__name__)
+
+# 分钟和小时汇总的保留天数，0表示不清理
+LOG_ROLLUP_MINUTE_RETENTION_DAYS = int(os.environ.get("LOG_ROLLUP_MINUTE_RETENTION_DAYS", "7"))
+LOG_ROLLUP_HOUR_RETENTION_DAYS = int(os.environ.get("LOG_ROLLUP_HOUR_RETENTION_DAYS", "365"))
+# 单次查询最多返回的时间桶数
+LOG_STATS_MAX_BUCKETS = int(os.environ.get("LOG_STATS_MAX_BUCKETS", "2880"))
+# 每批清理的汇总行数
+LOG_ROLLUP_PURGE_CHUNK = int(os.environ.get("LOG_ROLLUP_PURGE_CHUNK", "5000"))
+# 内存中的累加值写入汇总表的间隔秒数，0表示每条日志保存后立即写入
+LOG_ROLLUP_FLUSH_INTERVAL = float(os.environ.get("LOG_ROLLUP_FLUSH_INTERVAL", "5"))
+
+PERIODS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+GROUP_FIELDS = ("path", "client", "success")
+_KEY_FIELDS = ("period", "bucket", "path", "client", "success")
+_SUM_FIELDS = ("requests", "articles", "failed_articles", "latency_ms_sum")
+
+# 汇总键 -> [requests, articles, failed_articles, latency_ms_sum, latency_ms_max]
+_pending: Dict[Tuple[Any, ...], List[int]] = {}
+_pending_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_stop_event = threading.Event()
+
+def bucket_start(timestamp: datetime, period: str) -> datetime:
+    """时间所在时间桶的起点"""
+    if period == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+def _summary(log_data: Dict[str, Any]) -> Dict[str, Any]:
+    """从日志的响应中取出是否成功和保存的文章数"""
+    response = (log_data.get("data") or {}).get("response") or {}
+    latency = log_data.get("latency_ms") or 0
+    return {
+        "success": bool(response.get("success")),
+        "articles": int(response.get("saved") or 0),
+        "failed_articles": int(response.get("failed") or 0),
+        "latency_ms": int(round(latency))
+    }
+
+def _merge(target: Dict[Tuple[Any, ...], List[int]], key: Tuple[Any, ...], values: List[int]):
+    counters = target.get(key)
+    if counters is None:
+        target[key] = list(values)
+        return
+    for i in range(4):
+        counters[i] += values[i]
+    counters[4] = max(counters[4], values[4])
+
+def record(log_data: Dict[str, Any], timestamp: datetime):
+    """把一条已保存的请求累加到内存中的分钟和小时汇总，由后台线程写入汇总表"""
+    summary = _summary(log_data)
+    latency = summary["latency_ms"]
+    values = [1, summary["articles"], summary["failed_articles"], latency, latency]
+    path, client = log_data.get("path") or "", log_data.get("client") or ""
+    with _pending_lock:
+        for period in PERIODS:
+            _merge(_pending, (period, bucket_start(timestamp, period), path, client, summary["success"]), values)
+    if LOG_ROLLUP_FLUSH_INTERVAL <= 0:
+        flush()
+    else:
+        _ensure_worker()
+
+def _upsert(dialect: str):
+    """按唯一键插入，已存在时累加计数、取最大耗时"""
+    if dialect == "mysql":
+        statement = mysql.insert(LogRollup)
+        incoming = statement.inserted
+    else:
+        statement = (postgresql if dialect == "postgresql" else sqlite).insert(LogRollup)
+        incoming = statement.excluded
+    values = {field: getattr(LogRollup, field) + getattr(incoming, field) for field in _SUM_FIELDS}
+    values["latency_ms_max"] = case(
+        (LogRollup.latency_ms_max < incoming.latency_ms_max, incoming.latency_ms_max),
+        else_=LogRollup.latency_ms_max
+    )
+    if dialect == "mysql":
+        return statement.on_duplicate_key_update(**values)
+    return statement.on_conflict_do_update(index_elements=list(_KEY_FIELDS), set_=values)
+
+def flush(bind: Engine = engine) -> int:
+    """
+    把内存中的累加值写入汇总表
+
+    Returns:
+        int: 写入的汇总行数，失败时为0（累加值留到下次写入）
+    """
+    with _pending_lock:
+        batch = dict(_pending)
+        _pending.clear()
+    if not batch:
+        return 0
+    # 按键排序，多个进程同时写入时以相同顺序加锁
+    rows = [
+        {**dict(zip(_KEY_FIELDS, key)), **dict(zip(_SUM_FIELDS, values[:4])), "latency_ms_max": values[4]}
+        for key, values in sorted(batch.items(), key=lambda item: item[0])
+    ]
+    try:
+        with bind.begin() as conn:
+            conn.execute(_upsert(bind.dialect.name), rows)
+    except Exception as e:
+        logger.error(f"写入日志汇总时发生错误，{len(rows)} 行留待下次写入: {e}")
+        with _pending_lock:
+            for key, values in batch.items():
+                _merge(_pending, key, values)
+        return 0
+    return len(rows)
+
+def _flush_loop():
+    while not _stop_event.wait(LOG_ROLLUP_FLUSH_INTERVAL):
+        flush()
+    flush()
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _stop_event.clear()
+            _worker = threading.Thread(target=_flush_loop, name="log-rollup-flush", daemon=True)
+            _worker.start()
+
+def stop_rollup_flusher(timeout: float = 5.0):
+    """停止后台写入线程，写出剩余的累加值"""
+    global _worker
+    _stop_event.set()
+    if _worker is not None and _worker.is_alive():
+        _worker.join(timeout)
+    _worker = None
+    flush()
+
+def get_ingest_stats(
+    db: Session,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    period: str = "hour",
+    group_by: Optional[List[str]] = None,
+    path: Optional[str] = None,
+    client: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    按时间桶统计请求
+
+    Args:
+        db: 数据库会话
+        start_time: 开始时间，默认为结束时间前24小时（minute为前1小时）
+        end_time: 结束时间，默认为当前时间
+        period: minute 或 hour
+        group_by: 时间桶之外的分组字段（path、client、success），默认不分组
+        path: 只统计该路径
+        client: 只统计该客户端
+
+    Returns:
+        Dict: {"buckets": [...], "total": {...}}，时间范围超过 LOG_STATS_MAX_BUCKETS 个时间桶时 success 为False
+    """
+    group_by = [field for field in GROUP_FIELDS if field in (group_by or [])]
+    end_time = end_time or datetime.now()
+    start_time = start_time or end_time - (timedelta(hours=1) if period == "minute" else timedelta(days=1))
+    first, last = bucket_start(start_time, period), bucket_start(end_time, period)
+    buckets = int((last - first) / PERIODS[period]) + 1
+    if buckets > LOG_STATS_MAX_BUCKETS:
+        return {
+            "success": False,
+            "message": f"时间范围包含 {buckets} 个时间桶，超过上限 {LOG_STATS_MAX_BUCKETS}，请缩小范围或按小时统计"
+        }
+
+    columns = [LogRollup.bucket] + [getattr(LogRollup, field) for field in group_by]
+    conditions = [LogRollup.period == period, LogRollup.bucket >= first, LogRollup.bucket <= last]
+    if path:
+        conditions.append(LogRollup.path == path)
+    if client:
+        conditions.append(LogRollup.client == client)
+    rows = db.execute(
+        select(
+            *columns,
+            func.sum(LogRollup.requests).label("requests"),
+            func.sum(LogRollup.articles).label("articles"),
+            func.sum(LogRollup.failed_articles).label("failed_articles"),
+            func.sum(LogRollup.latency_ms_sum).label("latency_ms_sum"),
+            func.max(LogRollup.latency_ms_max).label("latency_ms_max")
+        )
+        .where(*conditions)
+        .group_by(*columns)
+        .order_by(*columns)
+    ).all()
+
+    def counters(requests: int, articles: int, failed_articles: int, latency_sum: int, latency_max: int) -> Dict[str, Any]:
+        return {
+            "requests": requests,
+            "articles": articles,
+            "failed_articles": failed_articles,
+            "latency_ms_avg": round(latency_sum / requests, 1) if requests else None,
+            "latency_ms_max": latency_max
+        }
+
+    result = []
+    for row in rows:
+        item = {"bucket": row.bucket.isoformat()}
+        item.update({field: getattr(row, field) for field in group_by})
+        item.update(counters(
+            int(row.requests), int(row.articles), int(row.failed_articles), int(row.latency_ms_sum), int(row.latency_ms_max)
+        ))
+        result.append(item)
+
+    total = counters(
+        sum(int(row.requests) for row in rows),
+        sum(int(row.articles) for row in rows),
+        sum(int(row.failed_articles) for row in rows),
+        sum(int(row.latency_ms_sum) for row in rows),
+        max((int(row.latency_ms_max) for row in rows), default=0)
+    )
+    return {
+        "success": True,
+        "period": period,
+        "start": first.isoformat(),
+        "end": last.isoformat(),
+        "group_by": group_by,
+        "buckets": result,
+        "total": total
+    }
+
+def prune_rollups(bind: Engine = engine) -> int:
+    """分批删除过期的汇总，每批单独提交"""
+    deleted = 0
+    for period, retention_days in (("minute", LOG_ROLLUP_MINUTE_RETENTION_DAYS), ("hour", LOG_ROLLUP_HOUR_RETENTION_DAYS)):
+        if retention_days <= 0:
+            continue
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        while True:
+            with bind.begin() as conn:
+                ids = conn.execute(
+                    select(LogRollup.id).where(LogRollup.period == period, LogRollup.bucket < cutoff)
+                    .limit(LOG_ROLLUP_PURGE_CHUNK)
+                ).scalars().all()
+                if not ids:
+                    break
+                conn.execute(delete(LogRollup).where(LogRollup.id.in_(ids)))
+            deleted += len(ids)
+    if deleted:
+        logger.info(f"已删除过期日志汇总 {deleted} 条")
+    return deleted
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="请求日志汇总维护")
+    parser.add_argument("--prune", action="store_true", help="清理过期汇总")
+    args = parser.parse_args()
+
+    if args.prune:
+        print({"deleted": prune_rollups()})
+    else:
+        parser.print_help()
@@ -0,0 +1,342 @@
+"""MySQL与Elasticsearch一致性检查和修复
+
+以MySQL为准找出ES中缺失、多余或内容过期的文档，只修复这些文档，不需要 rebuild_search_index 清空重建。
+
+按 unique_id 顺序每次从MySQL读取 RECONCILE_CHUNK 篇文章作为一个区间，区间的摘要为文档数和内容指纹之和
+（search.article_fingerprint，写入ES文档的 fingerprint 字段）：MySQL一侧由读到的文章计算，ES一侧用一次
+filters + sum 聚合得到 RECONCILE_FANOUT 个子区间的摘要。只有摘要不同的子区间继续拆分，不超过
+RECONCILE_LEAF_SIZE 篇时逐篇比较指纹。修复前先读ES再读MySQL主库重新核对：MySQL中存在且指纹不同的重新索引，
+MySQL中已不存在的从ES删除，扫描期间新写入的文章不会被误删；失败的转入同步重试队列。
+
+- MySQL按排序规则、ES按字节比较 unique_id，两者顺序不同时（如大小写不敏感的排序规则）子区间会互相重叠，
+  受影响的文章在逐篇比较时被标记，修复前的核对会跳过实际一致的文章，只影响效率不影响结果
+- 升级前写入的文档没有 fingerprint 字段，第一次检查时会被重新索引
+- 扫描每秒不超过 RECONCILE_ROWS_PER_SECOND 篇，修复每秒不超过 RECONCILE_REPAIRS_PER_SECOND 篇
+- 后台任务每 RECONCILE_INTERVAL 秒执行一次，多进程部署时由文件锁保证同一时间只有一个进程执行
+
+用法（在 backend 目录下）:
+    python -m app.services.reconcile                # 检查并修复
+    python -m app.services.reconcile --dry-run      # 只检查，输出不一致的文章
+    python -m app.services.reconcile --after <ID>   # 从该 unique_id 之后继续（中断时输出的 last_unique_id）
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ..models.database import SessionLocal, read_session
+from ..models.article import Article, ARTICLE_INDEX
+from ..metrics import Counter
+from .search import ES_INDEX, es_client, article_fingerprint, bulk_sync_articles
+from .index_retry import defer_index
+from . import data_version
+
+logger = logging.getLogger(__name__)
+
+# 后台检查间隔（秒），0表示不启动后台任务
+RECONCILE_INTERVAL = float(os.environ.get("RECONCILE_INTERVAL", "86400"))
+# 每个顶层区间从MySQL读取的文章数
+RECONCILE_CHUNK = int(os.environ.get("RECONCILE_CHUNK", "10000"))
+# 摘要不同的区间拆分成的子区间数
+RECONCILE_FANOUT = max(2, int(os.environ.get("RECONCILE_FANOUT", "16")))
+# 不超过该文章数的区间逐篇比较
+RECONCILE_LEAF_SIZE = int(os.environ.get("RECONCILE_LEAF_SIZE", "256"))
+# 每批修复的文章数
+RECONCILE_REPAIR_BATCH = int(os.environ.get("RECONCILE_REPAIR_BATCH", "500"))
+# 扫描和修复的速度上限（篇/秒），0表示不限速
+RECONCILE_ROWS_PER_SECOND = float(os.environ.get("RECONCILE_ROWS_PER_SECOND", "20000"))
+RECONCILE_REPAIRS_PER_SECOND = float(os.environ.get("RECONCILE_REPAIRS_PER_SECOND", "500"))
+
+_LOCK_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "reconcile.lock"
+)
+# 逐篇比较时每页读取的ES文档数
+_PAGE_SIZE = 1000
+# 只检查时最多返回的不一致文章数
+_DRY_RUN_SAMPLE = 1000
+
+RECONCILE_REPAIRED = Counter("es_reconcile_repaired_total", "一致性检查修复的ES文档", ("action",))
+
+# (下界, 上界]，None 表示不限
+Bounds = Tuple[Optional[str], Optional[str]]
+# (unique_id, 指纹)，按MySQL中的 unique_id 顺序
+Rows = List[Tuple[str, int]]
+
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+class _Throttle:
+    """按每秒数量限速，rate 为0时不限速；等待期间停止后台任务会立即返回"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def consume(self, count: int):
+        self.count += count
+        if self.rate > 0:
+            delay = self.started + self.count / self.rate - time.monotonic()
+            if delay > 0:
+                _stop_event.wait(delay)
+
+@contextmanager
+def _job_lock() -> Iterator[bool]:
+    """进程间互斥锁，已被其他进程持有时返回False"""
+    os.makedirs(os.path.dirname(_LOCK_PATH), exist_ok=True)
+    with open(_LOCK_PATH, "w") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _range_query(bounds: Bounds) -> Dict[str, Any]:
+    lower, upper = bounds
+    spec = {}
+    if lower is not None:
+        spec["gt"] = lower
+    if upper is not None:
+        spec["lte"] = upper
+    return {"range": {"unique_id": spec}} if spec else {"match_all": {}}
+
+def _digest(rows: Rows) -> Tuple[int, int]:
+    return len(rows), sum(fingerprint for _, fingerprint in rows)
+
+def _es_digests(ranges: Sequence[Bounds]) -> List[Tuple[int, int]]:
+    """一次聚合得到多个区间在ES中的文档数和指纹之和"""
+    response = es_client.search(index=ES_INDEX, body={
+        "size": 0,
+        "track_total_hits": False,
+        "aggs": {
+            "ranges": {
+                "filters": {"filters": [_range_query(bounds) for bounds in ranges]},
+                "aggs": {"fingerprint": {"sum": {"field": "fingerprint"}}}
+            }
+        }
+    })
+    return [
+        (bucket["doc_count"], int(bucket["fingerprint"]["value"]))
+        for bucket in response["aggregations"]["ranges"]["buckets"]
+    ]
+
+def _es_fingerprints(query: Dict[str, Any]) -> Dict[str, Optional[int]]:
+    """ES中匹配查询的文档指纹（没有指纹字段的为None），按 unique_id 分页读取"""
+    fingerprints = {}
+    search_after = None
+    while True:
+        body = {
+            "query": query,
+            "_source": ["fingerprint"],
+            "sort": [{"unique_id": "asc"}],
+            "size": _PAGE_SIZE,
+            "track_total_hits": False
+        }
+        if search_after:
+            body["search_after"] = search_after
+        hits = es_client.search(index=ES_INDEX, body=body)["hits"]["hits"]
+        for hit in hits:
+            fingerprints[hit["_id"]] = hit["_source"].get("fingerprint")
+        if len(hits) < _PAGE_SIZE:
+            return fingerprints
+        search_after = hits[-1]["sort"]
+
+def _split(rows: Rows, bounds: Bounds) -> List[Tuple[Rows, Bounds]]:
+    """按文章数把区间均分为 RECONCILE_FANOUT 个子区间，子区间的上界为其中最后一篇文章"""
+    step = -(-len(rows) // RECONCILE_FANOUT)
+    parts = []
+    lower = bounds[0]
+    for start in range(0, len(rows), step):
+        part = rows[start:start + step]
+        upper = part[-1][0] if start + step < len(rows) else bounds[1]
+        parts.append((part, (lower, upper)))
+        lower = upper
+    return parts
+
+def _diverged(rows: Rows, bounds: Bounds, stats: Dict[str, int]) -> List[str]:
+    """比较一个区间，只拆分摘要不同的子区间，返回不一致的 unique_id"""
+    if len(rows) <= RECONCILE_LEAF_SIZE:
+        stats["leaves"] += 1
+        expected = dict(rows)
+        actual = _es_fingerprints(_range_query(bounds))
+        return [unique_id for unique_id, fingerprint in expected.items() if actual.get(unique_id) != fingerprint] + \
+            [unique_id for unique_id in actual if unique_id not in expected]
+
+    parts = _split(rows, bounds)
+    stats["ranges"] += len(parts)
+    diverged = []
+    for (part, part_bounds), digest in zip(parts, _es_digests([part_bounds for _, part_bounds in parts])):
+        if digest != _digest(part):
+            diverged += _diverged(part, part_bounds, stats)
+    return diverged
+
+def repair(unique_ids: Sequence[str]) -> Dict[str, int]:
+    """
+    重新核对并修复一批文章
+
+    先读ES再读MySQL主库：写入路径先提交MySQL再写ES，ES中已有的文章在随后读MySQL时一定可见，不会被误删
+
+    Returns:
+        Dict: 重新索引、删除和失败（转入同步重试队列）的数量
+    """
+    actual = _es_fingerprints({"ids": {"values": list(unique_ids)}})
+    with SessionLocal() as db:
+        articles = ARTICLE_INDEX.to_dicts(
+            db.execute(ARTICLE_INDEX.select().where(Article.unique_id.in_(unique_ids)))
+        )
+        found = {article["unique_id"] for article in articles}
+        stale = [article for article in articles if actual.get(article["unique_id"]) != article_fingerprint(article)]
+        extra = [unique_id for unique_id in actual if unique_id not in found]
+        if not stale and not extra:
+            return {"indexed": 0, "deleted": 0, "failed": 0}
+
+        errors = bulk_sync_articles(stale, extra)
+        for unique_id, error in errors.items():
+            defer_index(db, unique_id, "index" if unique_id in found else "delete", error[:1000])
+        # 搜索结果发生了变化
+        data_version.bump(db)
+
+    indexed = sum(article["unique_id"] not in errors for article in stale)
+    deleted = sum(unique_id not in errors for unique_id in extra)
+    RECONCILE_REPAIRED.labels("index").inc(indexed)
+    RECONCILE_REPAIRED.labels("delete").inc(deleted)
+    RECONCILE_REPAIRED.labels("failed").inc(len(errors))
+    return {"indexed": indexed, "deleted": deleted, "failed": len(errors)}
+
+def reconcile(after: Optional[str] = None, dry_run: bool = False, chunk_size: int = RECONCILE_CHUNK) -> Dict[str, Any]:
+    """
+    检查并修复MySQL与ES的不一致
+
+    Args:
+        after: 从该 unique_id 之后开始（不含），为空时检查全部文章
+        dry_run: 只检查，不修复
+        chunk_size: 每个顶层区间从MySQL读取的文章数
+
+    Returns:
+        Dict: 扫描的文章数、比较的区间数、不一致和修复的数量，以及已检查到的 last_unique_id
+    """
+    if not es_client:
+        return {"success": False, "message": "Elasticsearch未连接"}
+
+    with _job_lock() as locked:
+        if not locked:
+            return {"success": False, "message": "其他进程正在执行一致性检查"}
+
+        started = time.monotonic()
+        stats = {"scanned": 0, "ranges": 0, "leaves": 0, "divergent": 0, "indexed": 0, "deleted": 0, "failed": 0}
+        sample: List[str] = []
+        scan_throttle = _Throttle(RECONCILE_ROWS_PER_SECOND)
+        repair_throttle = _Throttle(RECONCILE_REPAIRS_PER_SECOND)
+        last_id = after
+        message = None
+
+        # 大范围扫描使用只读副本，修复前在主库上重新核对
+        db = read_session()
+        try:
+            while True:
+                if _stop_event.is_set():
+                    message = "一致性检查已停止"
+                    break
+                stmt = ARTICLE_INDEX.select().order_by(Article.unique_id).limit(chunk_size)
+                if last_id is not None:
+                    stmt = stmt.where(Article.unique_id > last_id)
+                rows = [
+                    (article["unique_id"], article_fingerprint(article))
+                    for article in ARTICLE_INDEX.to_dicts(db.execute(stmt))
+                ]
+                db.rollback()
+                # 最后一个区间没有上界，包括ES中排在所有MySQL文章之后的文档
+                upper = rows[-1][0] if len(rows) == chunk_size else None
+
+                diverged = _diverged(rows, (last_id, upper), stats)
+                stats["scanned"] += len(rows)
+                stats["divergent"] += len(diverged)
+                if dry_run:
+                    sample += diverged[:_DRY_RUN_SAMPLE - len(sample)]
+                else:
+                    for start in range(0, len(diverged), RECONCILE_REPAIR_BATCH):
+                        batch = diverged[start:start + RECONCILE_REPAIR_BATCH]
+                        repair_throttle.consume(len(batch))
+                        for key, value in repair(batch).items():
+                            stats[key] += value
+
+                if upper is None:
+                    last_id = rows[-1][0] if rows else last_id
+                    break
+                last_id = upper
+                scan_throttle.consume(len(rows))
+        except Exception as e:
+            logger.error(f"一致性检查时发生错误: {e}")
+            message = f"一致性检查时发生错误: {str(e)}"
+        finally:
+            db.close()
+
+        result: Dict[str, Any] = {
+            "success": message is None,
+            "message": message or (
+                f"检查 {stats['scanned']} 篇文章，不一致 {stats['divergent']} 篇" if dry_run else
+                f"检查 {stats['scanned']} 篇文章，重新索引 {stats['indexed']} 篇，删除 {stats['deleted']} 篇，"
+                f"失败 {stats['failed']} 篇"
+            ),
+            **stats,
+            "last_unique_id": last_id,
+            "seconds": round(time.monotonic() - started, 2)
+        }
+        if dry_run:
+            result["divergent_ids"] = sample
+        logger.info(f"一致性检查: {result['message']}")
+        return result
+
+def _reconcile_loop():
+    """后台定期检查，启动后先等待一个间隔"""
+    while not _stop_event.wait(RECONCILE_INTERVAL):
+        try:
+            reconcile()
+        except Exception as e:
+            logger.error(f"一致性检查任务发生错误: {e}")
+
+def start_reconcile_worker() -> bool:
+    """启动后台检查线程"""
+    global _worker
+    if RECONCILE_INTERVAL <= 0:
+        logger.info("未配置检查间隔，不启动一致性检查任务")
+        return False
+    if _worker and _worker.is_alive():
+        return True
+
+    _stop_event.clear()
+    _worker = threading.Thread(target=_reconcile_loop, name="reconcile", daemon=True)
+    _worker.start()
+    logger.info(f"一致性检查任务已启动，间隔 {RECONCILE_INTERVAL} 秒")
+    return True
+
+def stop_reconcile_worker():
+    """停止后台检查线程"""
+    _stop_event.set()
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="检查并修复MySQL与Elasticsearch的不一致")
+    parser.add_argument("--dry-run", action="store_true", help="只检查，不修复")
+    parser.add_argument("--after", help="从该 unique_id 之后开始")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK, help="每个顶层区间的文章数")
+    args = parser.parse_args()
+
+    print(reconcile(args.after, args.dry_run, args.chunk_size))
@@ -0,0 +1,480 @@
+"""相关文章
+
+GET /article/{id}/related 返回预计算的相似文章，查询只读取 related_articles 表的一行，
+不在每次浏览时对ES执行 more_like_this。
+
+相似度为标题+摘要TF-IDF向量的余弦相似度。特征与近似重复检测相同（去除标点和空白后的相邻两字），
+哈希到 2^20 个桶计算IDF，再按桶号带符号地投影到 RELATED_DIM 维。归一化后的向量矩阵分块相乘，
+每块用 argpartition 取每行的 top-k；同一近似重复簇内的文章不互相推荐。
+
+向量、IDF和每篇文章当前第k名的分数保存在 RELATED_MODEL_DIR。后台任务每 RELATED_UPDATE_INTERVAL 秒
+为新入库的文章计算列表，并把新文章插入分数超过原第k名的已有文章的列表；被删除的文章在下次全量构建前
+仍可能出现在其他文章的列表中。多进程部署时用文件锁保证同一时间只有一个进程更新。
+
+构建和更新需要安装numpy，查询不需要。
+
+用法（在 backend 目录下）:
+    python -m app.services.related --build     # 全量构建
+    python -m app.services.related             # 处理新入库的文章
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Iterator, Optional, Sequence, Tuple
+from sqlalchemy import select, delete, insert, func
+from sqlalchemy.orm import Session
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ..models.database import SessionLocal
+from ..models.article import Article, ARTICLE_HYDRATE
+from ..models.related_article import RelatedArticle
+from .features import HASH_BITS, normalize_text, document_frequencies, inverse_document_frequency, vectorize
+
+logger = logging.getLogger(__name__)
+
+# 每篇文章保存的相关文章数
+RELATED_TOP_K = int(os.environ.get("RELATED_TOP_K", "10"))
+# 向量维数（2的幂）
+RELATED_DIM = int(os.environ.get("RELATED_DIM", "256"))
+# 低于该相似度的文章不推荐
+RELATED_MIN_SCORE = float(os.environ.get("RELATED_MIN_SCORE", "0.1"))
+# 每批处理的文章数（构建时每次相乘的行数，增量更新时每轮处理的新文章数）
+RELATED_BATCH_SIZE = int(os.environ.get("RELATED_BATCH_SIZE", "1024"))
+# 后台增量更新间隔（秒），0表示不启动后台任务
+RELATED_UPDATE_INTERVAL = float(os.environ.get("RELATED_UPDATE_INTERVAL", "60"))
+# 模型文件目录
+RELATED_MODEL_DIR = os.environ.get(
+    "RELATED_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "related")
+)
+
+# 每次与多少篇已有文章相乘，限制分数矩阵的内存（行数 × 列数 × 4字节）
+_COLUMN_BLOCK = 65536
+
+# 计算向量需要的列加上展示字段（ARTICLE_HYDRATE 已包含 unique_id 和 title）
+_FIELDS = (Article.id, Article.cluster_id, Article.digest, *ARTICLE_HYDRATE.columns)
+
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("构建相关文章需要安装numpy")
+
+def cluster_codes(unique_ids: Sequence[str], cluster_ids: Sequence[Optional[str]]) -> "np.ndarray":
+    """簇ID的整数编码，没有簇ID的文章自成一簇"""
+    return np.array(
+        [_code(cluster_id or unique_id) for unique_id, cluster_id in zip(unique_ids, cluster_ids)], dtype=np.int64
+    )
+
+def _code(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def _score_tiles(
+    queries: "np.ndarray", query_codes: "np.ndarray", matrix: "np.ndarray", codes: "np.ndarray", offset: int = 0
+) -> Iterator[Tuple[int, "np.ndarray"]]:
+    """查询向量与矩阵分块相乘，同簇的分数置为-inf，生成 (列起始位置, 分数块)"""
+    for start in range(0, len(matrix), _COLUMN_BLOCK):
+        block = np.asarray(matrix[start:start + _COLUMN_BLOCK])
+        scores = queries @ block.T
+        scores[query_codes[:, None] == codes[None, start:start + len(block)]] = -np.inf
+        yield offset + start, scores
+
+def _merge_top_k(
+    best: Tuple["np.ndarray", "np.ndarray"], scores: "np.ndarray", start: int, k: int
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """把一个分数块合并到每行当前的 top-k 中"""
+    indices = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, 1)
+        indices = np.take_along_axis(indices, part, 1)
+    merged_scores = np.concatenate([best[0], scores], axis=1)
+    merged_indices = np.concatenate([best[1], indices], axis=1)
+    if merged_scores.shape[1] > k:
+        part = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        merged_scores = np.take_along_axis(merged_scores, part, 1)
+        merged_indices = np.take_along_axis(merged_indices, part, 1)
+    return merged_scores, merged_indices
+
+def _empty_top_k(rows: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    return np.zeros((rows, 0), np.float32), np.zeros((rows, 0), np.int64)
+
+def _sorted_top_k(best: Tuple["np.ndarray", "np.ndarray"]) -> Tuple["np.ndarray", "np.ndarray"]:
+    order = np.argsort(-best[0], axis=1, kind="stable")
+    return np.take_along_axis(best[0], order, 1), np.take_along_axis(best[1], order, 1)
+
+def nearest(
+    queries: "np.ndarray", query_codes: "np.ndarray", matrix: "np.ndarray", codes: "np.ndarray", k: int = RELATED_TOP_K
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    每个查询向量在矩阵中的 top-k（不包括同簇的文章）
+
+    Returns:
+        Tuple: (分数, 行号)，按分数降序，不足k个时列数更少或分数为-inf
+    """
+    best = _empty_top_k(len(queries))
+    for start, scores in _score_tiles(queries, query_codes, matrix, codes):
+        best = _merge_top_k(best, scores, start, k)
+    return _sorted_top_k(best)
+
+def _kth_scores(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """新文章进入列表需要超过的分数：列表已满时为第k名，否则为最低相似度"""
+    if scores.shape[1] < k:
+        return np.full(len(scores), RELATED_MIN_SCORE, np.float32)
+    return np.maximum(scores[:, k - 1], RELATED_MIN_SCORE).astype(np.float32)
+
+class RelatedModel:
+    """模型文件：IDF、向量、簇编码、第k名分数和文章ID，行号一一对应"""
+    __slots__ = ("directory", "dim", "k", "last_id", "idf", "vectors", "codes", "kth", "ids")
+
+    def __init__(self, directory: str, meta: Dict[str, Any]):
+        self.directory = directory
+        self.dim = meta["dim"]
+        self.k = meta["k"]
+        self.last_id = meta["last_id"]
+        count = meta["count"]
+        self.idf = np.load(self._path("idf.npy"))
+        # 中断的追加可能在文件末尾留下多余的数据，以meta中的行数为准
+        for name, dtype, width in (("vectors.f32", np.float32, self.dim), ("codes.i64", np.int64, 1), ("kth.f32", np.float32, 1)):
+            os.truncate(self._path(name), count * width * np.dtype(dtype).itemsize)
+        self.vectors = np.memmap(self._path("vectors.f32"), np.float32, "r", shape=(count, self.dim)) if count else np.zeros((0, self.dim), np.float32)
+        self.codes = np.fromfile(self._path("codes.i64"), np.int64)
+        self.kth = np.fromfile(self._path("kth.f32"), np.float32)
+        with open(self._path("ids.txt"), encoding="utf-8") as f:
+            self.ids = f.read().split("\n")[:count]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @classmethod
+    def load(cls, directory: str = RELATED_MODEL_DIR) -> Optional["RelatedModel"]:
+        path = os.path.join(directory, "meta.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(directory, json.load(f))
+
+    @staticmethod
+    def write(
+        directory: str, idf: "np.ndarray", vectors: "np.ndarray", codes: "np.ndarray", kth: "np.ndarray",
+        ids: List[str], last_id: int, k: int
+    ):
+        """写入完整模型：先写临时目录再替换，构建期间旧模型仍可用"""
+        temp = f"{directory}.tmp"
+        shutil.rmtree(temp, ignore_errors=True)
+        os.makedirs(temp)
+        np.save(os.path.join(temp, "idf.npy"), idf)
+        vectors.astype(np.float32).tofile(os.path.join(temp, "vectors.f32"))
+        codes.astype(np.int64).tofile(os.path.join(temp, "codes.i64"))
+        kth.astype(np.float32).tofile(os.path.join(temp, "kth.f32"))
+        with open(os.path.join(temp, "ids.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(ids) + ("\n" if ids else ""))
+        RelatedModel._write_meta(temp, {"dim": vectors.shape[1], "k": k, "count": len(ids), "last_id": last_id})
+
+        old = f"{directory}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        os.replace(temp, directory)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @staticmethod
+    def _write_meta(directory: str, meta: Dict[str, Any]):
+        path = os.path.join(directory, "meta.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({**meta, "updated_at": datetime.now().isoformat()}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def append(self, vectors: "np.ndarray", codes: "np.ndarray", kth: "np.ndarray", ids: List[str], last_id: int):
+        """追加新文章并保存已有文章更新后的第k名分数，最后写meta使追加生效"""
+        for name, values in (("vectors.f32", vectors.astype(np.float32)), ("codes.i64", codes), ("kth.f32", kth)):
+            with open(self._path(name), "ab") as f:
+                f.write(values.tobytes())
+        with open(self._path("ids.txt"), "r+b") as f:
+            # 从已生效的最后一行之后写，覆盖中断的追加留下的多余行
+            f.seek(sum(len(unique_id.encode("utf-8")) + 1 for unique_id in self.ids))
+            f.write("".join(f"{unique_id}\n" for unique_id in ids).encode("utf-8"))
+            f.truncate()
+        existing = np.memmap(self._path("kth.f32"), np.float32, "r+", shape=(len(self.kth) + len(kth),))
+        existing[:len(self.kth)] = self.kth
+        existing.flush()
+        self._write_meta(self.directory, {"dim": self.dim, "k": self.k, "count": len(self.ids) + len(ids), "last_id": last_id})
+
+@contextmanager
+def _model_lock() -> Iterator[bool]:
+    """模型文件的进程间互斥锁，已被其他进程持有时返回False"""
+    os.makedirs(os.path.dirname(RELATED_MODEL_DIR) or ".", exist_ok=True)
+    with open(f"{RELATED_MODEL_DIR}.lock", "w") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _texts(rows: Sequence[Any]) -> List[str]:
+    return [normalize_text(row.title, row.digest) for row in rows]
+
+def _row_codes(rows: Sequence[Any]) -> "np.ndarray":
+    return cluster_codes([row.unique_id for row in rows], [row.cluster_id for row in rows])
+
+def _batches(db: Session, batch_size: int, after_id: int = 0, max_id: Optional[int] = None) -> Iterator[List[Any]]:
+    """按id分批读取文章（键集分页，批之间可以写库）"""
+    while True:
+        stmt = select(*_FIELDS).where(Article.id > after_id).order_by(Article.id).limit(batch_size)
+        if max_id is not None:
+            stmt = stmt.where(Article.id <= max_id)
+        rows = db.execute(stmt).all()
+        if not rows:
+            return
+        after_id = rows[-1].id
+        yield rows
+
+def _neighbour(article: Dict[str, Any], score: float) -> Dict[str, Any]:
+    return {
+        "unique_id": article["unique_id"],
+        "title": article["title"],
+        "url": article["url"],
+        "cover": article["cover"],
+        "bizname": article["bizname"],
+        "pub_time_iso": article["pub_time_iso"],
+        "score": round(float(score), 4)
+    }
+
+def _save_lists(db: Session, lists: Dict[str, List[Tuple[str, float]]], articles: Dict[str, Dict[str, Any]]):
+    """写入相关文章列表，articles 提供展示字段，缺少的（已删除的）文章跳过"""
+    missing = {unique_id for pairs in lists.values() for unique_id, _ in pairs} - articles.keys()
+    if missing:
+        rows = db.execute(ARTICLE_HYDRATE.select().where(Article.unique_id.in_(missing)))
+        articles = {**articles, **{article["unique_id"]: article for article in ARTICLE_HYDRATE.to_dicts(rows)}}
+
+    now = datetime.now()
+    values = [
+        {
+            "unique_id": unique_id,
+            "neighbours": json.dumps(
+                [_neighbour(articles[other], score) for other, score in pairs if other in articles], ensure_ascii=False
+            ),
+            "updated_at": now
+        }
+        for unique_id, pairs in lists.items()
+    ]
+    if values:
+        db.execute(delete(RelatedArticle).where(RelatedArticle.unique_id.in_(lists.keys())))
+        db.execute(insert(RelatedArticle), values)
+    db.commit()
+
+def _lists(
+    ids: Sequence[str], scores: "np.ndarray", indices: "np.ndarray", all_ids: Sequence[str]
+) -> Dict[str, List[Tuple[str, float]]]:
+    return {
+        unique_id: [(all_ids[j], s) for s, j in zip(row_scores, row_indices) if s >= RELATED_MIN_SCORE]
+        for unique_id, row_scores, row_indices in zip(ids, scores.tolist(), indices.tolist())
+    }
+
+def _hydrated(rows: Sequence[Any]) -> Dict[str, Dict[str, Any]]:
+    width = len(ARTICLE_HYDRATE.fields)
+    return {row.unique_id: ARTICLE_HYDRATE.to_dict(tuple(row)[-width:]) for row in rows}
+
+def build_related(db: Session, batch_size: int = RELATED_BATCH_SIZE, k: int = RELATED_TOP_K) -> Dict[str, Any]:
+    """
+    全量构建：两遍读取文章（先统计文档频率，再计算向量），然后分块计算每篇文章的 top-k 并写库
+
+    Returns:
+        Dict: 处理的文章数和耗时
+    """
+    _require_numpy()
+    with _model_lock() as locked:
+        if not locked:
+            return {"success": False, "message": "其他进程正在更新相关文章", "processed": 0}
+
+        started = datetime.now().replace(microsecond=0)
+        max_id = db.scalar(select(func.max(Article.id))) or 0
+
+        frequencies = np.zeros(1 << HASH_BITS, np.int64)
+        count = 0
+        for rows in _batches(db, batch_size, max_id=max_id):
+            frequencies += document_frequencies(_texts(rows))
+            count += len(rows)
+        idf = inverse_document_frequency(frequencies, count)
+
+        vectors, codes, ids = [], [], []
+        for rows in _batches(db, batch_size, max_id=max_id):
+            vectors.append(vectorize(_texts(rows), idf, RELATED_DIM))
+            codes.append(_row_codes(rows))
+            ids += [row.unique_id for row in rows]
+        matrix = np.concatenate(vectors) if vectors else np.zeros((0, RELATED_DIM), np.float32)
+        codes = np.concatenate(codes) if codes else np.zeros(0, np.int64)
+        vectorized = datetime.now()
+
+        kth = np.zeros(len(ids), np.float32)
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            scores, indices = nearest(matrix[start:end], codes[start:end], matrix, codes, k)
+            kth[start:end] = _kth_scores(scores, k)
+            _save_lists(db, _lists(ids[start:end], scores, indices, ids), {})
+
+        # 构建期间没有重新写入的是已删除文章的列表
+        db.execute(delete(RelatedArticle).where(RelatedArticle.updated_at < started))
+        db.commit()
+        RelatedModel.write(RELATED_MODEL_DIR, idf, matrix, codes, kth, ids, max_id, k)
+
+        finished = datetime.now()
+        logger.info(f"相关文章构建完成: {len(ids)} 篇，用时 {(finished - started).total_seconds():.1f} 秒")
+        return {
+            "success": True,
+            "message": f"构建 {len(ids)} 篇文章的相关文章",
+            "processed": len(ids),
+            "vectorize_seconds": round((vectorized - started).total_seconds(), 2),
+            "total_seconds": round((finished - started).total_seconds(), 2)
+        }
+
+def update_related(db: Session, batch_size: int = RELATED_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    增量更新一批新入库的文章：计算它们的列表，并插入到分数超过原第k名的已有文章的列表中
+
+    Returns:
+        Dict: 处理的新文章数和被更新列表的已有文章数
+    """
+    _require_numpy()
+    with _model_lock() as locked:
+        if not locked:
+            return {"success": True, "message": "其他进程正在更新相关文章", "processed": 0, "updated": 0}
+
+        model = RelatedModel.load()
+        if model is None:
+            return {"success": False, "message": "尚未构建相关文章，先执行 --build", "processed": 0, "updated": 0}
+
+        rows = next(_batches(db, batch_size, after_id=model.last_id), None)
+        if not rows:
+            return {"success": True, "processed": 0, "updated": 0}
+
+        new_ids = [row.unique_id for row in rows]
+        queries = vectorize(_texts(rows), model.idf, model.dim)
+        query_codes = _row_codes(rows)
+        offset = len(model.ids)
+
+        # 新文章之间以及与已有文章比较；已有文章中分数超过其第k名的记为插入候选
+        best = _empty_top_k(len(rows))
+        inserts: Dict[int, List[Tuple[float, int]]] = {}
+        for start, scores in _score_tiles(queries, query_codes, model.vectors, model.codes):
+            best = _merge_top_k(best, scores, start, model.k)
+            hit_rows, hit_columns = np.nonzero(scores > model.kth[None, start:start + scores.shape[1]])
+            for i, j in zip(hit_rows.tolist(), hit_columns.tolist()):
+                inserts.setdefault(start + j, []).append((float(scores[i, j]), offset + i))
+        for start, scores in _score_tiles(queries, query_codes, queries, query_codes, offset):
+            best = _merge_top_k(best, scores, start, model.k)
+        scores, indices = _sorted_top_k(best)
+
+        all_ids = model.ids + new_ids
+        articles = _hydrated(rows)
+        _save_lists(db, _lists(new_ids, scores, indices, all_ids), articles)
+
+        if inserts:
+            affected = {model.ids[j]: j for j in inserts}
+            current = dict(db.execute(
+                select(RelatedArticle.unique_id, RelatedArticle.neighbours)
+                .where(RelatedArticle.unique_id.in_(affected))
+            ).all())
+            lists = {}
+            for unique_id, j in affected.items():
+                pairs = [(item["unique_id"], item["score"]) for item in json.loads(current.get(unique_id) or "[]")]
+                pairs += [(all_ids[i], score) for score, i in inserts[j]]
+                pairs = sorted(pairs, key=lambda pair: -pair[1])[:model.k]
+                lists[unique_id] = pairs
+                if len(pairs) >= model.k:
+                    model.kth[j] = max(pairs[-1][1], RELATED_MIN_SCORE)
+            # 已有列表中的文章需要重新读取展示字段
+            _save_lists(db, lists, articles)
+
+        model.append(queries, query_codes, _kth_scores(scores, model.k), new_ids, rows[-1].id)
+        logger.info(f"相关文章增量更新: 新文章 {len(rows)} 篇，更新已有文章 {len(inserts)} 篇")
+        return {"success": True, "processed": len(rows), "updated": len(inserts)}
+
+def get_related(db: Session, article_id: str, size: int = RELATED_TOP_K) -> Dict[str, Any]:
+    """读取文章的相关文章列表，尚未计算时为空列表"""
+    row = db.execute(
+        select(RelatedArticle.neighbours, RelatedArticle.updated_at).where(RelatedArticle.unique_id == article_id)
+    ).first()
+    if not row:
+        return {"unique_id": article_id, "related": [], "updated_at": None}
+    return {"unique_id": article_id, "related": json.loads(row[0])[:size], "updated_at": row[1].isoformat()}
+
+def delete_lists(db: Session, unique_ids: Optional[List[str]] = None):
+    """删除文章的相关文章列表，unique_ids 为None时全部删除（由调用方提交）"""
+    stmt = delete(RelatedArticle)
+    if unique_ids is not None:
+        stmt = stmt.where(RelatedArticle.unique_id.in_(unique_ids))
+    db.execute(stmt)
+
+def _update_loop():
+    """后台定期处理新入库的文章，每轮处理完所有新文章"""
+    while not _stop_event.is_set():
+        try:
+            with SessionLocal() as db:
+                while not _stop_event.is_set():
+                    result = update_related(db)
+                    if not result["success"] or result["processed"] < RELATED_BATCH_SIZE:
+                        break
+        except Exception as e:
+            logger.error(f"相关文章更新任务发生错误: {e}")
+        _stop_event.wait(RELATED_UPDATE_INTERVAL)
+
+def start_related_worker() -> bool:
+    """启动后台增量更新线程"""
+    global _worker
+    if RELATED_UPDATE_INTERVAL <= 0:
+        logger.info("未配置更新间隔，不启动相关文章更新任务")
+        return False
+    if np is None:
+        logger.warning("未安装numpy，不启动相关文章更新任务")
+        return False
+    if _worker and _worker.is_alive():
+        return True
+
+    _stop_event.clear()
+    _worker = threading.Thread(target=_update_loop, name="related-update", daemon=True)
+    _worker.start()
+    logger.info(f"相关文章更新任务已启动，间隔 {RELATED_UPDATE_INTERVAL} 秒")
+    return True
+
+def stop_related_worker():
+    """停止后台更新线程"""
+    _stop_event.set()
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="构建或更新相关文章")
+    parser.add_argument("--build", action="store_true", help="全量构建")
+    parser.add_argument("--batch-size", type=int, default=RELATED_BATCH_SIZE, help="每批处理的文章数")
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        if args.build:
+            print(build_related(session, args.batch_size))
+        else:
+            print(update_related(session, args.batch_size))
@@ -1,18 +1,25 @@
- """搜索引擎服务"""
+"""搜索引擎服务"""
 import os
+import zlib
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Sequence
 from datetime import datetime
 from elasticsearch import Elasticsearch, helpers
 
+from ..connections import get_es_client, ES_HOST, ES_PORT
+from ..circuit_breaker import CircuitOpenError
+from . import embedding
+
 # 配置
-ES_HOST = os.environ.get("ES_HOST", "localhost")
-ES_PORT = os.environ.get("ES_PORT", "9200")
 ES_INDEX = os.environ.get("ES_INDEX", "wechat_articles")
+# 混合搜索：kNN每个分片的候选数、kNN结果的最低余弦相似度，以及向量得分（0~1）与BM25分数相加时的权重
+HYBRID_NUM_CANDIDATES = int(os.environ.get("HYBRID_NUM_CANDIDATES", "100"))
+HYBRID_MIN_SIMILARITY = float(os.environ.get("HYBRID_MIN_SIMILARITY", "0.3"))
+HYBRID_VECTOR_BOOST = float(os.environ.get("HYBRID_VECTOR_BOOST", "10"))
 
-# 创建Elasticsearch客户端
+# 获取共享的Elasticsearch客户端
 try:
-    es_client = Elasticsearch(f"http://{ES_HOST}:{ES_PORT}")
+    es_client = get_es_client()
     if es_client.ping():
         logging.info(f"Elasticsearch连接成功: {ES_HOST}:{ES_PORT}")
     else:
@@ -34,11 +41,22 @@ INDEX_MAPPING = {
             "digest": {"type": "text", "analyzer": "standard"},
             "bizname": {"type": "text", "analyzer": "standard"},
             "pub_time_iso": {"type": "date"},
-            "created_at": {"type": "date"}
+            "cluster_id": {"type": "keyword"},
+            "fingerprint": {"type": "long"},
+            "created_at": {"type": "date"},
+            **embedding.EMBEDDING_MAPPING
         }
     }
 }
 
+# 近似重复簇ID字段，已有索引在初始化时补充映射
+CLUSTER_MAPPING = {"cluster_id": {"type": "keyword"}}
+# 内容指纹字段（一致性检查使用，见 reconcile.py），已有索引在初始化时补充映射
+FINGERPRINT_MAPPING = {"fingerprint": {"type": "long"}}
+
+# 参与内容指纹的字段
+_FINGERPRINT_FIELDS = ("unique_id", "title", "digest", "bizname", "pub_time_iso", "cluster_id")
+
 def init_search_index():
     """初始化搜索索引"""
     if not es_client:
@@ -49,11 +67,60 @@ def init_search_index():
         if not es_client.indices.exists(index=ES_INDEX):
             es_client.indices.create(index=ES_INDEX, body=INDEX_MAPPING)
             logger.info(f"创建搜索索引: {ES_INDEX}")
+        else:
+            es_client.indices.put_mapping(index=ES_INDEX, properties={**CLUSTER_MAPPING, **FINGERPRINT_MAPPING})
+            put_embedding_mapping(ES_INDEX)
         return True
     except Exception as e:
         logger.error(f"初始化搜索索引时发生错误: {e}")
         return False
 
+def put_embedding_mapping(index: str):
+    """为已有索引补充向量字段，维数与现有映射不一致时只记录错误，混合搜索不可用直到重建索引"""
+    try:
+        es_client.indices.put_mapping(index=index, properties=embedding.EMBEDDING_MAPPING)
+    except Exception as e:
+        logger.error(f"补充向量字段映射失败（修改 EMBEDDING_DIM 后需要重建索引）: {e}")
+
+def _search_fields(article: Dict[str, Any]) -> Dict[str, Any]:
+    """索引文档中来自文章的字段"""
+    return {
+        "unique_id": article["unique_id"],
+        "title": article["title"],
+        "digest": article["digest"] or "",
+        "bizname": article["bizname"] or "",
+        "pub_time_iso": article["pub_time_iso"],
+        # 尚未回填簇ID的文章自成一簇，折叠时不会与其他文章合并
+        "cluster_id": article.get("cluster_id") or article["unique_id"]
+    }
+
+def _fingerprint(fields: Dict[str, Any]) -> int:
+    return zlib.crc32("\x1f".join(str(fields[name] or "") for name in _FINGERPRINT_FIELDS).encode("utf-8"))
+
+def article_fingerprint(article: Dict[str, Any]) -> int:
+    """
+    文章索引内容的32位指纹（CRC32），写入ES文档的 fingerprint 字段
+
+    一致性检查按区间比较文档数和指纹之和，ES的sum聚合按double计算，区间内不超过2^21篇文档时结果精确
+    """
+    return _fingerprint(_search_fields(article))
+
+def _index_document(article: Dict[str, Any], vector: Optional[List[float]] = None) -> Dict[str, Any]:
+    """准备索引文档（只包含搜索需要的字段），vector 为文章向量"""
+    document = _search_fields(article)
+    document["fingerprint"] = _fingerprint(document)
+    document["created_at"] = datetime.now().isoformat()
+    if vector is not None:
+        document["embedding"] = vector
+    return document
+
+def _index_documents(articles: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """一批文章的索引文档，向量整批编码"""
+    return [
+        _index_document(article, vector)
+        for article, vector in zip(articles, embedding.encode_articles(articles))
+    ]
+
 def index_article(article: Dict[str, Any]) -> bool:
     """将文章索引到Elasticsearch"""
     if not es_client:
@@ -61,24 +128,17 @@ def index_article(article: Dict[str, Any]) -> bool:
         return False
         
     try:
-        # 准备索引文档（只包含搜索需要的字段）
-        doc = {
-            "unique_id": article["unique_id"],
-            "title": article["title"],
-            "digest": article["digest"] or "",
-            "bizname": article["bizname"] or "",
-            "pub_time_iso": article["pub_time_iso"],
-            "created_at": datetime.now().isoformat()
-        }
-        
         # 索引文档
         es_client.index(
             index=ES_INDEX,
             id=article["unique_id"],
-            document=doc,
+            document=_index_documents([article])[0],
             refresh=True
         )
         return True
+    except CircuitOpenError:
+        # 熔断期间不逐条记录错误，由调用方转入重试队列
+        return False
     except Exception as e:
         logger.error(f"索引文章时发生错误: {e}")
         return False
@@ -92,6 +152,8 @@ def delete_article_from_index(article_id: str) -> bool:
     try:
         es_client.delete(index=ES_INDEX, id=article_id, refresh=True)
         return True
+    except CircuitOpenError:
+        return False
     except Exception as e:
         logger.error(f"从索引中删除文章时发生错误: {e}")
         return False
@@ -114,8 +176,58 @@ def clear_index() -> Dict[str, Any]:
         logger.error(f"清空索引时发生错误: {e}")
         return {"success": False, "message": f"清空索引时发生错误: {str(e)}"}
 
-def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]:
-    """搜索文章"""
+def build_search_query(
+    query: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """构建关键词查询，可选按发布时间过滤"""
+    match = {
+        "multi_match": {
+            "query": query,
+            "fields": ["title^3", "digest^2", "bizname"],
+            "type": "best_fields",
+            "operator": "or",
+            "minimum_should_match": "70%"
+        }
+    }
+    if not start_time and not end_time:
+        return match
+
+    pub_range = {}
+    if start_time:
+        pub_range["gte"] = start_time.isoformat()
+    if end_time:
+        pub_range["lte"] = end_time.isoformat()
+    return {"bool": {"must": [match], "filter": [{"range": {"pub_time_iso": pub_range}}]}}
+
+def _knn_clause(query: str, page: int, size: int) -> Optional[Dict[str, Any]]:
+    """混合搜索的kNN子句，没有向量模型或查询词没有特征时返回None"""
+    vector = embedding.encode_query(query)
+    if vector is None:
+        return None
+    # kNN只返回前k个结果，k要覆盖到当前页
+    k = min(page * size, 10000)
+    return {
+        "field": "embedding",
+        "query_vector": vector,
+        "k": k,
+        "num_candidates": min(max(k, HYBRID_NUM_CANDIDATES), 10000),
+        # 不设下限时kNN总会返回k篇，即使与查询无关
+        "similarity": HYBRID_MIN_SIMILARITY,
+        "boost": HYBRID_VECTOR_BOOST
+    }
+
+def search_articles(
+    query: str, page: int = 1, size: int = 10, collapse: bool = False, mode: str = "lexical"
+) -> Dict[str, Any]:
+    """
+    搜索文章
+
+    collapse 为True时按 cluster_id 折叠近似重复的文章，每簇只返回得分最高的一篇，
+    total 为匹配的簇数（cardinality聚合，近似值）
+
+    mode 为 hybrid 时同时执行向量kNN检索，文档得分为BM25分数加上 HYBRID_VECTOR_BOOST 倍的向量相似度，
+    关键词没有命中但语义相近的文章也能返回；没有向量模型时按关键词搜索，响应中的 mode 为实际使用的方式
+    """
     if not es_client:
         logger.error("Elasticsearch客户端未初始化，无法搜索文章")
         return {
@@ -134,15 +246,7 @@ def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]
         
         # 构建查询
         search_query = {
-            "query": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["title^3", "digest^2", "bizname"],
-                    "type": "best_fields",
-                    "operator": "or",
-                    "minimum_should_match": "70%"
-                }
-            },
+            "query": build_search_query(query),
             "highlight": {
                 "fields": {
                     "title": {"number_of_fragments": 0},
@@ -155,9 +259,16 @@ def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]
                 "_score",
                 {"pub_time_iso": {"order": "desc"}}
             ],
+            "_source": {"excludes": ["embedding"]},
             "from": from_val,
             "size": size
         }
+        knn = _knn_clause(query, page, size) if mode == "hybrid" else None
+        if knn:
+            search_query["knn"] = knn
+        if collapse:
+            search_query["collapse"] = {"field": "cluster_id"}
+            search_query["aggs"] = {"clusters": {"cardinality": {"field": "cluster_id"}}}
         
         # 执行搜索
         start_time = datetime.now()
@@ -170,6 +281,8 @@ def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]
         
         # 返回搜索结果和高亮信息
         total = response["hits"]["total"]["value"] if "hits" in response and "total" in response["hits"] else 0
+        if collapse and "aggregations" in response:
+            total = response["aggregations"]["clusters"]["value"]
         results = []
         
         for hit in response["hits"]["hits"]:
@@ -182,7 +295,8 @@ def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]
                 "title": highlight["title"][0] if "title" in highlight else source["title"],
                 "digest": "...".join(highlight["digest"]) if "digest" in highlight and highlight["digest"] else source.get("digest", ""),
                 "bizname": source.get("bizname", ""),
-                "pub_time_iso": source.get("pub_time_iso")
+                "pub_time_iso": source.get("pub_time_iso"),
+                "cluster_id": source.get("cluster_id")
             }
             results.append(doc)
         
@@ -192,10 +306,15 @@ def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]
             "size": size,
             "total": total,
             "took": took_ms,
+            "collapse": collapse,
+            "mode": "hybrid" if knn else "lexical",
             "results": results,
             "unique_ids": unique_ids  # 用于从MySQL获取完整数据
         }
         
+    except CircuitOpenError:
+        # 熔断时由调用方决定快速失败或降级
+        raise
     except Exception as e:
         logger.error(f"搜索文章时发生错误: {e}")
         return {
@@ -208,8 +327,136 @@ def search_articles(query: str, page: int = 1, size: int = 10) -> Dict[str, Any]
             "error": str(e)
         }
 
+def scan_search_results(
+    query: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    batch_size: int = 1000,
+    keep_alive: str = "1m"
+) -> Iterator[Dict[str, Any]]:
+    """
+    使用PIT + search_after遍历全部搜索结果，内存占用与结果总数无关
+
+    Args:
+        query: 搜索关键词
+        start_time: 发布时间下限
+        end_time: 发布时间上限
+        batch_size: 每批读取的文档数
+        keep_alive: PIT保持时间
+
+    Yields:
+        Dict: 单条搜索结果
+    """
+    if not es_client:
+        raise RuntimeError("Elasticsearch未连接")
+
+    pit_id = es_client.open_point_in_time(index=ES_INDEX, keep_alive=keep_alive)["id"]
+    try:
+        search_after = None
+        while True:
+            body = {
+                "query": build_search_query(query, start_time, end_time),
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "sort": ["_score", {"_shard_doc": "asc"}],
+                "_source": {"excludes": ["embedding"]},
+                "size": batch_size,
+                "track_total_hits": False
+            }
+            if search_after:
+                body["search_after"] = search_after
+
+            response = es_client.search(body=body)
+            hits = response["hits"]["hits"]
+            if not hits:
+                break
+
+            # PIT id 可能在每次请求后变化
+            pit_id = response.get("pit_id", pit_id)
+            search_after = hits[-1]["sort"]
+
+            for hit in hits:
+                source = hit["_source"]
+                yield {
+                    "unique_id": source["unique_id"],
+                    "title": source.get("title", ""),
+                    "digest": source.get("digest", ""),
+                    "bizname": source.get("bizname", ""),
+                    "pub_time_iso": source.get("pub_time_iso"),
+                    "score": hit["_score"]
+                }
+    finally:
+        try:
+            es_client.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"关闭PIT时发生错误: {e}")
+
+def bulk_sync_articles(articles: List[Dict[str, Any]], deleted_ids: List[str] = ()) -> Dict[str, str]:
+    """
+    批量索引和删除文章，用于重试之前失败的同步
+
+    Args:
+        articles: 要索引的文章
+        deleted_ids: 要从索引中删除的文章ID
+
+    Returns:
+        Dict: 失败的文章 {unique_id: 错误信息}，全部成功时为空
+    """
+    if not es_client:
+        raise RuntimeError("Elasticsearch未连接")
+
+    actions = [
+        {"_op_type": "index", "_index": ES_INDEX, "_id": article["unique_id"], "_source": document}
+        for article, document in zip(articles, _index_documents(articles))
+    ]
+    actions += [{"_op_type": "delete", "_index": ES_INDEX, "_id": unique_id} for unique_id in deleted_ids]
+
+    errors = {}
+    for ok, item in helpers.streaming_bulk(
+        es_client, actions, refresh=True, raise_on_error=False, raise_on_exception=False
+    ):
+        if ok:
+            continue
+        op_type, info = next(iter(item.items()))
+        # 要删除的文档已不存在
+        if op_type == "delete" and info.get("status") == 404:
+            continue
+        errors[info["_id"]] = str(info.get("error", info.get("status")))
+    return errors
+
+def update_embeddings(batches: Iterable[Sequence[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    用当前向量模型重新编码文章，每批整批编码后一次bulk部分更新 embedding 字段
+
+    Args:
+        batches: 分批的文章，至少包含 unique_id、title、digest
+    """
+    if not es_client:
+        return {"success": False, "message": "Elasticsearch未连接", "encoded": 0}
+    encoder = embedding.get_encoder()
+    if encoder is None:
+        return {"success": False, "message": "没有可用的向量模型", "encoded": 0}
+
+    encoded = failed = 0
+    for batch in batches:
+        actions = [
+            {"_op_type": "update", "_index": ES_INDEX, "_id": article["unique_id"], "doc": {"embedding": vector}}
+            for article, vector in zip(batch, encoder.encode_articles(batch))
+        ]
+        for ok, item in helpers.streaming_bulk(
+            es_client, actions, chunk_size=len(actions), raise_on_error=False, raise_on_exception=False
+        ):
+            if ok:
+                encoded += 1
+            else:
+                failed += 1
+                info = item["update"]
+                logger.error(f"更新文章向量失败: {info.get('_id')} {info.get('error', info.get('status'))}")
+        logger.info(f"已编码 {encoded} 篇文章")
+    es_client.indices.refresh(index=ES_INDEX)
+    return {"success": True, "message": f"编码 {encoded} 篇文章，失败 {failed} 篇", "encoded": encoded, "failed": failed}
+
 def reindex_all_articles(articles: List[Dict]) -> Dict[str, Any]:
-    """重建所有文章的搜索索引"""
+    """重建所有文章的搜索索引，每批文章整批编码向量后一次bulk写入"""
     if not es_client:
         logger.error("Elasticsearch客户端未初始化，无法重建索引")
         return {"success": False, "message": "Elasticsearch未连接", "indexed": 0}
@@ -224,11 +471,10 @@ def reindex_all_articles(articles: List[Dict]) -> Dict[str, Any]:
         success_count = 0
         failed_count = 0
         
-        for article in articles:
-            if index_article(article):
-                success_count += 1
-            else:
-                failed_count += 1
+        for batch in embedding.chunks(articles, embedding.EMBEDDING_BATCH_SIZE):
+            errors = bulk_sync_articles(batch)
+            failed_count += len(errors)
+            success_count += len(batch) - len(errors)
                 
         return {
             "success": True,
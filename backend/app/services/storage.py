@@ -0,0 +1,270 @@
+"""存储后端
+
+STORAGE_BACKEND 选择文章和日志的存储方式：
+
+- mysql+es（默认）：MySQL保存完整数据，Elasticsearch只保存搜索需要的字段
+- es-only：文章和日志只保存在Elasticsearch中（app/elasticsearch_utils.py），写入使用bulk API，
+  适合写入量大、MySQL成为瓶颈的部署；不支持MySQL降级搜索、同步重试队列、一致性检查、ETag条件请求、相关文章和变更订阅
+
+两种后端实现相同的接口，返回结构相同。接口的 db 参数是请求的数据库会话，es-only 模式下不使用
+（会话在第一次执行SQL时才建立连接）。切换回 mysql+es 时可用 migrate.py 把ES中的文章导入MySQL。
+"""
+import os
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Iterator, Optional
+from sqlalchemy.orm import Session
+
+from ..models.database import Base, engine, read_session
+from ..models.article import ARTICLE_DOCUMENT
+from ..models.migrations import run_migrations, DB_AUTO_MIGRATE
+from . import article as article_service
+from . import search as search_service
+from . import log as log_service
+from . import log_retention
+from . import index_retry
+from . import data_version
+from . import dedup
+from . import related
+from . import changes
+from . import reconcile
+from . import jobs
+from . import log_rollup
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mysql+es").lower()
+
+class StorageBackend:
+    """存储后端接口"""
+    name = ""
+    # 是否使用MySQL保存文章和日志
+    uses_mysql = True
+
+    def initialize(self):
+        """创建表/索引"""
+        raise NotImplementedError
+
+    def start(self):
+        """启动后端需要的后台任务"""
+
+    def stop(self):
+        """停止后台任务"""
+
+    def save_articles(self, db: Session, request_data: Any) -> Dict[str, Any]:
+        """保存 /artlist/ 上报的文章"""
+        raise NotImplementedError
+
+    def get_articles(self, db: Session, page: int, size: int, sort_by: str, sort_order: str) -> Dict[str, Any]:
+        """分页获取文章列表"""
+        raise NotImplementedError
+
+    def search(
+        self, db: Session, query: str, page: int, size: int, collapse: bool = False, mode: str = "lexical"
+    ) -> Dict[str, Any]:
+        """
+        关键词搜索，collapse 为True时按近似重复簇折叠，mode 为 hybrid 时同时按文章向量检索，
+        ES熔断时抛出 CircuitOpenError
+        """
+        return search_service.search_articles(query, page, size, collapse, mode)
+
+    def search_fallback(self, db: Session, query: str, page: int, size: int) -> Optional[Dict[str, Any]]:
+        """ES熔断时的降级搜索，不支持时返回None"""
+        return None
+
+    def iter_articles(
+        self, start_time: Optional[datetime], end_time: Optional[datetime], biz: Optional[str], batch_size: int
+    ) -> Iterator[Dict[str, Any]]:
+        """流式读取文章，字段至少包含 ARTICLE_DOCUMENT 的全部列"""
+        raise NotImplementedError
+
+    def delete_article(self, db: Session, article_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def delete_articles(self, db: Session, criteria: Dict[str, Any]) -> Dict[str, Any]:
+        """提交批量删除任务，criteria 为 ArticleDeleteFilter 的字段"""
+        raise NotImplementedError
+
+    def get_job(self, db: Session, job_id: str) -> Optional[Dict[str, Any]]:
+        """后台任务的状态和进度，不存在时返回None"""
+        raise NotImplementedError
+
+    def clear_articles(self, db: Session) -> Dict[str, Any]:
+        """提交清空文章任务，与批量删除共用 get_job 查询进度"""
+        raise NotImplementedError
+
+    def save_log(self, db: Session, log_data: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def get_logs(
+        self, db: Session, start_time: Optional[datetime], end_time: Optional[datetime],
+        cursor: Optional[str], size: int
+    ) -> Dict[str, Any]:
+        """按时间倒序键集分页的日志列表，不含请求/响应数据；游标格式不正确时抛出 CursorError"""
+        raise NotImplementedError
+
+    def get_log(self, db: Session, log_id: str) -> Optional[Dict[str, Any]]:
+        """单条日志的完整内容，不存在时返回None"""
+        raise NotImplementedError
+
+    def backfill_clusters(self, db: Session, batch_size: int, reset: bool = False) -> Dict[str, Any]:
+        """为已有文章回填近似重复簇ID"""
+        raise NotImplementedError
+
+    def validators(self, db: Session, prefix: str) -> Optional[data_version.Validators]:
+        """条件请求的校验信息，从接口查询数据所用的会话读取版本号，不支持时返回None"""
+        return None
+
+    def get_related(self, db: Session, article_id: str, size: int) -> Optional[Dict[str, Any]]:
+        """预计算的相关文章，不支持时返回None"""
+        return None
+
+    def get_changes(self, db: Session, since: Optional[str], limit: int) -> Optional[Dict[str, Any]]:
+        """游标之后的文章变更，不支持时返回None"""
+        return None
+
+    def get_ingest_stats(
+        self, db: Session, start_time: Optional[datetime], end_time: Optional[datetime], period: str,
+        group_by: List[str], path: Optional[str], client: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        """按时间桶汇总的请求统计，不支持时返回None"""
+        return None
+
+class MySQLESStorage(StorageBackend):
+    """MySQL保存完整数据，ES负责搜索"""
+    name = "mysql+es"
+
+    def initialize(self):
+        # 初始化数据库表
+        Base.metadata.create_all(bind=engine)
+        # 执行数据库结构迁移（补建索引等）
+        if DB_AUTO_MIGRATE:
+            run_migrations(engine)
+        # 初始化搜索索引
+        search_service.init_search_index()
+
+    def start(self):
+        log_retention.start_log_retention_worker()
+        index_retry.start_index_retry_worker()
+        related.start_related_worker()
+        reconcile.start_reconcile_worker()
+
+    def stop(self):
+        log_retention.stop_log_retention_worker()
+        index_retry.stop_index_retry_worker()
+        related.stop_related_worker()
+        reconcile.stop_reconcile_worker()
+        log_rollup.stop_rollup_flusher()
+
+    def save_articles(self, db, request_data):
+        return article_service.save_article_data(db, request_data)
+
+    def get_articles(self, db, page, size, sort_by, sort_order):
+        return article_service.get_all_articles(db, page, size, sort_by, sort_order)
+
+    def search_fallback(self, db, query, page, size):
+        return article_service.search_articles_fallback(db, query, page, size)
+
+    def iter_articles(self, start_time, end_time, biz, batch_size):
+        # 大范围扫描使用只读副本
+        db = read_session()
+        try:
+            yield from article_service.iter_articles(db, start_time, end_time, biz, batch_size, ARTICLE_DOCUMENT)
+        finally:
+            db.close()
+
+    def delete_article(self, db, article_id):
+        return article_service.delete_article_by_id(db, article_id)
+
+    def delete_articles(self, db, criteria):
+        return article_service.delete_articles(db, criteria)
+
+    def get_job(self, db, job_id):
+        return jobs.get_job(db, job_id)
+
+    def clear_articles(self, db):
+        return article_service.clear_articles(db)
+
+    def save_log(self, db, log_data):
+        return log_service.save_log(db, log_data)
+
+    def get_logs(self, db, start_time, end_time, cursor, size):
+        return log_service.get_logs(db, start_time, end_time, cursor, size)
+
+    def get_log(self, db, log_id):
+        return log_service.get_log(db, log_id)
+
+    def backfill_clusters(self, db, batch_size, reset=False):
+        return dedup.backfill_clusters(db, batch_size, reset)
+
+    def validators(self, db, prefix):
+        return data_version.validators(prefix, db)
+
+    def get_related(self, db, article_id, size):
+        return related.get_related(db, article_id, size)
+
+    def get_changes(self, db, since, limit):
+        return changes.get_changes(db, since, limit)
+
+    def get_ingest_stats(self, db, start_time, end_time, period, group_by, path, client):
+        return log_rollup.get_ingest_stats(db, start_time, end_time, period, group_by, path, client)
+
+class ESOnlyStorage(StorageBackend):
+    """文章和日志只保存在ES中"""
+    name = "es-only"
+    uses_mysql = False
+
+    def __init__(self):
+        # 只在启用时导入，避免 mysql+es 模式加载不需要的模块
+        from .. import elasticsearch_utils
+        self._es = elasticsearch_utils
+
+    def initialize(self):
+        self._es.initialize_indices()
+
+    def save_articles(self, db, request_data):
+        return self._es.save_article_data(request_data)
+
+    def get_articles(self, db, page, size, sort_by, sort_order):
+        return self._es.get_all_articles(page, size, sort_by, sort_order)
+
+    def iter_articles(self, start_time, end_time, biz, batch_size):
+        return self._es.iter_articles(start_time, end_time, biz, batch_size)
+
+    def delete_article(self, db, article_id):
+        return self._es.delete_article(article_id)
+
+    def delete_articles(self, db, criteria):
+        return self._es.delete_articles(criteria)
+
+    def get_job(self, db, job_id):
+        return self._es.get_job(job_id)
+
+    def clear_articles(self, db):
+        return self._es.clear_articles()
+
+    def save_log(self, db, log_data):
+        return self._es.save_log(log_data)
+
+    def get_logs(self, db, start_time, end_time, cursor, size):
+        return self._es.get_logs(start_time, end_time, cursor, size)
+
+    def get_log(self, db, log_id):
+        return self._es.get_log(log_id)
+
+    def backfill_clusters(self, db, batch_size, reset=False):
+        return self._es.backfill_clusters(batch_size, reset)
+
+STORAGE_BACKENDS = {
+    MySQLESStorage.name: MySQLESStorage,
+    ESOnlyStorage.name: ESOnlyStorage
+}
+
+def create_storage(name: str = STORAGE_BACKEND) -> StorageBackend:
+    """按名称创建存储后端"""
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"未知的存储后端: {name}，可选值: {', '.join(STORAGE_BACKENDS)}")
+    logger.info(f"使用存储后端: {name}")
+    return STORAGE_BACKENDS[name]()
+
+storage = create_storage()
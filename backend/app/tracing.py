@@ -0,0 +1,540 @@
+"""进程内请求追踪
+
+每个HTTP请求在内存中记录一棵span树：请求本身、JSON解析、文章提取、每条SQL语句、事务提交、
+每次Elasticsearch调用、日志保存和响应序列化。请求结束时按尾部采样决定是否导出：
+耗时超过 TRACE_SLOW_MS 的请求全部导出，其余按 TRACE_SAMPLE_RATE 随机导出，两者都为0时不记录。
+
+导出由后台线程写入 TRACE_EXPORT_DIR 下按进程区分的JSONL文件（traces-<pid>.jsonl），
+超过 TRACE_EXPORT_MAX_BYTES 时轮转，保留 TRACE_EXPORT_BACKUPS 个旧文件，不需要外部collector。
+已退出进程留下的文件在最后修改超过 TRACE_EXPORT_RETENTION_DAYS 天后，由之后启动的导出线程删除。
+TRACE_EXPORT_FORMAT=otlp 时每行是一个OTLP/JSON的 ExportTraceServiceRequest，可直接交给支持OTLP文件的工具。
+
+不在请求中的调用（后台任务、命令行）不记录span，只有一次ContextVar读取的开销。
+
+用法（在 backend 目录下）:
+    python -m app.tracing --summary                      # 汇总导出的追踪，按阶段分解耗时
+    python -m app.tracing --summary --route /artlist/ --min-ms 1000
+"""
+import os
+import glob
+import json
+import queue
+import random
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, Iterator
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# 随机导出的请求比例（0-1）
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+# 耗时超过该毫秒数的请求总是导出，0表示不按耗时导出
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "2000"))
+# 导出目录、格式（jsonl 或 otlp）和轮转设置
+TRACE_EXPORT_DIR = os.environ.get(
+    "TRACE_EXPORT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "traces")
+)
+TRACE_EXPORT_FORMAT = os.environ.get("TRACE_EXPORT_FORMAT", "jsonl").lower()
+TRACE_EXPORT_MAX_BYTES = int(os.environ.get("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_EXPORT_BACKUPS = int(os.environ.get("TRACE_EXPORT_BACKUPS", "5"))
+# 已退出进程的导出文件保留天数，0表示不清理
+TRACE_EXPORT_RETENTION_DAYS = float(os.environ.get("TRACE_EXPORT_RETENTION_DAYS", "7"))
+# 每个请求最多记录的span数，超过的只计数
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "2000"))
+# 等待写出的追踪数上限，写盘跟不上时丢弃
+TRACE_QUEUE_SIZE = int(os.environ.get("TRACE_QUEUE_SIZE", "1000"))
+# SQL语句属性的最大长度
+TRACE_STATEMENT_MAX_LENGTH = 300
+
+SERVICE_NAME = "wechatrec"
+
+TRACES_EXPORTED = Counter("traces_exported_total", "导出的请求追踪数", ("result",))
+
+class Span:
+    """一段计时，时间为相对请求开始的纳秒数"""
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes")
+
+    def __init__(self, trace: "Trace", parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter_ns() - trace.origin
+        self.end: Optional[int] = None
+        self.attributes = attributes
+
+    def finish(self, **attributes: Any):
+        self.end = time.perf_counter_ns() - self.trace.origin
+        if attributes:
+            self.attributes.update(attributes)
+
+class Trace:
+    """一个请求的全部span，第一个为请求本身"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.started_at = time.time_ns()
+        self.origin = time.perf_counter_ns()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.root = self.add(None, name, attributes)
+
+    def add(self, parent_id: Optional[str], name: str, attributes: Dict[str, Any]) -> Optional[Span]:
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return None
+        span = Span(self, parent_id, name, attributes)
+        self.spans.append(span)
+        return span
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+def enabled() -> bool:
+    return TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_MS > 0
+
+class _SpanContext:
+    __slots__ = ("name", "attributes", "span", "token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.span: Optional[Span] = None
+        self.token = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current.get()
+        if parent is not None:
+            self.span = parent.trace.add(parent.span_id, self.name, self.attributes)
+            if self.span is not None:
+                self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            if exc_type is not None:
+                self.span.attributes["error"] = exc_type.__name__
+            self.span.finish()
+            _current.reset(self.token)
+        return False
+
+def span(name: str, **attributes: Any) -> _SpanContext:
+    """
+    记录一段耗时，用法: with tracing.span("extract_articles"): ...
+
+    不在被追踪的请求中时不记录
+    """
+    return _SpanContext(name, attributes)
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """开始一个子span（用于无法使用with的事件回调），不在被追踪的请求中时返回None；由调用方 finish"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return parent.trace.add(parent.span_id, name, attributes)
+
+def annotate(**attributes: Any):
+    """给当前span添加属性"""
+    current = _current.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+# ---- 导出 ----
+
+def _to_record(trace: Trace) -> Dict[str, Any]:
+    root = trace.root
+    return {
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        "start": trace.started_at,
+        "duration_ms": round(root.end / 1e6, 3),
+        "attributes": root.attributes,
+        "dropped_spans": trace.dropped,
+        "spans": [
+            {
+                "span_id": item.span_id,
+                "parent_id": item.parent_id,
+                "name": item.name,
+                "start_ms": round(item.start / 1e6, 3),
+                "duration_ms": round(((item.end if item.end is not None else root.end) - item.start) / 1e6, 3),
+                "attributes": item.attributes
+            }
+            for item in trace.spans
+        ]
+    }
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _to_otlp(trace: Trace) -> Dict[str, Any]:
+    """OTLP/JSON 的 ExportTraceServiceRequest"""
+    spans = []
+    for item in trace.spans:
+        end = item.end if item.end is not None else trace.root.end
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": item.span_id,
+            "parentSpanId": item.parent_id or "",
+            "name": item.name,
+            # SPAN_KIND_SERVER / SPAN_KIND_INTERNAL
+            "kind": 2 if item.parent_id is None else 1,
+            "startTimeUnixNano": str(trace.started_at + item.start),
+            "endTimeUnixNano": str(trace.started_at + end),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()],
+            "status": {"code": 2} if "error" in item.attributes else {}
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]
+        }]
+    }
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 进程存在但无权发送信号
+        return True
+    return True
+
+def prune_stale_exports(directory: str = TRACE_EXPORT_DIR, retention_days: float = TRACE_EXPORT_RETENTION_DAYS) -> int:
+    """删除已退出进程留下的、超过保留天数未修改的导出文件，返回删除的文件数"""
+    if retention_days <= 0:
+        return 0
+    cutoff = time.time() - retention_days * 86400
+    removed = 0
+    for path in _trace_files(directory):
+        pid = os.path.basename(path)[len("traces-"):].split(".", 1)[0]
+        if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+class _Exporter:
+    """写入按进程区分的JSONL文件，超过大小上限时轮转"""
+
+    def __init__(self, directory: str, max_bytes: int, backups: int):
+        self.path = os.path.join(directory, f"traces-{os.getpid()}.jsonl")
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(directory, exist_ok=True)
+        removed = prune_stale_exports(directory)
+        if removed:
+            logger.info(f"已删除已退出进程的过期追踪文件 {removed} 个")
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, line: str):
+        self.file.write(line + "\n")
+        self.file.flush()
+        if self.max_bytes > 0 and self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self.file.close()
+
+_queue: "queue.Queue[Optional[Trace]]" = queue.Queue(TRACE_QUEUE_SIZE)
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+def _export_loop():
+    exporter = None
+    while True:
+        trace = _queue.get()
+        if trace is None:
+            break
+        try:
+            if exporter is None:
+                exporter = _Exporter(TRACE_EXPORT_DIR, TRACE_EXPORT_MAX_BYTES, TRACE_EXPORT_BACKUPS)
+            record = _to_otlp(trace) if TRACE_EXPORT_FORMAT == "otlp" else _to_record(trace)
+            exporter.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str))
+            TRACES_EXPORTED.labels("exported").inc()
+        except Exception as e:
+            logger.error(f"导出请求追踪时发生错误: {e}")
+            TRACES_EXPORTED.labels("failed").inc()
+    if exporter is not None:
+        exporter.close()
+
+def _submit(trace: Trace):
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _worker_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+                _worker.start()
+    try:
+        _queue.put_nowait(trace)
+    except queue.Full:
+        TRACES_EXPORTED.labels("dropped").inc()
+
+def stop_trace_exporter(timeout: float = 5.0):
+    """写完队列中的追踪后停止导出线程"""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        _queue.put(None)
+        _worker.join(timeout)
+    _worker = None
+
+def finish_trace(root: Span):
+    """结束请求的根span，按尾部采样决定是否导出"""
+    root.finish()
+    duration_ms = root.end / 1e6
+    if (TRACE_SLOW_MS > 0 and duration_ms >= TRACE_SLOW_MS) or random.random() < TRACE_SAMPLE_RATE:
+        _submit(root.trace)
+
+class TracingMiddleware:
+    """为每个HTTP请求建立追踪的ASGI中间件，span名使用路由模板"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled():
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        trace = Trace(f"{scope['method']} {scope['path']}", {"http.method": scope["method"], "http.target": scope["path"]})
+        token = _current.set(trace.root)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            trace.root.name = f"{scope['method']} {route}"
+            trace.root.attributes.update({"http.route": route, "http.status_code": status["code"]})
+            finish_trace(trace.root)
+
+def instrument_engine(engine):
+    """为被追踪请求中的每条SQL语句记录span"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        current = start_span(
+            f"db.{_operation(statement)}",
+            **{"db.statement": statement[:TRACE_STATEMENT_MAX_LENGTH], "db.executemany": executemany}
+        )
+        conn.info.setdefault("trace_spans", []).append(current)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        current = spans.pop() if spans else None
+        if current is not None:
+            current.finish(**{"db.rows": cursor.rowcount})
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        current = spans.pop() if spans else None
+        if current is not None:
+            current.finish(error=type(context.original_exception).__name__)
+
+def instrument_sessions():
+    """为ORM会话的提交（包括提交前的flush）记录span"""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    def _begin(session):
+        current = start_span("db.commit")
+        if current is not None:
+            # 提交前flush的语句记在提交之下
+            session.info["trace_commit"] = (current, _current.set(current))
+
+    def _finish(session, **attributes):
+        entry = session.info.pop("trace_commit", None)
+        if entry is not None:
+            entry[0].finish(**attributes)
+            try:
+                _current.reset(entry[1])
+            except ValueError:
+                # 提交和回滚不在同一上下文中（不应发生），保留当前span
+                pass
+
+    event.listen(Session, "before_commit", _begin)
+    event.listen(Session, "after_commit", lambda session: _finish(session))
+    event.listen(Session, "after_rollback", lambda session: _finish(session, error="rollback"))
+
+def _operation(statement: str) -> str:
+    operation = statement.lstrip().split(" ", 1)[0].lower()
+    return operation if operation in ("select", "insert", "update", "delete") else "other"
+
+# ---- 汇总 ----
+
+def _trace_files(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "traces-*.jsonl*")))
+
+def _otlp_attribute(value: Dict[str, Any]) -> Any:
+    # OTLP/JSON 中的整数编码为字符串
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+def _attributes(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {item["key"]: _otlp_attribute(item["value"]) for item in items}
+
+def read_traces(directory: str = TRACE_EXPORT_DIR) -> Iterator[Dict[str, Any]]:
+    """读取导出的追踪，OTLP格式转换为jsonl格式的结构"""
+    for path in _trace_files(directory):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "resourceSpans" not in record:
+                    yield record
+                    continue
+                spans = [
+                    span
+                    for resource in record["resourceSpans"]
+                    for scope in resource["scopeSpans"]
+                    for span in scope["spans"]
+                ]
+                root = next(span for span in spans if not span.get("parentSpanId"))
+                origin = int(root["startTimeUnixNano"])
+                converted = [
+                    {
+                        "span_id": span["spanId"],
+                        "parent_id": span.get("parentSpanId") or None,
+                        "name": span["name"],
+                        "start_ms": (int(span["startTimeUnixNano"]) - origin) / 1e6,
+                        "duration_ms": (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6,
+                        "attributes": _attributes(span.get("attributes", []))
+                    }
+                    for span in spans
+                ]
+                yield {
+                    "trace_id": root["traceId"],
+                    "name": root["name"],
+                    "start": origin,
+                    "duration_ms": (int(root["endTimeUnixNano"]) - origin) / 1e6,
+                    "attributes": _attributes(root.get("attributes", [])),
+                    "spans": converted
+                }
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+def summarize(traces: Iterator[Dict[str, Any]], route: Optional[str] = None, min_ms: float = 0) -> Dict[str, Any]:
+    """
+    按路由汇总追踪，把每个请求的耗时分解到各阶段
+
+    各阶段的 self_ms 为扣除子span后的自身耗时，各阶段 self_ms 之和等于请求总耗时；
+    请求span自身的耗时记为 (untraced)，即没有被任何子span覆盖的时间
+    """
+    routes: Dict[str, Dict[str, Any]] = {}
+    for trace in traces:
+        if (route and trace["attributes"].get("http.route") != route) or trace["duration_ms"] < min_ms:
+            continue
+        entry = routes.setdefault(trace["name"], {"durations": [], "stages": {}})
+        entry["durations"].append(trace["duration_ms"])
+
+        children: Dict[Optional[str], float] = {}
+        for item in trace["spans"]:
+            children[item["parent_id"]] = children.get(item["parent_id"], 0.0) + item["duration_ms"]
+        per_trace: Dict[str, List[float]] = {}
+        for item in trace["spans"]:
+            name = "(untraced)" if item["parent_id"] is None else item["name"]
+            stage = per_trace.setdefault(name, [0, 0.0, 0.0])
+            stage[0] += 1
+            stage[1] += item["duration_ms"]
+            stage[2] += max(item["duration_ms"] - children.get(item["span_id"], 0.0), 0.0)
+        for name, (calls, total, self_ms) in per_trace.items():
+            stage = entry["stages"].setdefault(name, {"calls": 0, "total_ms": 0.0, "self_ms": []})
+            stage["calls"] += calls
+            stage["total_ms"] += total
+            stage["self_ms"].append(self_ms)
+
+    result = {}
+    for name, entry in routes.items():
+        count = len(entry["durations"])
+        total = sum(entry["durations"])
+        stages = []
+        for stage_name, stage in entry["stages"].items():
+            self_total = sum(stage["self_ms"])
+            stages.append({
+                "stage": stage_name,
+                "calls_per_request": round(stage["calls"] / count, 2),
+                "self_ms_avg": round(self_total / count, 3),
+                "self_ms_p95": round(_percentile(stage["self_ms"] + [0.0] * (count - len(stage["self_ms"])), 95), 3),
+                "share": round(self_total / total, 4) if total else 0.0
+            })
+        stages.sort(key=lambda item: -item["self_ms_avg"])
+        result[name] = {
+            "requests": count,
+            "duration_ms_avg": round(total / count, 3),
+            "duration_ms_p50": round(_percentile(entry["durations"], 50), 3),
+            "duration_ms_p95": round(_percentile(entry["durations"], 95), 3),
+            "stages": stages
+        }
+    return result
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = []
+    for name, entry in summary.items():
+        lines.append(
+            f"{name}  请求 {entry['requests']}  平均 {entry['duration_ms_avg']:.1f}ms  "
+            f"p50 {entry['duration_ms_p50']:.1f}ms  p95 {entry['duration_ms_p95']:.1f}ms"
+        )
+        lines.append(f"  {'阶段':<28}{'次数/请求':>10}{'平均ms':>12}{'p95 ms':>12}{'占比':>9}")
+        for stage in entry["stages"]:
+            lines.append(
+                f"  {stage['stage']:<28}{stage['calls_per_request']:>10}{stage['self_ms_avg']:>12.2f}"
+                f"{stage['self_ms_p95']:>12.2f}{stage['share'] * 100:>8.1f}%"
+            )
+        lines.append("")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="请求追踪汇总")
+    parser.add_argument("--summary", action="store_true", help="按阶段汇总导出的追踪")
+    parser.add_argument("--dir", default=TRACE_EXPORT_DIR, help="追踪导出目录")
+    parser.add_argument("--route", help="只汇总该路由，如 /artlist/")
+    parser.add_argument("--min-ms", type=float, default=0, help="只汇总耗时不低于该毫秒数的请求")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    if args.summary:
+        summary = summarize(read_traces(args.dir), args.route, args.min_ms)
+        print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_summary(summary))
+    else:
+        parser.print_help()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+比较逐篇删除（DELETE /article/{id} 的实现）与按公众号批量删除任务的耗时
+
+写入 --articles 篇属于同一公众号的合成文章（MySQL和单独的基准索引，默认 wechat_bench_delete，结束后删除），
+先逐篇删除 --sample 篇并按平均耗时外推到全部文章，再用批量删除任务删除其余文章。
+
+用法（在 backend 目录下）:
+    python benchmarks/bulk_delete.py --articles 50000 --output bulk_delete.json   # 使用 ES_HOST/ES_PORT
+    python benchmarks/bulk_delete.py --local   # 内存ES替身，耗时不代表真实ES
+    未设置 DATABASE_URL 时使用临时SQLite数据库
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from typing import Dict, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from payloads import make_article
+
+BIZ = "MzIbenchDELETE=="
+
+def main():
+    parser = argparse.ArgumentParser(description="批量删除基准测试")
+    parser.add_argument("--articles", type=int, default=50000, help="公众号的文章数")
+    parser.add_argument("--sample", type=int, default=200, help="逐篇删除的文章数")
+    parser.add_argument("--index", default="wechat_bench_delete", help="基准索引名")
+    parser.add_argument("--local", action="store_true", help="使用内存ES替身")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    # 应用模块在导入时读取这些配置
+    os.environ["ES_INDEX"] = args.index
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bulk_delete.db')}"
+    if args.local:
+        from fake_es import start_fake_es
+        _, port = start_fake_es()
+        os.environ.update({"ES_HOST": "127.0.0.1", "ES_PORT": str(port), "ES_MAX_RETRIES": "0"})
+
+    from sqlalchemy import insert, select, func
+    from app.models.database import engine, Base, SessionLocal
+    from app.models.article import Article, ARTICLE_INDEX
+    from app.services import search, jobs
+    from app.services import article as article_service
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    with SessionLocal() as db:
+        db.execute(insert(Article), [
+            {**{key: article[key] for key in ("url", "title", "digest", "bizname", "mid", "idx")},
+             "biz": BIZ, "unique_id": f"{BIZ}-{i}-1", "pub_time_iso": None}
+            for i, article in enumerate(make_article(rng) for _ in range(args.articles))
+        ])
+        db.commit()
+        articles = ARTICLE_INDEX.to_dicts(db.execute(ARTICLE_INDEX.select().where(Article.biz == BIZ)))
+
+    es = search.es_client
+    try:
+        search.reindex_all_articles(articles)
+
+        with SessionLocal() as db:
+            start = time.perf_counter()
+            for article in articles[:args.sample]:
+                article_service.delete_article_by_id(db, article["unique_id"])
+            single_seconds = time.perf_counter() - start
+
+            job = jobs.create_job(db, "delete", {"biz": BIZ})
+            start = time.perf_counter()
+            message = article_service.delete_matching_articles({"biz": BIZ}, jobs.JobProgress(job.id))
+            bulk_seconds = time.perf_counter() - start
+            remaining = db.scalar(select(func.count()).select_from(Article).where(Article.biz == BIZ))
+        es_remaining = es.count(index=args.index)["count"]
+    finally:
+        es.indices.delete(index=args.index)
+
+    bulk_articles = args.articles - args.sample
+    output: Dict[str, Any] = {
+        "elasticsearch": "fake" if args.local else f"{os.environ.get('ES_HOST', 'localhost')}:{os.environ.get('ES_PORT', '9200')}",
+        "database": engine.url.render_as_string(hide_password=True),
+        "articles": args.articles,
+        "chunk": article_service.ARTICLE_DELETE_CHUNK,
+        "single": {
+            "articles": args.sample,
+            "seconds": round(single_seconds, 2),
+            "ms_per_article": round(single_seconds / args.sample * 1000, 2),
+            "extrapolated_seconds": round(single_seconds / args.sample * args.articles, 1)
+        },
+        "bulk": {
+            "articles": bulk_articles,
+            "seconds": round(bulk_seconds, 2),
+            "ms_per_article": round(bulk_seconds / bulk_articles * 1000, 3),
+            "message": message
+        },
+        "remaining": {"mysql": remaining, "elasticsearch": es_remaining}
+    }
+
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
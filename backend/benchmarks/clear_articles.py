@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+测量清空文章期间其他写入的延迟：原来的单条 DELETE FROM articles 与分批提交的清空任务对比
+
+写入 --articles 篇合成文章（MySQL和单独的基准索引，默认 wechat_bench_clear，结束后删除），清空的同时另一个线程
+每隔 --interval 秒写入一篇文章并提交，记录写入的延迟和失败数。两种方式各自重新写入一遍数据。
+
+用法（在 backend 目录下）:
+    python benchmarks/clear_articles.py --articles 200000 --output clear_articles.json   # 使用 ES_HOST/ES_PORT
+    python benchmarks/clear_articles.py --local   # 内存ES替身，耗时不代表真实ES
+    未设置 DATABASE_URL 时使用临时SQLite数据库（整库一把写锁，单条DELETE期间的阻塞比MySQL行锁更明显）
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from typing import Dict, List, Any, Callable
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from payloads import make_article
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="清空文章基准测试")
+    parser.add_argument("--articles", type=int, default=100000, help="文章数")
+    parser.add_argument("--interval", type=float, default=0.01, help="并发写入的间隔秒数")
+    parser.add_argument("--rate", type=int, default=0, help="清空任务每秒最多删除的文章数，0表示不限速")
+    parser.add_argument("--index", default="wechat_bench_clear", help="基准索引名")
+    parser.add_argument("--local", action="store_true", help="使用内存ES替身")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    # 应用模块在导入时读取这些配置
+    os.environ["ES_INDEX"] = args.index
+    os.environ["ARTICLE_CLEAR_ROWS_PER_SECOND"] = str(args.rate)
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'clear_articles.db')}"
+    if args.local:
+        from fake_es import start_fake_es
+        _, port = start_fake_es()
+        os.environ.update({"ES_HOST": "127.0.0.1", "ES_PORT": str(port), "ES_MAX_RETRIES": "0"})
+
+    from sqlalchemy import insert, delete, select, func
+    from app.models.database import engine, Base, SessionLocal
+    from app.models.article import Article, ARTICLE_INDEX
+    from app.services import search, jobs, dedup, related, changes
+    from app.services import article as article_service
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    es = search.es_client
+
+    def seed() -> int:
+        with SessionLocal() as db:
+            db.execute(delete(Article))
+            db.execute(insert(Article), [
+                {**{key: article[key] for key in ("url", "title", "digest", "bizname", "biz", "mid", "idx")},
+                 "unique_id": f"bench-{i:08d}", "pub_time_iso": None}
+                for i, article in enumerate(make_article(rng) for _ in range(args.articles))
+            ])
+            db.commit()
+            search.reindex_all_articles(ARTICLE_INDEX.to_dicts(db.execute(ARTICLE_INDEX.select())))
+            return db.scalar(select(func.max(Article.id)))
+
+    def measure(clear: Callable[[], None]) -> Dict[str, Any]:
+        """清空的同时定时写入，返回清空耗时和写入延迟"""
+        latencies: List[float] = []
+        errors = 0
+        done = threading.Event()
+
+        def writer():
+            nonlocal errors
+            sequence = 0
+            while not done.is_set():
+                article = make_article(rng)
+                start = time.perf_counter()
+                try:
+                    with SessionLocal() as db:
+                        db.execute(insert(Article).values(
+                            **{key: article[key] for key in ("url", "title", "digest", "bizname", "biz", "mid", "idx")},
+                            unique_id=f"live-{time.time_ns()}-{sequence}", pub_time_iso=None
+                        ))
+                        db.commit()
+                    latencies.append((time.perf_counter() - start) * 1000)
+                except Exception:
+                    errors += 1
+                sequence += 1
+                done.wait(args.interval)
+
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        start = time.perf_counter()
+        clear()
+        seconds = time.perf_counter() - start
+        done.set()
+        thread.join()
+        return {
+            "seconds": round(seconds, 2),
+            "writes": len(latencies),
+            "write_errors": errors,
+            "write_p50_ms": round(percentile(latencies, 50), 2),
+            "write_p99_ms": round(percentile(latencies, 99), 2),
+            "write_max_ms": round(max(latencies, default=0.0), 2)
+        }
+
+    def single_delete():
+        # 原来的实现：一条DELETE删除全部文章后重建索引
+        with SessionLocal() as db:
+            db.execute(delete(Article))
+            dedup.clear_bands(db)
+            related.delete_lists(db)
+            changes.record_clear(db)
+            db.commit()
+        search.clear_index()
+
+    try:
+        seed()
+        single = measure(single_delete)
+
+        max_id = seed()
+        with SessionLocal() as db:
+            job = jobs.create_job(db, "clear", {"max_id": max_id})
+            cleared_at = db.scalar(select(func.now()))
+        chunked = measure(lambda: article_service.clear_all_articles(max_id, cleared_at, jobs.JobProgress(job.id)))
+        with SessionLocal() as db:
+            remaining = db.scalar(select(func.count()).select_from(Article).where(Article.id <= max_id))
+    finally:
+        es.indices.delete(index=args.index)
+
+    output: Dict[str, Any] = {
+        "elasticsearch": "fake" if args.local else f"{os.environ.get('ES_HOST', 'localhost')}:{os.environ.get('ES_PORT', '9200')}",
+        "database": engine.url.render_as_string(hide_password=True),
+        "articles": args.articles,
+        "chunk": article_service.ARTICLE_CLEAR_CHUNK,
+        "rows_per_second": args.rate,
+        "single_delete": single,
+        "chunked_job": {**chunked, "remaining": remaining}
+    }
+
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+测量近似重复检测的开销：每篇文章的SimHash计算耗时、分段索引查找延迟和近似重复的召回率
+
+查找分别在内存分段索引（BandIndex）和数据库 simhash_bands 表上进行，
+候选集为 --articles 篇合成文章；近似重复样本在原文上随机替换若干字符生成。
+
+用法（在 backend 目录下）:
+    python benchmarks/dedup.py --articles 100000 --output dedup.json
+    未设置 DATABASE_URL 时使用临时SQLite数据库
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'dedup.db')}"
+
+from sqlalchemy import insert, delete
+
+from app.models.database import engine, Base, SessionLocal
+from app.models.simhash_band import SimhashBand
+from app.services.dedup import SIMHASH_MAX_DISTANCE, BandIndex, fingerprint, load_candidates, band_keys, to_signed, hamming, _spread
+from payloads import make_article
+
+def mutate(rng: random.Random, text: str, changes: int) -> str:
+    """随机替换若干个字符"""
+    chars = list(text)
+    for _ in range(changes):
+        chars[rng.randrange(len(chars))] = rng.choice("的了是在和有新能源电网")
+    return "".join(chars)
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "p50": round(statistics.median(samples), 1),
+        "p99": round(samples[int(len(samples) * 0.99) - 1], 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="近似重复检测基准测试")
+    parser.add_argument("--articles", type=int, default=20000, help="候选文章数")
+    parser.add_argument("--queries", type=int, default=2000, help="查找次数")
+    parser.add_argument("--changes", type=int, default=1, help="近似重复样本替换的字符数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    articles = [make_article(rng) for _ in range(args.articles)]
+    # 合成数据的词表很小，加上编号使不同文章的文本不同
+    for i, article in enumerate(articles):
+        article["title"] = f"{article['title']}{i}"
+
+    _spread.cache_clear()
+    start = time.perf_counter()
+    values = [fingerprint(article["title"], article["digest"]) for article in articles]
+    fingerprint_us = (time.perf_counter() - start) / len(articles) * 1e6
+
+    index = BandIndex()
+    for i, value in enumerate(values):
+        index.add(str(i), value, str(i))
+
+    queries = rng.sample(range(len(articles)), min(args.queries, len(articles)))
+    near = [
+        fingerprint(mutate(rng, articles[i]["title"], args.changes), articles[i]["digest"])
+        for i in queries
+    ]
+
+    memory_us = []
+    found = 0
+    for i, value in zip(queries, near):
+        start = time.perf_counter()
+        cluster_id = index.find(value)
+        memory_us.append((time.perf_counter() - start) * 1e6)
+        found += cluster_id == str(i)
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.execute(delete(SimhashBand))
+        rows = [
+            {"band_key": key, "unique_id": str(i), "simhash": to_signed(value), "cluster_id": str(i)}
+            for i, value in enumerate(values) for key in band_keys(value)
+        ]
+        for offset in range(0, len(rows), 20000):
+            db.execute(insert(SimhashBand), rows[offset:offset + 20000])
+        db.commit()
+
+        database_us = []
+        for value in near:
+            start = time.perf_counter()
+            load_candidates(db, [value]).find(value)
+            database_us.append((time.perf_counter() - start) * 1e6)
+
+    # 不在候选集中的新文章被误判为近似重复的比例
+    unrelated = [make_article(rng) for _ in range(len(queries))]
+    false_positives = sum(
+        index.find(fingerprint(f"{article['title']}{len(articles) + i}", article["digest"])) is not None
+        for i, article in enumerate(unrelated)
+    )
+
+    distances = [hamming(values[i], value) for i, value in zip(queries, near)]
+    result: Dict[str, Any] = {
+        "database": engine.url.render_as_string(hide_password=True),
+        "articles": len(articles),
+        "max_distance": SIMHASH_MAX_DISTANCE,
+        "fingerprint_us_per_article": round(fingerprint_us, 1),
+        "lookup_us": {
+            "band_index": percentiles(memory_us),
+            "simhash_bands_table": percentiles(database_us)
+        },
+        "near_duplicates": {
+            "changed_chars": args.changes,
+            "mean_distance": round(statistics.mean(distances), 2),
+            "recall": round(found / len(queries), 3)
+        },
+        "false_positive_rate": round(false_positives / len(unrelated), 4)
+    }
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,567 @@
+#!/usr/bin/env python
+"""
+内存中的Elasticsearch替身，通过HTTP提供服务，用于离线基准测试
+
+只实现本项目用到的接口：索引管理、单文档读写、_bulk、_search（multi_match、
+bool、range、term(s)、ids、match_all）、kNN（逐个计算余弦相似度）、高亮、排序、search_after、collapse、
+cardinality/sum/filters聚合、PIT、_delete_by_query和_tasks（异步任务立即执行完成）。评分为简单的词频统计，不代表真实ES的相关性和性能。
+
+用法:
+    python benchmarks/fake_es.py --port 9201
+"""
+import re
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, unquote
+
+logger = logging.getLogger(__name__)
+
+class FakeIndex:
+    """单个索引：按写入顺序保存文档"""
+
+    def __init__(self, body: Optional[Dict[str, Any]] = None):
+        self.body = body or {}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.seq: Dict[str, int] = {}
+        self.counter = 0
+
+    def put(self, doc_id: str, source: Dict[str, Any]) -> str:
+        result = "updated" if doc_id in self.docs else "created"
+        self.docs[doc_id] = source
+        if doc_id not in self.seq:
+            self.counter += 1
+            self.seq[doc_id] = self.counter
+        return result
+
+    def remove(self, doc_id: str) -> bool:
+        self.seq.pop(doc_id, None)
+        return self.docs.pop(doc_id, None) is not None
+
+class FakeStore:
+    """所有索引和PIT"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.indices: Dict[str, FakeIndex] = {}
+        self.pits: Dict[str, str] = {}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+
+def _terms(text: str) -> List[str]:
+    return [t for t in re.split(r"\s+", text.strip().lower()) if t]
+
+def _field_value(source: Dict[str, Any], field: str) -> Any:
+    value = source
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _compare(value: Any, bound: Any) -> int:
+    if isinstance(value, (int, float)) and isinstance(bound, (int, float)):
+        return (value > bound) - (value < bound)
+    value, bound = str(value), str(bound)
+    return (value > bound) - (value < bound)
+
+def evaluate(query: Dict[str, Any], doc_id: str, source: Dict[str, Any]) -> Tuple[bool, float]:
+    """判断文档是否匹配查询并给出分数"""
+    if not query or "match_all" in query:
+        return True, 1.0
+
+    if "multi_match" in query:
+        spec = query["multi_match"]
+        score = 0.0
+        for field in spec.get("fields", []):
+            name, _, boost = field.partition("^")
+            text = str(_field_value(source, name) or "").lower()
+            for term in _terms(str(spec.get("query", ""))):
+                score += text.count(term) * float(boost or 1)
+        return score > 0, score
+
+    if "match_phrase" in query:
+        field, spec = next(iter(query["match_phrase"].items()))
+        phrase = str(spec.get("query") if isinstance(spec, dict) else spec).lower()
+        return phrase in str(_field_value(source, field) or "").lower(), 1.0
+
+    if "match" in query:
+        field, spec = next(iter(query["match"].items()))
+        text = str(_field_value(source, field) or "").lower()
+        terms = _terms(str(spec.get("query") if isinstance(spec, dict) else spec))
+        score = float(sum(text.count(term) for term in terms))
+        return score > 0, score
+
+    if "term" in query:
+        field, spec = next(iter(query["term"].items()))
+        expected = spec.get("value") if isinstance(spec, dict) else spec
+        return _field_value(source, field) == expected, 1.0
+
+    if "terms" in query:
+        field, values = next(iter(query["terms"].items()))
+        value = _field_value(source, field)
+        if isinstance(value, list):
+            return any(item in values for item in value), 1.0
+        return value in values, 1.0
+
+    if "ids" in query:
+        return doc_id in query["ids"].get("values", []), 1.0
+
+    if "exists" in query:
+        return _field_value(source, query["exists"]["field"]) is not None, 1.0
+
+    if "range" in query:
+        field, spec = next(iter(query["range"].items()))
+        value = _field_value(source, field)
+        if value is None:
+            return False, 0.0
+        checks = {"gte": lambda c: c >= 0, "gt": lambda c: c > 0, "lte": lambda c: c <= 0, "lt": lambda c: c < 0}
+        for op, check in checks.items():
+            if op in spec and not check(_compare(value, spec[op])):
+                return False, 0.0
+        return True, 1.0
+
+    if "bool" in query:
+        spec = query["bool"]
+        score = 0.0
+        for clause in _as_list(spec.get("must")):
+            matched, clause_score = evaluate(clause, doc_id, source)
+            if not matched:
+                return False, 0.0
+            score += clause_score
+        for clause in _as_list(spec.get("filter")):
+            if not evaluate(clause, doc_id, source)[0]:
+                return False, 0.0
+        for clause in _as_list(spec.get("must_not")):
+            if evaluate(clause, doc_id, source)[0]:
+                return False, 0.0
+        should = _as_list(spec.get("should"))
+        should_matched = 0
+        for clause in should:
+            matched, clause_score = evaluate(clause, doc_id, source)
+            if matched:
+                should_matched += 1
+                score += clause_score
+        minimum = spec.get("minimum_should_match", 0 if (spec.get("must") or spec.get("filter")) else 1)
+        if should and should_matched < int(minimum):
+            return False, 0.0
+        return True, score or 1.0
+
+    # 未实现的查询类型按匹配处理
+    return True, 1.0
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _highlight(source: Dict[str, Any], spec: Dict[str, Any], query: Dict[str, Any]) -> Dict[str, List[str]]:
+    terms = _terms(" ".join(re.findall(r'"query":\s*"([^"]*)"', json.dumps(query, ensure_ascii=False))))
+    pre, post = spec.get("pre_tags", ["<em>"])[0], spec.get("post_tags", ["</em>"])[0]
+    result = {}
+    for field in spec.get("fields", {}):
+        text = str(source.get(field) or "")
+        highlighted = text
+        for term in terms:
+            highlighted = re.sub(re.escape(term), lambda m: f"{pre}{m.group(0)}{post}", highlighted, flags=re.I)
+        if highlighted != text:
+            result[field] = [highlighted]
+    return result
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+    return dot / norm if norm else 0.0
+
+def search(store: FakeStore, index_names: List[str], body: Dict[str, Any]) -> Dict[str, Any]:
+    """执行查询、kNN、排序、分页和高亮"""
+    knn = body.get("knn")
+    with store.lock:
+        pit_id = (body.get("pit") or {}).get("id")
+        if pit_id:
+            index_names = [store.pits[pit_id]]
+        matches: Dict[Tuple[str, str], List[Any]] = {}
+        vector_hits = []
+        for name in index_names:
+            index = store.indices.get(name)
+            if index is None:
+                continue
+            for doc_id, source in index.docs.items():
+                # 只有kNN没有query时只返回kNN结果
+                if "query" in body or not knn:
+                    matched, score = evaluate(body.get("query") or {}, doc_id, source)
+                    if matched:
+                        matches[(name, doc_id)] = [name, doc_id, score, index.seq[doc_id], source]
+                vector = source.get(knn["field"]) if knn else None
+                if vector:
+                    cosine = _cosine(knn["query_vector"], vector)
+                    if cosine >= knn.get("similarity", -1):
+                        score = (1 + cosine) / 2 * float(knn.get("boost", 1))
+                        vector_hits.append((score, name, doc_id, index.seq[doc_id], source))
+        # kNN的前k个结果与查询结果合并，分数相加
+        for score, name, doc_id, seq, source in sorted(vector_hits, key=lambda hit: -hit[0])[:int(knn["k"]) if knn else 0]:
+            if (name, doc_id) in matches:
+                matches[(name, doc_id)][2] += score
+            else:
+                matches[(name, doc_id)] = [name, doc_id, score, seq, source]
+        hits = [tuple(hit) for hit in matches.values()]
+
+    sort_spec = body.get("sort") or ["_score"]
+
+    def sort_values(hit):
+        name, doc_id, score, seq, source = hit
+        values = []
+        for item in sort_spec:
+            field = item if isinstance(item, str) else next(iter(item))
+            if field == "_score":
+                values.append(score)
+            elif field in ("_shard_doc", "_doc"):
+                values.append(seq)
+            elif field == "_id":
+                values.append(doc_id)
+            else:
+                values.append(_field_value(source, field))
+        return values
+
+    def directions():
+        result = []
+        for item in sort_spec:
+            field = item if isinstance(item, str) else next(iter(item))
+            order = "desc" if field == "_score" else "asc"
+            if isinstance(item, dict):
+                spec = item[field]
+                order = spec.get("order", order) if isinstance(spec, dict) else spec
+            result.append(order)
+        return result
+
+    orders = directions()
+
+    class Key:
+        __slots__ = ("values",)
+
+        def __init__(self, values):
+            self.values = values
+
+        def __lt__(self, other):
+            for a, b, order in zip(self.values, other.values, orders):
+                if a == b:
+                    continue
+                if a is None or b is None:
+                    return b is None
+                less = _compare(a, b) < 0
+                return less if order == "asc" else not less
+            return False
+
+    decorated = sorted(((Key(sort_values(hit)), hit) for hit in hits), key=lambda pair: pair[0])
+
+    collapse_field = (body.get("collapse") or {}).get("field")
+    if collapse_field:
+        seen = set()
+        collapsed = []
+        for pair in decorated:
+            value = _field_value(pair[1][4], collapse_field)
+            if value not in seen:
+                seen.add(value)
+                collapsed.append(pair)
+        decorated = collapsed
+
+    search_after = body.get("search_after")
+    if search_after is not None:
+        marker = Key(list(search_after))
+        decorated = [pair for pair in decorated if marker < pair[0]]
+
+    start = int(body.get("from", 0))
+    size = int(body.get("size", 10))
+    page = decorated[start:start + size]
+
+    response_hits = []
+    source_spec = body.get("_source")
+    for key, (name, doc_id, score, seq, source) in page:
+        excludes = source_spec.get("excludes", []) if isinstance(source_spec, dict) else []
+        if excludes:
+            source = {field: value for field, value in source.items() if field not in excludes}
+        if isinstance(source_spec, list):
+            source = {field: value for field, value in source.items() if field in source_spec}
+        item = {"_index": name, "_id": doc_id, "_score": score, "_source": source, "sort": key.values}
+        if body.get("highlight"):
+            highlight = _highlight(source, body["highlight"], body.get("query") or {})
+            if highlight:
+                item["highlight"] = highlight
+        response_hits.append(item)
+
+    response = {
+        "took": 1,
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {
+            "total": {"value": len(decorated) + (len(hits) - len(decorated)), "relation": "eq"},
+            "max_score": max((h["_score"] for h in response_hits), default=None),
+            "hits": response_hits
+        }
+    }
+    aggregations = _aggregate(body.get("aggs") or body.get("aggregations") or {}, hits)
+    if aggregations:
+        response["aggregations"] = aggregations
+    if pit_id:
+        response["pit_id"] = pit_id
+    return response
+
+def _aggregate(specs: Dict[str, Any], hits: List[Tuple]) -> Dict[str, Any]:
+    """cardinality、sum 和 filters（匿名过滤器列表，可嵌套子聚合）"""
+    aggregations = {}
+    for name, spec in specs.items():
+        if "cardinality" in spec:
+            field = spec["cardinality"]["field"]
+            aggregations[name] = {"value": len({_field_value(hit[4], field) for hit in hits} - {None})}
+        elif "sum" in spec:
+            field = spec["sum"]["field"]
+            aggregations[name] = {"value": float(sum(
+                value for value in (_field_value(hit[4], field) for hit in hits) if isinstance(value, (int, float))
+            ))}
+        elif "filters" in spec:
+            buckets = []
+            for query in spec["filters"]["filters"]:
+                matched = [hit for hit in hits if evaluate(query, hit[1], hit[4])[0]]
+                buckets.append({"doc_count": len(matched), **_aggregate(spec.get("aggs") or {}, matched)})
+            aggregations[name] = {"buckets": buckets}
+    return aggregations
+
+class FakeESHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理"""
+    protocol_version = "HTTP/1.1"
+    store: FakeStore = None
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+    def _send(self, status: int, payload: Any = None):
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Type", "application/vnd.elasticsearch+json;compatible-with=8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json(self) -> Dict[str, Any]:
+        raw = self._body()
+        return json.loads(raw) if raw else {}
+
+    def do_HEAD(self):
+        self._dispatch()
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_PUT(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_DELETE(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        try:
+            url = urlparse(self.path)
+            parts = [unquote(p) for p in url.path.split("/") if p]
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            self._route(parts, params)
+        except Exception as e:
+            logger.exception("fake es error")
+            self._send(500, {"error": {"type": "fake_es_exception", "reason": str(e)}, "status": 500})
+
+    def _route(self, parts: List[str], params: Dict[str, str]):
+        store = self.store
+        method = self.command
+
+        if not parts:
+            self._send(200, {"name": "fake-es", "version": {"number": "8.9.0"}, "tagline": "You Know, for Search"})
+            return
+
+        if parts[0] == "_bulk" or (len(parts) == 2 and parts[1] == "_bulk"):
+            self._bulk(parts[0] if parts[0] != "_bulk" else None)
+            return
+
+        if parts[0] == "_search":
+            self._send(200, search(store, list(store.indices), self._json()))
+            return
+
+        if parts[0] == "_tasks" and len(parts) == 2:
+            with store.lock:
+                task = store.tasks.get(parts[1])
+            if task is None:
+                self._send(404, {"error": {"type": "resource_not_found_exception"}, "status": 404})
+            else:
+                self._send(200, task)
+            return
+
+        if parts[0] == "_pit":
+            body = self._json()
+            with store.lock:
+                store.pits.pop(body.get("id"), None)
+            self._send(200, {"succeeded": True, "num_freed": 1})
+            return
+
+        if parts[0] in ("_analyze",) or (len(parts) > 1 and parts[1] == "_analyze"):
+            self._body()
+            self._send(400, {"error": {"type": "illegal_argument_exception", "reason": "analyzer not found"}, "status": 400})
+            return
+
+        index_name = parts[0]
+        with store.lock:
+            index = store.indices.get(index_name)
+
+        if len(parts) == 1:
+            if method == "HEAD" or method == "GET":
+                self._send(200 if index else 404, {index_name: index.body} if index and method == "GET" else None)
+            elif method == "PUT":
+                with store.lock:
+                    if index_name in store.indices:
+                        self._send(400, {"error": {"type": "resource_already_exists_exception"}, "status": 400})
+                        return
+                    store.indices[index_name] = FakeIndex(self._json())
+                self._send(200, {"acknowledged": True, "index": index_name})
+            elif method == "DELETE":
+                with store.lock:
+                    existed = store.indices.pop(index_name, None)
+                self._send(200 if existed else 404, {"acknowledged": True})
+            return
+
+        action = parts[1]
+        if action == "_mapping":
+            self._body()
+            self._send(200 if index else 404, {"acknowledged": True})
+            return
+
+        if action in ("_refresh", "_flush"):
+            self._send(200, {"_shards": {"total": 1, "successful": 1, "failed": 0}})
+            return
+
+        if action == "_search":
+            self._send(200, search(store, [index_name], self._json()))
+            return
+
+        if action == "_count":
+            result = search(store, [index_name], {**self._json(), "size": 0})
+            self._send(200, {"count": result["hits"]["total"]["value"]})
+            return
+
+        if action == "_pit":
+            pit_id = uuid.uuid4().hex
+            with store.lock:
+                store.pits[pit_id] = index_name
+            self._send(200, {"id": pit_id})
+            return
+
+        if action == "_delete_by_query":
+            body = self._json()
+            deleted = 0
+            with store.lock:
+                if index:
+                    for doc_id, source in list(index.docs.items()):
+                        if evaluate(body.get("query") or {}, doc_id, source)[0]:
+                            index.remove(doc_id)
+                            deleted += 1
+            result = {"took": 1, "total": deleted, "deleted": deleted, "failures": []}
+            if params.get("wait_for_completion") == "false":
+                task_id = f"fake:{uuid.uuid4().int % 10 ** 9}"
+                with store.lock:
+                    store.tasks[task_id] = {
+                        "completed": True,
+                        "task": {
+                            "id": task_id, "action": "indices:data/write/delete/byquery",
+                            "status": {"total": deleted, "deleted": deleted}, "start_time_in_millis": int(time.time() * 1000)
+                        },
+                        "response": result
+                    }
+                self._send(200, {"task": task_id})
+            else:
+                self._send(200, result)
+            return
+
+        if action in ("_doc", "_create") and len(parts) == 3:
+            doc_id = parts[2]
+            if method in ("PUT", "POST"):
+                source = self._json()
+                with store.lock:
+                    index = store.indices.setdefault(index_name, FakeIndex())
+                    result = index.put(doc_id, source)
+                self._send(201 if result == "created" else 200, {"_index": index_name, "_id": doc_id, "result": result})
+            elif method == "DELETE":
+                with store.lock:
+                    removed = index.remove(doc_id) if index else False
+                self._send(200 if removed else 404, {"_index": index_name, "_id": doc_id, "result": "deleted" if removed else "not_found"})
+            else:
+                source = index.docs.get(doc_id) if index else None
+                self._send(200 if source else 404, {"_index": index_name, "_id": doc_id, "found": bool(source), "_source": source})
+            return
+
+        if action == "_doc" and len(parts) == 2 and method == "POST":
+            doc_id = uuid.uuid4().hex
+            with store.lock:
+                store.indices.setdefault(index_name, FakeIndex()).put(doc_id, self._json())
+            self._send(201, {"_index": index_name, "_id": doc_id, "result": "created"})
+            return
+
+        self._send(400, {"error": {"type": "unsupported", "reason": f"{method} /{'/'.join(parts)}"}, "status": 400})
+
+    def _bulk(self, default_index: Optional[str]):
+        lines = [line for line in self._body().decode("utf-8").split("\n") if line.strip()]
+        items = []
+        i = 0
+        with self.store.lock:
+            while i < len(lines):
+                action_line = json.loads(lines[i])
+                op, meta = next(iter(action_line.items()))
+                index_name = meta.get("_index", default_index)
+                doc_id = meta.get("_id") or uuid.uuid4().hex
+                index = self.store.indices.setdefault(index_name, FakeIndex())
+                if op == "delete":
+                    removed = index.remove(doc_id)
+                    items.append({op: {"_index": index_name, "_id": doc_id, "status": 200 if removed else 404,
+                                       "result": "deleted" if removed else "not_found"}})
+                    i += 1
+                    continue
+                source = json.loads(lines[i + 1])
+                if op == "update":
+                    existing = index.docs.get(doc_id)
+                    if existing is not None:
+                        source = {**existing, **source.get("doc", {})}
+                    else:
+                        source = source.get("upsert", source.get("doc", {}))
+                result = index.put(doc_id, source)
+                items.append({op: {"_index": index_name, "_id": doc_id, "status": 201 if result == "created" else 200,
+                                   "result": result}})
+                i += 2
+        self._send(200, {"took": 1, "errors": False, "items": items})
+
+def start_fake_es(host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, int]:
+    """在后台线程中启动替身服务，返回 (server, 实际端口)"""
+    handler = type("BoundFakeESHandler", (FakeESHandler,), {"store": FakeStore()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-es", daemon=True).start()
+    return server, server.server_address[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="内存中的Elasticsearch替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9201)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    handler = type("BoundFakeESHandler", (FakeESHandler,), {"store": FakeStore()})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    logger.info(f"Fake Elasticsearch listening on {args.host}:{args.port}")
+    server.serve_forever()
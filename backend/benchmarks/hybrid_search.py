@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+比较关键词搜索和混合搜索（关键词+向量kNN）的延迟
+
+生成 --articles 篇合成文章写入单独的基准索引（默认 wechat_bench_hybrid，结束后删除），训练向量模型并整批编码，
+然后对同一组查询词交替执行 mode=lexical 和 mode=hybrid，记录延迟（包括查询词编码）和查询词编码耗时，
+以及混合搜索结果中关键词搜索没有返回的比例。
+
+用法（在 backend 目录下）:
+    python benchmarks/hybrid_search.py --articles 100000 --queries 1000 --output hybrid.json   # 使用 ES_HOST/ES_PORT
+    python benchmarks/hybrid_search.py --local   # 内存ES替身，kNN逐个计算相似度，延迟不代表真实ES
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from payloads import make_article, make_query
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "p50": round(statistics.median(samples), 2),
+        "p95": round(samples[int(len(samples) * 0.95) - 1], 2),
+        "p99": round(samples[int(len(samples) * 0.99) - 1], 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词搜索与混合搜索的延迟对比")
+    parser.add_argument("--articles", type=int, default=20000, help="文章数")
+    parser.add_argument("--queries", type=int, default=500, help="每种方式的查询次数")
+    parser.add_argument("--size", type=int, default=10, help="每页结果数")
+    parser.add_argument("--index", default="wechat_bench_hybrid", help="基准索引名")
+    parser.add_argument("--local", action="store_true", help="使用内存ES替身")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    # 应用模块在导入时读取这些配置
+    os.environ["ES_INDEX"] = args.index
+    os.environ["EMBEDDING_MODEL_PATH"] = os.path.join(tempfile.mkdtemp(), "embedding.npz")
+    if args.local:
+        from fake_es import start_fake_es
+        _, port = start_fake_es()
+        os.environ.update({"ES_HOST": "127.0.0.1", "ES_PORT": str(port), "ES_MAX_RETRIES": "0"})
+
+    from app.services import embedding, search
+
+    rng = random.Random(42)
+    articles = []
+    for i in range(args.articles):
+        article = make_article(rng)
+        article.update(unique_id=f"bench-{i}", pub_time_iso=None, cluster_id=None)
+        articles.append(article)
+
+    es = search.es_client
+    search.clear_index()
+
+    try:
+        start = time.perf_counter()
+        encoder = embedding.fit_encoder(lambda: embedding.chunks(articles, embedding.EMBEDDING_BATCH_SIZE))
+        encoder.save(embedding.EMBEDDING_MODEL_PATH)
+        fit_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for batch in embedding.chunks(articles, embedding.EMBEDDING_BATCH_SIZE):
+            encoder.encode_articles(batch)
+        encode_us = (time.perf_counter() - start) / len(articles) * 1e6
+
+        start = time.perf_counter()
+        result = search.reindex_all_articles(articles)
+        index_seconds = time.perf_counter() - start
+
+        queries = [make_query(rng) for _ in range(args.queries)]
+        start = time.perf_counter()
+        for query in queries:
+            embedding.encode_query(query)
+        query_encode_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+        latency = {"lexical": [], "hybrid": []}
+        hybrid_only = []
+        for query in queries:
+            pages = {}
+            for mode in ("lexical", "hybrid"):
+                start = time.perf_counter()
+                response = search.search_articles(query, 1, args.size, mode=mode)
+                latency[mode].append((time.perf_counter() - start) * 1000)
+                pages[mode] = response["unique_ids"]
+            if pages["hybrid"]:
+                lexical = set(pages["lexical"])
+                hybrid_only.append(sum(unique_id not in lexical for unique_id in pages["hybrid"]) / len(pages["hybrid"]))
+    finally:
+        es.indices.delete(index=args.index)
+
+    output: Dict[str, Any] = {
+        "elasticsearch": "fake" if args.local else f"{os.environ.get('ES_HOST', 'localhost')}:{os.environ.get('ES_PORT', '9200')}",
+        "articles": len(articles),
+        "queries": len(queries),
+        "dim": embedding.EMBEDDING_DIM,
+        "features": embedding.EMBEDDING_FEATURES,
+        "fit_seconds": round(fit_seconds, 2),
+        "encode_us_per_article": round(encode_us, 1),
+        "reindex": {"seconds": round(index_seconds, 2), "indexed": result.get("indexed"), "failed": result.get("failed")},
+        "query_encode_us": round(query_encode_us, 1),
+        "latency_ms": {mode: percentiles(samples) for mode, samples in latency.items()},
+        "hybrid_only_ratio": round(statistics.mean(hybrid_only), 3) if hybrid_only else None
+    }
+
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
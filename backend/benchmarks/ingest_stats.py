@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+对比“每个客户端每小时的调用次数和保存文章数”两种统计方式的耗时：扫描 logs 表并解压请求数据聚合，
+与读取 log_rollups 汇总表（GET /stats/ingest 的实现）；同时测量汇总对保存日志的开销
+
+写入 --count 条分布在 --hours 小时内、来自 --clients 个客户端的 /artlist/ 日志（同时累加汇总），
+两种方式的统计结果逐项核对。
+
+注意：会清空logs和log_rollups表，只应在测试库上运行；未设置 DATABASE_URL 时使用临时SQLite数据库。
+
+用法（在 backend 目录下）:
+    python benchmarks/ingest_stats.py --count 100000 --output ingest_stats.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+def main():
+    parser = argparse.ArgumentParser(description="请求统计基准测试")
+    parser.add_argument("--count", type=int, default=50000, help="日志条数")
+    parser.add_argument("--articles", type=int, default=20, help="每次调用的文章数")
+    parser.add_argument("--hours", type=int, default=48, help="日志分布的小时数")
+    parser.add_argument("--clients", type=int, default=20, help="客户端数")
+    parser.add_argument("--writes", type=int, default=2000, help="测量写日志开销的次数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'ingest_stats.db')}"
+
+    from sqlalchemy import insert, delete, select
+    from app.models.database import engine, Base, SessionLocal
+    from app.models.log import Log
+    from app.models.log_rollup import LogRollup
+    from app.services import log as log_service
+    from app.services import log_rollup
+    from log_storage import artlist_payload
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=args.hours)
+    data = artlist_payload(args.articles)
+
+    def make_log() -> Dict[str, Any]:
+        saved = rng.randint(0, args.articles)
+        return {
+            "method": "POST",
+            "path": "/artlist/",
+            "client": f"10.0.0.{rng.randrange(args.clients)}",
+            "latency_ms": rng.uniform(5, 200),
+            "data": {**data, "response": {**data["response"], "success": saved > 0, "saved": saved, "failed": args.articles - saved}}
+        }
+
+    with SessionLocal() as db:
+        db.execute(delete(Log))
+        db.execute(delete(LogRollup))
+        db.commit()
+        for offset in range(0, args.count, 1000):
+            rows = []
+            for _ in range(min(1000, args.count - offset)):
+                log_data = make_log()
+                timestamp = start + timedelta(seconds=rng.uniform(0, args.hours * 3600 - 1))
+                encoded, payload, codec, size = log_service.encode_payload(log_data["data"])
+                rows.append({
+                    "timestamp": timestamp, "method": "POST", "path": log_data["path"], "client": log_data["client"],
+                    "data": encoded, "payload": payload, "payload_codec": codec, "payload_size": size
+                })
+                log_rollup.record(log_data, timestamp)
+            db.execute(insert(Log), rows)
+            db.commit()
+    log_rollup.flush()
+
+    # 扫描日志表：读出每条日志并解压请求数据后在应用中聚合
+    started = time.perf_counter()
+    scanned: Dict[Any, list] = defaultdict(lambda: [0, 0])
+    with SessionLocal() as db:
+        result = db.execute(
+            select(Log.timestamp, Log.client, Log.data, Log.payload, Log.payload_codec)
+            .where(Log.timestamp >= start, Log.timestamp < end)
+            .execution_options(yield_per=1000)
+        )
+        for row in result:
+            payload = row.data if row.payload is None else log_service.decode_payload(row.payload, row.payload_codec)
+            counters = scanned[(log_rollup.bucket_start(row.timestamp, "hour").isoformat(), row.client)]
+            counters[0] += 1
+            counters[1] += int(payload["response"].get("saved") or 0)
+    scan_seconds = time.perf_counter() - started
+
+    # 读汇总表
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        stats = log_rollup.get_ingest_stats(db, start, end - timedelta(seconds=1), "hour", ["client"])
+    rollup_seconds = time.perf_counter() - started
+    rolled = {(item["bucket"], item["client"]): [item["requests"], item["articles"]] for item in stats["buckets"]}
+
+    # 保存日志的开销：正常保存与不累加汇总各写 --writes 条
+    def write_seconds() -> float:
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            for _ in range(args.writes):
+                log_service.save_log(db, make_log())
+        return time.perf_counter() - started
+
+    with_rollup = write_seconds()
+    record = log_rollup.record
+    log_rollup.record = lambda log_data, timestamp: None
+    try:
+        without_rollup = write_seconds()
+    finally:
+        log_rollup.record = record
+
+    with SessionLocal() as db:
+        rollup_rows = db.query(LogRollup).count()
+
+    output: Dict[str, Any] = {
+        "database": engine.url.render_as_string(hide_password=True),
+        "logs": args.count,
+        "hours": args.hours,
+        "clients": args.clients,
+        "rollup_rows": rollup_rows,
+        "groups": len(rolled),
+        "matches": rolled == {key: value for key, value in scanned.items()},
+        "scan_logs_ms": round(scan_seconds * 1000, 1),
+        "read_rollups_ms": round(rollup_seconds * 1000, 1),
+        "save_log_ms": round(with_rollup / args.writes * 1000, 3),
+        "save_log_without_rollup_ms": round(without_rollup / args.writes * 1000, 3)
+    }
+
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+测量 /artlist/ 上报数据的规范化开销（每篇文章的CPU时间）
+
+对比原来逐字段手写的规范化（get + 拼接唯一ID + split检查 + 时间戳转换）与
+app/schemas.py 中按 ArticleIn 整批校验的耗时，以及批内含有不合法文章时的耗时。
+
+用法（在 backend 目录下）:
+    python benchmarks/ingest_validation.py --batch 20 --iterations 2000 --output ingest_validation.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from app.schemas import article_record, validate_article, validate_articles
+from payloads import make_article
+
+def handwritten(articles: List[Any]) -> List[Dict[str, Any]]:
+    """原 save_article_data 中的逐字段规范化"""
+    result = []
+    for article_data in articles:
+        if not isinstance(article_data, dict):
+            continue
+        biz = article_data.get('biz', '')
+        mid = article_data.get('mid', '')
+        idx = article_data.get('idx', '')
+        unique_id = f"{biz}-{mid}-{idx}"
+        parts = unique_id.split('-')
+        if len(parts) != 3 or not all(parts) or unique_id == "--":
+            unique_id = str(uuid.uuid4())
+        pub_time = article_data.get("pub_time", "")
+        pub_time_iso = None
+        if pub_time:
+            try:
+                pub_time_iso = datetime.fromtimestamp(int(pub_time))
+            except (ValueError, TypeError):
+                pub_time_iso = None
+        result.append({
+            "unique_id": unique_id,
+            "url": article_data.get("url", ""),
+            "title": article_data.get("title", ""),
+            "digest": article_data.get("digest", ""),
+            "pub_time": pub_time,
+            "pub_time_iso": pub_time_iso,
+            "cover": article_data.get("cover", ""),
+            "bizname": article_data.get("bizname", ""),
+            "biz": biz,
+            "mid": mid,
+            "idx": idx
+        })
+    return result
+
+def schema(articles: List[Any]) -> List[Dict[str, Any]]:
+    """整批校验后生成相同的字段"""
+    valid, _ = validate_articles(articles)
+    return [article_record(article) for _, article in valid]
+
+def schema_per_item(articles: List[Any]) -> List[Dict[str, Any]]:
+    """逐条调用校验器，用于对比整批校验"""
+    return [article_record(validate_article(article)) for article in articles]
+
+def per_article_us(func: Callable[[List[Any]], Any], batch: List[Any], iterations: int) -> float:
+    func(batch)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(batch)
+    return (time.perf_counter() - start) / iterations / len(batch) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="上报数据规范化基准测试")
+    parser.add_argument("--batch", type=int, default=20, help="每次请求的文章数")
+    parser.add_argument("--iterations", type=int, default=2000, help="重复次数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    batch = [make_article(rng) for _ in range(args.batch)]
+    for article in batch:
+        # 采集端的时间戳和mid通常是字符串
+        article["pub_time"] = str(int(article["pub_time"]))
+        article["mid"] = str(article["mid"])
+    with_invalid = list(batch)
+    with_invalid[0] = dict(batch[0], title="标题" * 150)
+
+    handwritten_us = per_article_us(handwritten, batch, args.iterations)
+    schema_us = per_article_us(schema, batch, args.iterations)
+    result = {
+        "batch": args.batch,
+        "us_per_article": {
+            "handwritten": round(handwritten_us, 2),
+            "schema_batch": round(schema_us, 2),
+            "schema_per_item": round(per_article_us(schema_per_item, batch, args.iterations), 2),
+            "schema_batch_one_invalid": round(per_article_us(schema, with_invalid, args.iterations), 2)
+        },
+        "speedup": round(handwritten_us / schema_us, 2)
+    }
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+对 /artlist/、/search/、/articles/ 进行压测，输出吞吐量和延迟分位数
+
+用法（在 backend 目录下）:
+    # 离线运行：自动启动SQLite + 内存ES替身 + 服务进程
+    python benchmarks/loadtest.py --local --concurrency 32 --duration 20 --output run.json
+
+    # 压测已经启动的服务
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000 --scenarios search,articles
+
+    # 对比两次结果
+    python benchmarks/loadtest.py --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+sys.path.append(BENCH_DIR)
+
+from payloads import make_payload, make_query
+from fake_es import start_fake_es
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("artlist", "search", "articles")
+
+def build_request(scenario: str, rng: random.Random, args) -> Dict[str, Any]:
+    """生成一次请求的参数"""
+    if scenario == "artlist":
+        return {"method": "POST", "url": "/artlist/", "json": make_payload(rng, args.articles_per_request)}
+    if scenario == "search":
+        return {"method": "GET", "url": "/search/", "params": {"q": make_query(rng), "page": rng.randint(1, 3), "size": 10}}
+    return {"method": "GET", "url": "/articles/", "params": {"page": rng.randint(1, 20), "size": 20}}
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def summarize(latencies: List[float], errors: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    """汇总单个场景的结果，延迟单位为毫秒"""
+    values = sorted(latencies)
+    total = len(values) + sum(errors.values())
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "requests": total,
+        "succeeded": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            "mean": ms(sum(values) / len(values)) if values else None,
+            "p50": ms(percentile(values, 50)),
+            "p95": ms(percentile(values, 95)),
+            "p99": ms(percentile(values, 99)),
+            "max": ms(values[-1]) if values else None
+        }
+    }
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, args) -> Dict[str, Any]:
+    """以固定并发运行一个场景，直到达到请求数或持续时间"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = [args.requests] if args.requests else None
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(worker_id: int):
+        rng = random.Random(f"{args.seed}-{scenario}-{worker_id}")
+        while True:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            elif time.perf_counter() >= deadline:
+                return
+
+            request = build_request(scenario, rng, args)
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                elapsed = time.perf_counter() - start
+                if response.status_code < 400:
+                    latencies.append(elapsed)
+                else:
+                    key = str(response.status_code)
+                    errors[key] = errors.get(key, 0) + 1
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+async def run_all(base_url: str, args) -> Dict[str, Any]:
+    """依次运行各场景，每个场景前先预热"""
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        for scenario in args.scenarios:
+            rng = random.Random(f"{args.seed}-warmup-{scenario}")
+            for _ in range(args.warmup):
+                try:
+                    await client.request(**build_request(scenario, rng, args))
+                except httpx.HTTPError:
+                    pass
+            logger.info(f"运行场景 {scenario}: 并发 {args.concurrency}")
+            results[scenario] = await run_scenario(client, scenario, args)
+            logger.info(f"{scenario}: {results[scenario]['throughput_rps']} req/s, p95 {results[scenario]['latency_ms']['p95']} ms")
+    return results
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_local_stack(args):
+    """启动内存ES替身和使用SQLite（或 --database-url 指定的库）的服务进程"""
+    es_server, es_port = start_fake_es()
+    workdir = tempfile.mkdtemp(prefix="wechatrec_bench_")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    port = free_port()
+
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "ES_HOST": "127.0.0.1",
+        "ES_PORT": str(es_port),
+        "ES_MAX_RETRIES": "0",
+        "LOG_RETENTION_DAYS": "0",
+        "WEB_CONCURRENCY": str(args.workers),
+        "STORAGE_BACKEND": args.storage
+    })
+    if not args.admission:
+        # 压测测量的是应用本身的吞吐量，默认关闭准入控制，否则大部分请求被限流返回429
+        env.update({
+            "INGEST_RATE_LIMIT": "0",
+            "SEARCH_RATE_LIMIT": "0",
+            "INGEST_MAX_CONCURRENCY": "0",
+            "SEARCH_MAX_CONCURRENCY": "0"
+        })
+    command = [sys.executable, os.path.join(ROOT_DIR, "run.py"), "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers)]
+    log_file = open(os.path.join(workdir, "server.log"), "w")
+    process = subprocess.Popen(command, env=env, cwd=ROOT_DIR, stdout=log_file, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务进程启动失败，日志见 {log_file.name}")
+        try:
+            if httpx.get(f"{base_url}/articles/", params={"size": 1}, timeout=1).status_code == 200:
+                break
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    else:
+        process.terminate()
+        raise RuntimeError(f"服务进程启动超时，日志见 {log_file.name}")
+
+    logger.info(f"本地环境已启动: {base_url}, ES替身端口 {es_port}, 数据库 {database_url}")
+    return base_url, process, es_server, log_file
+
+def stop_local_stack(process, es_server, log_file):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    es_server.shutdown()
+    log_file.close()
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(before_path: str, after_path: str):
+    """打印两次结果的吞吐量和延迟对比"""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+
+    def change(old, new):
+        if not old or new is None:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"{'scenario':<10} {'metric':<16} {'before':>10} {'after':>10} {'change':>9}")
+    for scenario in after["scenarios"]:
+        if scenario not in before["scenarios"]:
+            continue
+        old, new = before["scenarios"][scenario], after["scenarios"][scenario]
+        rows = [("throughput_rps", old["throughput_rps"], new["throughput_rps"])]
+        rows += [(f"{p}_ms", old["latency_ms"][p], new["latency_ms"][p]) for p in ("p50", "p95", "p99")]
+        for metric, a, b in rows:
+            print(f"{scenario:<10} {metric:<16} {a if a is not None else '-':>10} {b if b is not None else '-':>10} {change(a, b):>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="WeChat文章搜索系统压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="被测服务地址")
+    parser.add_argument("--local", action="store_true", help="启动SQLite和内存ES替身，离线压测")
+    parser.add_argument("--database-url", help="--local 时使用的数据库，默认临时SQLite文件，也可指定本地MySQL")
+    parser.add_argument("--workers", type=int, default=1, help="--local 时的服务进程数")
+    parser.add_argument("--storage", default="mysql+es", choices=("mysql+es", "es-only"), help="--local 时的存储后端")
+    parser.add_argument("--admission", action="store_true", help="--local 时保留准入控制的默认限流和并发上限")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景: artlist,search,articles")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--duration", type=float, default=10, help="每个场景的持续秒数")
+    parser.add_argument("--requests", type=int, default=0, help="每个场景的请求总数，指定时忽略 --duration")
+    parser.add_argument("--warmup", type=int, default=20, help="每个场景的预热请求数")
+    parser.add_argument("--articles-per-request", type=int, default=20, help="每次 /artlist/ 请求的文章数")
+    parser.add_argument("--timeout", type=float, default=30, help="单个请求超时秒数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，相同种子生成相同的请求序列")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="对比两次结果JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    base_url = args.base_url
+    stack = None
+    if args.local:
+        base_url, *stack = start_local_stack(args)
+
+    try:
+        scenarios = asyncio.run(run_all(base_url, args))
+    finally:
+        if stack:
+            stop_local_stack(*stack)
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "base_url": "local" if args.local else base_url,
+            "database": (args.database_url or "sqlite") if args.local else None,
+            "workers": args.workers if args.local else None,
+            "storage": args.storage if args.local else None,
+            "admission": args.admission if args.local else None,
+            "concurrency": args.concurrency,
+            "duration_s": None if args.requests else args.duration,
+            "requests": args.requests or None,
+            "articles_per_request": args.articles_per_request,
+            "seed": args.seed
+        },
+        "scenarios": scenarios
+    }
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
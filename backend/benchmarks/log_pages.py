@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+对比日志列表两种分页方式在不同深度的耗时：原来的 count() + OFFSET 分页（返回完整行），
+与 GET /logs/ 使用的 (timestamp, id) 键集分页（只读列表字段）
+
+写入 --count 条日志后，分别读取第1页、10%、50%和最后一页的位置，每个位置重复 --repeat 次取中位数。
+
+注意：会清空logs表，只应在测试库上运行；未设置 DATABASE_URL 时使用临时SQLite数据库。
+
+用法（在 backend 目录下）:
+    python benchmarks/log_pages.py --count 1000000 --output log_pages.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+def main():
+    parser = argparse.ArgumentParser(description="日志分页基准测试")
+    parser.add_argument("--count", type=int, default=200000, help="日志条数")
+    parser.add_argument("--size", type=int, default=50, help="每页条数")
+    parser.add_argument("--repeat", type=int, default=5, help="每个位置的重复次数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'log_pages.db')}"
+
+    from sqlalchemy import insert, delete, select, desc
+    from app.models.database import engine, Base, SessionLocal
+    from app.models.log import Log
+    from app.services import log as log_service
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(days=30)
+    data = {"request": {"data": {"datatype": "article"}}, "response": {"success": True, "message": "成功保存 20 篇文章，失败 0 篇", "saved": 20, "failed": 0}}
+    with SessionLocal() as db:
+        db.execute(delete(Log))
+        for offset in range(0, args.count, 10000):
+            db.execute(insert(Log), [
+                {
+                    "timestamp": start + timedelta(seconds=rng.uniform(0, 30 * 86400)),
+                    "method": "POST", "path": "/artlist/", "client": f"10.0.0.{rng.randrange(20)}", "data": data
+                }
+                for _ in range(min(10000, args.count - offset))
+            ])
+            db.commit()
+
+    def median_ms(run: Callable[[], Any]) -> float:
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(samples), 2)
+
+    def offset_page(db, page: int):
+        # 原来的实现：统计总数后 OFFSET 跳过前面的行，返回完整行
+        query = db.query(Log)
+        query.count()
+        return [log.to_dict() for log in query.order_by(desc(Log.timestamp), desc(Log.id)).offset((page - 1) * args.size).limit(args.size)]
+
+    pages = (args.count + args.size - 1) // args.size
+    results = []
+    with SessionLocal() as db:
+        for label, page in (("first", 1), ("10%", max(1, pages // 10)), ("50%", max(1, pages // 2)), ("last", pages)):
+            # 键集分页的游标指向该页之前的最后一条日志
+            cursor = None
+            skip = (page - 1) * args.size
+            if skip:
+                row = db.execute(
+                    select(Log.timestamp, Log.id).order_by(desc(Log.timestamp), desc(Log.id)).offset(skip - 1).limit(1)
+                ).one()
+                cursor = log_service.encode_cursor([row.timestamp.isoformat(), row.id])
+            keyset_ids = [log["id"] for log in log_service.get_logs(db, cursor=cursor, size=args.size)["logs"]]
+            offset_ids = [log["id"] for log in offset_page(db, page)]
+            results.append({
+                "position": label,
+                "page": page,
+                "same_rows": keyset_ids == offset_ids,
+                "offset_ms": median_ms(lambda: offset_page(db, page)),
+                "keyset_ms": median_ms(lambda: log_service.get_logs(db, cursor=cursor, size=args.size))
+            })
+
+    output: Dict[str, Any] = {
+        "database": engine.url.render_as_string(hide_password=True),
+        "logs": args.count,
+        "size": args.size,
+        "pages": results
+    }
+
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+对比日志数据原样存储与压缩存储的空间和扫描耗时
+
+注意：会清空logs表，只应在测试库上运行。
+
+用法（在 backend 目录下）:
+    python benchmarks/log_storage.py --count 20000 --articles 20 --confirm
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+from typing import Dict, Any
+
+from sqlalchemy import text, delete, func, select
+
+# 添加backend目录到路径，确保可以导入app包
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.database import engine, SessionLocal, Base
+from app.models.log import Log
+from app.models.migrations import run_migrations
+from app.services import log as log_service
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+def artlist_payload(articles: int) -> Dict[str, Any]:
+    """构造一次 /artlist/ 调用的请求和响应数据"""
+    items = []
+    for i in range(articles):
+        items.append({
+            "url": f"http://mp.weixin.qq.com/s?__biz=MzI2Mjg2ODk4OA==&mid={random.randint(1, 1 << 31)}&idx={i}",
+            "title": f"构网型技术/虚拟电厂等七个方向，新型电力系统建设试点工作 {i}",
+            "digest": "国家能源局开展新型电力系统建设第一批试点工作，涉及构网型技术、系统友好型新能源电站等方向。",
+            "pub_time": str(1749030723 + i),
+            "cover": "https://mmbiz.qpic.cn/mmbiz_jpg/VjeqDTAdu7oiaWPM5LzAxRn3NmnWFzR3L3Mic3DSxe1G78IVBtHDAF0Ck8azLt6QDtcQGRSfk5gxr9TcibR7ZWaWQ/640",
+            "bizname": "储能之音",
+            "biz": "MzI2Mjg2ODk4OA=="
+        })
+    return {
+        "request": {"data": {"key": "AEqoeyurxc.98AEWQUcxi", "data": items, "datatype": "article"}},
+        "response": {"success": True, "message": f"成功保存 {articles} 篇文章，失败 0 篇", "saved": articles, "failed": 0}
+    }
+
+def table_bytes() -> int:
+    """日志表占用的存储空间"""
+    with engine.connect() as conn:
+        if engine.dialect.name == "mysql":
+            conn.execute(text("ANALYZE TABLE logs"))
+            return int(conn.execute(text(
+                "SELECT SUM(DATA_LENGTH + INDEX_LENGTH) FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'logs'"
+            )).scalar() or 0)
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("VACUUM"))
+            page_size = conn.execute(text("PRAGMA page_size")).scalar()
+            page_count = conn.execute(text("PRAGMA page_count")).scalar()
+            return page_size * page_count
+    return 0
+
+def run_mode(name: str, threshold: int, count: int, articles: int, pages: int) -> Dict[str, Any]:
+    """按指定压缩阈值写入日志并测量存储和扫描成本"""
+    with engine.begin() as conn:
+        conn.execute(delete(Log))
+
+    log_service.LOG_COMPRESS_THRESHOLD = threshold
+    payload = artlist_payload(articles)
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for _ in range(count):
+            log_service.save_log(db, {"method": "POST", "path": "/artlist/", "client": "127.0.0.1", "data": payload})
+        write_s = time.perf_counter() - start
+
+        def scan(detail: bool) -> float:
+            cursor = None
+            start = time.perf_counter()
+            for _ in range(pages):
+                cursor = log_service.get_logs(db, cursor=cursor, size=50, detail=detail)["cursor"]
+                if cursor is None:
+                    break
+            return (time.perf_counter() - start) * 1000 / pages
+
+        list_ms = scan(False)
+        detail_ms = scan(True)
+    finally:
+        db.close()
+
+    with engine.connect() as conn:
+        inline_bytes = conn.execute(select(func.sum(func.length(Log.data)))).scalar() or 0
+        blob_bytes = conn.execute(select(func.sum(func.length(Log.payload)))).scalar() or 0
+
+    return {
+        "mode": name,
+        "rows": count,
+        "payload_bytes": int(inline_bytes) + int(blob_bytes),
+        "table_bytes": table_bytes(),
+        "write_rows_per_s": round(count / write_s, 1),
+        "list_page_ms": round(list_ms, 3),
+        "detail_page_ms": round(detail_ms, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="日志压缩存储前后的空间和扫描成本")
+    parser.add_argument("--count", type=int, default=5000, help="写入的日志条数")
+    parser.add_argument("--articles", type=int, default=20, help="每条日志包含的文章数")
+    parser.add_argument("--pages", type=int, default=20, help="分页扫描的页数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    parser.add_argument("--confirm", action="store_true", help="确认清空logs表")
+    args = parser.parse_args()
+
+    if not args.confirm:
+        parser.error("该基准测试会清空logs表，请在测试库上加 --confirm 运行")
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    codec = log_service.LOG_PAYLOAD_CODEC
+    threshold = log_service.LOG_COMPRESS_THRESHOLD
+    result = {
+        "dialect": engine.dialect.name,
+        "codec": codec if codec != "zstd" or log_service.zstandard else "zlib",
+        "before": run_mode("inline", 1 << 62, args.count, args.articles, args.pages),
+        "after": run_mode("compressed", threshold, args.count, args.articles, args.pages),
+    }
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
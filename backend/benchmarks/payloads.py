@@ -0,0 +1,49 @@
+"""合成的微信公众号文章数据，结构与 /artlist/ 实际接收的数据一致"""
+import random
+from typing import Dict, List, Any
+
+# 生成标题和摘要使用的词表
+WORDS = [
+    "储能", "光伏", "风电", "虚拟电厂", "构网型", "新型电力系统", "氢能", "电网", "充电桩", "锂电池",
+    "钠离子", "抽水蓄能", "碳市场", "绿电", "配电网", "微电网", "电力现货", "辅助服务", "源网荷储", "试点",
+    "政策", "招标", "项目", "装机", "并网", "技术", "市场", "价格", "规划", "国家能源局"
+]
+
+# save_article_data 支持的嵌套结构
+SHAPES = ("data", "data.data", "data.data.data")
+
+def make_article(rng: random.Random, biz_count: int = 200) -> Dict[str, Any]:
+    """生成一篇文章"""
+    biz_no = rng.randrange(biz_count)
+    biz = f"MzI{biz_no:07d}OA=="
+    mid = str(rng.randint(2247000000, 2248000000))
+    idx = str(rng.randint(1, 8))
+    title = "".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+    digest = "，".join("".join(rng.choice(WORDS) for _ in range(4)) for _ in range(rng.randint(2, 6)))
+    return {
+        "url": f"http://mp.weixin.qq.com/s?__biz={biz}&mid={mid}&idx={idx}&sn={rng.getrandbits(64):016x}",
+        "title": title[:200],
+        "digest": digest,
+        "pub_time": str(rng.randint(1700000000, 1760000000)),
+        "cover": f"https://mmbiz.qpic.cn/mmbiz_jpg/{rng.getrandbits(128):032x}/640?wxtype=jpeg&wxfrom=0",
+        "bizname": f"新能源观察{biz_no}",
+        "biz": biz,
+        "mid": mid,
+        "idx": idx
+    }
+
+def wrap(articles: List[Dict[str, Any]], shape: str) -> Dict[str, Any]:
+    """按指定的嵌套结构包装文章列表"""
+    if shape == "data":
+        return {"data": articles}
+    if shape == "data.data":
+        return {"data": {"key": "AEqoeyurxc.98AEWQUcxi", "data": articles, "datatype": "article"}}
+    return {"data": {"data": {"data": articles, "stamp": 1749030921}, "datatype": "article"}}
+
+def make_payload(rng: random.Random, articles: int, shape: str = "") -> Dict[str, Any]:
+    """生成一次 /artlist/ 请求体，未指定结构时随机选择"""
+    return wrap([make_article(rng) for _ in range(articles)], shape or rng.choice(SHAPES))
+
+def make_query(rng: random.Random) -> str:
+    """生成搜索关键词"""
+    return " ".join(rng.sample(WORDS, rng.randint(1, 2)))
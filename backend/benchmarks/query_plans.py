@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+对比索引迁移前后的查询计划与耗时
+
+用法（在 backend 目录下）:
+    python benchmarks/query_plans.py --seed 200000 --reset --apply
+        --seed N   先写入N篇合成文章和N条日志
+        --reset    删除迁移管理的索引，得到"迁移前"的查询计划
+        --apply    执行未执行的迁移，再输出"迁移后"的查询计划
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+from sqlalchemy import text, delete, inspect
+
+# 添加backend目录到路径，确保可以导入app包
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.database import engine, Base
+from app.models.article import Article
+from app.models.log import Log
+from app.models.migrations import run_migrations, SchemaMigration
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 受迁移 001 管理的索引
+MANAGED_INDEXES = {
+    "articles": [
+        "ix_articles_pub_time_iso_id",
+        "ix_articles_created_at_id",
+        "ix_articles_updated_at_id",
+        "ix_articles_biz_pub_time_iso",
+    ],
+    "logs": ["ix_logs_timestamp_id"],
+}
+
+# 需要对比的热点查询
+QUERIES = {
+    "articles_by_pub_time": (
+        "SELECT * FROM articles ORDER BY pub_time_iso DESC, id DESC LIMIT 20 OFFSET 2000",
+        {},
+    ),
+    "articles_by_created_at": (
+        "SELECT * FROM articles ORDER BY created_at DESC, id DESC LIMIT 20",
+        {},
+    ),
+    "articles_by_biz": (
+        "SELECT * FROM articles WHERE biz = :biz ORDER BY pub_time_iso DESC LIMIT 20",
+        {"biz": "biz_0007"},
+    ),
+    "articles_updated_since": (
+        "SELECT id, unique_id, updated_at FROM articles WHERE updated_at >= :since "
+        "ORDER BY updated_at, id LIMIT 100",
+        {"since": datetime(2024, 6, 1)},
+    ),
+    "logs_by_time_range": (
+        "SELECT id, timestamp, method, path, client FROM logs "
+        "WHERE timestamp >= :start AND timestamp <= :end ORDER BY timestamp DESC, id DESC LIMIT 50",
+        {"start": datetime(2024, 3, 1), "end": datetime(2024, 3, 8)},
+    ),
+}
+
+def seed(count: int, chunk: int = 5000):
+    """写入合成的文章和日志数据"""
+    base = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, count, chunk):
+            articles, logs = [], []
+            for i in range(start, min(start + chunk, count)):
+                ts = base + timedelta(seconds=random.randint(0, 365 * 86400))
+                articles.append({
+                    "unique_id": f"bench-{i}-{random.randint(0, 1 << 30)}",
+                    "url": f"http://mp.weixin.qq.com/s?mid={i}",
+                    "title": f"合成文章标题 {i}",
+                    "digest": "合成摘要" * 10,
+                    "pub_time": int(ts.timestamp()),
+                    "pub_time_iso": ts,
+                    "bizname": f"公众号{i % 500}",
+                    "biz": f"biz_{i % 500:04d}",
+                    "mid": str(i),
+                    "idx": "1",
+                    "created_at": ts,
+                    "updated_at": ts,
+                })
+                logs.append({
+                    "timestamp": ts,
+                    "method": "POST",
+                    "path": "/artlist/",
+                    "client": f"10.0.0.{i % 250}",
+                    "data": {"response": {"saved": 1}},
+                    "created_at": ts,
+                })
+            conn.execute(Article.__table__.insert(), articles)
+            conn.execute(Log.__table__.insert(), logs)
+    logger.info(f"已写入 {count} 篇文章和 {count} 条日志")
+
+def reset_indexes():
+    """删除迁移管理的索引并清除迁移记录"""
+    with engine.begin() as conn:
+        for table, names in MANAGED_INDEXES.items():
+            existing = {index["name"] for index in inspect(conn).get_indexes(table)}
+            for name in names:
+                if name in existing:
+                    if engine.dialect.name == "mysql":
+                        conn.execute(text(f"DROP INDEX {name} ON {table}"))
+                    else:
+                        conn.execute(text(f"DROP INDEX {name}"))
+        conn.execute(delete(SchemaMigration.__table__).where(SchemaMigration.version == 1))
+
+def explain(repeat: int = 5) -> Dict[str, Any]:
+    """获取每个查询的执行计划和平均耗时"""
+    prefix = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    report = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            plan = [
+                {key: str(value) for key, value in row._mapping.items()}
+                for row in conn.execute(text(f"{prefix} {sql}"), params)
+            ]
+            start = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(text(sql), params).all()
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+            report[name] = {"plan": plan, "avg_ms": round(elapsed_ms, 3)}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="索引迁移前后的查询计划对比")
+    parser.add_argument("--seed", type=int, default=0, help="写入合成数据的条数")
+    parser.add_argument("--reset", action="store_true", help="先删除迁移管理的索引")
+    parser.add_argument("--apply", action="store_true", help="执行迁移后再次输出查询计划")
+    parser.add_argument("--repeat", type=int, default=5, help="每个查询执行的次数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    if args.reset:
+        reset_indexes()
+    if args.seed:
+        seed(args.seed)
+
+    result = {"dialect": engine.dialect.name, "before": explain(args.repeat)}
+    if args.apply:
+        result["migrations"] = run_migrations(engine)
+        result["after"] = explain(args.repeat)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+对比ORM对象与Core列投影读路径的吞吐量和每行内存
+
+用法（在 backend 目录下）:
+    python benchmarks/read_path.py --seed 50000 --output read_path.json
+    未设置 DATABASE_URL 时使用临时SQLite数据库
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'read_path.db')}"
+
+from sqlalchemy import select, func, desc, insert
+
+from app.models.database import engine, Base, SessionLocal
+from app.models.article import Article, ARTICLE_FULL, ARTICLE_INDEX, ARTICLE_HYDRATE
+from payloads import make_article
+
+def seed(count: int):
+    """写入合成文章，已有足够数据时跳过"""
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        existing = db.scalar(select(func.count()).select_from(Article))
+        rng = random.Random(42)
+        batch = []
+        for i in range(existing, count):
+            article = make_article(rng)
+            article["unique_id"] = f"{article['biz']}-{article['mid']}-{article['idx']}-{i}"
+            article["pub_time"] = int(article["pub_time"])
+            article["pub_time_iso"] = None
+            batch.append(article)
+            if len(batch) == 5000:
+                db.execute(insert(Article), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Article), batch)
+        db.commit()
+        return db.scalar(select(func.count()).select_from(Article))
+
+def rows_per_second(func: Callable[[], int], repeat: int) -> float:
+    """重复执行，返回每秒处理的行数"""
+    rows = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows += func()
+    return rows / (time.perf_counter() - start)
+
+def bytes_per_row(func: Callable[[], list]) -> float:
+    """结果列表常驻内存的每行字节数"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = func()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return size / max(len(result), 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="文章读路径基准测试")
+    parser.add_argument("--seed", type=int, default=20000, help="确保库中至少有N篇文章")
+    parser.add_argument("--page-size", type=int, default=100, help="列表页行数")
+    parser.add_argument("--repeat", type=int, default=200, help="列表页重复次数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    total = seed(args.seed)
+    order = (desc(Article.pub_time_iso), desc(Article.id))
+    db = SessionLocal()
+
+    def orm_page():
+        articles = db.query(Article).order_by(*order).limit(args.page_size).all()
+        result = [article.to_dict() for article in articles]
+        db.expunge_all()
+        return len(result)
+
+    def core_page():
+        return len(ARTICLE_FULL.to_dicts(db.execute(ARTICLE_FULL.select().order_by(*order).limit(args.page_size))))
+
+    def orm_scan():
+        result = [article.to_dict() for article in db.execute(select(Article)).scalars()]
+        db.expunge_all()
+        return len(result)
+
+    def projection_scan(projection):
+        return lambda: len(projection.to_dicts(db.execute(projection.select())))
+
+    def orm_objects():
+        objects = db.query(Article).all()
+        return objects
+
+    result: Dict[str, Any] = {
+        "database": engine.url.render_as_string(hide_password=True),
+        "articles": total,
+        "list_page_rows_per_s": {
+            "orm": round(rows_per_second(orm_page, args.repeat)),
+            "core_full": round(rows_per_second(core_page, args.repeat)),
+        },
+        "full_scan_rows_per_s": {
+            "orm": round(rows_per_second(orm_scan, 1)),
+            "core_full": round(rows_per_second(projection_scan(ARTICLE_FULL), 1)),
+            "core_index": round(rows_per_second(projection_scan(ARTICLE_INDEX), 1)),
+            "core_hydrate": round(rows_per_second(projection_scan(ARTICLE_HYDRATE), 1)),
+        },
+    }
+
+    memory = {"orm_object": round(bytes_per_row(orm_objects))}
+    db.expunge_all()
+    for projection in (ARTICLE_FULL, ARTICLE_INDEX, ARTICLE_HYDRATE):
+        memory[f"core_row_{projection.name}"] = round(
+            bytes_per_row(lambda: db.execute(projection.select()).all())
+        )
+    memory["dict_full"] = round(bytes_per_row(lambda: ARTICLE_FULL.to_dicts(db.execute(ARTICLE_FULL.select()))))
+    result["bytes_per_row"] = memory
+    db.close()
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+测量一致性检查的开销：一致时全量检查的耗时和ES请求数，以及注入 --drift 篇不一致（ES缺失、ES内容过期、
+MySQL已删除）后检查并修复的耗时、比较的区间数和修复的文档数，与清空重建索引对比
+
+用法（在 backend 目录下）:
+    python benchmarks/reconcile.py --articles 100000 --drift 100 --output reconcile.json   # 使用 ES_HOST/ES_PORT
+    python benchmarks/reconcile.py --local   # 内存ES替身，每次聚合遍历全部文档，耗时不代表真实ES
+    未设置 DATABASE_URL 时使用临时SQLite数据库
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from typing import Dict, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from payloads import make_article
+
+def main():
+    parser = argparse.ArgumentParser(description="一致性检查基准测试")
+    parser.add_argument("--articles", type=int, default=20000, help="文章数")
+    parser.add_argument("--drift", type=int, default=30, help="每种不一致注入的文章数")
+    parser.add_argument("--index", default="wechat_bench_reconcile", help="基准索引名")
+    parser.add_argument("--local", action="store_true", help="使用内存ES替身")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    # 应用模块在导入时读取这些配置
+    os.environ["ES_INDEX"] = args.index
+    os.environ["RECONCILE_ROWS_PER_SECOND"] = "0"
+    os.environ["RECONCILE_REPAIRS_PER_SECOND"] = "0"
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'reconcile.db')}"
+    if args.local:
+        from fake_es import start_fake_es
+        _, port = start_fake_es()
+        os.environ.update({"ES_HOST": "127.0.0.1", "ES_PORT": str(port), "ES_MAX_RETRIES": "0"})
+
+    from sqlalchemy import insert, delete
+    from app.models.database import engine, Base, SessionLocal
+    from app.models.article import Article, ARTICLE_INDEX
+    from app.services import search, reconcile
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    with SessionLocal() as db:
+        db.execute(delete(Article))
+        db.execute(insert(Article), [
+            {**{key: article[key] for key in ("url", "title", "digest", "bizname", "biz", "mid", "idx")},
+             "unique_id": f"bench-{i:08d}", "pub_time_iso": None}
+            for i, article in enumerate(make_article(rng) for _ in range(args.articles))
+        ])
+        db.commit()
+        articles = ARTICLE_INDEX.to_dicts(db.execute(ARTICLE_INDEX.select()))
+
+    es = search.es_client
+    try:
+        start = time.perf_counter()
+        search.reindex_all_articles(articles)
+        rebuild_seconds = time.perf_counter() - start
+
+        clean = reconcile.reconcile(dry_run=True)
+
+        # 注入不一致：ES缺失、ES内容过期、MySQL已删除但ES仍保留
+        picked = rng.sample([article["unique_id"] for article in articles], args.drift * 3)
+        missing, stale, removed = picked[:args.drift], picked[args.drift:2 * args.drift], picked[2 * args.drift:]
+        for unique_id in missing:
+            es.delete(index=args.index, id=unique_id)
+        for unique_id in stale:
+            document = es.get(index=args.index, id=unique_id)["_source"]
+            es.index(index=args.index, id=unique_id, document={**document, "title": "stale", "fingerprint": 0})
+        es.indices.refresh(index=args.index)
+        with SessionLocal() as db:
+            db.execute(delete(Article).where(Article.unique_id.in_(removed)))
+            db.commit()
+
+        repaired = reconcile.reconcile()
+        after = reconcile.reconcile(dry_run=True)
+    finally:
+        es.indices.delete(index=args.index)
+
+    def summary(result: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: result[key] for key in (
+            "success", "seconds", "scanned", "ranges", "leaves", "divergent", "indexed", "deleted", "failed"
+        ) if key in result}
+
+    output: Dict[str, Any] = {
+        "elasticsearch": "fake" if args.local else f"{os.environ.get('ES_HOST', 'localhost')}:{os.environ.get('ES_PORT', '9200')}",
+        "database": engine.url.render_as_string(hide_password=True),
+        "articles": args.articles,
+        "chunk": reconcile.RECONCILE_CHUNK,
+        "fanout": reconcile.RECONCILE_FANOUT,
+        "leaf_size": reconcile.RECONCILE_LEAF_SIZE,
+        "rebuild_seconds": round(rebuild_seconds, 2),
+        "consistent": summary(clean),
+        "drifted": {"injected": args.drift * 3, **summary(repaired)},
+        "after_repair": summary(after)
+    }
+
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
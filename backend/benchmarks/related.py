@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+测量相关文章的计算开销：向量化吞吐、全量 top-k 的耗时随文章数的增长、增量更新一批新文章的耗时，
+以及读取预计算列表的延迟，并按测量结果外推到100万篇文章
+
+全量 top-k 是所有文章两两相乘，耗时与文章数的平方成正比；向量化和增量更新与文章数成正比。
+合成文章的标题加上编号使文本各不相同，簇ID各自独立。
+
+用法（在 backend 目录下）:
+    python benchmarks/related.py --articles 10000,20000,40000 --output related.json
+    未设置 DATABASE_URL 时使用临时SQLite数据库
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'related.db')}"
+
+import numpy as np
+from sqlalchemy import insert, delete
+
+from app.models.database import engine, Base, SessionLocal
+from app.models.related_article import RelatedArticle
+from app.services.features import normalize_text, document_frequencies, inverse_document_frequency, vectorize
+from app.services.related import (
+    RELATED_DIM, RELATED_TOP_K, RELATED_BATCH_SIZE, _COLUMN_BLOCK, nearest, get_related
+)
+from payloads import make_article
+
+MILLION = 1_000_000
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "p50": round(statistics.median(samples), 1),
+        "p99": round(samples[int(len(samples) * 0.99) - 1], 1)
+    }
+
+def build_vectors(texts: List[str]):
+    idf = inverse_document_frequency(document_frequencies(texts), len(texts))
+    return vectorize(texts, idf, RELATED_DIM)
+
+def main():
+    parser = argparse.ArgumentParser(description="相关文章基准测试")
+    parser.add_argument("--articles", default="10000,20000,40000", help="全量构建的文章数，逗号分隔")
+    parser.add_argument("--lookups", type=int, default=2000, help="读取列表的次数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.articles.split(",")]
+    rng = random.Random(42)
+    articles = [make_article(rng) for _ in range(max(sizes) + RELATED_BATCH_SIZE)]
+    texts = [normalize_text(f"{article['title']}{i}", article["digest"]) for i, article in enumerate(articles)]
+
+    start = time.perf_counter()
+    vectors = build_vectors(texts)
+    vectorize_us = (time.perf_counter() - start) / len(texts) * 1e6
+    codes = np.arange(len(texts), dtype=np.int64)
+
+    builds = []
+    for size in sizes:
+        matrix, matrix_codes = vectors[:size], codes[:size]
+        start = time.perf_counter()
+        for offset in range(0, size, RELATED_BATCH_SIZE):
+            end = offset + RELATED_BATCH_SIZE
+            nearest(matrix[offset:end], matrix_codes[offset:end], matrix, matrix_codes)
+        seconds = time.perf_counter() - start
+        builds.append({"articles": size, "top_k_seconds": round(seconds, 2)})
+
+    # 按最大规模的测量值平方外推
+    largest = builds[-1]
+    top_k_million = largest["top_k_seconds"] * (MILLION / largest["articles"]) ** 2
+
+    # 增量更新：一批新文章与全部已有文章相乘，与已有文章数成正比
+    size = sizes[-1]
+    start = time.perf_counter()
+    nearest(vectors[size:], codes[size:], vectors[:size], codes[:size])
+    update_seconds = time.perf_counter() - start
+
+    Base.metadata.create_all(bind=engine)
+    neighbours = json.dumps([
+        {"unique_id": str(i), "title": articles[i]["title"], "url": articles[i]["url"], "cover": "",
+         "bizname": articles[i]["bizname"], "pub_time_iso": None, "score": 0.5}
+        for i in range(RELATED_TOP_K)
+    ], ensure_ascii=False)
+    with SessionLocal() as db:
+        db.execute(delete(RelatedArticle))
+        db.execute(insert(RelatedArticle), [{"unique_id": str(i), "neighbours": neighbours} for i in range(size)])
+        db.commit()
+        lookup_us = []
+        for _ in range(args.lookups):
+            article_id = str(rng.randrange(size))
+            start = time.perf_counter()
+            get_related(db, article_id)
+            lookup_us.append((time.perf_counter() - start) * 1e6)
+
+    result: Dict[str, Any] = {
+        "database": engine.url.render_as_string(hide_password=True),
+        "dim": RELATED_DIM,
+        "top_k": RELATED_TOP_K,
+        "vectorize_us_per_article": round(vectorize_us, 1),
+        "builds": builds,
+        "incremental_update": {
+            "existing_articles": size,
+            "new_articles": len(texts) - size,
+            "seconds": round(update_seconds, 3)
+        },
+        "lookup_us": percentiles(lookup_us),
+        "extrapolated_1m": {
+            "vectorize_seconds": round(vectorize_us * MILLION / 1e6, 1),
+            "top_k_hours": round(top_k_million / 3600, 2),
+            "incremental_update_seconds": round(update_seconds * MILLION / size, 1),
+            # 向量矩阵加上一个分数块（行数 × 列块）
+            "memory_mb": round((MILLION * RELATED_DIM + RELATED_BATCH_SIZE * _COLUMN_BLOCK) * 4 / 2 ** 20)
+        }
+    }
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
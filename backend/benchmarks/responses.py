@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+测量一页文章/搜索结果的序列化和压缩开销
+
+对比FastAPI默认路径（jsonable_encoder + JSONResponse）与 FastJSONResponse，
+以及不同压缩算法的耗时和体积，最后通过ASGI调用 /articles/ 测量整页延迟。
+
+用法（在 backend 目录下）:
+    python benchmarks/responses.py --page-size 100 --iterations 2000 --output responses.json
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Callable, Dict, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app import responses
+from app.responses import FastJSONResponse
+from payloads import make_article
+
+def per_call_us(func: Callable[[], Any], iterations: int) -> float:
+    """单次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def article_page(rng: random.Random, size: int) -> Dict[str, Any]:
+    """与 get_all_articles 返回结构相同的一页文章"""
+    articles = []
+    for i in range(size):
+        article = make_article(rng)
+        article.update({
+            "id": i + 1,
+            "unique_id": f"{article['biz']}-{article['mid']}-{article['idx']}",
+            "pub_time": int(article["pub_time"]),
+            "pub_time_iso": "2025-06-04T17:55:21",
+            "created_at": "2025-06-04T18:00:00",
+            "updated_at": "2025-06-04T18:00:00"
+        })
+        articles.append(article)
+    return {"page": 1, "size": size, "total": 100000, "articles": articles}
+
+def search_page(rng: random.Random, size: int) -> Dict[str, Any]:
+    """与 search_articles 返回结构相同的一页搜索结果"""
+    results = []
+    for _ in range(size):
+        article = make_article(rng)
+        results.append({
+            "unique_id": f"{article['biz']}-{article['mid']}-{article['idx']}",
+            "title": f"<em>{article['title'][:4]}</em>{article['title'][4:]}",
+            "digest": "...".join([f"<em>储能</em>{article['digest'][:60]}", article["digest"][60:150]]),
+            "bizname": article["bizname"],
+            "pub_time_iso": "2025-06-04T17:55:21"
+        })
+    return {
+        "query": "储能", "page": 1, "size": size, "total": 5000, "took": 12.3,
+        "results": results, "unique_ids": [r["unique_id"] for r in results]
+    }
+
+def serialization(content: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+    default_us = per_call_us(lambda: JSONResponse(jsonable_encoder(content)), iterations)
+    fast_us = per_call_us(lambda: FastJSONResponse(content), iterations)
+    return {
+        "bytes": len(FastJSONResponse(content).body),
+        "default_us": round(default_us, 1),
+        "fast_us": round(fast_us, 1),
+        "saved_us": round(default_us - fast_us, 1),
+        "speedup": round(default_us / fast_us, 2)
+    }
+
+def compression(body: bytes, iterations: int) -> Dict[str, Any]:
+    result = {}
+    for level in (1, responses.COMPRESS_GZIP_LEVEL, 9):
+        def gzip_once(level=level):
+            c = zlib.compressobj(level, zlib.DEFLATED, 31)
+            return c.compress(body) + c.flush()
+        result[f"gzip_{level}"] = {"bytes": len(gzip_once()), "us": round(per_call_us(gzip_once, iterations), 1)}
+    if responses.brotli is not None:
+        for quality in (1, responses.COMPRESS_BROTLI_QUALITY, 11):
+            def br_once(quality=quality):
+                return responses.brotli.compress(body, quality=quality)
+            result[f"br_{quality}"] = {
+                "bytes": len(br_once()),
+                "us": round(per_call_us(br_once, max(iterations // (20 if quality == 11 else 1), 1)), 1)
+            }
+    return result
+
+async def endpoint_latency(requests: int, page_size: int) -> Dict[str, Any]:
+    """通过ASGI调用 /articles/，对比不压缩和各压缩算法的延迟与传输字节数"""
+    import httpx
+    from app.fastapiServer import app, initialize_storage
+    from app.models.database import SessionLocal
+    from app.models.article import Article
+
+    initialize_storage()
+    rng = random.Random(7)
+    with SessionLocal() as db:
+        if db.query(Article).count() < page_size:
+            for article in article_page(rng, page_size)["articles"]:
+                article.pop("id")
+                article["pub_time_iso"] = None
+                article.pop("created_at")
+                article.pop("updated_at")
+                db.add(Article(**article))
+            db.commit()
+
+    result = {}
+    encodings = ["identity", "gzip"] + (["br"] if responses.brotli is not None else [])
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for encoding in encodings:
+            headers = {"Accept-Encoding": encoding}
+            await client.get("/articles/", params={"size": page_size}, headers=headers)
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = await client.get("/articles/", params={"size": page_size}, headers=headers)
+            elapsed = (time.perf_counter() - start) / requests
+            result[encoding] = {
+                "ms": round(elapsed * 1000, 3),
+                "wire_bytes": len(response.content) if encoding == "identity"
+                else int(response.headers.get("content-length", 0))
+            }
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="响应序列化与压缩基准测试")
+    parser.add_argument("--page-size", type=int, default=100, help="每页文章数")
+    parser.add_argument("--iterations", type=int, default=2000, help="每项测试的调用次数")
+    parser.add_argument("--requests", type=int, default=200, help="端到端测试的请求数，0表示跳过")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    articles = article_page(rng, args.page_size)
+    search = search_page(rng, min(args.page_size, 50))
+
+    result: Dict[str, Any] = {
+        "page_size": args.page_size,
+        "orjson": responses.orjson is not None,
+        "brotli": responses.brotli is not None,
+        "articles_serialization": serialization(articles, args.iterations),
+        "search_serialization": serialization(search, args.iterations),
+        "articles_compression": compression(FastJSONResponse(articles).body, max(args.iterations // 10, 1)),
+    }
+
+    if args.requests:
+        # 未指定数据库时使用临时SQLite，避免写入正式库
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+        os.environ.setdefault("APP_INIT_ON_STARTUP", "false")
+        result["articles_endpoint"] = asyncio.run(endpoint_latency(args.requests, args.page_size))
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
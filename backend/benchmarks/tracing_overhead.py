@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+测量请求追踪的开销：span 本身的耗时、追踪中间件的开销，以及 /artlist/ 请求在
+关闭追踪、记录但不导出、全部导出三种设置下的平均耗时，最后汇总导出的追踪得到各阶段耗时
+
+用法（在 backend 目录下）:
+    python benchmarks/tracing_overhead.py --requests 200 --output tracing.json   # 使用 ES_HOST/ES_PORT
+    python benchmarks/tracing_overhead.py --local   # 内存ES替身，耗时不代表真实ES
+    未设置 DATABASE_URL 时使用临时SQLite数据库
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from payloads import make_payload
+from metrics_overhead import per_op_ns, _endpoint, _asgi_ns
+
+def main():
+    parser = argparse.ArgumentParser(description="请求追踪开销基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="每种设置的 /artlist/ 请求数")
+    parser.add_argument("--articles", type=int, default=20, help="每个请求的文章数")
+    parser.add_argument("--iterations", type=int, default=200000, help="span 微基准的调用次数")
+    parser.add_argument("--index", default="wechat_bench_tracing", help="基准索引名")
+    parser.add_argument("--local", action="store_true", help="使用内存ES替身")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    # 应用模块在导入时读取这些配置
+    export_dir = tempfile.mkdtemp()
+    os.environ.update({
+        "ES_INDEX": args.index,
+        "ES_LOGS_INDEX": f"{args.index}_logs",
+        "TRACE_EXPORT_DIR": export_dir,
+        "INGEST_RATE_LIMIT": "0"
+    })
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tracing.db')}"
+    if args.local:
+        from fake_es import start_fake_es
+        _, port = start_fake_es()
+        os.environ.update({"ES_HOST": "127.0.0.1", "ES_PORT": str(port), "ES_MAX_RETRIES": "0"})
+
+    from fastapi.testclient import TestClient
+    from app import tracing
+    from app.fastapiServer import app, initialize_storage
+    from app.connections import get_es_client
+
+    def configure(sample_rate: float, slow_ms: float):
+        tracing.TRACE_SAMPLE_RATE = sample_rate
+        tracing.TRACE_SLOW_MS = slow_ms
+
+    n = args.iterations
+    result: Dict[str, Any] = {
+        "elasticsearch": "fake" if args.local else f"{os.environ.get('ES_HOST', 'localhost')}:{os.environ.get('ES_PORT', '9200')}",
+        "iterations": n
+    }
+
+    def empty_span():
+        with tracing.span("bench"):
+            pass
+    result["span_untraced_ns"] = round(per_op_ns(empty_span, n), 1)
+    trace = tracing.Trace("bench", {})
+    token = tracing._current.set(trace.root)
+    try:
+        result["span_traced_ns"] = round(per_op_ns(empty_span, min(n, tracing.TRACE_MAX_SPANS)), 1)
+    finally:
+        tracing._current.reset(token)
+
+    asgi_iterations = max(n // 10, 1)
+    plain = asyncio.run(_asgi_ns(_endpoint, asgi_iterations))
+    configure(0, 0)
+    disabled = asyncio.run(_asgi_ns(tracing.TracingMiddleware(_endpoint), asgi_iterations))
+    # 只记录不导出：慢请求阈值设得足够大
+    configure(0, 1e9)
+    recorded = asyncio.run(_asgi_ns(tracing.TracingMiddleware(_endpoint), asgi_iterations))
+    result["middleware_overhead_ns"] = {
+        "disabled": round(disabled - plain, 1),
+        "recorded": round(recorded - plain, 1)
+    }
+
+    settings = {
+        "disabled": (0, 0),
+        "recorded_not_exported": (0, 1e9),
+        "exported": (1, 0)
+    }
+    rng = random.Random(42)
+    payloads = [make_payload(rng, args.articles) for _ in range(args.requests * len(settings))]
+    requests: Dict[str, Any] = {}
+    es = get_es_client()
+    initialize_storage()
+    try:
+        # 不进入lifespan：关闭事件会关闭ES客户端，后台任务也不参与测量
+        client = TestClient(app)
+        for i, (name, (sample_rate, slow_ms)) in enumerate(settings.items()):
+            configure(sample_rate, slow_ms)
+            latencies: List[float] = []
+            for payload in payloads[i * args.requests:(i + 1) * args.requests]:
+                start = time.perf_counter()
+                response = client.post("/artlist/", json=payload)
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.text
+            latencies.sort()
+            requests[name] = {
+                "ms_avg": round(sum(latencies) / len(latencies), 2),
+                "ms_p50": round(latencies[len(latencies) // 2], 2),
+                "ms_p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2)
+            }
+        # 写完导出队列
+        tracing.stop_trace_exporter()
+    finally:
+        for index in (args.index, f"{args.index}_logs"):
+            es.options(ignore_status=404).indices.delete(index=index)
+
+    result["articles_per_request"] = args.articles
+    result["requests"] = requests
+    result["export_bytes"] = sum(
+        os.path.getsize(os.path.join(export_dir, name)) for name in os.listdir(export_dir)
+    )
+    summary = tracing.summarize(tracing.read_traces(export_dir), route="/artlist/")
+    result["summary"] = summary
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    print(tracing.format_summary(summary))
+
+if __name__ == "__main__":
+    main()
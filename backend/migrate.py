@@ -1,4 +1,4 @@
- #!/usr/bin/env python
+#!/usr/bin/env python
 """
 从Elasticsearch迁移数据到MySQL
 """
@@ -6,14 +6,17 @@ import os
 import sys
 import logging
 from datetime import datetime
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import helpers
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 
 # 添加当前目录到路径，确保可以导入app包
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.models.database import SessionLocal, engine, Base
-from app.models.article import Article
+from app.models.article import Article, ARTICLE_INDEX
+from app.schemas import article_record, validate_article, error_report
+from app.connections import get_es_client, ES_HOST, ES_PORT
 import app.services.search as search_service
 
 # 配置日志
@@ -21,13 +24,11 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ES配置
-ES_HOST = os.environ.get("ES_HOST", "localhost")
-ES_PORT = os.environ.get("ES_PORT", "9200")
 ES_ARTICLES_INDEX = os.environ.get("ES_INDEX", "wechat_articles")
 
-# 创建Elasticsearch客户端
+# 获取共享的Elasticsearch客户端
 try:
-    es_client = Elasticsearch(f"http://{ES_HOST}:{ES_PORT}")
+    es_client = get_es_client()
     if es_client.ping():
         logger.info(f"Elasticsearch连接成功: {ES_HOST}:{ES_PORT}")
     else:
@@ -83,47 +84,29 @@ def migrate_data():
                         logger.debug(f"文章已存在，跳过: {unique_id}")
                         continue
                     
-                    # 处理pub_time_iso
-                    pub_time = source.get("pub_time")
-                    pub_time_iso = None
+                    # 与 /artlist/ 使用相同的校验和类型转换，不合法的文档计为失败
+                    try:
+                        record = article_record(validate_article(source))
+                    except ValidationError as e:
+                        failed_count += 1
+                        logger.error(f"文章数据不合法，跳过 {unique_id}: {error_report(e)}")
+                        continue
+                    record["unique_id"] = unique_id
+                    
+                    # 旧数据没有biz/mid/idx字段时从unique_id提取
+                    if unique_id.count("-") == 2:
+                        for field, part in zip(("biz", "mid", "idx"), unique_id.split("-")):
+                            record[field] = record[field] or part
                     
-                    if pub_time:
+                    # 时间戳无效时尝试直接解析iso格式
+                    if record["pub_time_iso"] is None and source.get("pub_time_iso"):
                         try:
-                            pub_time_iso = datetime.fromtimestamp(int(pub_time))
+                            record["pub_time_iso"] = datetime.fromisoformat(source["pub_time_iso"].replace('Z', '+00:00'))
                         except (ValueError, TypeError):
-                            # 尝试直接解析iso格式
-                            try:
-                                pub_time_str = source.get("pub_time_iso")
-                                if pub_time_str:
-                                    pub_time_iso = datetime.fromisoformat(pub_time_str.replace('Z', '+00:00'))
-                            except (ValueError, TypeError):
-                                pass
-                    
-                    # 尝试从unique_id提取biz, mid, idx
-                    biz, mid, idx = "", "", ""
-                    if "-" in unique_id:
-                        parts = unique_id.split("-")
-                        if len(parts) >= 1:
-                            biz = parts[0]
-                        if len(parts) >= 2:
-                            mid = parts[1]
-                        if len(parts) >= 3:
-                            idx = parts[2]
+                            pass
                     
                     # 创建新文章
-                    article = Article(
-                        unique_id=unique_id,
-                        url=source.get("url", ""),
-                        title=source.get("title", ""),
-                        digest=source.get("digest", ""),
-                        pub_time=pub_time,
-                        pub_time_iso=pub_time_iso,
-                        cover=source.get("cover", ""),
-                        bizname=source.get("bizname", ""),
-                        biz=source.get("biz") or biz,
-                        mid=source.get("mid") or mid,
-                        idx=source.get("idx") or idx
-                    )
+                    article = Article(**record)
                     
                     db.add(article)
                     
@@ -148,8 +131,8 @@ def migrate_data():
                 logger.info("开始重建搜索索引...")
                 
                 # 获取所有文章用于重建索引
-                articles = db.query(Article).all()
-                articles_dict = [article.to_dict() for article in articles]
+                rows = db.execute(ARTICLE_INDEX.select().execution_options(yield_per=1000))
+                articles_dict = ARTICLE_INDEX.to_dicts(rows)
                 
                 # 调用搜索服务重建索引
                 reindex_result = search_service.reindex_all_articles(articles_dict)
@@ -0,0 +1,58 @@
+"""
+测试环境：临时SQLite数据库和内存ES替身（benchmarks/fake_es.py）
+
+应用模块在导入时读取配置并连接ES，所以这里在导入任何应用模块之前设置环境变量
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+from fake_es import start_fake_es
+
+_, _port = start_fake_es()
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}",
+    "ES_HOST": "127.0.0.1",
+    "ES_PORT": str(_port),
+    "ES_MAX_RETRIES": "0",
+    "ES_INDEX": "wechat_test_articles",
+    "ES_LOGS_INDEX": "wechat_test_logs",
+    "RECONCILE_ROWS_PER_SECOND": "0",
+    "RECONCILE_REPAIRS_PER_SECOND": "0"
+})
+
+from sqlalchemy import delete
+from app.models.database import engine, Base, SessionLocal
+from app.models.article import Article
+from app.models.article_tombstone import ArticleTombstone
+
+Base.metadata.create_all(bind=engine)
+
+@pytest.fixture
+def db():
+    """每个测试使用空的文章表和删除记录表"""
+    session = SessionLocal()
+    session.execute(delete(Article))
+    session.execute(delete(ArticleTombstone))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def es_index():
+    """每个测试重建空的文章索引，返回 (ES客户端, 索引名)"""
+    from app.services import search
+    es = search.es_client
+    es.options(ignore_status=404).indices.delete(index=search.ES_INDEX)
+    search.init_search_index()
+    yield es, search.ES_INDEX
+    es.options(ignore_status=404).indices.delete(index=search.ES_INDEX)
@@ -0,0 +1,83 @@
+"""
+变更订阅（app/services/changes.py）：游标编解码、游标过期，以及文章和删除记录的归并顺序
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select, func
+
+from app.models.article import Article
+from app.models.article_tombstone import ArticleTombstone
+from app.services import changes
+
+def _now(db) -> datetime:
+    return db.scalar(select(func.now())).replace(microsecond=0)
+
+def _article(unique_id: str, created_at: datetime, updated_at: datetime):
+    return {
+        "unique_id": unique_id,
+        "url": f"http://mp.weixin.qq.com/s?sn={unique_id}",
+        "title": unique_id,
+        "created_at": created_at,
+        "updated_at": updated_at
+    }
+
+@pytest.fixture
+def feed(db):
+    """插入一组变更，返回期望的 (op, unique_id) 顺序"""
+    now = _now(db)
+    earlier, later = now - timedelta(seconds=60), now - timedelta(seconds=30)
+    db.execute(insert(Article), [
+        _article("a1", earlier, earlier),
+        _article("a2", earlier, later),
+        # 还在 CHANGE_FEED_LAG 内，不返回
+        _article("a3", now, now)
+    ])
+    db.execute(insert(ArticleTombstone), [
+        {"unique_id": "x1", "op": "delete", "deleted_at": earlier + timedelta(seconds=10)},
+        # 与 a2 的更新同一秒：先删除后写入
+        {"unique_id": "a2", "op": "delete", "deleted_at": later}
+    ])
+    db.commit()
+    return [("insert", "a1"), ("delete", "x1"), ("delete", "a2"), ("update", "a2")]
+
+def test_cursor_round_trip():
+    articles = (datetime(2024, 5, 1, 12, 30, 15), 42)
+    tombstones = (datetime(2024, 5, 1, 12, 29, 59), 7)
+    cursor = changes.encode_cursor(articles, tombstones)
+    assert "=" not in cursor
+    assert changes.decode_cursor(cursor) == (articles, tombstones)
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "eyJhIjpbXX0", "eyJhIjpbIngiLDFdLCJ0IjpbIngiLDFdfQ"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(changes.CursorError):
+        changes.decode_cursor(cursor)
+
+def test_cursor_expired(db, monkeypatch):
+    monkeypatch.setattr(changes, "TOMBSTONE_RETENTION_DAYS", 1)
+    now = _now(db)
+    expired = changes.encode_cursor((now, 0), (now - timedelta(days=2), 0))
+    with pytest.raises(changes.CursorExpired):
+        changes.get_changes(db, expired)
+
+    fresh = changes.encode_cursor((now, 0), (now - timedelta(hours=1), 0))
+    assert changes.get_changes(db, fresh)["changes"] == []
+
+def test_merge_order(db, feed):
+    result = changes.get_changes(db)
+    assert [(change["op"], change["unique_id"]) for change in result["changes"]] == feed
+    assert result["has_more"] is False
+
+def test_paging_resumes_without_gaps(db, feed):
+    seen = []
+    cursor = None
+    for _ in range(len(feed) * 2):
+        result = changes.get_changes(db, cursor, limit=1)
+        seen += [(change["op"], change["unique_id"]) for change in result["changes"]]
+        cursor = result["cursor"]
+        if not result["has_more"]:
+            break
+    assert seen == feed
+
+    # 读完后游标不回退，再读不会重复
+    assert changes.get_changes(db, cursor)["changes"] == []
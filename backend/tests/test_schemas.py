@@ -0,0 +1,58 @@
+"""
+上报文章的校验（app/schemas.py）：类型转换、列长度检查、非对象条目，以及错误在请求中的位置
+"""
+from app.schemas import article_record, validate_articles
+
+def _article(**fields):
+    return {"url": "http://mp.weixin.qq.com/s?sn=1", "title": "标题", "biz": "MzI0", "mid": "2247", "idx": "1", **fields}
+
+def test_coercion():
+    valid, invalid = validate_articles([_article(mid=2247000001, idx=2, pub_time="1700000000")])
+    assert invalid == []
+    assert valid == [(0, _article(mid="2247000001", idx="2", pub_time=1700000000))]
+
+    valid, _ = validate_articles([_article(pub_time="")])
+    assert valid[0][1]["pub_time"] is None
+
+def test_length_errors():
+    _, invalid = validate_articles([_article(url="x" * 501, idx="1" * 11)])
+    assert [(error["field"], error["type"]) for error in invalid[0]["errors"]] == [
+        ("url", "string_too_long"), ("idx", "string_too_long")
+    ]
+
+def test_unique_id_length():
+    # biz、mid 各自合法，拼成的 unique_id 超过 unique_id 列的长度
+    _, invalid = validate_articles([_article(biz="b" * 60, mid="m" * 60)])
+    assert invalid == [{"index": 0, "errors": [{
+        "field": None,
+        "type": "unique_id_too_long",
+        "message": "biz-mid-idx 组成的 unique_id 不能超过 100 个字符"
+    }]}]
+
+    # 恰好等于列长度
+    valid, invalid = validate_articles([_article(biz="b" * 48, mid="m" * 49, idx="1")])
+    assert invalid == []
+    assert len(article_record(valid[0][1])["unique_id"]) == 100
+
+def test_non_dict_item():
+    valid, invalid = validate_articles(["not an article"])
+    assert valid == []
+    assert invalid == [{"index": 0, "errors": [{
+        "field": None, "type": "dict_type", "message": "Input should be a valid dictionary"
+    }]}]
+
+def test_index_mapping():
+    items = [_article(mid="1"), None, _article(mid="3", title="t" * 201), _article(mid="4")]
+    valid, invalid = validate_articles(items)
+    assert [(index, article["mid"]) for index, article in valid] == [(0, "1"), (3, "4")]
+    assert [item["index"] for item in invalid] == [1, 2]
+    assert invalid[1]["errors"][0]["field"] == "title"
+
+def test_article_record():
+    record = article_record({"biz": "MzI0", "mid": "2247", "idx": "1", "pub_time": 1700000000})
+    assert record["unique_id"] == "MzI0-2247-1"
+    assert record["url"] == "" and record["cover"] == ""
+    assert record["pub_time_iso"] is not None
+
+    # 缺少标识时使用随机ID
+    assert len(article_record({"biz": "MzI0"})["unique_id"]) == 36
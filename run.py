@@ -1,16 +1,63 @@
- #!/usr/bin/env python
+#!/usr/bin/env python
 """
 启动WeChat文章搜索系统
+
+    python run.py                    # 生产模式，多进程，进程数默认等于CPU核数
+    python run.py --workers 8        # 指定进程数
+    python run.py --reload           # 开发模式，单进程并自动重载
 """
 import os
 import sys
 import logging
+import argparse
+import tempfile
+import importlib.util
 import uvicorn
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
+# 应用代码使用 app. 开头的绝对导入，需要以backend目录为根目录
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+APP = "app.fastapiServer:app"
+
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """解析命令行参数，默认值可通过环境变量配置"""
+    parser = argparse.ArgumentParser(description="启动WeChat文章搜索系统")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+                        help="工作进程数（默认CPU核数）")
+    parser.add_argument("--reload", action="store_true", default=os.environ.get("RELOAD", "").lower() in ("1", "true", "yes"),
+                        help="开发模式：单进程并在代码变化时自动重载")
+    parser.add_argument("--backlog", type=int, default=int(os.environ.get("BACKLOG", "4096")),
+                        help="监听队列长度")
+    parser.add_argument("--keep-alive", type=int, default=int(os.environ.get("KEEP_ALIVE", "75")),
+                        help="Keep-Alive连接空闲超时秒数")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get("GRACEFUL_TIMEOUT", "30")),
+                        help="关闭时等待进行中请求完成的最长秒数")
+    parser.add_argument("--limit-concurrency", type=int, default=None,
+                        help="每个进程的最大并发连接数，超出返回503")
+    return parser.parse_args()
+
+def initialize_once():
+    """
+    在主进程中执行一次建表、迁移和索引初始化，工作进程启动时跳过，
+    避免多个进程同时执行DDL
+    """
+    os.environ["APP_INIT_ON_STARTUP"] = "false"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from app.fastapiServer import initialize_storage
+    from app.models.database import engine
+
+    initialize_storage()
+    # 主进程不处理请求，释放初始化时建立的连接
+    engine.dispose()
+
 def main():
     """主函数"""
     # 配置日志
@@ -18,14 +65,38 @@ def main():
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    
-    # 启动FastAPI应用
+    args = parse_args()
+
+    # 开发模式：单进程自动重载
+    if args.reload:
+        uvicorn.run(APP, app_dir=BACKEND_DIR, host=args.host, port=args.port, reload=True)
+        return
+
+    initialize_once()
+
+    # 多进程时各工作进程的指标写入同一目录，由 /metrics 汇总
+    if args.workers > 1 and not os.environ.get("METRICS_MULTIPROC_DIR"):
+        os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="wechatrec_metrics_")
+
+    # 可用时使用uvloop和httptools
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    logger.info(f"生产模式启动: workers={args.workers}, loop={loop}, http={http}")
+
     uvicorn.run(
-        "backend.app.fastapiServer:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
+        APP,
+        app_dir=BACKEND_DIR,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency,
+        proxy_headers=True
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()